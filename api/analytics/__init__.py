@@ -3,12 +3,28 @@ Analytics Intelligence Engine - v2.0 Polyglot Backend
 Shared types and utilities for analytics endpoints
 """
 
-from typing import Any, TypedDict
+from typing import TYPE_CHECKING, Any, TypedDict
 
-from api.analytics.audit import EnvelopeIntegrityAuditor
+if TYPE_CHECKING:
+    from api.analytics.audit import EnvelopeIntegrityAuditor
 
 __all__ = ["EnvelopeIntegrityAuditor"]
 
+# Envelope IDs that mean "not assigned yet" (the frontend stores "unassigned")
+UNASSIGNED_ENVELOPE_IDS = frozenset({"", "unassigned"})
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Lazily import the auditor so the serverless categorization/prediction
+    handlers (which only need the TypedDicts below) never load Pydantic
+    """
+    if name == "EnvelopeIntegrityAuditor":
+        from api.analytics.audit import EnvelopeIntegrityAuditor
+
+        return EnvelopeIntegrityAuditor
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class PaycheckEntry(TypedDict, total=False):
     """Paycheck entry structure"""
@@ -38,9 +54,56 @@ class MerchantSuggestion(TypedDict):
     monthlyAverage: float
 
 
+class MerchantCluster(TypedDict):
+    """Fuzzy cluster of descriptions no merchant pattern matched"""
+
+    name: str
+    amount: float
+    count: int
+    suggestedBudget: float
+    monthlyAverage: float
+    descriptions: list[str]
+
+
+class EnvelopeCandidate(TypedDict):
+    """Envelope scored for an unassigned transaction"""
+
+    envelopeId: str
+    score: float
+
+
+class EnvelopeSuggestion(TypedDict):
+    """Suggested envelope for one unassigned transaction"""
+
+    index: int
+    transactionId: str | None
+    envelopeId: str
+    confidence: float
+    candidates: list[EnvelopeCandidate]
+
+
+class RecurringCharge(TypedDict):
+    """Recurring charge detected for one merchant"""
+
+    merchant: str
+    cadence: str
+    intervalDays: int
+    occurrences: int
+    amount: float
+    amountStability: float
+    monthlyCost: float
+    kind: str
+    firstDate: str
+    lastDate: str
+    nextDate: str
+    active: bool
+    confidence: int
+
+
 class ErrorResponse(TypedDict):
     """Standard error response structure"""
 
+    success: bool
     error: str
 
 
@@ -3,16 +3,114 @@ Envelope Integrity Audit Logic
 Analyzes budget data for integrity violations and inconsistencies
 """
 
+from collections.abc import Iterator
 from datetime import UTC, datetime
 from typing import Any, Literal
 
+from api.metrics import timed
 from api.models import (
     AuditSnapshot,
+    BudgetMetadata,
     Envelope,
     IntegrityAuditResult,
     IntegrityViolation,
     Transaction,
 )
+from api.tracing import start_span
+
+# Transaction fields that must reference an existing envelope, in check order
+ORPHAN_REFERENCE_FIELDS = ("envelopeId", "fromEnvelopeId", "toEnvelopeId")
+
+# Detail fields violations can be grouped by (see group_violations)
+GROUP_BY_FIELDS = ("missingEnvelopeId",)
+GROUP_SAMPLE_SIZE = 5
+
+
+def audit_timestamp() -> str:
+    """Current UTC time in the audit result's ``timestamp`` format"""
+    return datetime.now(UTC).isoformat().replace("+00:00", "Z")
+
+
+def valid_envelope_ids(envelopes: list[Envelope]) -> set[str]:
+    """IDs transactions may reference: every envelope plus the special "unassigned" """
+    envelope_ids = {env.id for env in envelopes}
+    # Add special "unassigned" envelope ID that's used for income
+    envelope_ids.add("unassigned")
+    return envelope_ids
+
+
+def orphan_violation(
+    field: str,
+    transaction_id: str,
+    envelope_id: str,
+    amount: float,
+    date: str,
+    description: str | None,
+) -> IntegrityViolation:
+    """
+    Violation for a transaction whose ``field`` names a non-existent envelope
+
+    Args:
+        field: One of ORPHAN_REFERENCE_FIELDS
+        transaction_id: The transaction's ID
+        envelope_id: The missing envelope ID
+        amount: Transaction amount
+        date: Transaction date
+        description: Transaction description
+    """
+    if field == "envelopeId":
+        return IntegrityViolation(
+            severity="error",
+            type="orphaned_transaction",
+            message=f"Transaction references non-existent envelope: {envelope_id}",
+            entityId=transaction_id,
+            entityType="transaction",
+            details={
+                "transactionId": transaction_id,
+                "missingEnvelopeId": envelope_id,
+                "amount": amount,
+                "date": date,
+                "description": description,
+            },
+        )
+    # Transfers: fromEnvelopeId is the source, toEnvelopeId the destination
+    side, kind = (
+        ("source", "transfer_from") if field == "fromEnvelopeId" else ("destination", "transfer_to")
+    )
+    return IntegrityViolation(
+        severity="error",
+        type="orphaned_transaction",
+        message=f"Transfer transaction references non-existent {side} envelope: {envelope_id}",
+        entityId=transaction_id,
+        entityType="transaction",
+        details={
+            "transactionId": transaction_id,
+            "missingEnvelopeId": envelope_id,
+            "amount": amount,
+            "type": kind,
+        },
+    )
+
+
+def _traced_check(
+    check: str, rows: int, violations: Iterator[IntegrityViolation]
+) -> Iterator[IntegrityViolation]:
+    """
+    Pass a check's violations through inside an ``audit.check`` span
+
+    The span is not activated because streaming responses resume this
+    generator from different contexts; when streaming, its duration also
+    covers the time spent sending each violation.
+    """
+    check_span = start_span("audit.check", check=check, rows=rows)
+    found = 0
+    try:
+        for violation in violations:
+            found += 1
+            yield violation
+    finally:
+        check_span.set_attribute("violations", found)
+        check_span.end()
 
 
 class EnvelopeIntegrityAuditor:
@@ -23,6 +121,7 @@ class EnvelopeIntegrityAuditor:
     This class is stateless - each audit() call is independent.
     """
 
+    @timed("EnvelopeIntegrityAuditor.audit")
     def audit(self, snapshot: AuditSnapshot) -> IntegrityAuditResult:
         """
         Perform complete integrity audit on budget snapshot
@@ -33,15 +132,7 @@ class EnvelopeIntegrityAuditor:
         Returns:
             IntegrityAuditResult with all violations found
         """
-        violations: list[IntegrityViolation] = []
-
-        # Build envelope ID set for efficient lookup
-        envelope_ids = self._build_envelope_id_set(snapshot.envelopes)
-
-        # Run all audit checks
-        self._check_orphaned_transactions(snapshot.transactions, envelope_ids, violations)
-        self._check_negative_envelopes(snapshot.envelopes, violations)
-        self._check_balance_leakage(snapshot, violations)
+        violations = list(self.iter_violations(snapshot))
 
         # Generate summary statistics
         summary = self._generate_summary(violations)
@@ -49,14 +140,158 @@ class EnvelopeIntegrityAuditor:
         return IntegrityAuditResult(
             violations=violations,
             summary=summary,
-            timestamp=datetime.now(UTC).isoformat().replace("+00:00", "Z"),
+            timestamp=self._timestamp(),
+            snapshotSize=self._snapshot_size(snapshot),
+        )
+
+    @timed("EnvelopeIntegrityAuditor.audit_with_orphans")
+    def audit_with_orphans(
+        self,
+        envelopes: list[Envelope],
+        metadata: BudgetMetadata,
+        orphans: list[IntegrityViolation],
+        transaction_count: int,
+    ) -> IntegrityAuditResult:
+        """
+        Finish an audit whose orphaned-transaction check already ran elsewhere
+
+        Used by the sharded audit (api/sharded_audit.py), which scans the
+        transactions across worker processes.
+
+        Args:
+            envelopes: All envelopes
+            metadata: Budget metadata
+            orphans: Orphaned-transaction violations in transaction order
+            transaction_count: Number of transactions the orphans came from
+
+        Returns:
+            IntegrityAuditResult matching what audit() reports for the full snapshot
+        """
+        envelope_only = AuditSnapshot.model_construct(
+            envelopes=envelopes, transactions=[], metadata=metadata
+        )
+        violations = [*orphans, *self.iter_violations(envelope_only)]
+        return IntegrityAuditResult(
+            violations=violations,
+            summary=self._generate_summary(violations),
+            timestamp=self._timestamp(),
             snapshotSize={
-                "envelopes": len(snapshot.envelopes),
-                "transactions": len(snapshot.transactions),
+                "envelopes": len(envelopes),
+                "transactions": transaction_count,
                 "metadata": 1,
             },
         )
 
+    def iter_violations(self, snapshot: AuditSnapshot) -> Iterator[IntegrityViolation]:
+        """
+        Yield violations as each audit check produces them
+
+        Used directly by streaming responses so the first violation can be
+        sent before the whole audit finishes.
+
+        Args:
+            snapshot: Complete budget data snapshot
+
+        Yields:
+            IntegrityViolation in the same order audit() reports them
+        """
+        # Build envelope ID set for efficient lookup
+        envelope_ids = self._build_envelope_id_set(snapshot.envelopes)
+
+        # Run all audit checks
+        yield from _traced_check(
+            "orphaned_transactions",
+            len(snapshot.transactions),
+            self._check_orphaned_transactions(snapshot.transactions, envelope_ids),
+        )
+        yield from _traced_check(
+            "negative_envelopes",
+            len(snapshot.envelopes),
+            self._check_negative_envelopes(snapshot.envelopes),
+        )
+        yield from _traced_check(
+            "balance_leakage", len(snapshot.envelopes), self._check_balance_leakage(snapshot)
+        )
+
+    def group_violations(
+        self, violations: list[IntegrityViolation], group_by: str
+    ) -> list[IntegrityViolation]:
+        """
+        Collapse violations sharing a detail value into one violation per value
+
+        For ``missingEnvelopeId`` all orphans of one deleted envelope become a
+        single violation carrying the count, amount total and sample IDs.
+        Violations without the field pass through unchanged; groups keep the
+        position of their first member.
+
+        Args:
+            violations: Violations in audit order
+            group_by: Detail field to group on (one of GROUP_BY_FIELDS)
+
+        Returns:
+            Grouped violations
+
+        Raises:
+            ValueError: If group_by is not supported
+        """
+        if group_by not in GROUP_BY_FIELDS:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+
+        # Each slot is either an ungrouped violation or the key of a group
+        slots: list[IntegrityViolation | str] = []
+        groups: dict[str, dict[str, Any]] = {}
+        for violation in violations:
+            details = violation.details or {}
+            value = details.get(group_by)
+            if value is None:
+                slots.append(violation)
+                continue
+
+            group = groups.get(value)
+            if group is None:
+                group = {"first": violation, "count": 0, "totalAmount": 0.0, "sampleIds": []}
+                groups[value] = group
+                slots.append(value)
+            group["count"] += 1
+            group["totalAmount"] += details.get("amount") or 0
+            if len(group["sampleIds"]) < GROUP_SAMPLE_SIZE:
+                group["sampleIds"].append(violation.entityId)
+
+        grouped: list[IntegrityViolation] = []
+        for slot in slots:
+            if isinstance(slot, IntegrityViolation):
+                grouped.append(slot)
+                continue
+            group = groups[slot]
+            count = group["count"]
+            noun = "transaction references" if count == 1 else "transactions reference"
+            grouped.append(
+                IntegrityViolation(
+                    severity=group["first"].severity,
+                    type=group["first"].type,
+                    message=f"{count} {noun} non-existent envelope: {slot}",
+                    entityId=slot,
+                    entityType="envelope",
+                    details={
+                        group_by: slot,
+                        "count": count,
+                        "totalAmount": round(group["totalAmount"], 2),
+                        "sampleIds": group["sampleIds"],
+                    },
+                )
+            )
+        return grouped
+
+    def _timestamp(self) -> str:
+        return audit_timestamp()
+
+    def _snapshot_size(self, snapshot: AuditSnapshot) -> dict[str, int]:
+        return {
+            "envelopes": len(snapshot.envelopes),
+            "transactions": len(snapshot.transactions),
+            "metadata": 1,
+        }
+
     def _build_envelope_id_set(self, envelopes: list[Envelope]) -> set[str]:
         """
         Build a set of valid envelope IDs for fast lookup
@@ -67,90 +302,40 @@ class EnvelopeIntegrityAuditor:
         Returns:
             Set of envelope IDs (including "unassigned" special envelope)
         """
-        envelope_ids = {env.id for env in envelopes}
-        # Add special "unassigned" envelope ID that's used for income
-        envelope_ids.add("unassigned")
-        return envelope_ids
+        return valid_envelope_ids(envelopes)
 
     def _check_orphaned_transactions(
         self,
         transactions: list[Transaction],
         envelope_ids: set[str],
-        violations: list[IntegrityViolation],
-    ) -> None:
+    ) -> Iterator[IntegrityViolation]:
         """
         Check for transactions pointing to non-existent envelopes
 
         Args:
             transactions: List of all transactions
             envelope_ids: Set of valid envelope IDs
-            violations: List to append violations to
+
+        Yields:
+            One violation per dangling envelope reference
         """
         for txn in transactions:
-            # Check main envelopeId
-            if txn.envelopeId and txn.envelopeId not in envelope_ids:
-                violations.append(
-                    IntegrityViolation(
-                        severity="error",
-                        type="orphaned_transaction",
-                        message=f"Transaction references non-existent envelope: {txn.envelopeId}",
-                        entityId=txn.id,
-                        entityType="transaction",
-                        details={
-                            "transactionId": txn.id,
-                            "missingEnvelopeId": txn.envelopeId,
-                            "amount": txn.amount,
-                            "date": txn.date,
-                            "description": txn.description,
-                        },
+            for field in ORPHAN_REFERENCE_FIELDS:
+                envelope_id = getattr(txn, field)
+                if envelope_id and envelope_id not in envelope_ids:
+                    yield orphan_violation(
+                        field, txn.id, envelope_id, txn.amount, txn.date, txn.description
                     )
-                )
 
-            # Check fromEnvelopeId for transfers
-            if txn.fromEnvelopeId and txn.fromEnvelopeId not in envelope_ids:
-                violations.append(
-                    IntegrityViolation(
-                        severity="error",
-                        type="orphaned_transaction",
-                        message=f"Transfer transaction references non-existent source envelope: {txn.fromEnvelopeId}",
-                        entityId=txn.id,
-                        entityType="transaction",
-                        details={
-                            "transactionId": txn.id,
-                            "missingEnvelopeId": txn.fromEnvelopeId,
-                            "amount": txn.amount,
-                            "type": "transfer_from",
-                        },
-                    )
-                )
-
-            # Check toEnvelopeId for transfers
-            if txn.toEnvelopeId and txn.toEnvelopeId not in envelope_ids:
-                violations.append(
-                    IntegrityViolation(
-                        severity="error",
-                        type="orphaned_transaction",
-                        message=f"Transfer transaction references non-existent destination envelope: {txn.toEnvelopeId}",
-                        entityId=txn.id,
-                        entityType="transaction",
-                        details={
-                            "transactionId": txn.id,
-                            "missingEnvelopeId": txn.toEnvelopeId,
-                            "amount": txn.amount,
-                            "type": "transfer_to",
-                        },
-                    )
-                )
-
-    def _check_negative_envelopes(
-        self, envelopes: list[Envelope], violations: list[IntegrityViolation]
-    ) -> None:
+    def _check_negative_envelopes(self, envelopes: list[Envelope]) -> Iterator[IntegrityViolation]:
         """
         Check for envelopes with negative balances (unless explicitly allowed)
 
         Args:
             envelopes: List of all envelopes
-            violations: List to append violations to
+
+        Yields:
+            One violation per envelope with a negative balance
         """
         for env in envelopes:
             # Skip if balance is not set or envelope is archived
@@ -165,32 +350,30 @@ class EnvelopeIntegrityAuditor:
                     "warning" if env.type in ["bill", "variable"] else "error"
                 )
 
-                violations.append(
-                    IntegrityViolation(
-                        severity=severity,
-                        type="negative_balance",
-                        message=f"Envelope has negative balance: {env.name} (${env.currentBalance:.2f})",
-                        entityId=env.id,
-                        entityType="envelope",
-                        details={
-                            "envelopeId": env.id,
-                            "envelopeName": env.name,
-                            "currentBalance": env.currentBalance,
-                            "envelopeType": env.type,
-                            "category": env.category,
-                        },
-                    )
+                yield IntegrityViolation(
+                    severity=severity,
+                    type="negative_balance",
+                    message=f"Envelope has negative balance: {env.name} (${env.currentBalance:.2f})",
+                    entityId=env.id,
+                    entityType="envelope",
+                    details={
+                        "envelopeId": env.id,
+                        "envelopeName": env.name,
+                        "currentBalance": env.currentBalance,
+                        "envelopeType": env.type,
+                        "category": env.category,
+                    },
                 )
 
-    def _check_balance_leakage(
-        self, snapshot: AuditSnapshot, violations: list[IntegrityViolation]
-    ) -> None:
+    def _check_balance_leakage(self, snapshot: AuditSnapshot) -> Iterator[IntegrityViolation]:
         """
         Check for balance leakage: Sum of envelope balances + unassigned != total account balance
 
         Args:
             snapshot: Complete budget snapshot
-            violations: List to append violations to
+
+        Yields:
+            A missing_data or balance_leakage violation when applicable
         """
         # Calculate sum of all envelope balances
         total_envelope_balance = sum(
@@ -205,18 +388,16 @@ class EnvelopeIntegrityAuditor:
 
         # If actual balance is not set, we can't check for leakage
         if actual_balance is None:
-            violations.append(
-                IntegrityViolation(
-                    severity="warning",
-                    type="missing_data",
-                    message="Cannot check balance leakage: actualBalance not set in metadata",
-                    entityId=snapshot.metadata.id,
-                    entityType="budget",
-                    details={
-                        "totalEnvelopeBalance": total_envelope_balance,
-                        "unassignedCash": unassigned_cash,
-                    },
-                )
+            yield IntegrityViolation(
+                severity="warning",
+                type="missing_data",
+                message="Cannot check balance leakage: actualBalance not set in metadata",
+                entityId=snapshot.metadata.id,
+                entityType="budget",
+                details={
+                    "totalEnvelopeBalance": total_envelope_balance,
+                    "unassignedCash": unassigned_cash,
+                },
             )
             return
 
@@ -229,24 +410,22 @@ class EnvelopeIntegrityAuditor:
         tolerance = getattr(self, "balance_leakage_tolerance", 0.01)
 
         if discrepancy > tolerance:
-            violations.append(
-                IntegrityViolation(
-                    severity="error",
-                    type="balance_leakage",
-                    message=f"Balance leakage detected: Expected ${expected_balance:.2f}, but actual is ${actual_balance:.2f} (diff: ${discrepancy:.2f})",
-                    entityId=snapshot.metadata.id,
-                    entityType="budget",
-                    details={
-                        "actualBalance": actual_balance,
-                        "expectedBalance": expected_balance,
-                        "totalEnvelopeBalance": total_envelope_balance,
-                        "unassignedCash": unassigned_cash,
-                        "discrepancy": discrepancy,
-                        "percentageOff": (discrepancy / actual_balance * 100)
-                        if actual_balance != 0
-                        else 0,
-                    },
-                )
+            yield IntegrityViolation(
+                severity="error",
+                type="balance_leakage",
+                message=f"Balance leakage detected: Expected ${expected_balance:.2f}, but actual is ${actual_balance:.2f} (diff: ${discrepancy:.2f})",
+                entityId=snapshot.metadata.id,
+                entityType="budget",
+                details={
+                    "actualBalance": actual_balance,
+                    "expectedBalance": expected_balance,
+                    "totalEnvelopeBalance": total_envelope_balance,
+                    "unassignedCash": unassigned_cash,
+                    "discrepancy": discrepancy,
+                    "percentageOff": (discrepancy / actual_balance * 100)
+                    if actual_balance != 0
+                    else 0,
+                },
             )
 
     def _generate_summary(self, violations: list[IntegrityViolation]) -> dict[str, Any]:
@@ -259,19 +438,61 @@ class EnvelopeIntegrityAuditor:
         Returns:
             Dictionary with counts by severity and type
         """
-        summary: dict[str, Any] = {
-            "total": len(violations),
+        summary = self._empty_summary()
+        for violation in violations:
+            self._count_violation(summary, violation)
+        return summary
+
+    def _empty_summary(self) -> dict[str, Any]:
+        return {
+            "total": 0,
             "by_severity": {"error": 0, "warning": 0, "info": 0},
             "by_type": {},
         }
 
-        for violation in violations:
-            # Count by severity
-            summary["by_severity"][violation.severity] += 1
+    def _count_violation(self, summary: dict[str, Any], violation: IntegrityViolation) -> None:
+        """Add one violation to a summary built by _empty_summary()"""
+        summary["total"] += 1
 
-            # Count by type
-            if violation.type not in summary["by_type"]:
-                summary["by_type"][violation.type] = 0
-            summary["by_type"][violation.type] += 1
+        # Count by severity
+        summary["by_severity"][violation.severity] += 1
 
-        return summary
+        # Count by type
+        if violation.type not in summary["by_type"]:
+            summary["by_type"][violation.type] = 0
+        summary["by_type"][violation.type] += 1
+
+    def stream_ndjson(self, snapshot: AuditSnapshot, batch_size: int = 500) -> Iterator[bytes]:
+        """
+        Stream the audit as newline-delimited JSON
+
+        Each violation is one line, emitted as the checks produce it (in
+        batches of ``batch_size`` lines per chunk). The final line carries the
+        summary, timestamp and snapshotSize of the equivalent
+        IntegrityAuditResult.
+
+        Args:
+            snapshot: Complete budget data snapshot
+            batch_size: Violations per yielded chunk
+
+        Yields:
+            UTF-8 encoded NDJSON chunks
+        """
+        summary = self._empty_summary()
+        batch: list[str] = []
+        for violation in self.iter_violations(snapshot):
+            self._count_violation(summary, violation)
+            batch.append(violation.model_dump_json())
+            if len(batch) >= batch_size:
+                yield ("\n".join(batch) + "\n").encode()
+                batch = []
+        if batch:
+            yield ("\n".join(batch) + "\n").encode()
+
+        trailer = IntegrityAuditResult(
+            violations=[],
+            summary=summary,
+            timestamp=self._timestamp(),
+            snapshotSize=self._snapshot_size(snapshot),
+        ).model_dump_json(exclude={"violations"})
+        yield (trailer + "\n").encode()
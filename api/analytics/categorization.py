@@ -1,35 +1,558 @@
 """
 Merchant Categorization API - v2.0 Polyglot Backend
 Handles merchant pattern analysis and envelope suggestions
+
+Requests may carry their own ``patterns`` (category -> pattern, merged over
+MERCHANT_PATTERNS), optionally for a ``userId``. The compiled matcher is
+cached by (user, content hash), so later requests can send just the
+returned ``patternVersion``; see PatternSetStore.
 """
 
+import hashlib
+import heapq
 import json
 import os
 import re
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import cache
+from typing import Any, cast
+
+from api.endpoint import (
+    EndpointResult,
+    JSONEndpointHandler,
+    RequestError,
+    decode_json_object,
+    error_body,
+    run_cached_endpoint,
+    run_endpoint,
+)
+from api.metrics import record_cache_lookup, timed
+from api.result_cache import cache_key, load_result, store_result
+from api.state_log import LogPosition, StateLog, StateStore, require_shared_state
+from api.tracing import span
 
 # Import shared types
-import sys
-from http.server import BaseHTTPRequestHandler
-from typing import Any
-
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from . import ErrorResponse, MerchantSuggestion
-
-# Merchant pattern matchers (ported from suggestionUtils.ts)
-MERCHANT_PATTERNS = {
-    "Online Shopping": re.compile(r"amazon|amzn|ebay|etsy|online", re.IGNORECASE),
-    "Coffee & Drinks": re.compile(r"starbucks|coffee|cafe|dunkin|dutch|brew", re.IGNORECASE),
-    "Gas Stations": re.compile(r"shell|exxon|chevron|bp|mobil|gas|fuel", re.IGNORECASE),
-    "Subscriptions": re.compile(r"netflix|spotify|hulu|disney|prime|subscription", re.IGNORECASE),
-    "Rideshare": re.compile(r"uber|lyft|taxi|ride", re.IGNORECASE),
-    "Pharmacy": re.compile(r"cvs|walgreens|pharmacy|drug", re.IGNORECASE),
-    "Fast Food": re.compile(r"mcdonald|burger|taco|pizza|subway|kfc|wendy", re.IGNORECASE),
-    "Grocery Delivery": re.compile(r"instacart|shipt|fresh|delivery", re.IGNORECASE),
-    "Streaming": re.compile(r"netflix|hulu|disney|hbo|paramount|apple.*tv", re.IGNORECASE),
-    "Fitness": re.compile(r"gym|fitness|planet|la.*fitness|crossfit", re.IGNORECASE),
+from . import UNASSIGNED_ENVELOPE_IDS, MerchantCluster, MerchantSuggestion
+from .heavy_hitters import SpaceSaving
+
+# Merchant pattern sources (ported from suggestionUtils.ts); compiled lazily on
+# first use so cold starts that never categorize do not pay for it
+MERCHANT_PATTERNS: dict[str, str] = {
+    "Online Shopping": r"amazon|amzn|ebay|etsy|online",
+    "Coffee & Drinks": r"starbucks|coffee|cafe|dunkin|dutch|brew",
+    "Gas Stations": r"shell|exxon|chevron|bp|mobil|gas|fuel",
+    "Subscriptions": r"netflix|spotify|hulu|disney|prime|subscription",
+    "Rideshare": r"uber|lyft|taxi|ride",
+    "Pharmacy": r"cvs|walgreens|pharmacy|drug",
+    "Fast Food": r"mcdonald|burger|taco|pizza|subway|kfc|wendy",
+    "Grocery Delivery": r"instacart|shipt|fresh|delivery",
+    "Streaming": r"netflix|hulu|disney|hbo|paramount|apple.*tv",
+    "Fitness": r"gym|fitness|planet|la.*fitness|crossfit",
 }
 
 
+DEFAULT_DESCRIPTION_CACHE_ENTRIES = 65_536
+
+# Custom pattern sets: compiled sets kept warm, descriptions cached per set,
+# and limits on what a request may send
+DEFAULT_PATTERN_SETS = 256
+PATTERN_SET_DESCRIPTION_ENTRIES = 4096
+
+# Unmatched descriptions a MerchantAggregator tracks exactly before the
+# lightest ones are sketched (see heavy_hitters.SpaceSaving)
+DEFAULT_UNMATCHED_ENTRIES = 8192
+MAX_CUSTOM_PATTERNS = 200
+MAX_PATTERN_LENGTH = 1000
+
+# Thresholds for suggesting an envelope
+MIN_AMOUNT = 50
+MIN_TRANSACTIONS = 3
+BUFFER_PERCENTAGE = 1.1
+MAX_SUGGESTIONS = 10
+MAX_CLUSTER_EXAMPLES = 5
+
+# MinHash/LSH clustering of descriptions no pattern matches: 8 bands of 4
+# rows put the LSH threshold near a Jaccard similarity of 0.6
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+CLUSTER_SIMILARITY = 0.5
+MAX_BUCKET_COMPARISONS = 8
+# Largest prime below 2**30, so hash values stay single-digit Python ints
+_MINHASH_PRIME = 1_073_741_789
+_CLUSTER_NOISE = re.compile(r"[^\w ]|[\d_]")
+
+# [spend, transactions] per category of each "YYYY-MM" month
+MonthlyRollup = dict[str, dict[str, list[float]]]
+
+# Spend per category, transactions per category, the sketch of [spend,
+# transactions] per description no pattern matched, and the monthly rollup
+# of dated rows
+MerchantSpending = tuple[dict[str, float], dict[str, int], SpaceSaving, MonthlyRollup]
+
+# (description, amount, envelope ID, date) of one row of a user's rollup
+RollupRow = tuple[str | None, float, Any, Any]
+
+# How monthlyAverage is computed (see monthly_averages)
+AVERAGING_METHODS = ("mean", "median", "trailing")
+DEFAULT_TRAILING_MONTHS = 3
+DEFAULT_ROLLUP_USERS = 256
+
+_MONTH = re.compile(r"\d{4}-(?:0[1-9]|1[0-2])")
+_DAY = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Characters that make a pattern alternative more than a plain keyword
+_REGEX_SYNTAX = re.compile(r"[.^$*+?{}\[\]\\|()]")
+# Digit-free literals joined by ".*" wildcards: the only patterns that cannot
+# tell one run of digits from another, so descriptions may fold digit runs
+_DIGIT_BLIND_ALTERNATIVE = re.compile(r"[^.^$*+?{}\[\]\\|()\d]*(?:\.\*[^.^$*+?{}\[\]\\|()\d]*)*")
+# A user keyword rule alternative: a literal, or two joined by one ".*"
+_KEYWORD_RULE = re.compile(r"[^.^$*+?{}\[\]\\|()]+(?:\.\*[^.^$*+?{}\[\]\\|()]+)?")
+_DIGIT_RUN = re.compile(r"\d+")
+
+
+def _trie_alternation(keywords: list[str]) -> str:
+    """Alternation of ``keywords`` factored by common prefix (``sub(?:way|scription)``)"""
+    trie: dict[str, Any] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: dict[str, Any]) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if "" in node else "")
+
+    return emit(trie)
+
+
+class MerchantMatcher:
+    """
+    Matches a description against every merchant pattern in one pass
+
+    Plain keyword alternatives of all patterns are compiled into a single
+    prefix-factored regex that reports each keyword occurrence, overlapping
+    ones included. Each keyword maps to the categories of every keyword it
+    starts with, so a shorter keyword hidden by a longer match at the same
+    position still counts, and netflix reports both Subscriptions and
+    Streaming. Alternatives with regex syntax (``apple.*tv``) are keyed by
+    their leading literal and confirmed with their own regex. A category
+    whose pattern has no such literal is always searched separately.
+
+    The result is the same as running ``re.search`` with each pattern in
+    turn and ``re.IGNORECASE``. ASCII descriptions are lowercased and
+    matched case-sensitively, which is several times faster. Other text
+    keeps the case-insensitive regex, since it also matches characters
+    such as ``ſ`` (long s) to ``s``.
+    """
+
+    def __init__(self, patterns: dict[str, str]):
+        self.categories = list(patterns)
+        # Only plain keywords (and ".*" between them) cannot tell "#1234" from "#0";
+        # ".", "\d", "\w", classes and counted repeats all can
+        self.digit_insensitive = all(
+            _DIGIT_BLIND_ALTERNATIVE.fullmatch(alternative)
+            for pattern in patterns.values()
+            for alternative in pattern.split("|")
+        )
+        order = {category: index for index, category in enumerate(self.categories)}
+        keywords: dict[str, set[int]] = {}
+        # Leading literal -> (category index, regex) checks it triggers
+        self._confirm: dict[str, list[tuple[int, re.Pattern[str]]]] = {}
+        # Categories searched on every description
+        self._always: list[tuple[int, re.Pattern[str]]] = []
+
+        for category, pattern in patterns.items():
+            index = order[category]
+            if "(" in pattern or "[" in pattern or "\\" in pattern:
+                self._always.append((index, re.compile(pattern, re.IGNORECASE)))
+                continue
+            for alternative in pattern.split("|"):
+                syntax = _REGEX_SYNTAX.search(alternative)
+                if syntax is None and alternative.isascii():
+                    keywords.setdefault(alternative.lower(), set()).add(index)
+                    continue
+                trigger = alternative[: syntax.start()] if syntax else ""
+                trigger = trigger.lower() if trigger.isascii() else ""
+                check = (index, re.compile(alternative, re.IGNORECASE))
+                if trigger:
+                    keywords.setdefault(trigger, set())
+                    self._confirm.setdefault(trigger, []).append(check)
+                else:
+                    self._always.append(check)
+
+        # A match on a keyword also means a match on every keyword it starts with
+        self._keyword_categories = {
+            keyword: frozenset(
+                index
+                for prefix, indices in keywords.items()
+                if keyword.startswith(prefix)
+                for index in indices
+            )
+            for keyword in keywords
+        }
+        self._confirm = {
+            keyword: [
+                check
+                for prefix, checks in self._confirm.items()
+                if keyword.startswith(prefix)
+                for check in checks
+            ]
+            for keyword in keywords
+            if any(keyword.startswith(prefix) for prefix in self._confirm)
+        }
+        # Categories of a lone keyword, the common case, in pattern order
+        self._keyword_match = {
+            keyword: [self.categories[index] for index in sorted(indices)]
+            for keyword, indices in self._keyword_categories.items()
+        }
+        source = f"(?=({_trie_alternation(sorted(keywords))}))" if keywords else "(?!)"
+        self._pattern = re.compile(source)
+        self._folded_pattern = re.compile(source, re.IGNORECASE)
+
+    def normalize(self, description: str) -> str:
+        """
+        Cache key for ``description``: lowercased, with digit runs collapsed
+
+        Store numbers and dates are folded only when ``digit_insensitive``,
+        so match(normalize(d)) always equals match(d.lower()).
+        """
+        description = description.lower()
+        if self.digit_insensitive:
+            return _DIGIT_RUN.sub("0", description)
+        return description
+
+    def _keyword_for(self, text: str) -> str:
+        """Keyword of a case-insensitive match such as ``ſhell``"""
+        if text.lower() in self._keyword_categories:
+            return text.lower()
+        return next(
+            keyword
+            for keyword in self._keyword_categories
+            if re.fullmatch(re.escape(keyword), text, re.IGNORECASE)
+        )
+
+    def match(self, description: str) -> list[str]:
+        """Categories whose pattern matches ``description``, in pattern order"""
+        if description.isascii():
+            found = set(self._pattern.findall(description.lower()))
+        else:
+            found = {self._keyword_for(text) for text in self._folded_pattern.findall(description)}
+        if not self._always:
+            if not found:
+                return []
+            if len(found) == 1:
+                (key,) = found
+                if key not in self._confirm:
+                    return list(self._keyword_match[key])
+        matched: set[int] = set()
+        for key in found:
+            matched.update(self._keyword_categories[key])
+            for index, regex in self._confirm.get(key, ()):
+                if index not in matched and regex.search(description):
+                    matched.add(index)
+        for index, regex in self._always:
+            if index not in matched and regex.search(description):
+                matched.add(index)
+        return [self.categories[index] for index in sorted(matched)]
+
+
+@cache
+def merchant_matcher() -> MerchantMatcher:
+    """Compile MERCHANT_PATTERNS once per process"""
+    return MerchantMatcher(MERCHANT_PATTERNS)
+
+
+class DescriptionCache:
+    """
+    Bounded LRU of normalized description -> matched categories
+
+    Shared by every request a warm worker serves, so a merchant that
+    repeats across rows and users is matched once.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_DESCRIPTION_CACHE_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, ...]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DescriptionCache":
+        """
+        Build a cache from environment configuration
+
+        - ANALYTICS_DESCRIPTION_CACHE_ENTRIES: descriptions kept (default 65536, 0 disables)
+        """
+        return cls(
+            int(
+                os.environ.get(
+                    "ANALYTICS_DESCRIPTION_CACHE_ENTRIES", DEFAULT_DESCRIPTION_CACHE_ENTRIES
+                )
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> tuple[str, ...] | None:
+        with self._lock:
+            categories = self._entries.get(key)
+            if categories is not None:
+                self._entries.move_to_end(key)
+            return categories
+
+    def put(self, key: str, categories: tuple[str, ...]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = categories
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+@cache
+def description_cache() -> DescriptionCache:
+    """The process-wide cache used by analyze_merchant_patterns"""
+    return DescriptionCache.from_env()
+
+
+def match_descriptions(
+    matcher: MerchantMatcher, cache: DescriptionCache, descriptions: list[str]
+) -> list[tuple[str, ...]]:
+    """
+    Categories of each description, skipping the matcher for cached ones
+
+    Exact repeats within the call are answered from a local dict before
+    normalizing. Hits and misses are exported as
+    ``analytics_cache_hit_ratio{cache="merchant_categories"}``.
+    """
+    results: list[tuple[str, ...]] = []
+    seen: dict[str, tuple[str, ...]] = {}
+    misses = 0
+    for description in descriptions:
+        categories = seen.get(description)
+        if categories is None:
+            key = matcher.normalize(description)
+            categories = cache.get(key)
+            if categories is None:
+                categories = tuple(matcher.match(key))
+                cache.put(key, categories)
+                misses += 1
+            seen[description] = categories
+        results.append(categories)
+    if cache.max_entries > 0:
+        record_cache_lookup("merchant_categories", True, len(descriptions) - misses)
+        record_cache_lookup("merchant_categories", False, misses)
+    return results
+
+
+def pattern_version(patterns: dict[str, str]) -> str:
+    """Content hash identifying a custom pattern set"""
+    canonical = json.dumps(patterns, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def validate_patterns(patterns: Any) -> dict[str, str]:
+    """
+    Check a custom pattern set: category -> keyword rule
+
+    A rule is keywords separated by ``|``, matched case-insensitively
+    anywhere in the description; a keyword may join two literals with one
+    ``.*`` (``apple.*tv``), like the default patterns. Other regex syntax
+    (groups, classes, quantifiers, backreferences) is rejected, so user
+    rules can never backtrack catastrophically. An empty rule drops the
+    default category of that name.
+
+    Raises:
+        RequestError: If it is not a small object of keyword rules
+    """
+    if not isinstance(patterns, dict) or not patterns:
+        raise RequestError("patterns must be a non-empty object of category -> pattern")
+    if len(patterns) > MAX_CUSTOM_PATTERNS:
+        raise RequestError(f"patterns may define at most {MAX_CUSTOM_PATTERNS} categories")
+    for category, pattern in patterns.items():
+        if not category or not isinstance(pattern, str) or len(pattern) > MAX_PATTERN_LENGTH:
+            raise RequestError(
+                f"patterns.{category} must be a string of at most {MAX_PATTERN_LENGTH} characters"
+            )
+        if pattern and not all(_KEYWORD_RULE.fullmatch(k) for k in pattern.split("|")):
+            raise RequestError(
+                f"patterns.{category} is not a valid pattern: use keywords separated by |, "
+                "each with at most one .* wildcard"
+            )
+    return patterns
+
+
+class PatternSet:
+    """A user's compiled patterns with their own description cache"""
+
+    def __init__(self, user_id: str | None, patterns: dict[str, str]) -> None:
+        self.user_id = user_id
+        self.patterns = patterns
+        self.version = pattern_version(patterns)
+        # User categories replace same-named defaults; an empty pattern drops one
+        merged = {**MERCHANT_PATTERNS, **patterns}
+        self.matcher = MerchantMatcher({c: p for c, p in merged.items() if p})
+        self.cache = DescriptionCache(PATTERN_SET_DESCRIPTION_ENTRIES)
+
+
+def _pattern_set_key(user_id: str | None, version: str) -> str:
+    return cache_key("pattern_set", version.encode(), user_id or "")
+
+
+def _latest_version_key(user_id: str) -> str:
+    return cache_key("pattern_set_latest", user_id.encode())
+
+
+class PatternSetStore:
+    """
+    Bounded LRU of compiled pattern sets keyed by (user, version)
+
+    The sets themselves live in the result cache backend, serialized, so a
+    set registered by one process (a fast-lane thread or another worker)
+    resolves in every process sharing the backend; each process compiles
+    it on first use. A user keeps only their latest version: storing a new
+    one records it as the user's latest, and older versions then resolve
+    nowhere, so stale rules are never matched again.
+    """
+
+    def __init__(self, max_sets: int = DEFAULT_PATTERN_SETS) -> None:
+        self.max_sets = max_sets
+        self._sets: OrderedDict[tuple[str | None, str], PatternSet] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "PatternSetStore":
+        """
+        Build a store from environment configuration
+
+        - ANALYTICS_PATTERN_SETS: compiled pattern sets kept warm (default 256, 0 disables)
+        """
+        return cls(int(os.environ.get("ANALYTICS_PATTERN_SETS", DEFAULT_PATTERN_SETS)))
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def _superseded(self, user_id: str | None, version: str) -> bool:
+        """Whether another process stored a newer version for ``user_id``"""
+        if user_id is None:
+            return False
+        latest = load_result("pattern_set_latest", _latest_version_key(user_id))
+        return latest is not None and latest.decode() != version
+
+    def get(self, user_id: str | None, version: str) -> PatternSet | None:
+        """A set compiled in this process, unless the user has a newer version"""
+        with self._lock:
+            pattern_set = self._sets.get((user_id, version))
+            if pattern_set is not None:
+                self._sets.move_to_end((user_id, version))
+        if pattern_set is not None and self._superseded(user_id, version):
+            with self._lock:
+                self._sets.pop((user_id, version), None)
+            pattern_set = None
+        record_cache_lookup("merchant_pattern_sets", pattern_set is not None)
+        return pattern_set
+
+    def load(self, user_id: str | None, version: str) -> PatternSet | None:
+        """Compile a set stored by any process sharing the result cache backend"""
+        stored = load_result("pattern_set", _pattern_set_key(user_id, version))
+        if stored is None or self._superseded(user_id, version):
+            return None
+        pattern_set = PatternSet(user_id, json.loads(stored))
+        self._keep(pattern_set)
+        return pattern_set
+
+    def put(self, pattern_set: PatternSet) -> None:
+        """Store a newly compiled set and make it the user's latest version"""
+        user_id = pattern_set.user_id
+        store_result(
+            _pattern_set_key(user_id, pattern_set.version),
+            json.dumps(pattern_set.patterns).encode(),
+        )
+        if user_id is not None:
+            store_result(_latest_version_key(user_id), pattern_set.version.encode())
+        self._keep(pattern_set)
+
+    def _keep(self, pattern_set: PatternSet) -> None:
+        if self.max_sets <= 0:
+            return
+        user_id = pattern_set.user_id
+        with self._lock:
+            if user_id is not None:
+                for key in [key for key in self._sets if key[0] == user_id]:
+                    del self._sets[key]
+            self._sets[(user_id, pattern_set.version)] = pattern_set
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sets.clear()
+
+
+# Process-wide store, shared by every request a warm worker serves
+pattern_sets = PatternSetStore.from_env()
+
+
+def resolve_pattern_set(request_data: dict[str, Any]) -> tuple[PatternSet | None, bool]:
+    """
+    The custom pattern set a request asks for, compiling it on first use
+
+    ``patterns`` sends the set itself; ``patternVersion`` alone refers to one
+    sent before (by the same ``userId``). Neither means the default patterns.
+
+    Returns:
+        Tuple of (pattern set or None for the defaults, whether it was cached)
+
+    Raises:
+        RequestError: If the set is invalid, its version does not match, or
+            a referenced version is not (or no longer) cached (404)
+    """
+    patterns = request_data.get("patterns")
+    version = request_data.get("patternVersion")
+    if patterns is None and version is None:
+        return None, False
+    require_shared_state("custom pattern sets")
+
+    user_id = request_data.get("userId")
+    if user_id is not None and (not isinstance(user_id, str) or not user_id):
+        raise RequestError("userId must be a non-empty string")
+
+    if patterns is None:
+        pattern_set = pattern_sets.get(user_id, str(version))
+        if pattern_set is not None:
+            return pattern_set, True
+        pattern_set = pattern_sets.load(user_id, str(version))
+        if pattern_set is None:
+            raise RequestError(f"Unknown patternVersion {version}; send the patterns", 404)
+        return pattern_set, False
+
+    patterns = validate_patterns(patterns)
+    expected = pattern_version(patterns)
+    if version is not None and version != expected:
+        raise RequestError("patternVersion does not match patterns")
+    pattern_set = pattern_sets.get(user_id, expected)
+    if pattern_set is not None:
+        return pattern_set, True
+    pattern_set = PatternSet(user_id, patterns)
+    pattern_sets.put(pattern_set)
+    return pattern_set, False
+
+
+@timed("analyze_merchant_patterns")
 def analyze_merchant_patterns(
     transactions: list[dict[str, Any]], months_of_data: int = 1
 ) -> list[MerchantSuggestion]:
@@ -37,121 +560,824 @@ def analyze_merchant_patterns(
     Analyze merchant patterns and suggest envelopes
     Ported from suggestionUtils.ts
     """
-    # Validate months_of_data
-    if months_of_data <= 0:
-        raise ValueError("months_of_data must be a positive integer")
+    return analyze_merchant_columns(*_transaction_columns(transactions), months_of_data)
 
-    MIN_AMOUNT = 50
-    MIN_TRANSACTIONS = 3
-    BUFFER_PERCENTAGE = 1.1
 
-    # Filter unassigned negative transactions
-    unassigned_transactions = [
-        t for t in transactions if t.get("amount", 0) < 0 and not t.get("envelopeId")
+def _transaction_columns(
+    transactions: list[dict[str, Any]],
+) -> tuple[list[str], list[float], list[Any]]:
+    return (
+        [str(t.get("description", "")) for t in transactions],
+        [t.get("amount", 0) for t in transactions],
+        [t.get("envelopeId") for t in transactions],
+    )
+
+
+@timed("merchant_spending")
+def merchant_spending(
+    descriptions: Sequence[str | None],
+    amounts: Sequence[float],
+    envelope_ids: Sequence[Any],
+    pattern_set: PatternSet | None = None,
+    dates: Sequence[Any] | None = None,
+    unmatched: SpaceSaving | None = None,
+) -> MerchantSpending:
+    """
+    Sum unassigned spending per matched category, and per description for
+    the descriptions no pattern matches
+
+    Unassigned expenses are selected by index, and their descriptions are
+    encoded as codes into a table of distinct descriptions (like
+    ``np.unique(..., return_inverse=True)``). Only the distinct descriptions
+    are matched. Spending is then summed per category by scattering the
+    codes' matches back over the rows in order, so totals equal the
+    row-by-row loop's exactly. A missing (None) description matches as "".
+
+    Descriptions are matched with ``pattern_set`` if given, else with
+    MERCHANT_PATTERNS. With ``dates``, matched spending is also rolled up
+    per month in the same pass (rows without an ISO date are left out).
+    Unmatched rows are summed per description in a buffer of at most the
+    ``unmatched`` sketch's capacity, flushed into the sketch whenever it
+    fills, so a bounded sketch bounds their memory too. The default sketch
+    tracks them exactly.
+    """
+    # Filter unassigned negative transactions (no envelopeId, or "unassigned")
+    unassigned = [
+        i
+        for i, (amount, envelope_id) in enumerate(zip(amounts, envelope_ids, strict=True))
+        if amount < 0 and (not envelope_id or envelope_id in UNASSIGNED_ENVELOPE_IDS)
     ]
 
-    merchant_spending: dict[str, dict[str, Any]] = {}
+    distinct: dict[str, int] = {}
+    codes = [distinct.setdefault(descriptions[i] or "", len(distinct)) for i in unassigned]
+    spending: dict[str, float] = {}
+    counts: dict[str, int] = {}
+    if unmatched is None:
+        unmatched = SpaceSaving(0)
+    pending: dict[int, list[float]] = {}
+    monthly: MonthlyRollup = {}
+    row_months = None if dates is None else _row_months(dates, unassigned)
+    if pattern_set is None:
+        matcher, cache = merchant_matcher(), description_cache()
+    else:
+        matcher, cache = pattern_set.matcher, pattern_set.cache
 
-    for transaction in unassigned_transactions:
-        description = str(transaction.get("description", "")).lower()
+    with span(
+        "categorization.match",
+        rows=len(unassigned),
+        transactions=len(amounts),
+        patterns=len(matcher.categories),
+        distinct=len(distinct),
+    ) as match_span:
+        names = list(distinct)
+        matches = match_descriptions(matcher, cache, names)
+        for position, (i, code) in enumerate(zip(unassigned, codes, strict=True)):
+            categories = matches[code]
+            amount = abs(amounts[i])
+            if not categories:
+                totals = pending.get(code)
+                if totals is None:
+                    if 0 < unmatched.capacity <= len(pending):
+                        _flush_unmatched(unmatched, names, pending)
+                    totals = pending[code] = [0, 0]
+                totals[0] += amount
+                totals[1] += 1
+                continue
+            for category in categories:
+                spending[category] = spending.get(category, 0) + amount
+                counts[category] = counts.get(category, 0) + 1
+            month = None if row_months is None else row_months[position]
+            if month is not None:
+                by_category = monthly.setdefault(month, {})
+                for category in categories:
+                    totals = by_category.setdefault(category, [0, 0])
+                    totals[0] += amount
+                    totals[1] += 1
+        _flush_unmatched(unmatched, names, pending)
+        match_span.set_attribute("categories", len(spending))
 
-        for category, pattern in MERCHANT_PATTERNS.items():
-            if pattern.search(description):
-                if category not in merchant_spending:
-                    merchant_spending[category] = {"amount": 0, "count": 0, "transactions": []}
-                merchant_spending[category]["amount"] += abs(transaction.get("amount", 0))
-                merchant_spending[category]["count"] += 1
-                merchant_spending[category]["transactions"].append(transaction)
+    return spending, counts, unmatched, monthly
 
-    # Generate suggestions
-    suggestions: list[MerchantSuggestion] = []
-    for category, data in merchant_spending.items():
-        if data["amount"] >= MIN_AMOUNT and data["count"] >= MIN_TRANSACTIONS:
-            monthly_average = data["amount"] / months_of_data
-            suggested_budget = int(monthly_average * BUFFER_PERCENTAGE)
 
+def _flush_unmatched(
+    unmatched: SpaceSaving, names: list[str], pending: dict[int, list[float]]
+) -> None:
+    """Move buffered [spend, transactions] per description code into the sketch"""
+    for code, (total, count) in pending.items():
+        unmatched.add(names[code], total, int(count))
+    pending.clear()
+
+
+def month_key(value: Any) -> str | None:
+    """The "YYYY-MM" of an ISO date or timestamp string, None if it is not one"""
+    text = str(value)[:7] if value else ""
+    return text if _MONTH.fullmatch(text) else None
+
+
+def _row_months(dates: Sequence[Any], rows: list[int]) -> list[str | None]:
+    """month_key of each row's date, parsed once per distinct date"""
+    months: dict[Any, str | None] = {}
+    result = []
+    for i in rows:
+        day = dates[i]
+        month = months.get(day, "")
+        if month == "":
+            month = months[day] = month_key(day)
+        result.append(month)
+    return result
+
+
+def month_span(monthly: MonthlyRollup) -> list[str]:
+    """Every month from the first to the last with spending, gaps included"""
+    if not monthly:
+        return []
+    first, last = min(monthly), max(monthly)
+    year, month = int(first[:4]), int(first[5:])
+    span = []
+    while True:
+        key = f"{year:04d}-{month:02d}"
+        span.append(key)
+        if key >= last:
+            return span
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def monthly_averages(
+    monthly: MonthlyRollup, averaging: str, trailing_months: int = DEFAULT_TRAILING_MONTHS
+) -> dict[str, float]:
+    """
+    Average monthly spend per category over the rollup's month_span
+
+    - mean: total over the span divided by its length
+    - median: median month of the span (months without spending count as 0)
+    - trailing: mean of the last ``trailing_months`` months of the span
+    """
+    months = month_span(monthly)
+    if averaging == "trailing":
+        months = months[-trailing_months:]
+    categories = {category for by_category in monthly.values() for category in by_category}
+    if averaging == "median":
+        # statistics imports fractions and decimal; keep it off the cold-start path
+        import statistics
+
+    averages = {}
+    for category in categories:
+        series = [monthly.get(month, {}).get(category, (0,))[0] for month in months]
+        if averaging == "median":
+            averages[category] = statistics.median(series)
+        else:
+            averages[category] = sum(series) / len(series)
+    return averages
+
+
+def _budget_fields(monthly_average: float) -> dict[str, Any]:
+    return {
+        "suggestedBudget": int(monthly_average * BUFFER_PERCENTAGE),
+        "monthlyAverage": round(monthly_average, 2),
+    }
+
+
+def merchant_suggestions(
+    spending: dict[str, float],
+    counts: dict[str, int],
+    months_of_data: int,
+    averages: dict[str, float] | None = None,
+) -> list[MerchantSuggestion]:
+    """
+    Top categories with enough spending to deserve an envelope
+
+    The monthly average is ``averages[category]`` if given (see
+    monthly_averages), else the total divided by ``months_of_data``.
+    """
+    suggestions: list[MerchantSuggestion] = []
+    for category, total in spending.items():
+        if total >= MIN_AMOUNT and counts[category] >= MIN_TRANSACTIONS:
             suggestions.append(
                 {
                     "category": category,
-                    "amount": round(data["amount"], 2),
-                    "count": data["count"],
-                    "suggestedBudget": suggested_budget,
-                    "monthlyAverage": round(monthly_average, 2),
+                    "amount": round(total, 2),
+                    "count": counts[category],
+                    **_budget_fields(  # type: ignore[typeddict-item]
+                        total / months_of_data if averages is None else averages.get(category, 0.0)
+                    ),
                 }
             )
 
-    # Sort by amount descending
-    suggestions.sort(key=lambda x: x["amount"], reverse=True)
-    return suggestions[:10]  # Limit to top 10
+    # Largest amounts first (a heap; same order as a full sort)
+    return heapq.nlargest(MAX_SUGGESTIONS, suggestions, key=lambda x: x["amount"])
 
 
-class handler(BaseHTTPRequestHandler):
-    """Vercel serverless function handler for merchant categorization"""
+@timed("analyze_merchant_columns")
+def analyze_merchant_columns(
+    descriptions: Sequence[str | None],
+    amounts: Sequence[float],
+    envelope_ids: Sequence[Any],
+    months_of_data: int = 1,
+) -> list[MerchantSuggestion]:
+    """analyze_merchant_patterns over transaction columns (see merchant_spending)"""
+    # Validate months_of_data
+    if months_of_data <= 0:
+        raise ValueError("months_of_data must be a positive integer")
+
+    spending, counts, _, _ = merchant_spending(descriptions, amounts, envelope_ids)
+    return merchant_suggestions(spending, counts, months_of_data)
+
+
+def cluster_key(description: str) -> str:
+    """Lowercase words of a description: "SQ *ROSA'S BAKERY 555" -> "sq rosas bakery" """
+    return " ".join(_CLUSTER_NOISE.sub(" ", description.lower().replace("'", "")).split())
+
+
+@cache
+def _minhash_coefficients() -> tuple[tuple[int, int], ...]:
+    """Deterministic (a, b) of each ``a * x + b mod p`` hash permutation"""
+    return tuple(
+        (
+            zlib.crc32(b"a%d" % i) % (_MINHASH_PRIME - 1) + 1,
+            zlib.crc32(b"b%d" % i) % _MINHASH_PRIME,
+        )
+        for i in range(MINHASH_PERMUTATIONS)
+    )
+
+
+def minhash_signatures(keys: Sequence[str]) -> list[tuple[int, ...] | None]:
+    """
+    MinHash signature of each key's character shingles
+
+    Shingle hashes are computed once per distinct shingle, so the cost per
+    key is one min over its shingles' hash rows. Keys shorter than a
+    shingle get None.
+    """
+    coefficients = _minhash_coefficients()
+    shingle_hashes: dict[str, tuple[int, ...]] = {}
+    signatures: list[tuple[int, ...] | None] = []
+    for key in keys:
+        rows = []
+        for start in range(len(key) - SHINGLE_SIZE + 1):
+            shingle = key[start : start + SHINGLE_SIZE]
+            hashes = shingle_hashes.get(shingle)
+            if hashes is None:
+                x = zlib.crc32(shingle.encode())
+                hashes = tuple((a * x + b) % _MINHASH_PRIME for a, b in coefficients)
+                shingle_hashes[shingle] = hashes
+            rows.append(hashes)
+        signatures.append(tuple(map(min, zip(*rows, strict=True))) if rows else None)
+    return signatures
+
+
+def lsh_clusters(signatures: Sequence[tuple[int, ...] | None]) -> list[int]:
+    """
+    Cluster label of each signature (the position of one of its members)
+
+    Signatures are split into LSH_BANDS bands. Two signatures sharing a band
+    are candidates, and they are merged (union-find) when their estimated
+    Jaccard similarity reaches CLUSTER_SIMILARITY. Each signature is only
+    compared with the last MAX_BUCKET_COMPARISONS members of each of its
+    buckets, so the cost stays linear in the number of signatures.
+    """
+    parent = list(range(len(signatures)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    min_agreement = CLUSTER_SIMILARITY * MINHASH_PERMUTATIONS
+    buckets: dict[tuple[int, tuple[int, ...]], list[int]] = {}
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(LSH_BANDS):
+            members = buckets.setdefault((band, signature[band * rows : (band + 1) * rows]), [])
+            for other in members[-MAX_BUCKET_COMPARISONS:]:
+                if find(other) == find(i):
+                    continue
+                other_signature = signatures[other]
+                assert other_signature is not None
+                agreement = sum(x == y for x, y in zip(signature, other_signature, strict=True))
+                if agreement >= min_agreement:
+                    parent[find(i)] = find(other)
+            members.append(i)
+    return [find(i) for i in range(len(signatures))]
 
-    def _set_headers(self, status_code: int = 200) -> None:
-        """Set response headers"""
-        self.send_response(status_code)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-
-    def do_OPTIONS(self) -> None:
-        """Handle preflight requests"""
-        self._set_headers(200)
-
-    def do_POST(self) -> None:
-        """Handle POST requests"""
-        try:
-            # Read and parse request body
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length)
-            request_data: dict[str, Any] = json.loads(body)
-
-            transactions = request_data.get("transactions", [])
-            if not transactions:
-                self._send_error(400, "Missing required field: transactions")
-                return
-
-            months_of_data = request_data.get("monthsOfData", 1)
-            if months_of_data is None:
-                months_of_data = 1
-
-            # Validate months_of_data
-            if not isinstance(months_of_data, int) or months_of_data <= 0:
-                self._send_error(400, "monthsOfData must be a positive integer")
-                return
-
-            suggestions = analyze_merchant_patterns(transactions, months_of_data)
-            response = {
-                "success": True,
-                "error": None,
-                "suggestions": suggestions,
+
+@timed("cluster_unmatched_merchants")
+def cluster_unmatched_merchants(
+    unmatched: dict[str, list[float]], months_of_data: int = 1
+) -> list[MerchantCluster]:
+    """
+    Group descriptions no pattern matched into fuzzy merchant clusters
+
+    Descriptions are reduced to their words (cluster_key), so store numbers
+    and punctuation never split a merchant. The distinct keys are then
+    clustered with MinHash over character shingles and LSH bucketing, which
+    is near-linear in the number of keys. Clusters with enough spending are
+    returned like merchant suggestions, named after their most frequent key.
+
+    Args:
+        unmatched: [spend, transactions] per description (see merchant_spending)
+        months_of_data: Months the transactions span
+    """
+    keys: dict[str, list[Any]] = {}
+    for description, (total, count) in unmatched.items():
+        entry = keys.setdefault(cluster_key(description), [0, 0, {}])
+        entry[0] += total
+        entry[1] += count
+        entry[2][description] = count
+
+    with span("categorization.cluster", rows=len(unmatched), keys=len(keys)) as cluster_span:
+        key_list = [key for key in keys if key]
+        labels = lsh_clusters(minhash_signatures(key_list))
+        groups: dict[int, list[str]] = {}
+        for key, label in zip(key_list, labels, strict=True):
+            groups.setdefault(label, []).append(key)
+        cluster_span.set_attribute("clusters", len(groups))
+
+    clusters: list[MerchantCluster] = []
+    for members in groups.values():
+        total = sum(keys[key][0] for key in members)
+        count = sum(keys[key][1] for key in members)
+        if total < MIN_AMOUNT or count < MIN_TRANSACTIONS:
+            continue
+        descriptions: dict[str, int] = {}
+        for key in members:
+            descriptions.update(keys[key][2])
+        # Most frequent key, the shortest on ties
+        name = max(members, key=lambda key: (keys[key][1], -len(key)))
+        clusters.append(
+            {
+                "name": name.title(),
+                "amount": round(total, 2),
+                "count": count,
+                **_budget_fields(total / months_of_data),  # type: ignore[typeddict-item]
+                "descriptions": sorted(descriptions, key=lambda d: -descriptions[d])[
+                    :MAX_CLUSTER_EXAMPLES
+                ],
             }
+        )
+
+    return heapq.nlargest(MAX_SUGGESTIONS, clusters, key=lambda x: x["amount"])
+
+
+class MerchantAggregator:
+    """
+    Running merchant_spending totals over chunks of transaction columns
+
+    Lets a stream of transactions (e.g. a CSV import) be categorized chunk
+    by chunk in fixed memory. Category totals and their monthly rollup are
+    exact (there are only as many categories as patterns). Unmatched
+    descriptions, which grow with the number of distinct merchants, are
+    kept in a Space-Saving sketch of ``max_unmatched`` entries: exact while
+    there are fewer, and past that the heaviest merchants stay exact or
+    over-estimated by at most ``unmatched.max_error``.
+    """
+
+    def __init__(
+        self, pattern_set: PatternSet | None = None, max_unmatched: int | None = None
+    ) -> None:
+        """
+        Args:
+            pattern_set: Custom patterns to match with (default MERCHANT_PATTERNS)
+            max_unmatched: Unmatched descriptions tracked; defaults to
+                ANALYTICS_UNMATCHED_MERCHANTS (8192, 0 tracks all)
+        """
+        if max_unmatched is None:
+            max_unmatched = int(
+                os.environ.get("ANALYTICS_UNMATCHED_MERCHANTS", DEFAULT_UNMATCHED_ENTRIES)
+            )
+        self.pattern_set = pattern_set
+        self.spending: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.monthly: MonthlyRollup = {}
+        self.unmatched = SpaceSaving(max_unmatched)
+        self.rows = 0
+
+    def add(
+        self,
+        descriptions: Sequence[str | None],
+        amounts: Sequence[float],
+        envelope_ids: Sequence[Any],
+        dates: Sequence[Any] | None = None,
+    ) -> None:
+        """Add one chunk of columns (see merchant_spending)"""
+        spending, counts, _, monthly = merchant_spending(
+            descriptions, amounts, envelope_ids, self.pattern_set, dates, self.unmatched
+        )
+        for category, total in spending.items():
+            self.spending[category] = self.spending.get(category, 0) + total
+            self.counts[category] = self.counts.get(category, 0) + counts[category]
+        for month, by_category in monthly.items():
+            merged = self.monthly.setdefault(month, {})
+            for category, (total, count) in by_category.items():
+                totals = merged.setdefault(category, [0, 0])
+                totals[0] += total
+                totals[1] += count
+        self.rows += len(amounts)
 
-            self._set_headers(200)
-            self.wfile.write(json.dumps(response).encode())
+    def remove(
+        self,
+        descriptions: Sequence[str | None],
+        amounts: Sequence[float],
+        envelope_ids: Sequence[Any],
+        dates: Sequence[Any] | None = None,
+    ) -> None:
+        """
+        Take rows added before back out (see add)
 
-        except ValueError as e:
-            self._send_error(400, str(e))
-        except json.JSONDecodeError as e:
-            self._send_error(400, f"Invalid JSON: {str(e)}")
-        except Exception as e:
-            self._send_error(500, f"Internal server error: {str(e)}")
+        Raises:
+            ValueError: If unmatched descriptions are sketched (max_unmatched > 0)
+        """
+        spending, counts, unmatched, monthly = merchant_spending(
+            descriptions, amounts, envelope_ids, self.pattern_set, dates
+        )
+        for category, total in spending.items():
+            _subtract(self.spending, self.counts, category, total, counts[category])
+        for description, (total, count) in unmatched.totals().items():
+            self.unmatched.remove(description, total, int(count))
+        for month, by_category in monthly.items():
+            merged = self.monthly[month]
+            for category, (total, count) in by_category.items():
+                totals = merged[category]
+                totals[0] -= total
+                totals[1] -= count
+                if totals[1] <= 0:
+                    del merged[category]
+            if not merged:
+                del self.monthly[month]
+        self.rows -= len(amounts)
 
-    def do_GET(self) -> None:
-        """Handle GET requests (health check)"""
-        self._set_headers(200)
-        response = {
+    def response(
+        self,
+        months_of_data: int | None = None,
+        averaging: str = "mean",
+        trailing_months: int = DEFAULT_TRAILING_MONTHS,
+    ) -> dict[str, Any]:
+        """
+        Categorization response body for everything added so far
+
+        Without ``months_of_data``, the months of data are the months the
+        dated spending spans (1 if nothing is dated).
+
+        Raises:
+            RequestError: If median or trailing averaging has no dated spending
+        """
+        if months_of_data is None:
+            months_of_data = max(1, len(month_span(self.monthly)))
+        averages = None
+        if averaging != "mean":
+            if not self.monthly:
+                raise RequestError(f"{averaging} averaging needs transaction dates")
+            averages = monthly_averages(self.monthly, averaging, trailing_months)
+        return {
             "success": True,
-            "message": "VioletVault Merchant Categorization API v2.0",
-            "endpoint": "POST /api/analytics/categorization",
+            "error": None,
+            "monthsOfData": months_of_data,
+            "averaging": averaging,
+            "suggestions": merchant_suggestions(
+                self.spending, self.counts, months_of_data, averages
+            ),
+            "clusters": cluster_unmatched_merchants(self.unmatched.totals(), months_of_data),
+        }
+
+
+def _subtract(
+    spending: dict[str, float], counts: dict[str, int], category: str, total: float, count: int
+) -> None:
+    """Take ``count`` rows worth ``total`` out of a category, dropping it once empty"""
+    remaining = counts[category] - count
+    if remaining > 0:
+        spending[category] -= total
+        counts[category] = remaining
+    else:
+        del spending[category]
+        del counts[category]
+
+
+class CategoryRollup:
+    """
+    One user's aggregated categorization, updated row by row
+
+    Each row's values are kept by transaction key. A row not seen before is
+    added; a row whose values changed is taken back out of the totals and
+    added again; an unchanged row is skipped, so resending history costs
+    one lookup per row. Rows dated after the watermark cannot be held yet
+    and skip even that. Deleted rows are taken out by key. The rollup keeps
+    every row anyway, so unmatched descriptions are tracked exactly and
+    taking rows out is exact too.
+    """
+
+    def __init__(self, pattern_set: PatternSet | None = None) -> None:
+        self.aggregator = MerchantAggregator(pattern_set, max_unmatched=0)
+        # Newest ISO day of any row added
+        self.watermark: str | None = None
+        self._rows: dict[str, RollupRow] = {}
+        self.lock = threading.Lock()
+        # Log entry this rollup was loaded from or saved as (see RollupStore)
+        self.position: LogPosition | None = None
+
+    def checkpoint(self) -> tuple[dict[str, Any], int]:
+        """The whole rollup as JSON-ready data, and its row count (call with ``lock`` held)"""
+        aggregator = self.aggregator
+        state = {
+            "rows": self._rows,
+            "watermark": self.watermark,
+            "spending": aggregator.spending,
+            "counts": aggregator.counts,
+            "monthly": aggregator.monthly,
+            "unmatched": aggregator.unmatched.totals(),
+            "aggregatedRows": aggregator.rows,
+        }
+        return state, len(self._rows)
+
+    def reset(self, checkpoint: dict[str, Any] | None) -> None:
+        """Replace the contents with a ``checkpoint``'s, or empty it (call with ``lock`` held)"""
+        self.aggregator = aggregator = MerchantAggregator(
+            self.aggregator.pattern_set, max_unmatched=0
+        )
+        self._rows = {}
+        self.watermark = None
+        if checkpoint is None:
+            return
+        self._rows = _rollup_rows(checkpoint["rows"])
+        self.watermark = checkpoint["watermark"]
+        aggregator.spending = checkpoint["spending"]
+        aggregator.counts = checkpoint["counts"]
+        aggregator.monthly = checkpoint["monthly"]
+        for description, (total, count) in checkpoint["unmatched"].items():
+            aggregator.unmatched.add(description, total, int(count))
+        aggregator.rows = checkpoint["aggregatedRows"]
+
+    def apply(self, change: dict[str, Any]) -> None:
+        """Replay a change another request saved (call with ``lock`` held)"""
+        self.remove(change["deleted"])
+        self._put(_rollup_rows(change["rows"]))
+
+    def add(
+        self,
+        descriptions: Sequence[str | None],
+        amounts: Sequence[float],
+        envelope_ids: Sequence[Any],
+        dates: Sequence[Any],
+        keys: Sequence[str],
+    ) -> tuple[dict[str, RollupRow], int]:
+        """
+        Add new rows and re-add changed ones (call with ``lock`` held)
+
+        A key sent more than once counts with its last row.
+
+        Returns:
+            Tuple of (rows added or changed by key, how many of them were updated)
+        """
+        watermark = self.watermark
+        held = self._rows
+        changes: dict[str, RollupRow] = {}
+        for i, key in enumerate(keys):
+            row = (descriptions[i], amounts[i], envelope_ids[i], dates[i])
+            day = str(row[3])[:10] if row[3] else None
+            if (watermark is None or day is None or day <= watermark) and held.get(key) == row:
+                changes.pop(key, None)
+            else:
+                changes[key] = row
+        return changes, self._put(changes)
+
+    def _put(self, changes: dict[str, RollupRow]) -> int:
+        """Count ``changes`` in place of the rows they replace; returns how many they replaced"""
+        if not changes:
+            return 0
+        stale = [self._rows[key] for key in changes if key in self._rows]
+        if stale:
+            self.aggregator.remove(*_rollup_columns(stale))
+        self.aggregator.add(*_rollup_columns(list(changes.values())))
+        self._rows.update(changes)
+        days = [str(row[3])[:10] for row in changes.values() if row[3]]
+        newest = max((day for day in days if _DAY.fullmatch(day)), default=None)
+        if newest is not None and (self.watermark is None or newest > self.watermark):
+            self.watermark = newest
+        return len(stale)
+
+    def remove(self, keys: Sequence[str]) -> list[str]:
+        """
+        Take deleted rows out by key (call with ``lock`` held); unknown keys are ignored
+
+        Returns:
+            Keys of the rows removed
+        """
+        removed = [key for key in dict.fromkeys(keys) if key in self._rows]
+        if removed:
+            self.aggregator.remove(*_rollup_columns([self._rows.pop(key) for key in removed]))
+        return removed
+
+
+def _rollup_rows(rows: dict[str, list[Any]]) -> dict[str, RollupRow]:
+    """Rollup rows read back from JSON, which stored them as lists"""
+    return {key: cast(RollupRow, tuple(row)) for key, row in rows.items()}
+
+
+def _rollup_columns(
+    rows: list[RollupRow],
+) -> tuple[list[str | None], list[float], list[Any], list[Any]]:
+    return (
+        [row[0] for row in rows],
+        [row[1] for row in rows],
+        [row[2] for row in rows],
+        [row[3] for row in rows],
+    )
+
+
+class RollupStore(StateStore[CategoryRollup]):
+    """
+    Bounded LRU of per-(user, pattern version) category rollups, kept in
+    step through the result cache
+
+    Each change is logged as just the rows it added, changed or deleted
+    (see api.state_log), so saving costs what the request changed rather
+    than the user's history.
+    """
+
+    def __init__(self, max_users: int = DEFAULT_ROLLUP_USERS) -> None:
+        super().__init__(StateLog("category_rollup"), max_users)
+
+    @classmethod
+    def from_env(cls) -> "RollupStore":
+        """
+        Build a store from environment configuration
+
+        - ANALYTICS_ROLLUP_USERS: user rollups kept warm (default 256, 0 disables)
+        """
+        return cls(int(os.environ.get("ANALYTICS_ROLLUP_USERS", DEFAULT_ROLLUP_USERS)))
+
+
+def _rollup_owner(user_id: str, pattern_set: PatternSet | None) -> str:
+    return f"{user_id}\0{'' if pattern_set is None else pattern_set.version}"
+
+
+# Process-wide store, shared by every request a warm worker serves
+rollup_store = RollupStore.from_env()
+
+
+def _months_of_data(request_data: dict[str, Any]) -> int | None:
+    """The requested monthsOfData; None (infer from dates) if omitted"""
+    months_of_data = request_data.get("monthsOfData")
+
+    # Validate months_of_data
+    if months_of_data is not None and (not isinstance(months_of_data, int) or months_of_data <= 0):
+        raise RequestError("monthsOfData must be a positive integer")
+    return months_of_data
+
+
+def _averaging(request_data: dict[str, Any]) -> tuple[str, int]:
+    averaging = request_data.get("averaging") or "mean"
+    if averaging not in AVERAGING_METHODS:
+        raise RequestError(f"averaging must be one of: {', '.join(AVERAGING_METHODS)}")
+    trailing_months = request_data.get("trailingMonths", DEFAULT_TRAILING_MONTHS)
+    if not isinstance(trailing_months, int) or trailing_months <= 0:
+        raise RequestError("trailingMonths must be a positive integer")
+    return averaging, trailing_months
+
+
+def _row_keys(ids: Sequence[Any], columns: Sequence[Sequence[Any]]) -> list[str]:
+    """Transaction IDs, or the row's values where a row has none"""
+    return [
+        str(transaction_id) if transaction_id else "\0".join(str(c[i]) for c in columns)
+        for i, transaction_id in enumerate(ids)
+    ]
+
+
+def _categorization_response(
+    descriptions: Sequence[str | None],
+    amounts: Sequence[float],
+    envelope_ids: Sequence[Any],
+    dates: Sequence[Any],
+    ids: Sequence[Any],
+    request_data: dict[str, Any],
+) -> dict[str, Any]:
+    months_of_data = _months_of_data(request_data)
+    averaging, trailing_months = _averaging(request_data)
+    pattern_set, cached = resolve_pattern_set(request_data)
+
+    if request_data.get("incremental"):
+        user_id = request_data.get("userId")
+        if not isinstance(user_id, str) or not user_id:
+            raise RequestError("incremental requests need a userId")
+        deleted_ids = request_data.get("deletedIds", [])
+        if not isinstance(deleted_ids, list) or not all(isinstance(i, str) for i in deleted_ids):
+            raise RequestError("deletedIds must be a list of transaction IDs")
+        require_shared_state("incremental rollups")
+        owner = _rollup_owner(user_id, pattern_set)
+        keys = _row_keys(ids, (dates, amounts, descriptions))
+        with rollup_store.checkout(owner, lambda: CategoryRollup(pattern_set)) as (rollup, hit):
+            removed = rollup.remove(deleted_ids)
+            changes, updated = rollup.add(descriptions, amounts, envelope_ids, dates, keys)
+            if changes or removed:
+                change = {"rows": changes, "deleted": removed}
+                rollup_store.save(owner, rollup, change, len(changes) + len(removed))
+            response = rollup.aggregator.response(months_of_data, averaging, trailing_months)
+            response["rollup"] = {
+                "userId": user_id,
+                "cached": hit,
+                "added": len(changes) - updated,
+                "updated": updated,
+                "removed": len(removed),
+                "watermark": rollup.watermark,
+            }
+    else:
+        aggregator = MerchantAggregator(pattern_set)
+        aggregator.add(descriptions, amounts, envelope_ids, dates)
+        response = aggregator.response(months_of_data, averaging, trailing_months)
+
+    if pattern_set is not None:
+        response["patternSet"] = {
+            "userId": pattern_set.user_id,
+            "patternVersion": pattern_set.version,
+            "categories": len(pattern_set.matcher.categories),
+            "cached": cached,
         }
-        self.wfile.write(json.dumps(response).encode())
+    return response
+
+
+def process_categorization(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate a categorization request and run the analysis
+
+    Raises:
+        RequestError: If required fields are missing or invalid
+    """
+    transactions = request_data.get("transactions", [])
+    # An incremental request may only delete rows
+    if not transactions and not (
+        request_data.get("incremental") and request_data.get("deletedIds")
+    ):
+        raise RequestError("Missing required field: transactions")
+
+    return _categorization_response(
+        *_transaction_columns(transactions),
+        [t.get("date") for t in transactions],
+        [t.get("id") for t in transactions],
+        request_data,
+    )
+
+
+def process_column_categorization(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Run the analysis over ``columns`` (description, amount, envelopeId, date
+    and id sequences of equal length, as a stored snapshot keeps them)
+
+    A column that is missing or None counts as all None.
+
+    Raises:
+        RequestError: If there are no transactions, or monthsOfData, the
+            averaging or the pattern set is invalid
+    """
+    columns = request_data["columns"]
+    amounts = columns.get("amount") or ()
+    if not amounts:
+        raise RequestError("Missing required field: transactions")
+
+    empty = [None] * len(amounts)
+    return _categorization_response(
+        columns.get("description") or empty,
+        amounts,
+        columns.get("envelopeId") or empty,
+        columns.get("date") or empty,
+        columns.get("id") or empty,
+        request_data,
+    )
+
+
+def handle_request(body: bytes) -> EndpointResult:
+    """
+    Handle a raw categorization request body (shared by Vercel and FastAPI)
+
+    Incremental requests update per-user state, and a bare ``patternVersion``
+    resolves against the user's latest stored set, so both bypass the result
+    cache.
+    """
+    try:
+        request_data = decode_json_object(body)
+    except RequestError as e:
+        return e.status_code, error_body(e.message)
+
+    def process() -> dict[str, Any]:
+        return process_categorization(request_data)
+
+    if request_data.get("incremental") or (
+        request_data.get("patterns") is None and request_data.get("patternVersion") is not None
+    ):
+        return run_endpoint(process, "categorization")
+    return run_cached_endpoint(body, process, "categorization")
+
+
+SERVICE_INFO: dict[str, Any] = {
+    "success": True,
+    "message": "VioletVault Merchant Categorization API v2.0",
+    "endpoint": "POST /api/analytics/categorization",
+}
+
+
+class handler(JSONEndpointHandler):
+    """Vercel serverless function handler for merchant categorization"""
 
-    def _send_error(self, status_code: int, message: str) -> None:
-        """Send error response"""
-        self._set_headers(status_code)
-        error_response: ErrorResponse = {"error": message}
-        self.wfile.write(json.dumps(error_response).encode())
+    info = SERVICE_INFO
+    process = staticmethod(handle_request)
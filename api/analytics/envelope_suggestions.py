@@ -0,0 +1,437 @@
+"""
+Envelope Suggestion API - v2.0 Polyglot Backend
+Suggests which existing envelope each unassigned transaction belongs in
+
+The user's already-assigned transactions are indexed by merchant token: each
+token of a description (or merchant name) maps to the envelopes it was
+assigned to, with a count and the date it was last seen. An unassigned
+transaction is scored against that inverted index with its own tokens, so a
+suggestion only touches the postings of a handful of tokens.
+
+Indexes are kept per user (``userId``). Each request adds only the
+assigned transactions the index has not seen yet, moves a transaction whose
+envelope changed and removes ones that are unassigned again or deleted.
+Each change is logged to the result cache backend (see api.state_log), so
+every process sharing the backend (fast lane threads and process workers)
+catches up with it; each process keeps its copy in a bounded LRU.
+"""
+
+import math
+import os
+import re
+import threading
+from collections.abc import Iterable
+from datetime import date
+from typing import Any
+
+from api.endpoint import (
+    EndpointResult,
+    JSONEndpointHandler,
+    RequestError,
+    run_json_endpoint,
+)
+from api.metrics import timed
+from api.state_log import LogPosition, StateLog, StateStore, require_shared_state
+from api.tracing import span
+
+# Import shared types
+from . import UNASSIGNED_ENVELOPE_IDS, EnvelopeSuggestion
+
+DEFAULT_MAX_USERS = 256
+DEFAULT_LIMIT = 3
+MAX_LIMIT = 10
+
+# Recency weight halves every HALF_LIFE_DAYS and never drops below RECENCY_FLOOR,
+# so old history still counts; undated assignments get the floor
+HALF_LIFE_DAYS = 90.0
+RECENCY_FLOOR = 0.25
+
+# Statement boilerplate that says nothing about the merchant
+STOP_TOKENS = frozenset(
+    {"ach", "card", "com", "debit", "inc", "llc", "payment", "pos", "purchase", "the", "www"}
+)
+
+_TOKEN = re.compile(r"[^\W\d_]{2,}")
+
+# (transaction key, envelope ID, tokens, date ordinal or None) of one assignment
+Assignment = tuple[str, str, tuple[str, ...], int | None]
+
+
+def merchant_tokens(*texts: Any) -> tuple[str, ...]:
+    """Distinct lowercase word tokens of ``texts`` (numbers and boilerplate dropped)"""
+    tokens: dict[str, None] = {}
+    for text in texts:
+        if text:
+            for token in _TOKEN.findall(str(text).lower()):
+                if token not in STOP_TOKENS:
+                    tokens[token] = None
+    return tuple(tokens)
+
+
+def _date_ordinal(value: Any) -> int | None:
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def _is_unassigned(transaction: dict[str, Any]) -> bool:
+    envelope_id = transaction.get("envelopeId")
+    return not envelope_id or envelope_id in UNASSIGNED_ENVELOPE_IDS
+
+
+def _transaction_key(transaction: dict[str, Any]) -> str:
+    transaction_id = transaction.get("id")
+    if transaction_id:
+        return str(transaction_id)
+    return "\0".join(
+        str(transaction.get(field)) for field in ("date", "amount", "description", "merchant")
+    )
+
+
+def assignment(transaction: dict[str, Any]) -> Assignment:
+    """Index entry for an assigned transaction"""
+    return (
+        _transaction_key(transaction),
+        str(transaction["envelopeId"]),
+        merchant_tokens(transaction.get("description"), transaction.get("merchant")),
+        _date_ordinal(transaction.get("date")),
+    )
+
+
+class EnvelopeIndex:
+    """
+    Inverted index of merchant token -> envelope -> [count, last seen day]
+
+    Thread-safe; ``add`` and ``remove`` are incremental and idempotent per
+    transaction.
+    """
+
+    def __init__(self) -> None:
+        self._postings: dict[str, dict[str, list[int]]] = {}
+        # Assignments per token across all envelopes (document frequency)
+        self._token_counts: dict[str, int] = {}
+        self._assigned: dict[str, tuple[str, tuple[str, ...]]] = {}
+        self._latest_day: int | None = None
+        self._lock = threading.Lock()
+        # Held while a request brings the index up to date and changes it
+        # (see EnvelopeIndexStore)
+        self.lock = threading.Lock()
+        # Log entry this index was loaded from or saved as
+        self.position: LogPosition | None = None
+
+    def checkpoint(self) -> tuple[dict[str, Any], int]:
+        """The whole index as JSON-ready data, and its assignment count"""
+        with self._lock:
+            state = {
+                "postings": self._postings,
+                "tokenCounts": self._token_counts,
+                "assigned": self._assigned,
+                "latestDay": self._latest_day,
+            }
+            return state, len(self._assigned)
+
+    def reset(self, checkpoint: dict[str, Any] | None) -> None:
+        """Replace the contents with a ``checkpoint``'s, or empty the index"""
+        with self._lock:
+            if checkpoint is None:
+                self._postings, self._token_counts, self._assigned = {}, {}, {}
+                self._latest_day = None
+                return
+            self._postings = checkpoint["postings"]
+            self._token_counts = checkpoint["tokenCounts"]
+            self._assigned = {
+                key: (envelope_id, tuple(tokens))
+                for key, (envelope_id, tokens) in checkpoint["assigned"].items()
+            }
+            self._latest_day = checkpoint["latestDay"]
+
+    def apply(self, change: dict[str, Any]) -> None:
+        """Replay a change another request saved"""
+        self.unassign(change["removed"])
+        self.assign(
+            (key, envelope_id, tuple(tokens), day)
+            for key, envelope_id, tokens, day in change["assigned"]
+        )
+
+    def __len__(self) -> int:
+        return len(self._assigned)
+
+    @property
+    def token_count(self) -> int:
+        return len(self._postings)
+
+    def add(self, assignments: Iterable[Assignment]) -> int:
+        """
+        Index assignments not seen before; a known transaction whose envelope
+        changed is moved to the new envelope
+
+        Returns:
+            Number of assignments added or moved
+        """
+        return len(self.assign(assignments))
+
+    def assign(self, assignments: Iterable[Assignment]) -> list[Assignment]:
+        """Like ``add``, returning the assignments added or moved"""
+        changed: list[Assignment] = []
+        with self._lock:
+            for entry in assignments:
+                key, envelope_id, tokens, day = entry
+                previous = self._assigned.get(key)
+                if previous is not None:
+                    if previous[0] == envelope_id:
+                        continue
+                    self._remove(previous[0], previous[1])
+                self._assigned[key] = (envelope_id, tokens)
+                for token in tokens:
+                    postings = self._postings.setdefault(token, {})
+                    posting = postings.get(envelope_id)
+                    if posting is None:
+                        postings[envelope_id] = [1, -1 if day is None else day]
+                    else:
+                        posting[0] += 1
+                        if day is not None and day > posting[1]:
+                            posting[1] = day
+                    self._token_counts[token] = self._token_counts.get(token, 0) + 1
+                if day is not None and (self._latest_day is None or day > self._latest_day):
+                    self._latest_day = day
+                changed.append(entry)
+        return changed
+
+    def remove(self, keys: Iterable[str]) -> int:
+        """
+        Take the assignments of transactions that are unassigned again or
+        deleted back out; unknown keys are ignored
+
+        Returns:
+            Number of assignments removed
+        """
+        return len(self.unassign(keys))
+
+    def unassign(self, keys: Iterable[str]) -> list[str]:
+        """Like ``remove``, returning the keys of the assignments removed"""
+        removed: list[str] = []
+        with self._lock:
+            for key in keys:
+                previous = self._assigned.pop(key, None)
+                if previous is not None:
+                    self._remove(*previous)
+                    removed.append(key)
+        return removed
+
+    def _remove(self, envelope_id: str, tokens: tuple[str, ...]) -> None:
+        """Take one assignment back out (its last-seen days are kept)"""
+        for token in tokens:
+            postings = self._postings[token]
+            posting = postings[envelope_id]
+            posting[0] -= 1
+            if posting[0] == 0:
+                del postings[envelope_id]
+            self._token_counts[token] -= 1
+            if not postings:
+                del self._postings[token]
+                del self._token_counts[token]
+
+    def _recency(self, day: int) -> float:
+        if day < 0 or self._latest_day is None:
+            return RECENCY_FLOOR
+        decay = math.pow(0.5, (self._latest_day - day) / HALF_LIFE_DAYS)
+        return RECENCY_FLOOR + (1 - RECENCY_FLOOR) * decay
+
+    def score(self, tokens: tuple[str, ...]) -> list[tuple[str, float]]:
+        """
+        Candidate envelopes for ``tokens``, best first
+
+        Each token adds, per envelope, its share of the token's assignments,
+        weighted by the token's inverse document frequency (rare merchant
+        words outweigh common ones) and by how recently that envelope got it.
+        """
+        with self._lock:
+            return self._score(tokens)
+
+    def _score(self, tokens: tuple[str, ...]) -> list[tuple[str, float]]:
+        total = len(self._assigned)
+        scores: dict[str, float] = {}
+        for token in tokens:
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            frequency = self._token_counts[token]
+            idf = math.log(1 + total / frequency)
+            for envelope_id, (count, day) in postings.items():
+                weight = idf * count / frequency * self._recency(day)
+                scores[envelope_id] = scores.get(envelope_id, 0.0) + weight
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+    def suggest(
+        self, transactions: Iterable[tuple[int, dict[str, Any]]], limit: int = DEFAULT_LIMIT
+    ) -> list[EnvelopeSuggestion]:
+        """
+        Suggestions for each (position, transaction) pair that has a candidate
+
+        Transactions with the same tokens are scored once.
+        """
+        suggestions: list[EnvelopeSuggestion] = []
+        scored: dict[tuple[str, ...], list[tuple[str, float]]] = {}
+        with self._lock:
+            for position, transaction in transactions:
+                tokens = merchant_tokens(
+                    transaction.get("description"), transaction.get("merchant")
+                )
+                candidates = scored.get(tokens)
+                if candidates is None:
+                    candidates = scored[tokens] = self._score(tokens)
+                if not candidates:
+                    continue
+                total = sum(score for _, score in candidates)
+                envelope_id, best = candidates[0]
+                suggestions.append(
+                    {
+                        "index": position,
+                        "transactionId": transaction.get("id"),
+                        "envelopeId": envelope_id,
+                        "confidence": round(best / total, 3),
+                        "candidates": [
+                            {"envelopeId": candidate, "score": round(score, 4)}
+                            for candidate, score in candidates[:limit]
+                        ],
+                    }
+                )
+        return suggestions
+
+
+class EnvelopeIndexStore(StateStore[EnvelopeIndex]):
+    """
+    Bounded LRU of per-user envelope indexes, kept in step through the
+    result cache
+
+    Each change is logged as just the assignments it added, moved or
+    removed (see api.state_log), so saving costs what the request changed
+    rather than the user's history.
+    """
+
+    def __init__(self, max_users: int = DEFAULT_MAX_USERS) -> None:
+        super().__init__(StateLog("envelope_index"), max_users)
+
+    @classmethod
+    def from_env(cls) -> "EnvelopeIndexStore":
+        """
+        Build a store from environment configuration
+
+        - ANALYTICS_SUGGESTION_INDEX_USERS: user indexes kept warm (default 256, 0 disables)
+        """
+        return cls(int(os.environ.get("ANALYTICS_SUGGESTION_INDEX_USERS", DEFAULT_MAX_USERS)))
+
+
+# Process-wide store, shared by every request a warm worker serves
+index_store = EnvelopeIndexStore.from_env()
+
+
+@timed("suggest_envelopes")
+def suggest_envelopes(
+    transactions: list[dict[str, Any]],
+    user_id: str | None = None,
+    limit: int = DEFAULT_LIMIT,
+    deleted_ids: Iterable[str] = (),
+) -> dict[str, Any]:
+    """
+    Index the assigned transactions and suggest envelopes for the rest
+
+    Unassigned transactions and ``deleted_ids`` are taken out of the index.
+    Without ``user_id`` the index lives for this call only.
+    """
+    if user_id is None:
+        return _suggest(EnvelopeIndex(), False, transactions, user_id, limit, deleted_ids)
+    require_shared_state("envelope suggestion indexes")
+    with index_store.checkout(user_id, EnvelopeIndex) as (index, cached):
+        return _suggest(index, cached, transactions, user_id, limit, deleted_ids)
+
+
+def _suggest(
+    index: EnvelopeIndex,
+    cached: bool,
+    transactions: list[dict[str, Any]],
+    user_id: str | None,
+    limit: int,
+    deleted_ids: Iterable[str],
+) -> dict[str, Any]:
+    assigned = [t for t in transactions if not _is_unassigned(t)]
+    unassigned = [(i, t) for i, t in enumerate(transactions) if _is_unassigned(t)]
+    with span("suggestions.index", rows=len(assigned), cached=cached) as index_span:
+        removed = index.unassign([*deleted_ids, *(_transaction_key(t) for _, t in unassigned)])
+        added = index.assign(assignment(t) for t in assigned)
+        index_span.set_attribute("added", len(added))
+        index_span.set_attribute("removed", len(removed))
+    if user_id is not None and (added or removed):
+        change = {"assigned": added, "removed": removed}
+        index_store.save(user_id, index, change, len(added) + len(removed))
+    with span("suggestions.score", rows=len(unassigned)) as score_span:
+        suggestions = index.suggest(unassigned, limit)
+        score_span.set_attribute("suggested", len(suggestions))
+
+    return {
+        "suggestions": suggestions,
+        "index": {
+            "userId": user_id,
+            "cached": cached,
+            "added": len(added),
+            "removed": len(removed),
+            "transactions": len(index),
+            "tokens": index.token_count,
+        },
+    }
+
+
+def process_envelope_suggestions(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate a suggestion request and score its unassigned transactions
+
+    Raises:
+        RequestError: If fields are missing or invalid
+    """
+    transactions = request_data.get("transactions")
+    if not transactions:
+        raise RequestError("Missing required field: transactions")
+    if not isinstance(transactions, list) or not all(isinstance(t, dict) for t in transactions):
+        raise RequestError("transactions must be a list of objects")
+
+    user_id = request_data.get("userId")
+    if user_id is not None and (not isinstance(user_id, str) or not user_id):
+        raise RequestError("userId must be a non-empty string")
+
+    limit = request_data.get("limit", DEFAULT_LIMIT)
+    if not isinstance(limit, int) or not 1 <= limit <= MAX_LIMIT:
+        raise RequestError(f"limit must be an integer between 1 and {MAX_LIMIT}")
+
+    deleted_ids = request_data.get("deletedIds", [])
+    if not isinstance(deleted_ids, list) or not all(isinstance(i, str) for i in deleted_ids):
+        raise RequestError("deletedIds must be a list of transaction IDs")
+
+    return {
+        "success": True,
+        "error": None,
+        **suggest_envelopes(transactions, user_id, limit, deleted_ids),
+    }
+
+
+def handle_request(body: bytes) -> EndpointResult:
+    """
+    Handle a raw suggestion request body (shared by Vercel and FastAPI)
+
+    Not served from the result cache: the answer depends on the user's index.
+    """
+    return run_json_endpoint(body, process_envelope_suggestions, "envelope_suggestions")
+
+
+SERVICE_INFO: dict[str, Any] = {
+    "success": True,
+    "message": "VioletVault Envelope Suggestion API v2.0",
+    "endpoint": "POST /api/analytics/envelope_suggestions",
+}
+
+
+class handler(JSONEndpointHandler):
+    """Vercel serverless function handler for envelope suggestions"""
+
+    info = SERVICE_INFO
+    process = staticmethod(handle_request)
@@ -0,0 +1,98 @@
+"""
+Heavy Hitters
+Bounded-memory totals for the heaviest keys of an unbounded stream
+
+SpaceSaving keeps exact counters while a stream has at most ``capacity``
+distinct keys. Beyond that, a new key replaces the lightest one and takes
+over its totals as an upper bound on its own (weighted Space-Saving,
+Metwally et al.). Any key heavier than the total weight divided by
+``capacity`` is always kept, and a kept key's weight is over-estimated by
+at most its recorded error. The lightest key is found through a lazy
+min-heap, so each update is O(log capacity) amortized.
+"""
+
+import heapq
+
+# [weight, count, error] of a tracked key
+Counter = list[float]
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving sketch over (key, weight, count) updates
+
+    ``capacity`` 0 keeps every key (exact, unbounded).
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.evicted = 0
+        self._counters: dict[str, Counter] = {}
+        # (weight, key) entries, some stale; rebuilt when it outgrows the counters
+        self._heap: list[tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._counters
+
+    def add(self, key: str, weight: float, count: int = 1) -> None:
+        """Add ``weight`` and ``count`` to ``key``"""
+        counter = self._counters.get(key)
+        if counter is None:
+            if 0 < self.capacity <= len(self._counters):
+                floor_weight, floor_count = self._evict()
+                counter = [floor_weight, floor_count, floor_weight]
+            else:
+                counter = [0.0, 0, 0.0]
+            self._counters[key] = counter
+        counter[0] += weight
+        counter[1] += count
+        if self.capacity > 0:
+            heapq.heappush(self._heap, (counter[0], key))
+            if len(self._heap) > 4 * self.capacity:
+                self._heap = [(c[0], k) for k, c in self._counters.items()]
+                heapq.heapify(self._heap)
+
+    def remove(self, key: str, weight: float, count: int = 1) -> None:
+        """
+        Take back ``weight`` and ``count`` added to ``key`` before
+
+        Raises:
+            ValueError: If the sketch is bounded (an evicted key's share is lost)
+        """
+        if self.capacity > 0:
+            raise ValueError("only an exact sketch (capacity 0) can take updates back")
+        counter = self._counters[key]
+        counter[0] -= weight
+        counter[1] -= count
+        if counter[1] <= 0:
+            del self._counters[key]
+
+    def _evict(self) -> tuple[float, float]:
+        """Drop the lightest key; returns its (weight, count)"""
+        while True:
+            weight, key = heapq.heappop(self._heap)
+            counter = self._counters.get(key)
+            if counter is not None and counter[0] == weight:
+                del self._counters[key]
+                self.evicted += 1
+                return counter[0], counter[1]
+
+    @property
+    def max_error(self) -> float:
+        """Largest over-estimate of any tracked key's weight (0 while exact)"""
+        return max((counter[2] for counter in self._counters.values()), default=0)
+
+    def error(self, key: str) -> float:
+        return self._counters[key][2]
+
+    def totals(self) -> dict[str, list[float]]:
+        """[weight, count] per tracked key"""
+        return {key: [counter[0], counter[1]] for key, counter in self._counters.items()}
+
+    def top(self, k: int) -> list[tuple[str, float, int]]:
+        """The ``k`` heaviest (key, weight, count), heaviest first"""
+        heaviest = heapq.nlargest(k, self._counters.items(), key=lambda item: item[1][0])
+        return [(key, counter[0], int(counter[1])) for key, counter in heaviest]
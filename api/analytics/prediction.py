@@ -3,19 +3,22 @@ Payday Prediction API - v2.0 Polyglot Backend
 Handles payday prediction logic based on paycheck history
 """
 
-import json
-import os
-
-# Import shared types
-import sys
 from datetime import datetime, timedelta
-from http.server import BaseHTTPRequestHandler
 from typing import Any
 
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from . import ErrorResponse, PaycheckEntry, PaydayPrediction
+from api.endpoint import (
+    EndpointResult,
+    JSONEndpointHandler,
+    RequestError,
+    run_cached_json_endpoint,
+)
+from api.metrics import timed
 
+# Import shared types
+from . import PaycheckEntry, PaydayPrediction
 
+
+@timed("predict_next_payday")
 def predict_next_payday(paychecks: list[PaycheckEntry]) -> PaydayPrediction:
     """
     Predict next payday based on paycheck history
@@ -114,62 +117,39 @@ def predict_next_payday(paychecks: list[PaycheckEntry]) -> PaydayPrediction:
     }
 
 
-class handler(BaseHTTPRequestHandler):
-    """Vercel serverless function handler for payday prediction"""
+def process_prediction(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate a prediction request and run the prediction
 
-    def _set_headers(self, status_code: int = 200) -> None:
-        """Set response headers"""
-        self.send_response(status_code)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-
-    def do_OPTIONS(self) -> None:
-        """Handle preflight requests"""
-        self._set_headers(200)
-
-    def do_POST(self) -> None:
-        """Handle POST requests"""
-        try:
-            # Read and parse request body
-            content_length = int(self.headers.get("Content-Length", 0))
-            body = self.rfile.read(content_length)
-            request_data: dict[str, Any] = json.loads(body)
-
-            paychecks = request_data.get("paychecks", [])
-            if not paychecks:
-                self._send_error(400, "Missing required field: paychecks")
-                return
-
-            prediction = predict_next_payday(paychecks)
-            response = {
-                "success": True,
-                "error": None,
-                "prediction": prediction,
-            }
-
-            self._set_headers(200)
-            self.wfile.write(json.dumps(response).encode())
-
-        except json.JSONDecodeError as e:
-            self._send_error(400, f"Invalid JSON: {str(e)}")
-        except Exception as e:
-            self._send_error(500, f"Internal server error: {str(e)}")
-
-    def do_GET(self) -> None:
-        """Handle GET requests (health check)"""
-        self._set_headers(200)
-        response = {
-            "success": True,
-            "message": "VioletVault Payday Prediction API v2.0",
-            "endpoint": "POST /api/analytics/prediction",
-        }
-        self.wfile.write(json.dumps(response).encode())
+    Raises:
+        RequestError: If paychecks are missing
+    """
+    paychecks = request_data.get("paychecks", [])
+    if not paychecks:
+        raise RequestError("Missing required field: paychecks")
+
+    prediction = predict_next_payday(paychecks)
+    return {
+        "success": True,
+        "error": None,
+        "prediction": prediction,
+    }
+
+
+def handle_request(body: bytes) -> EndpointResult:
+    """Handle a raw prediction request body (shared by Vercel and FastAPI)"""
+    return run_cached_json_endpoint(body, process_prediction, "prediction")
+
+
+SERVICE_INFO: dict[str, Any] = {
+    "success": True,
+    "message": "VioletVault Payday Prediction API v2.0",
+    "endpoint": "POST /api/analytics/prediction",
+}
+
+
+class handler(JSONEndpointHandler):
+    """Vercel serverless function handler for payday prediction"""
 
-    def _send_error(self, status_code: int, message: str) -> None:
-        """Send error response"""
-        self._set_headers(status_code)
-        error_response: ErrorResponse = {"error": message}
-        self.wfile.write(json.dumps(error_response).encode())
+    info = SERVICE_INFO
+    process = staticmethod(handle_request)
@@ -0,0 +1,306 @@
+"""
+Recurring Charge Detection API - v2.0 Polyglot Backend
+Finds subscriptions and bills in transaction history
+
+Expenses are grouped by normalized merchant (the merchant field, else the
+description, reduced to its words so store numbers and punctuation never
+split a merchant). Each merchant's inter-arrival intervals are binned into
+a cadence histogram (weekly, biweekly, monthly, quarterly, yearly), like
+the interval logic of predict_next_payday. A merchant recurs when most of
+its intervals land in one cadence bin. Its amount stability then tells a
+fixed subscription from a varying bill.
+
+The whole history is processed column-wise: merchants and dates are
+encoded once per distinct value, the (merchant code, day) rows are sorted
+once, and every merchant is then scanned in one pass over its run of that
+sorted array, so thousands of merchants cost one sort plus linear work.
+"""
+
+from collections import Counter
+from datetime import date, timedelta
+from itertools import groupby, pairwise
+from operator import itemgetter
+from typing import Any
+
+from api.endpoint import (
+    EndpointResult,
+    JSONEndpointHandler,
+    RequestError,
+    run_cached_json_endpoint,
+)
+from api.metrics import timed
+from api.tracing import span
+
+# Import shared types
+from . import RecurringCharge
+from .categorization import cluster_key
+
+DEFAULT_MIN_OCCURRENCES = 3
+
+# Share of a merchant's intervals that must fall in its cadence bin
+MIN_REGULARITY = 0.7
+
+# Charges within this fraction of the median amount count as stable
+AMOUNT_TOLERANCE = 0.1
+
+# Largest deviation from the median for a fixed-price subscription
+SUBSCRIPTION_TOLERANCE = 0.02
+
+AVERAGE_MONTH_DAYS = 30.44
+
+# (name, nominal days, shortest and longest interval in the bin)
+CADENCES = (
+    ("weekly", 7, 6, 8),
+    ("biweekly", 14, 13, 15),
+    ("monthly", 30, 27, 33),
+    ("quarterly", 91, 85, 97),
+    ("yearly", 365, 355, 375),
+)
+
+# CADENCES index of each interval that falls in a bin
+CADENCE_OF = {
+    interval: index
+    for index, (_, _, shortest, longest) in enumerate(CADENCES)
+    for interval in range(shortest, longest + 1)
+}
+
+# Calendar months a cadence advances by; the others advance by days
+CADENCE_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+# (merchant code, day ordinal, amount spent) of one expense
+ChargeRow = tuple[int, int, float]
+
+
+def _day_ordinal(value: Any) -> int | None:
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+def _median(values: list[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _add_months(day: date, months: int) -> date:
+    """``day`` moved by calendar months, clamped to the end of shorter months"""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    for day_of_month in range(day.day, 27, -1):
+        try:
+            return date(year, month, day_of_month)
+        except ValueError:
+            continue
+    return date(year, month, min(day.day, 28))
+
+
+def _recurring_charge(
+    rows: list[ChargeRow], name: str, latest_day: int, min_occurrences: int
+) -> RecurringCharge | None:
+    """Cadence, amount and next date of one merchant's charges, if they recur"""
+    # Rows arrive sorted by day; same-day charges count once
+    days = list(dict.fromkeys(day for _, day, _ in rows))
+    if len(days) < min_occurrences:
+        return None
+
+    intervals = [later - earlier for earlier, later in pairwise(days)]
+    histogram: dict[int, list[int]] = {}
+    for interval in intervals:
+        index = CADENCE_OF.get(interval)
+        if index is not None:
+            histogram.setdefault(index, []).append(interval)
+    if not histogram:
+        return None
+    index = max(histogram, key=lambda i: len(histogram[i]))
+    regularity = len(histogram[index]) / len(intervals)
+    if regularity < MIN_REGULARITY:
+        return None
+
+    cadence = CADENCES[index][0]
+    interval_days = round(_median([float(i) for i in histogram[index]]))
+    amounts = [amount for _, _, amount in rows]
+    amount = _median(amounts)
+    deviations = [abs(a - amount) / amount for a in amounts] if amount else [0.0]
+    stability = sum(d <= AMOUNT_TOLERANCE for d in deviations) / len(deviations)
+
+    last = date.fromordinal(days[-1])
+    months = CADENCE_MONTHS.get(cadence)
+    if months is None:
+        next_date = last + timedelta(days=interval_days)
+        monthly_cost = amount * AVERAGE_MONTH_DAYS / interval_days
+    else:
+        next_date = _add_months(last, months)
+        monthly_cost = amount / months
+    # A charge overdue by more than half a cycle was most likely cancelled
+    active = latest_day - days[-1] <= interval_days * 1.5
+    history = min(1.0, (len(days) - 1) / 5)
+    confidence = min(int(regularity * (0.5 + 0.5 * stability) * history * 100), 95)
+
+    return {
+        "merchant": name,
+        "cadence": cadence,
+        "intervalDays": interval_days,
+        "occurrences": len(days),
+        "amount": round(amount, 2),
+        "amountStability": round(stability, 3),
+        "monthlyCost": round(monthly_cost, 2),
+        "kind": "subscription" if max(deviations) <= SUBSCRIPTION_TOLERANCE else "bill",
+        "firstDate": date.fromordinal(days[0]).isoformat(),
+        "lastDate": last.isoformat(),
+        "nextDate": next_date.isoformat(),
+        "active": active,
+        "confidence": confidence,
+    }
+
+
+@timed("detect_recurring_columns")
+def detect_recurring_columns(
+    dates: list[Any],
+    amounts: list[float],
+    descriptions: list[Any],
+    merchants: list[Any],
+    min_occurrences: int = DEFAULT_MIN_OCCURRENCES,
+) -> list[RecurringCharge]:
+    """
+    Recurring charges among the expenses of transaction columns
+
+    Dates and merchant names are parsed once per distinct value; rows whose
+    date does not parse or whose merchant has no words are skipped. Results
+    are sorted by monthly cost, largest first.
+    """
+    expenses = [i for i, amount in enumerate(amounts) if amount and amount < 0]
+    raws = [str(merchants[i] or descriptions[i] or "") for i in expenses]
+    raw_counts = Counter(raws)
+    key_of = {raw: cluster_key(raw) for raw in raw_counts}
+    # Most used raw names first, so the first one seen for a key names it
+    codes: dict[str, int] = {}
+    names: list[str] = []
+    for raw, _ in raw_counts.most_common():
+        key = key_of[raw]
+        if key and key not in codes:
+            codes[key] = len(names)
+            names.append(raw)
+    code_of = {raw: codes.get(key) for raw, key in key_of.items()}
+    day_of = {value: _day_ordinal(value) for value in {dates[i] for i in expenses}}
+    rows: list[ChargeRow] = [
+        (merchant_code, day, -amounts[i])
+        for i, raw in zip(expenses, raws, strict=True)
+        if (merchant_code := code_of[raw]) is not None and (day := day_of[dates[i]]) is not None
+    ]
+
+    with span(
+        "recurring.detect", rows=len(rows), transactions=len(amounts), merchants=len(codes)
+    ) as detect_span:
+        rows.sort()
+        latest_day = max((day for day in day_of.values() if day is not None), default=0)
+        charges = []
+        for code, group in groupby(rows, key=itemgetter(0)):
+            charge = _recurring_charge(list(group), names[code], latest_day, min_occurrences)
+            if charge is not None:
+                charges.append(charge)
+        detect_span.set_attribute("recurring", len(charges))
+
+    charges.sort(key=lambda c: c["monthlyCost"], reverse=True)
+    return charges
+
+
+def _recurring_response(
+    dates: list[Any],
+    amounts: list[float],
+    descriptions: list[Any],
+    merchants: list[Any],
+    request_data: dict[str, Any],
+) -> dict[str, Any]:
+    min_occurrences = request_data.get("minOccurrences", DEFAULT_MIN_OCCURRENCES)
+    if not isinstance(min_occurrences, int) or min_occurrences < 3:
+        raise RequestError("minOccurrences must be an integer of at least 3")
+
+    charges = detect_recurring_columns(dates, amounts, descriptions, merchants, min_occurrences)
+    active = [charge for charge in charges if charge["active"]]
+    return {
+        "success": True,
+        "error": None,
+        "recurring": charges,
+        "summary": {
+            "recurring": len(charges),
+            "active": len(active),
+            "monthlyTotal": round(sum(charge["monthlyCost"] for charge in active), 2),
+        },
+    }
+
+
+def process_recurring(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate a recurring charge request and run the detection
+
+    Raises:
+        RequestError: If transactions are missing, an amount is not a number,
+            a date is not a string or minOccurrences is invalid
+    """
+    transactions = request_data.get("transactions")
+    if not transactions:
+        raise RequestError("Missing required field: transactions")
+    if not isinstance(transactions, list) or not all(isinstance(t, dict) for t in transactions):
+        raise RequestError("transactions must be a list of objects")
+    amounts = [t.get("amount") or 0 for t in transactions]
+    for i, amount in enumerate(amounts):
+        if isinstance(amount, bool) or not isinstance(amount, int | float):
+            raise RequestError(f"transactions[{i}].amount must be a number")
+    dates = [t.get("date") for t in transactions]
+    for i, day in enumerate(dates):
+        if day is not None and not isinstance(day, str):
+            raise RequestError(f"transactions[{i}].date must be a string")
+
+    return _recurring_response(
+        dates,
+        amounts,
+        [t.get("description") for t in transactions],
+        [t.get("merchant") for t in transactions],
+        request_data,
+    )
+
+
+def process_column_recurring(request_data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Run the detection over ``columns`` (date, amount, description and
+    merchant sequences of equal length, as a stored snapshot keeps them)
+
+    Raises:
+        RequestError: If there are no transactions or minOccurrences is invalid
+    """
+    columns = request_data["columns"]
+    amounts = columns.get("amount") or ()
+    if not amounts:
+        raise RequestError("Missing required field: transactions")
+
+    empty = [None] * len(amounts)
+    return _recurring_response(
+        columns.get("date") or empty,
+        amounts,
+        columns.get("description") or empty,
+        columns.get("merchant") or empty,
+        request_data,
+    )
+
+
+def handle_request(body: bytes) -> EndpointResult:
+    """Handle a raw recurring charge request body (shared by Vercel and FastAPI)"""
+    return run_cached_json_endpoint(body, process_recurring, "recurring")
+
+
+SERVICE_INFO: dict[str, Any] = {
+    "success": True,
+    "message": "VioletVault Recurring Charge API v2.0",
+    "endpoint": "POST /api/analytics/recurring",
+}
+
+
+class handler(JSONEndpointHandler):
+    """Vercel serverless function handler for recurring charge detection"""
+
+    info = SERVICE_INFO
+    process = staticmethod(handle_request)
@@ -1,6 +1,46 @@
+import asyncio
+import json
+import re
+from typing import Any
+
 import pytest
 
-from api.analytics.categorization import analyze_merchant_patterns
+from api import result_cache
+from api.analytics.benchmark_categorization import generate_descriptions
+from api.analytics.categorization import (
+    MERCHANT_PATTERNS,
+    DescriptionCache,
+    MerchantMatcher,
+    PatternSet,
+    PatternSetStore,
+    RollupStore,
+    analyze_merchant_columns,
+    analyze_merchant_patterns,
+    cluster_key,
+    handle_request,
+    lsh_clusters,
+    match_descriptions,
+    merchant_matcher,
+    minhash_signatures,
+    monthly_averages,
+    pattern_version,
+    process_categorization,
+    process_column_categorization,
+    validate_patterns,
+)
+from api.compute_pool import ComputePool
+from api.endpoint import RequestError
+from api.metrics import CACHE_REQUESTS
+from api.result_cache import MemoryCacheBackend
+
+
+def _per_pattern(patterns: dict[str, str], description: str) -> list[str]:
+    """Reference semantics: one case-insensitive search per category"""
+    return [
+        category
+        for category, pattern in patterns.items()
+        if re.search(pattern, description, re.IGNORECASE)
+    ]
 
 
 def test_analyze_merchant_patterns_basic() -> None:
@@ -77,3 +117,389 @@ def test_ignore_positive_and_assigned() -> None:
     ]
     suggestions = analyze_merchant_patterns(transactions)
     assert len(suggestions) == 0
+
+
+def test_merchant_matcher_reports_every_category() -> None:
+    matcher = merchant_matcher()
+    assert matcher.match("netflix.com") == ["Subscriptions", "Streaming"]
+    assert matcher.match("apple.com/bill apple tv+") == ["Streaming"]
+    assert matcher.match("la fitness") == ["Fitness"]
+    assert matcher.match("kroger #123") == []
+
+
+def test_merchant_matcher_matches_per_pattern_search() -> None:
+    matcher = merchant_matcher()
+    descriptions = generate_descriptions(2000, seed=3) + [
+        "",
+        "subwayscription",
+        "apple\ntv",
+        "ſhell ſtation",
+        "\u212afc drive-thru",
+        "İnstacart",
+        "Mixed Case NETFLIX",
+    ]
+    for description in descriptions:
+        assert matcher.match(description) == _per_pattern(MERCHANT_PATTERNS, description)
+
+
+def test_merchant_matcher_custom_patterns() -> None:
+    """Shared prefixes, regex alternatives and non-ASCII keywords keep search semantics"""
+    patterns = {"A": "AB|abcd", "B": "abc|x(y|z)", "C": "bc.*d|.*q", "D": "ſt|é"}
+    matcher = MerchantMatcher(patterns)
+    for description in ["abcd", "xabc", "bcxd", "zq", "st", "Ést", "xz", "b c d", ""]:
+        assert matcher.match(description) == _per_pattern(patterns, description)
+
+
+def test_description_cache_skips_matcher_for_repeats(monkeypatch: Any) -> None:
+    matcher = MerchantMatcher(MERCHANT_PATTERNS)
+    cache = DescriptionCache(max_entries=8)
+    hits = CACHE_REQUESTS.value(("merchant_categories", "hit"))
+
+    first = match_descriptions(matcher, cache, ["STARBUCKS #1234", "Kroger 77"])
+    assert first == [("Coffee & Drinks",), ()]
+
+    def unexpected(description: str) -> list[str]:
+        raise AssertionError(f"matched {description!r} again")
+
+    monkeypatch.setattr(matcher, "match", unexpected)
+    again = match_descriptions(matcher, cache, ["starbucks #5678", "STARBUCKS #1234", "kroger 9"])
+    assert again == [("Coffee & Drinks",), ("Coffee & Drinks",), ()]
+    assert len(cache) == 2
+    assert CACHE_REQUESTS.value(("merchant_categories", "hit")) - hits == 3
+
+
+def test_description_cache_evicts_least_recently_used() -> None:
+    cache = DescriptionCache(max_entries=2)
+    cache.put("a", ("A",))
+    cache.put("b", ("B",))
+    assert cache.get("a") == ("A",)
+    cache.put("c", ("C",))
+    assert cache.get("b") is None
+    assert cache.get("a") == ("A",) and cache.get("c") == ("C",)
+
+    disabled = DescriptionCache(max_entries=0)
+    disabled.put("a", ("A",))
+    assert disabled.get("a") is None
+
+
+def test_normalization_keeps_digits_patterns_can_see() -> None:
+    assert merchant_matcher().normalize("Shell 00123 Pump 4") == "shell 0 pump 0"
+    digits = MerchantMatcher({"Convenience": "7-eleven|circle k"})
+    assert not digits.digit_insensitive
+    assert digits.normalize("7-Eleven #12") == "7-eleven #12"
+
+
+@pytest.mark.parametrize("pattern", ["a.c", r"a\dc", r"a\w+c", "a[0-9]c", "a.?c", "^a"])
+def test_regex_patterns_disable_digit_folding(pattern: str) -> None:
+    """Folding "12" to "0" would change what these patterns match"""
+    matcher = MerchantMatcher({"Weird": pattern, "Shops": "apple.*tv"})
+    assert not matcher.digit_insensitive
+    for description in ("a12c", "a1c", "a0c", "12ac"):
+        expected = _per_pattern({"Weird": pattern}, description)
+        assert [
+            c for c in matcher.match(matcher.normalize(description)) if c == "Weird"
+        ] == expected
+
+
+def test_column_analysis_matches_row_analysis() -> None:
+    """Distinct descriptions are matched once; totals equal the row-wise analysis"""
+    descriptions = ["Netflix", "Starbucks #1", None, "Netflix", "Uber", "Netflix", "Starbucks #1"]
+    amounts = [-15.49, -4.1, -60.0, -15.49, -30.0, 15.49, -49.9]
+    envelope_ids = [None, "", None, None, "env-1", None, None]
+    rows = [
+        {"description": d, "amount": a, "envelopeId": e}
+        for d, a, e in zip(descriptions, amounts, envelope_ids, strict=True)
+        if d is not None
+    ] + [{"amount": -60.0}]
+    columns = analyze_merchant_columns(descriptions, amounts, envelope_ids, 2)
+    assert columns == analyze_merchant_patterns(rows, 2)
+
+    many = analyze_merchant_columns(["Netflix"] * 4, [-20.0] * 4, [None] * 4)
+    assert [(s["category"], s["count"]) for s in many] == [
+        ("Subscriptions", 4),
+        ("Streaming", 4),
+    ]
+
+
+def test_cluster_key_keeps_merchant_words() -> None:
+    assert cluster_key("SQ *ROSA'S BAKERY 555") == "sq rosas bakery"
+    assert cluster_key("  #1234 ") == ""
+
+
+def test_unmatched_descriptions_cluster_by_merchant() -> None:
+    descriptions = [
+        "SQ *ROSAS BAKERY 555",
+        "ROSA'S BAKERY #12",
+        "Rosas Bakery WA",
+        "Netflix",
+        "Netflix",
+        "Netflix",
+        "Riverside Dental 01",
+        "RIVERSIDE DENTAL 02",
+        "Riverside Dental",
+        "Tiny Kiosk",
+    ]
+    amounts = [-20.0, -25.0, -30.0, -20.0, -20.0, -20.0, -100.0, -100.0, -100.0, -200.0]
+    response = process_column_categorization(
+        {
+            "columns": {"description": descriptions, "amount": amounts},
+            "monthsOfData": 3,
+        }
+    )
+    clusters = response["clusters"]
+    assert [(c["name"], c["amount"], c["count"]) for c in clusters] == [
+        ("Riverside Dental", 300.0, 3),
+        ("Rosas Bakery", 75.0, 3),
+    ]
+    assert clusters[1]["monthlyAverage"] == 25.0 and clusters[1]["suggestedBudget"] == 27
+    assert set(clusters[1]["descriptions"]) == set(descriptions[:3])
+    # Matched merchants and single transactions are not clustered
+    assert [s["category"] for s in response["suggestions"]] == ["Subscriptions", "Streaming"]
+
+
+def test_lsh_clusters_unrelated_keys_apart() -> None:
+    keys = ["rosas bakery", "rosas bakery seattle", "riverside dental", "ab"]
+    signatures = minhash_signatures(keys)
+    assert signatures[3] is None
+    labels = lsh_clusters(signatures)
+    assert labels[0] == labels[1] != labels[2]
+    assert len(set(labels)) == 3
+
+
+def _custom_request(**fields: Any) -> dict[str, Any]:
+    transactions = [{"description": "Rosas Bakery", "amount": -25.0} for _ in range(3)]
+    return {"transactions": transactions, **fields}
+
+
+def test_custom_patterns_are_compiled_once_per_version(monkeypatch: Any) -> None:
+    monkeypatch.setattr("api.analytics.categorization.pattern_sets", PatternSetStore())
+    patterns = {"Bakery": "bakery|patisserie"}
+
+    first = process_categorization(_custom_request(userId="user-1", patterns=patterns))
+    assert [s["category"] for s in first["suggestions"]] == ["Bakery"]
+    assert first["clusters"] == []
+    version = first["patternSet"]["patternVersion"]
+    assert version == pattern_version(patterns)
+    assert first["patternSet"]["cached"] is False
+
+    # Later requests can refer to the set by version
+    second = process_categorization(_custom_request(userId="user-1", patternVersion=version))
+    assert second["patternSet"]["cached"] is True
+    assert second["suggestions"] == first["suggestions"]
+
+    # Without patterns the defaults apply
+    assert process_categorization(_custom_request())["suggestions"] == []
+
+
+def test_new_pattern_version_invalidates_the_old_one(monkeypatch: Any) -> None:
+    monkeypatch.setattr("api.analytics.categorization.pattern_sets", PatternSetStore())
+    old = process_categorization(_custom_request(userId="user-1", patterns={"Treats": "rosas"}))
+    new = process_categorization(_custom_request(userId="user-1", patterns={"Bakery": "bakery"}))
+    assert [s["category"] for s in new["suggestions"]] == ["Bakery"]
+
+    with pytest.raises(RequestError, match="Unknown patternVersion") as error:
+        process_categorization(
+            _custom_request(userId="user-1", patternVersion=old["patternSet"]["patternVersion"])
+        )
+    assert error.value.status_code == 404
+
+
+def test_pattern_sets_resolve_across_pool_lanes(monkeypatch: Any, tmp_path: Any) -> None:
+    """A set registered on the fast lane resolves, and is superseded, in a process worker"""
+    monkeypatch.setenv("ANALYTICS_CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("ANALYTICS_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    backend = result_cache.backend_from_env()
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    monkeypatch.setattr("api.analytics.categorization.pattern_sets", PatternSetStore())
+
+    def body(**fields: Any) -> bytes:
+        return json.dumps(_custom_request(userId="user-9", **fields)).encode()
+
+    async def requests() -> list[tuple[int, dict[str, Any]]]:
+        registered = await pool.run(handle_request, body(patterns={"Bakery": "bakery"}))
+        version = registered[1]["patternSet"]["patternVersion"]
+        resolved = await pool.run(handle_request, body(patternVersion=version), size=2048)
+        await pool.run(handle_request, body(patterns={"Treats": "rosas"}))
+        superseded = await pool.run(handle_request, body(patternVersion=version), size=4096)
+        return [registered, resolved, superseded]
+
+    pool = ComputePool(workers=1, queue_size=1, fast_lane_bytes=1024)
+    try:
+        registered, resolved, superseded = asyncio.run(requests())
+    finally:
+        pool.shutdown()
+
+    assert registered[0] == resolved[0] == 200
+    assert resolved[1]["suggestions"] == registered[1]["suggestions"]
+    assert resolved[1]["patternSet"] == {**registered[1]["patternSet"], "cached": False}
+    assert superseded[0] == 404
+
+
+def test_custom_patterns_override_and_drop_defaults() -> None:
+    pattern_set = PatternSet(None, {"Streaming": "", "Video": "netflix"})
+    assert pattern_set.matcher.match("netflix") == ["Subscriptions", "Video"]
+
+
+def test_custom_pattern_validation() -> None:
+    with pytest.raises(RequestError, match="not a valid pattern"):
+        process_categorization(_custom_request(patterns={"Broken": "(unclosed"}))
+    # Regex syntax that could backtrack catastrophically is not accepted
+    for pattern in ["(a+)+$", "(a|aa)*b", r"(\w)\1", "a.*b.*c", "[a-z]+", "bakery||cafe"]:
+        with pytest.raises(RequestError, match="keywords separated by"):
+            process_categorization(_custom_request(patterns={"Risky": pattern}))
+    # Keywords, one .* wildcard, and empty rules (dropping a default) are fine
+    patterns = {"Bakery": "bakery|rosa's|7-eleven", "Video": "apple.*tv", "Streaming": ""}
+    assert validate_patterns(patterns) == patterns
+    with pytest.raises(RequestError, match="non-empty object"):
+        process_categorization(_custom_request(patterns=["bakery"]))
+    with pytest.raises(RequestError, match="does not match"):
+        process_categorization(_custom_request(patterns={"Bakery": "bakery"}, patternVersion="x"))
+
+
+def _netflix(day: str, amount: float = -20.0, **fields: Any) -> dict[str, Any]:
+    return {"date": day, "description": "Netflix", "amount": amount, **fields}
+
+
+def test_months_of_data_are_inferred_from_dates() -> None:
+    transactions = [_netflix("2024-01-05"), _netflix("2024-02-05"), _netflix("2024-04-05")]
+    response = process_categorization({"transactions": transactions})
+    # January to April, the empty March included
+    assert response["monthsOfData"] == 4
+    assert response["suggestions"][0]["monthlyAverage"] == 15.0
+
+    explicit = process_categorization({"transactions": transactions, "monthsOfData": 1})
+    assert explicit["suggestions"][0]["monthlyAverage"] == 60.0
+    undated = process_categorization({"transactions": [{"amount": -60.0, "description": "x"}]})
+    assert undated["monthsOfData"] == 1
+
+
+def test_median_and_trailing_averages() -> None:
+    transactions = [
+        _netflix("2024-01-05", -10.0),
+        _netflix("2024-02-05", -10.0),
+        _netflix("2024-03-05", -100.0),
+        _netflix("2024-04-05", -40.0),
+    ]
+    median = process_categorization({"transactions": transactions, "averaging": "median"})
+    assert median["suggestions"][0]["monthlyAverage"] == 25.0
+    trailing = process_categorization(
+        {"transactions": transactions, "averaging": "trailing", "trailingMonths": 2}
+    )
+    assert trailing["suggestions"][0]["monthlyAverage"] == 70.0
+    assert trailing["suggestions"][0]["suggestedBudget"] == 77
+
+    assert monthly_averages({"2024-01": {"A": [10, 1]}, "2024-03": {"A": [20, 1]}}, "mean") == {
+        "A": 10.0
+    }
+    with pytest.raises(RequestError, match="averaging"):
+        process_categorization({"transactions": transactions, "averaging": "mode"})
+    with pytest.raises(RequestError, match="needs transaction dates"):
+        process_categorization(
+            {"transactions": [{"amount": -60.0, "description": "x"}], "averaging": "median"}
+        )
+
+
+@pytest.fixture
+def rollups(monkeypatch: Any) -> RollupStore:
+    """A fresh rollup store and result cache backend"""
+    backend = MemoryCacheBackend(1024 * 1024, 60)
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    store = RollupStore()
+    monkeypatch.setattr("api.analytics.categorization.rollup_store", store)
+    return store
+
+
+def test_incremental_rollup_only_adds_new_rows(rollups: RollupStore) -> None:
+    history = [_netflix(f"2024-0{m}-05", id=f"t{m}") for m in (1, 2, 3)]
+    request = {"userId": "user-1", "incremental": True}
+
+    first = process_categorization({**request, "transactions": history})
+    assert first["rollup"] == {
+        "userId": "user-1",
+        "cached": False,
+        "added": 3,
+        "updated": 0,
+        "removed": 0,
+        "watermark": "2024-03-05",
+    }
+
+    # Resending history adds only what is new, same-day rows included
+    later = history + [_netflix("2024-03-05", id="t3b"), _netflix("2024-04-05", id="t4")]
+    second = process_categorization({**request, "transactions": later})
+    assert second["rollup"]["cached"] is True and second["rollup"]["added"] == 2
+    assert second["suggestions"][0]["count"] == 5
+    assert second["monthsOfData"] == 4
+    assert process_categorization({**request, "transactions": later})["rollup"]["added"] == 0
+
+    with pytest.raises(RequestError, match="userId"):
+        process_categorization({"incremental": True, "transactions": history})
+    with pytest.raises(RequestError, match="deletedIds"):
+        process_categorization({**request, "transactions": history, "deletedIds": "t1"})
+
+
+def _without_rollup(response: dict[str, Any]) -> dict[str, Any]:
+    return {key: value for key, value in response.items() if key != "rollup"}
+
+
+def test_incremental_rollup_follows_changed_and_deleted_rows(rollups: RollupStore) -> None:
+    """Edited rows replace their old contribution, as a full recompute would count them"""
+    history = [
+        _netflix("2024-01-05", id="t1"),
+        _netflix("2024-02-05", id="t2"),
+        {"id": "t3", "date": "2024-02-09", "amount": -80.5, "description": "Rosas Bakery"},
+        {"id": "t4", "date": "2024-03-05", "amount": -64.0, "description": "Shell Oil 5744"},
+    ]
+    request = {"userId": "user-1", "incremental": True}
+    process_categorization({**request, "transactions": history})
+
+    # t2 becomes a larger charge in another month, t3 is assigned to an envelope
+    edited = [
+        history[0],
+        _netflix("2024-03-07", -45.5, id="t2"),
+        {**history[2], "envelopeId": "env-treats"},
+        history[3],
+    ]
+    changed = process_categorization({**request, "transactions": edited[1:3]})
+    assert changed["rollup"]["added"] == 0 and changed["rollup"]["updated"] == 2
+    full = process_categorization({"transactions": edited})
+    assert _without_rollup(changed) == full
+
+    deleted = process_categorization({**request, "transactions": [], "deletedIds": ["t4", "t9"]})
+    assert deleted["rollup"]["removed"] == 1
+    assert _without_rollup(deleted) == process_categorization({"transactions": edited[:3]})
+
+    # Another process sharing the backend sees the same rollup
+    rollups.clear()
+    reloaded = process_categorization({**request, "transactions": edited[:3]})
+    assert reloaded["rollup"]["cached"] is True and reloaded["rollup"]["added"] == 0
+    assert _without_rollup(reloaded) == _without_rollup(deleted)
+
+
+def test_incremental_rollup_saves_only_changes(rollups: RollupStore, monkeypatch: Any) -> None:
+    """A request's log entry holds what it changed, not the user's history"""
+    history = [_netflix(f"2024-0{1 + i % 9}-05", id=f"t{i}") for i in range(300)]
+    request = {"userId": "user-1", "incremental": True}
+    backend = result_cache.result_backend()
+    assert backend is not None
+    writes: list[int] = []
+    original_set = backend.set
+
+    def recording_set(key: str, value: bytes) -> None:
+        writes.append(len(value))
+        original_set(key, value)
+
+    monkeypatch.setattr(backend, "set", recording_set)
+    process_categorization({**request, "transactions": history})
+    checkpoint_bytes = max(writes)
+    writes.clear()
+
+    later = history[1:] + [_netflix("2024-09-09", id="new")]
+    changed = process_categorization({**request, "transactions": later, "deletedIds": ["t0"]})
+    assert changed["rollup"]["added"] == 1 and changed["rollup"]["removed"] == 1
+    assert max(writes) < 300 < checkpoint_bytes
+
+    # Another process replays the change over the checkpoint
+    rollups.clear()
+    reloaded = process_categorization({**request, "transactions": later[-1:]})
+    assert reloaded["rollup"]["cached"] is True and reloaded["rollup"]["added"] == 0
+    assert _without_rollup(reloaded) == process_categorization({"transactions": later})
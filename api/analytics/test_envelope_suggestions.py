@@ -0,0 +1,259 @@
+import asyncio
+import json
+import time
+from typing import Any
+
+import pytest
+
+from api import result_cache
+from api.analytics.envelope_suggestions import (
+    EnvelopeIndex,
+    EnvelopeIndexStore,
+    assignment,
+    handle_request,
+    merchant_tokens,
+    process_envelope_suggestions,
+)
+from api.compute_pool import ComputePool
+from api.endpoint import RequestError
+from api.result_cache import MemoryCacheBackend
+
+
+def _assigned(
+    i: int, description: str, envelope_id: str, day: str = "2024-03-01"
+) -> dict[str, Any]:
+    return {"id": f"tx-{i}", "date": day, "description": description, "envelopeId": envelope_id}
+
+
+HISTORY = [
+    _assigned(1, "SAFEWAY #1234 SEATTLE", "env-groceries"),
+    _assigned(2, "Safeway Store 0042", "env-groceries"),
+    _assigned(3, "TRADER JOE'S #55", "env-groceries"),
+    _assigned(4, "SHELL OIL 5744 SEATTLE", "env-gas"),
+    _assigned(5, "Chevron 0091", "env-gas"),
+    _assigned(6, "POS PURCHASE NETFLIX.COM", "env-subscriptions"),
+]
+
+
+def test_merchant_tokens_drop_numbers_and_boilerplate() -> None:
+    assert merchant_tokens("POS PURCHASE SAFEWAY #1234 Seattle WA") == ("safeway", "seattle", "wa")
+    assert merchant_tokens("Netflix.com", "NETFLIX") == ("netflix",)
+    assert merchant_tokens(None, "") == ()
+
+
+def test_suggests_envelope_from_history() -> None:
+    index = EnvelopeIndex()
+    assert index.add(assignment(t) for t in HISTORY) == 6
+    suggestions = index.suggest(
+        [
+            (0, {"id": "new-1", "description": "SAFEWAY #9999 TACOMA"}),
+            (1, {"id": "new-2", "description": "Unknown Vendor"}),
+            (2, {"id": "new-3", "merchant": "Shell"}),
+        ]
+    )
+    assert [(s["index"], s["envelopeId"]) for s in suggestions] == [
+        (0, "env-groceries"),
+        (2, "env-gas"),
+    ]
+    assert suggestions[0]["confidence"] == 1.0
+
+
+def test_rare_tokens_outweigh_common_ones() -> None:
+    index = EnvelopeIndex()
+    index.add(assignment(t) for t in HISTORY)
+    # "seattle" appears under groceries and gas; "shell" only under gas
+    candidates = index.score(merchant_tokens("shell seattle"))
+    assert [envelope for envelope, _ in candidates] == ["env-gas", "env-groceries"]
+
+
+def test_recent_assignments_win_ties() -> None:
+    index = EnvelopeIndex()
+    index.add(
+        [
+            assignment(_assigned(1, "Amazon", "env-household", day="2023-01-01")),
+            assignment(_assigned(2, "Amazon", "env-gifts", day="2024-06-01")),
+        ]
+    )
+    (best, _), (older, _) = index.score(("amazon",))
+    assert (best, older) == ("env-gifts", "env-household")
+
+
+def test_index_updates_incrementally() -> None:
+    index = EnvelopeIndex()
+    index.add(assignment(t) for t in HISTORY)
+    assert index.add(assignment(t) for t in HISTORY) == 0
+
+    # Reassigning a transaction moves it rather than double counting
+    moved = _assigned(6, "POS PURCHASE NETFLIX.COM", "env-entertainment")
+    assert index.add([assignment(moved)]) == 1
+    assert len(index) == 6
+    assert [envelope for envelope, _ in index.score(("netflix",))] == ["env-entertainment"]
+
+
+def test_scoring_is_sub_millisecond() -> None:
+    index = EnvelopeIndex()
+    index.add(
+        assignment(_assigned(i, f"merchant{chr(97 + i % 26)}x store {i}", f"env-{i % 40}"))
+        for i in range(50_000)
+    )
+    tokens = merchant_tokens("merchantqx store 123")
+    start = time.perf_counter()
+    for _ in range(100):
+        index.score(tokens)
+    assert (time.perf_counter() - start) / 100 < 0.001
+
+
+def test_removed_assignments_leave_the_index() -> None:
+    index = EnvelopeIndex()
+    index.add(assignment(t) for t in [*HISTORY, _assigned(7, "Safeway", "env-dining")])
+    assert "env-dining" in dict(index.score(("safeway",)))
+
+    assert index.remove(["tx-7", "tx-unknown"]) == 1
+    assert index.remove(["tx-7"]) == 0
+    assert [envelope for envelope, _ in index.score(("safeway",))] == ["env-groceries"]
+    assert len(index) == 6
+
+
+@pytest.fixture
+def user_store(monkeypatch: Any) -> EnvelopeIndexStore:
+    """A fresh index store and result cache backend"""
+    backend = MemoryCacheBackend(1024 * 1024, 60)
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    store = EnvelopeIndexStore(max_users=1)
+    monkeypatch.setattr("api.analytics.envelope_suggestions.index_store", store)
+    return store
+
+
+def test_user_index_is_cached_between_requests(user_store: EnvelopeIndexStore) -> None:
+    first = process_envelope_suggestions({"userId": "user-1", "transactions": HISTORY})
+    assert first["index"] == {
+        "userId": "user-1",
+        "cached": False,
+        "added": 6,
+        "removed": 0,
+        "transactions": 6,
+        "tokens": 9,
+    }
+    assert first["suggestions"] == []
+
+    # Later requests only need the new rows
+    pending = {"description": "Chevron 1234", "envelopeId": "unassigned"}
+    second = process_envelope_suggestions({"userId": "user-1", "transactions": [pending]})
+    assert second["index"]["cached"] is True and second["index"]["added"] == 0
+    assert second["suggestions"][0]["envelopeId"] == "env-gas"
+
+    # Another user evicts the first (max_users=1); it is reloaded from the backend
+    process_envelope_suggestions({"userId": "user-2", "transactions": [pending]})
+    assert len(user_store) == 1
+    third = process_envelope_suggestions({"userId": "user-1", "transactions": [pending]})
+    assert third["index"]["cached"] is True
+    assert third["suggestions"] == second["suggestions"]
+
+
+def test_unassigned_and_deleted_transactions_leave_suggestions(
+    user_store: EnvelopeIndexStore,
+) -> None:
+    dining = _assigned(7, "Safeway Deli", "env-dining")
+    pending = {"id": "new-1", "description": "SAFEWAY DELI", "envelopeId": ""}
+    first = process_envelope_suggestions({"userId": "user-1", "transactions": [*HISTORY, dining]})
+    assert first["index"]["added"] == 7
+
+    candidates = process_envelope_suggestions({"userId": "user-1", "transactions": [pending]})
+    assert candidates["suggestions"][0]["envelopeId"] == "env-dining"
+
+    # The deli row is unassigned again: its weight leaves the suggestion
+    unassigned = {**dining, "envelopeId": ""}
+    after = process_envelope_suggestions(
+        {"userId": "user-1", "transactions": [unassigned, pending]}
+    )
+    assert after["index"]["removed"] == 1 and after["index"]["transactions"] == 6
+    suggestion = after["suggestions"][1]
+    assert [c["envelopeId"] for c in suggestion["candidates"]] == ["env-groceries"]
+
+    deleted = process_envelope_suggestions(
+        {"userId": "user-1", "transactions": [pending], "deletedIds": ["tx-1", "tx-2"]}
+    )
+    assert deleted["index"]["removed"] == 2 and deleted["index"]["transactions"] == 4
+
+
+def test_user_index_saves_only_changes(user_store: EnvelopeIndexStore, monkeypatch: Any) -> None:
+    """A request's log entry holds the assignments it changed, not the whole index"""
+    history = [
+        _assigned(i, f"Merchant{chr(97 + i % 26)} Store", f"env-{i % 7}") for i in range(300)
+    ]
+    backend = result_cache.result_backend()
+    assert backend is not None
+    writes: list[int] = []
+    original_set = backend.set
+
+    def recording_set(key: str, value: bytes) -> None:
+        writes.append(len(value))
+        original_set(key, value)
+
+    monkeypatch.setattr(backend, "set", recording_set)
+    process_envelope_suggestions({"userId": "user-1", "transactions": history})
+    checkpoint_bytes = max(writes)
+    writes.clear()
+
+    moved = {**history[0], "envelopeId": "env-moved"}
+    changed = process_envelope_suggestions(
+        {"userId": "user-1", "transactions": [*history[3:], moved], "deletedIds": ["tx-2"]}
+    )
+    assert changed["index"]["added"] == 1 and changed["index"]["removed"] == 1
+    assert max(writes) < 300 < checkpoint_bytes
+
+    # Another process replays the change over the checkpoint
+    user_store.clear()
+    pending = {"description": "Merchanta Store", "envelopeId": ""}
+    reloaded = process_envelope_suggestions({"userId": "user-1", "transactions": [pending]})
+    expected = process_envelope_suggestions(
+        {"transactions": [*history[1:2], *history[3:], moved, pending]}
+    )
+    assert reloaded["index"]["cached"] is True
+    assert reloaded["suggestions"] == [{**expected["suggestions"][0], "index": 0}]
+
+
+def test_user_index_is_shared_across_pool_lanes(monkeypatch: Any, tmp_path: Any) -> None:
+    """An index built on the fast lane, then changed there, is current in a process worker"""
+    monkeypatch.setenv("ANALYTICS_CACHE_BACKEND", "sqlite")
+    monkeypatch.setenv("ANALYTICS_CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    backend = result_cache.backend_from_env()
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    monkeypatch.setattr("api.analytics.envelope_suggestions.index_store", EnvelopeIndexStore())
+    pending = {"id": "new-1", "description": "Chevron 1234", "envelopeId": ""}
+
+    def body(*transactions: dict[str, Any]) -> bytes:
+        return json.dumps({"userId": "user-9", "transactions": transactions}).encode()
+
+    async def requests() -> list[tuple[int, dict[str, Any]]]:
+        await pool.run(handle_request, body(*HISTORY))
+        before = await pool.run(handle_request, body(pending), size=4096)
+        await pool.run(handle_request, body(_assigned(8, "Chevron 77", "env-travel")))
+        after = await pool.run(handle_request, body(pending), size=4096)
+        return [before, after]
+
+    pool = ComputePool(workers=1, queue_size=1, fast_lane_bytes=1024)
+    try:
+        before, after = asyncio.run(requests())
+    finally:
+        pool.shutdown()
+
+    assert before[1]["index"]["cached"] is True
+    assert [c["envelopeId"] for c in before[1]["suggestions"][0]["candidates"]] == ["env-gas"]
+    assert {c["envelopeId"] for c in after[1]["suggestions"][0]["candidates"]} == {
+        "env-gas",
+        "env-travel",
+    }
+
+
+def test_request_validation() -> None:
+    with pytest.raises(RequestError, match="transactions"):
+        process_envelope_suggestions({})
+    with pytest.raises(RequestError, match="list of objects"):
+        process_envelope_suggestions({"transactions": ["Safeway"]})
+    with pytest.raises(RequestError, match="userId"):
+        process_envelope_suggestions({"transactions": HISTORY, "userId": 5})
+    with pytest.raises(RequestError, match="limit"):
+        process_envelope_suggestions({"transactions": HISTORY, "limit": 0})
+    with pytest.raises(RequestError, match="deletedIds"):
+        process_envelope_suggestions({"transactions": HISTORY, "deletedIds": "tx-1"})
@@ -0,0 +1,68 @@
+import random
+
+from api.analytics.categorization import MerchantAggregator, merchant_spending
+from api.analytics.heavy_hitters import SpaceSaving
+
+
+def test_exact_below_capacity() -> None:
+    sketch = SpaceSaving(capacity=4)
+    for key, weight in [("a", 5.0), ("b", 1.0), ("a", 2.5), ("c", 3.0)]:
+        sketch.add(key, weight)
+    assert sketch.totals() == {"a": [7.5, 2], "b": [1.0, 1], "c": [3.0, 1]}
+    assert sketch.max_error == 0 and sketch.evicted == 0
+    assert sketch.top(2) == [("a", 7.5, 2), ("c", 3.0, 1)]
+
+
+def test_heavy_hitters_survive_a_long_tail() -> None:
+    rng = random.Random(5)
+    sketch = SpaceSaving(capacity=50)
+    exact: dict[str, float] = {}
+    updates = [(f"heavy-{i}", 40.0) for i in range(5) for _ in range(100)]
+    updates += [(f"tail-{rng.randrange(20_000)}", 1.0) for _ in range(20_000)]
+    rng.shuffle(updates)
+    for key, weight in updates:
+        sketch.add(key, weight)
+        exact[key] = exact.get(key, 0) + weight
+
+    assert len(sketch) == 50
+    top = sketch.top(5)
+    assert sorted(key for key, _, _ in top) == [f"heavy-{i}" for i in range(5)]
+    for key, weight, _ in top:
+        # Never under-estimated, over-estimated by at most the recorded error
+        assert exact[key] <= weight <= exact[key] + sketch.error(key)
+
+
+def test_zero_capacity_tracks_everything() -> None:
+    sketch = SpaceSaving(capacity=0)
+    for i in range(1000):
+        sketch.add(str(i), 1.0)
+    assert len(sketch) == 1000 and sketch.evicted == 0
+
+
+def test_aggregator_memory_is_fixed_by_the_sketch() -> None:
+    aggregator = MerchantAggregator(max_unmatched=64)
+    for chunk in range(20):
+        descriptions = [f"Corner Shop {chunk}-{i}" for i in range(500)]
+        descriptions += ["Riverside Dental"] * 10
+        aggregator.add(descriptions, [-1.0] * 500 + [-30.0] * 10, [None] * 510)
+
+    assert len(aggregator.unmatched) == 64
+    (cluster,) = (c for c in aggregator.response(1)["clusters"] if c["name"] == "Riverside Dental")
+    assert cluster["count"] >= 200 and cluster["amount"] >= 6000
+
+
+def test_unmatched_rows_are_sketched_within_a_chunk() -> None:
+    """A single chunk of distinct merchants never holds more than max_unmatched totals"""
+    sketch = SpaceSaving(capacity=64)
+    descriptions = [f"Corner Shop {i}" for i in range(20_000)] + ["Riverside Dental"] * 10
+    amounts = [-1.0] * 20_000 + [-500.0] * 10
+    _, _, unmatched, _ = merchant_spending(
+        descriptions, amounts, [None] * len(amounts), unmatched=sketch
+    )
+    assert unmatched is sketch
+    assert len(sketch) == 64 and sketch.evicted == 20_010 - 64 - 9
+    assert sketch.top(1)[0][0] == "Riverside Dental"
+
+    aggregator = MerchantAggregator(max_unmatched=64)
+    aggregator.add(descriptions, amounts, [None] * len(amounts))
+    assert len(aggregator.unmatched) == 64
@@ -0,0 +1,172 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+from typing import Any
+
+import pytest
+
+from api.analytics.recurring import (
+    detect_recurring_columns,
+    handle_request,
+    process_column_recurring,
+    process_recurring,
+)
+from api.endpoint import RequestError
+
+
+def _charges(
+    description: str, start: date, step: int, count: int, amount: float = -15.99
+) -> list[dict[str, Any]]:
+    return [
+        {
+            "date": (start + timedelta(days=step * i)).isoformat(),
+            "amount": amount,
+            "description": description,
+        }
+        for i in range(count)
+    ]
+
+
+def _monthly(description: str, count: int, amount: float = -15.99) -> list[dict[str, Any]]:
+    return [
+        {"date": f"2024-{month:02d}-15", "amount": amount, "description": description}
+        for month in range(1, count + 1)
+    ]
+
+
+def test_detects_cadence_and_next_date() -> None:
+    transactions = (
+        _monthly("NETFLIX.COM 866-579-7172", 6)
+        + _charges("Gym Weekly", date(2024, 4, 1), 7, 12, amount=-10)
+        + _charges("Domain Renewal", date(2019, 6, 1), 365, 3, amount=-12)
+        # Irregular spending is not recurring
+        + _charges("Corner Cafe", date(2024, 1, 2), 3, 10, amount=-4.5)
+    )
+    response = process_recurring({"transactions": transactions})
+    charges = {charge["merchant"]: charge for charge in response["recurring"]}
+    assert set(charges) == {"NETFLIX.COM 866-579-7172", "Gym Weekly", "Domain Renewal"}
+
+    netflix = charges["NETFLIX.COM 866-579-7172"]
+    assert netflix["cadence"] == "monthly"
+    assert netflix["kind"] == "subscription"
+    assert (netflix["lastDate"], netflix["nextDate"]) == ("2024-06-15", "2024-07-15")
+    assert netflix["monthlyCost"] == 15.99
+    assert netflix["active"] is True
+
+    gym = charges["Gym Weekly"]
+    assert (gym["cadence"], gym["intervalDays"], gym["occurrences"]) == ("weekly", 7, 12)
+    assert gym["monthlyCost"] == pytest.approx(43.49)
+
+    # Last charged in 2021, more than one and a half years before the latest row
+    assert charges["Domain Renewal"]["cadence"] == "yearly"
+    assert charges["Domain Renewal"]["active"] is False
+    assert response["summary"] == {
+        "recurring": 3,
+        "active": 2,
+        "monthlyTotal": round(netflix["monthlyCost"] + gym["monthlyCost"], 2),
+    }
+    # Largest monthly cost first
+    assert [c["merchant"] for c in response["recurring"]][0] == "Gym Weekly"
+
+
+def test_merchant_variants_and_varying_bills() -> None:
+    bills = [
+        {"date": f"2024-{month:02d}-0{month % 3 + 1}", "amount": amount, "description": name}
+        for month, amount, name in [
+            (1, -80.0, "CITY POWER #0012"),
+            (2, -95.5, "City Power 0013"),
+            (3, -88.0, "CITY POWER"),
+            (4, -120.0, "CITY POWER #0012"),
+        ]
+    ]
+    (charge,) = process_recurring({"transactions": bills})["recurring"]
+    assert charge["merchant"] == "CITY POWER #0012"
+    assert charge["cadence"] == "monthly"
+    assert charge["kind"] == "bill"
+    assert charge["amount"] == 91.75
+    assert charge["amountStability"] == 0.5
+
+
+def test_next_date_clamps_to_month_end() -> None:
+    transactions = [
+        {"date": day, "amount": -9.99, "merchant": "Spotify", "description": "SPOTIFY P1A2B3"}
+        for day in ("2023-10-31", "2023-11-30", "2023-12-31", "2024-01-31")
+    ]
+    (charge,) = process_recurring({"transactions": transactions})["recurring"]
+    assert charge["merchant"] == "Spotify"
+    assert charge["nextDate"] == "2024-02-29"
+
+
+def test_needs_min_occurrences_of_expenses() -> None:
+    transactions = _monthly("Hulu", 2) + _monthly("Paycheck", 6, amount=2000)
+    assert process_recurring({"transactions": transactions})["recurring"] == []
+    monthly = _monthly("Hulu", 4)
+    assert process_recurring({"transactions": monthly, "minOccurrences": 5})["recurring"] == []
+
+
+def test_columns_match_transactions() -> None:
+    transactions = _monthly("Hulu", 4) + _charges("Gym", date(2024, 1, 1), 14, 8)
+    columns = {
+        "date": [t["date"] for t in transactions],
+        "amount": [t["amount"] for t in transactions],
+        "description": [t["description"] for t in transactions],
+        "merchant": None,
+    }
+    assert process_column_recurring({"columns": columns}) == process_recurring(
+        {"transactions": transactions}
+    )
+
+
+def test_five_years_of_thousands_of_merchants_under_a_second() -> None:
+    rng = random.Random(7)
+    dates: list[str] = []
+    amounts: list[float] = []
+    descriptions: list[str] = []
+    start = date(2020, 1, 1)
+    for m in range(2000):
+        step = rng.choice((7, 14, 30, 91, 365, 3))
+        day = rng.randrange(30)
+        while day < 5 * 365:
+            dates.append((start + timedelta(days=day)).isoformat())
+            amounts.append(-round(rng.uniform(5, 50), 2))
+            # Letters only, since merchant keys drop digits
+            descriptions.append("MERCHANT " + "".join(chr(97 + m // 26**k % 26) for k in range(3)))
+            day += step + rng.choice((-1, 0, 0, 1)) if step != 3 else rng.randrange(1, 6)
+
+    started = time.perf_counter()
+    charges = detect_recurring_columns(dates, amounts, descriptions, [None] * len(dates))
+    assert time.perf_counter() - started < 1.0
+    assert len(dates) > 200_000
+    assert len(charges) > 1000
+
+
+def test_request_validation() -> None:
+    with pytest.raises(RequestError, match="transactions"):
+        process_recurring({})
+    with pytest.raises(RequestError, match="list of objects"):
+        process_recurring({"transactions": ["Netflix"]})
+    with pytest.raises(RequestError, match=r"transactions\[1\]\.amount must be a number"):
+        process_recurring({"transactions": [{"amount": -5}, {"amount": "-5"}]})
+    with pytest.raises(RequestError, match="amount must be a number"):
+        process_recurring({"transactions": [{"amount": True}]})
+    with pytest.raises(RequestError, match=r"transactions\[0\]\.date must be a string"):
+        process_recurring({"transactions": [{"amount": -5, "date": ["2024-01-01"]}]})
+    with pytest.raises(RequestError, match="minOccurrences"):
+        process_recurring({"transactions": _monthly("Hulu", 4), "minOccurrences": 2})
+
+
+def test_string_amounts_are_bad_requests() -> None:
+    transactions = _monthly("Hulu", 4)
+    transactions[2]["amount"] = "-15.99"
+    status, payload = handle_request(json.dumps({"transactions": transactions}).encode())
+    assert status == 400
+    assert payload["error"] == "transactions[2].amount must be a number"
+
+
+def test_non_string_dates_are_bad_requests() -> None:
+    transactions = _monthly("Hulu", 4)
+    transactions[1]["date"] = {"day": "2024-02-01"}
+    status, payload = handle_request(json.dumps({"transactions": transactions}).encode())
+    assert status == 400
+    assert payload["error"] == "transactions[1].date must be a string"
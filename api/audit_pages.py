@@ -0,0 +1,146 @@
+"""
+Audit Result Pagination
+Cursor-paged views over cached audit results
+
+A paged audit is computed once and kept in a bounded, time-limited store
+keyed by the snapshot body and grouping. Cursors are opaque tokens naming a
+stored result and an offset, so fetching later pages only slices the cached
+violations. Resubmitting the same snapshot also reuses the cached result.
+"""
+
+import base64
+import binascii
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from api.metrics import record_cache_lookup
+
+DEFAULT_MAX_AUDITS = 32
+DEFAULT_TTL_SECONDS = 600
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor cannot be decoded"""
+
+
+class CursorExpiredError(Exception):
+    """Raised when the audit a cursor points at is no longer cached"""
+
+
+def audit_id(body: bytes, group_by: str | None) -> str:
+    """Stable ID for the audit of ``body`` with the given grouping"""
+    digest = hashlib.sha256(body)
+    digest.update(f"\0{group_by or ''}".encode())
+    return digest.hexdigest()[:32]
+
+
+def encode_cursor(audit: str, offset: int, limit: int) -> str:
+    raw = json.dumps({"id": audit, "offset": offset, "limit": limit}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, int, int]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Returns:
+        Tuple of (audit ID, offset, limit)
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        audit, offset, limit = str(data["id"]), int(data["offset"]), int(data["limit"])
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if offset < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidCursorError("Invalid cursor")
+    return audit, offset, limit
+
+
+class AuditPageStore:
+    """Bounded LRU of audit results (as JSON-ready dicts) with a TTL"""
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_AUDITS, ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AuditPageStore":
+        """
+        Build a store from environment configuration
+
+        - ANALYTICS_AUDIT_CACHE_ENTRIES: audits kept for paging (default 32)
+        - ANALYTICS_AUDIT_CURSOR_TTL_SECONDS: how long cursors stay valid (default 600)
+        """
+        return cls(
+            max_entries=int(os.environ.get("ANALYTICS_AUDIT_CACHE_ENTRIES", DEFAULT_MAX_AUDITS)),
+            ttl_seconds=float(
+                os.environ.get("ANALYTICS_AUDIT_CURSOR_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+            ),
+        )
+
+    def get(self, audit: str) -> dict[str, Any] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(audit)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                del self._entries[audit]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(audit)
+        record_cache_lookup("audit_pages", entry is not None)
+        return entry[1] if entry is not None else None
+
+    def put(self, audit: str, result: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[audit] = (time.monotonic(), result)
+            self._entries.move_to_end(audit)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def page(self, audit: str, offset: int, limit: int | None) -> dict[str, Any]:
+        """
+        Slice a stored result into one page
+
+        Raises:
+            CursorExpiredError: If the audit is no longer stored
+        """
+        result = self.get(audit)
+        if result is None:
+            raise CursorExpiredError("Cursor expired, resubmit the snapshot")
+        return build_page(audit, result, offset, limit)
+
+
+def build_page(
+    audit: str, result: dict[str, Any], offset: int, limit: int | None
+) -> dict[str, Any]:
+    """
+    Slice one page out of an audit result dict
+
+    The page has the IntegrityAuditResult fields plus ``totalViolations`` and
+    ``nextCursor`` (None on the last page, or when ``limit`` is None).
+    """
+    violations = result["violations"]
+    end = len(violations) if limit is None else offset + limit
+    next_cursor = None
+    if limit is not None and end < len(violations):
+        next_cursor = encode_cursor(audit, end, limit)
+    return {
+        **result,
+        "violations": violations[offset:end],
+        "totalViolations": len(violations),
+        "nextCursor": next_cursor,
+    }
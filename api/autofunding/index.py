@@ -3,23 +3,88 @@ AutoFunding Simulation API Endpoint
 Vercel serverless function for autofunding simulation
 """
 
-import json
-import logging
-import os
-from http.server import BaseHTTPRequestHandler
 from typing import Any
 
 from pydantic import ValidationError
 
+from api.endpoint import (
+    EndpointResult,
+    JSONEndpointHandler,
+    RequestError,
+    decode_json_object,
+    error_body,
+    run_cached_endpoint,
+    run_endpoint,
+)
+from api.tracing import span
+
 # Use relative imports within the package
 from .models import AutoFundingRequest, AutoFundingResult
 from .simulation import simulate_rule_execution
 
-# Configure logging
-logger = logging.getLogger(__name__)
+
+def process_autofunding(data: dict[str, Any]) -> dict[str, Any]:
+    """
+    Validate an autofunding request and run the simulation
+
+    Raises:
+        RequestError: If the payload fails model validation
+    """
+    # Validate request with Pydantic
+    try:
+        with span("autofunding.validate", rules=len(data.get("rules") or [])):
+            request = AutoFundingRequest(**data)
+    except ValidationError as e:
+        # Extract user-friendly validation errors
+        error_messages = []
+        for error in e.errors():
+            field = ".".join(str(loc) for loc in error["loc"])
+            error_messages.append(f"{field}: {error['msg']}")
+        raise RequestError(f"Validation error: {'; '.join(error_messages)}") from e
+    except Exception as e:
+        raise RequestError("Invalid request format") from e
+
+    # Execute simulation
+    result = simulate_rule_execution(request.rules, request.context)
+
+    # Format response
+    if result["success"]:
+        response = AutoFundingResult(success=True, simulation=result["simulation"])
+    else:
+        response = AutoFundingResult(success=False, error=result.get("error", "Unknown error"))
+
+    return response.model_dump()
+
+
+def handle_request(body: bytes) -> EndpointResult:
+    """
+    Handle a raw autofunding request body (shared by Vercel and FastAPI)
+
+    Only requests that pin ``context.currentDate`` are served from the result
+    cache; without it schedules and date conditions read the server clock.
+    """
+    try:
+        data = decode_json_object(body)
+    except RequestError as e:
+        return e.status_code, error_body(e.message)
+
+    context = data.get("context")
+    current_date = context.get("currentDate") if isinstance(context, dict) else None
+    if not current_date or not isinstance(current_date, str):
+        return run_endpoint(lambda: process_autofunding(data), "autofunding")
+    return run_cached_endpoint(body, lambda: process_autofunding(data), "autofunding", current_date)
 
 
-class handler(BaseHTTPRequestHandler):
+SERVICE_INFO: dict[str, Any] = {
+    "name": "AutoFunding Simulation API",
+    "version": "1.0.0",
+    "description": "Simulates autofunding rule execution without making changes",
+    "methods": ["POST"],
+    "endpoint": "/api/autofunding",
+}
+
+
+class handler(JSONEndpointHandler):
     """
     Vercel serverless function handler for autofunding simulation
 
@@ -53,94 +118,6 @@ class handler(BaseHTTPRequestHandler):
         }
     """
 
-    def _get_allowed_origin(self) -> str:
-        """Get allowed origin from environment or use wildcard for development"""
-        # In production, should be set to specific domain(s)
-        allowed_origin = os.environ.get("ALLOWED_ORIGIN", "*")
-        return allowed_origin
-
-    def _set_headers(self, status_code: int = 200, content_type: str = "application/json") -> None:
-        """Set response headers"""
-        self.send_response(status_code)
-        self.send_header("Content-type", content_type)
-        self.send_header("Access-Control-Allow-Origin", self._get_allowed_origin())
-        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
-        self.end_headers()
-
-    def _send_json_response(self, data: dict[str, Any], status_code: int = 200) -> None:
-        """Send JSON response"""
-        self._set_headers(status_code)
-        self.wfile.write(json.dumps(data).encode())
-
-    def _send_error_response(self, message: str, status_code: int = 400) -> None:
-        """Send error response"""
-        self._send_json_response({"success": False, "error": message}, status_code)
-
-    def do_OPTIONS(self) -> None:
-        """Handle CORS preflight"""
-        self._set_headers(204)
-
-    def do_POST(self) -> None:
-        """Handle POST request"""
-        try:
-            # Read request body
-            content_length = int(self.headers.get("Content-Length", 0))
-            if content_length == 0:
-                self._send_error_response("Request body is required", 400)
-                return
-
-            body = self.rfile.read(content_length)
-
-            # Parse JSON
-            try:
-                data = json.loads(body.decode("utf-8"))
-            except json.JSONDecodeError:
-                self._send_error_response("Invalid JSON format", 400)
-                return
-
-            # Validate request with Pydantic
-            try:
-                request = AutoFundingRequest(**data)
-            except ValidationError as e:
-                # Extract user-friendly validation errors
-                error_messages = []
-                for error in e.errors():
-                    field = ".".join(str(loc) for loc in error["loc"])
-                    error_messages.append(f"{field}: {error['msg']}")
-                self._send_error_response(f"Validation error: {'; '.join(error_messages)}", 400)
-                return
-            except Exception:
-                self._send_error_response("Invalid request format", 400)
-                return
-
-            # Execute simulation
-            result = simulate_rule_execution(request.rules, request.context)
-
-            # Format response
-            if result["success"]:
-                response = AutoFundingResult(success=True, simulation=result["simulation"])
-            else:
-                response = AutoFundingResult(
-                    success=False, error=result.get("error", "Unknown error")
-                )
-
-            # Send response
-            self._send_json_response(response.model_dump(), 200)
-
-        except Exception as e:
-            # Log the full error for debugging but send sanitized message to client
-            logger.error(f"Internal error in autofunding API: {str(e)}", exc_info=True)
-            self._send_error_response("An internal error occurred. Please try again later.", 500)
-
-    def do_GET(self) -> None:
-        """Handle GET request - return API info"""
-        self._send_json_response(
-            {
-                "name": "AutoFunding Simulation API",
-                "version": "1.0.0",
-                "description": "Simulates autofunding rule execution without making changes",
-                "methods": ["POST"],
-                "endpoint": "/api/autofunding",
-            }
-        )
+    info = SERVICE_INFO
+    options_status = 204
+    process = staticmethod(handle_request)
@@ -6,6 +6,9 @@ Pure functions for simulating rule executions and planning transfers
 
 from typing import Any
 
+from api.metrics import timed
+from api.tracing import span
+
 from .conditions import should_rule_execute
 from .currency import split_amount
 from .models import (
@@ -23,6 +26,7 @@ from .rules import (
 )
 
 
+@timed("simulate_rule_execution")
 def simulate_rule_execution(
     rules: list[AutoFundingRule], context: AutoFundingContext
 ) -> dict[str, Any]:
@@ -55,7 +59,12 @@ def simulate_rule_execution(
         # Simulate each rule execution
         for rule in sorted_rules:
             try:
-                rule_result = simulate_single_rule(rule, context, available_cash)
+                with span("autofunding.rule", rows=len(context.data.envelopes)) as rule_span:
+                    rule_span.set_attribute("rule.id", rule.id)
+                    rule_span.set_attribute("rule.type", rule.type)
+                    rule_result = simulate_single_rule(rule, context, available_cash)
+                    rule_span.set_attribute("amount", rule_result.amount)
+                    rule_span.set_attribute("success", rule_result.success)
 
                 if rule_result.success and rule_result.amount > 0:
                     simulation.ruleResults.append(rule_result)
@@ -3,7 +3,11 @@ import json
 from typing import Any, cast
 from unittest.mock import patch
 
-from api.autofunding.index import handler
+import pytest
+
+from api import result_cache
+from api.autofunding.index import handle_request, handler
+from api.result_cache import MemoryCacheBackend
 
 
 class MockHeaders:
@@ -128,3 +132,40 @@ def test_handler_post_validation_error() -> None:
     result = json.loads(output.getvalue().decode("utf-8"))
     assert result["success"] is False
     assert "Validation error" in result["error"]
+
+
+def test_only_requests_with_current_date_are_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Without context.currentDate the simulation reads the clock, so it always reruns"""
+    backend = MemoryCacheBackend()
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    context: dict[str, Any] = {
+        "data": {"unassignedCash": 100, "envelopes": []},
+        "trigger": "manual",
+    }
+
+    def body(**extra: Any) -> bytes:
+        return json.dumps({"rules": [], "context": {**context, **extra}}).encode()
+
+    with patch("api.autofunding.index.simulate_rule_execution") as mock_simulate:
+        mock_simulate.return_value = {
+            "success": True,
+            "simulation": {
+                "totalPlanned": 0,
+                "rulesExecuted": 0,
+                "plannedTransfers": [],
+                "ruleResults": [],
+                "remainingCash": 100,
+                "errors": [],
+            },
+        }
+
+        for _ in range(2):
+            assert handle_request(body())[0] == 200
+        assert mock_simulate.call_count == 2
+
+        for _ in range(2):
+            assert handle_request(body(currentDate="2024-01-15T12:00:00.000Z"))[0] == 200
+        assert mock_simulate.call_count == 3
+
+        assert handle_request(body(currentDate="2024-01-16T12:00:00.000Z"))[0] == 200
+        assert mock_simulate.call_count == 4
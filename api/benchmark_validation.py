@@ -0,0 +1,144 @@
+"""
+Parallel Validation Benchmark
+Compares serial snapshot validation with the chunked parallel path
+
+Usage:
+    python -m api.benchmark_validation [--rows 300000] [--workers 4] [--seed 7]
+
+Builds one snapshot upload of ``--rows`` transactions and validates it three
+ways: serially in this process, serially in a process worker (the server's
+path below ANALYTICS_PARALLEL_VALIDATION_BYTES, which also pickles the
+columns back), and split across ``--workers`` process workers. Both paths
+must produce the same columns. The split and the segment walks are timed
+separately, in this process: the split runs on one worker before the
+others start, and the walks add a pass over the array before validation.
+
+The parallel path only wins on wall-clock time with at least two cores;
+the CPU count is printed with the results.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from api.compute_pool import ComputePool
+from api.models import SnapshotUpload
+from api.parallel_validation import (
+    DEFAULT_MIN_CHUNK_BYTES,
+    plan_chunks,
+    split_document,
+    validate_in_parallel,
+    walk_elements,
+)
+from api.snapshots import StoredSnapshot
+
+CATEGORIES = ["Food", "Transport", "Rent", "Utilities", "Entertainment", "Health"]
+
+
+def generate_payload(rows: int, seed: int) -> bytes:
+    """A deterministic snapshot upload with statement-style transactions"""
+    rng = random.Random(seed)
+    envelopes = [
+        {"id": f"env-{i}", "name": name, "category": name, "lastModified": 1700000000000}
+        for i, name in enumerate(CATEGORIES)
+    ]
+    transactions = [
+        {
+            "id": f"tx-{i}",
+            "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "amount": round(rng.uniform(-250, 50), 2),
+            "envelopeId": f"env-{rng.randrange(len(CATEGORIES))}",
+            "category": rng.choice(CATEGORIES),
+            "lastModified": 1700000000000 + i,
+            "description": f"Card purchase {rng.randint(100, 99999)} Seattle WA",
+        }
+        for i in range(rows)
+    ]
+    return json.dumps(
+        {
+            "envelopes": envelopes,
+            "transactions": transactions,
+            "metadata": {"id": "budget-1", "lastModified": 1700000000000},
+        }
+    ).encode()
+
+
+def validate_serially(payload: bytes) -> StoredSnapshot:
+    return StoredSnapshot(SnapshotUpload.model_validate_json(payload))
+
+
+async def run_pooled(pool: ComputePool, payload: bytes) -> tuple[float, float]:
+    """Seconds for (serial validation in a worker, parallel validation)"""
+    start = time.perf_counter()
+    serial = await pool.run(validate_serially, payload, size=len(payload))
+    pooled_serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = await validate_in_parallel(pool, payload, SnapshotUpload)
+    parallel = time.perf_counter() - start
+
+    if result is None or result[2]:
+        raise SystemExit("Parallel validation fell back or reported errors")
+    if StoredSnapshot(result[0], result[1]).columns != serial.columns:
+        raise SystemExit("Parallel validation disagrees with serial validation")
+    return pooled_serial, parallel
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=300_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    payload = generate_payload(args.rows, args.seed)
+
+    start = time.perf_counter()
+    validate_serially(payload)
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    split = split_document(payload, args.workers, DEFAULT_MIN_CHUNK_BYTES)
+    split_seconds = time.perf_counter() - start
+    if split is None:
+        raise SystemExit("Payload could not be split")
+
+    start = time.perf_counter()
+    starts = [split[1], *(element for _, element in split[2])]
+    walks = [
+        walk_elements(payload[begin:end], 0, DEFAULT_MIN_CHUNK_BYTES // 8)
+        for begin, end in zip(starts, [*starts[1:], len(payload)], strict=True)
+    ]
+    walk_seconds = time.perf_counter() - start
+    plan = plan_chunks(split, walks, args.workers, DEFAULT_MIN_CHUNK_BYTES)
+    if plan is None:
+        raise SystemExit("Payload could not be split")
+
+    pool = ComputePool(workers=args.workers, queue_size=args.workers, fast_lane_bytes=0)
+    try:
+        # Start the workers before timing anything that runs in them
+        asyncio.run(run_pooled(pool, generate_payload(100, args.seed)))
+        pooled_serial, parallel = asyncio.run(run_pooled(pool, payload))
+    finally:
+        pool.shutdown()
+
+    print(
+        f"{args.rows:,} transactions, {len(payload) / 2**20:.1f} MiB, "
+        f"{len(plan[0]) + 1} chunks, {args.workers} workers, {os.cpu_count()} CPUs"
+    )
+    timings = (
+        ("serial", serial),
+        ("serial (pool)", pooled_serial),
+        ("split only", split_seconds),
+        ("walks only", walk_seconds),
+        ("parallel", parallel),
+    )
+    for name, seconds in timings:
+        print(f"  {name:<14} {seconds:7.2f} s  {serial / seconds:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Compute Pool for Analytics Endpoints
+Runs CPU-bound analytics work off the event loop with bounded admission
+
+Large payloads are executed in a process pool so the GIL does not serialize
+concurrent audits. Small payloads take a thread-backed fast lane so a single
+huge request cannot starve health checks and small clients. Each lane admits
+at most ``workers + queue_size`` jobs; anything beyond that is rejected with
+``PoolSaturatedError`` so the API can answer 503 with ``Retry-After``.
+
+Streams on the process lane hand their items back through a bounded queue
+served by a ``multiprocessing`` manager, so the first item reaches the
+caller while the worker is still producing the rest.
+"""
+
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import queue
+import threading
+from collections.abc import AsyncGenerator, Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing.managers import SyncManager
+from typing import Any, TypeVar, cast
+
+from api.metrics import REGISTRY
+from api.sampling_profiler import drain_active_stacks, merge_into_active, start_worker_sampler
+from api.tracing import (
+    SpanContext,
+    current_context,
+    drain_worker_spans,
+    export_spans,
+    run_in_context,
+)
+
+T = TypeVar("T")
+
+# Defaults (overridable via environment variables)
+DEFAULT_FAST_LANE_BYTES = 256 * 1024
+DEFAULT_FAST_LANE_WORKERS = 4
+DEFAULT_RETRY_AFTER_SECONDS = 1
+
+# Items a process-lane stream may run ahead of its consumer
+STREAM_QUEUE_SIZE = 8
+
+# How often a blocked stream producer or consumer re-checks for cancellation
+# or a dead worker
+_STREAM_POLL_SECONDS = 0.1
+
+
+class PoolSaturatedError(Exception):
+    """Raised when a lane has no free worker and its queue is full"""
+
+    def __init__(self, lane: str, retry_after: int) -> None:
+        super().__init__(f"Compute pool saturated ({lane} lane)")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read a non-negative integer from the environment, falling back to default"""
+    raw = os.environ.get(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return default
+
+
+def _call_with_metrics(
+    trace_context: SpanContext | None, fn: Callable[..., Any], *args: Any
+) -> tuple[Any, Exception | None, dict[str, Any], dict[str, int], list[dict[str, Any]]]:
+    """
+    Run ``fn`` in a worker process and hand back the metrics, profiler
+    stacks and trace spans it recorded
+
+    The exception (if any) is returned rather than raised so the samples
+    still reach the parent process. Spans started by ``fn`` are children of
+    ``trace_context`` (the parent's active span).
+    """
+    try:
+        result, error = run_in_context(trace_context, fn, *args), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, REGISTRY.drain(), drain_active_stacks(), drain_worker_spans()
+
+
+class _StreamEnd:
+    """Queue marker: the worker has produced its last stream item"""
+
+
+def _put_streamed(items: "queue.Queue[Any]", cancelled: threading.Event, item: Any) -> bool:
+    """Queue ``item`` once there is room; False if the consumer went away first"""
+    while not cancelled.is_set():
+        try:
+            items.put(item, timeout=_STREAM_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _feed(
+    items: "queue.Queue[Any]",
+    cancelled: threading.Event,
+    fn: Callable[..., Iterable[Any]],
+    *args: Any,
+) -> None:
+    """Put each item of ``fn(*args)`` on ``items`` until done or cancelled"""
+    iterator = iter(fn(*args))
+    try:
+        for item in iterator:
+            if not _put_streamed(items, cancelled, item):
+                return
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def _stream_with_metrics(
+    items: "queue.Queue[Any]",
+    cancelled: threading.Event,
+    trace_context: SpanContext | None,
+    fn: Callable[..., Iterable[Any]],
+    *args: Any,
+) -> tuple[None, Exception | None, dict[str, Any], dict[str, int], list[dict[str, Any]]]:
+    """
+    Stream ``fn(*args)`` from a worker process through ``items``
+
+    An end marker follows the last item (or the error), so the consumer
+    never waits on a finished worker; the outcome travels back like
+    ``_call_with_metrics``.
+    """
+    outcome = _call_with_metrics(trace_context, _feed, items, cancelled, fn, *args)
+    _put_streamed(items, cancelled, _StreamEnd())
+    return outcome
+
+
+def _next_streamed(items: "queue.Queue[Any]", worker: "Future[Any]") -> Any:
+    """Block for the next streamed item; a worker that died ends the stream"""
+    while True:
+        try:
+            return items.get(timeout=_STREAM_POLL_SECONDS)
+        except queue.Empty:
+            if worker.done():
+                return _StreamEnd()
+
+
+def _merge_worker_metrics(
+    samples: dict[str, Any], stacks: dict[str, int], spans: list[dict[str, Any]]
+) -> None:
+    """Fold metrics, profiler stacks and spans recorded by a worker into this process"""
+    REGISTRY.merge(samples)
+    merge_into_active(stacks)
+    export_spans(spans)
+
+
+class _Lane:
+    """
+    A lazily created executor guarded by an admission counter
+
+    Admission is checked synchronously before submitting, so a full lane
+    rejects immediately instead of growing an unbounded executor queue.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Executor], workers: int, queue_size: int):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._factory = factory
+        self._executor: Executor | None = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory()
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ComputePool:
+    """
+    Two-lane executor for analytics compute
+
+    - fast lane: threads, for payloads up to ``fast_lane_bytes``
+    - process lane: a ``ProcessPoolExecutor`` for everything larger
+
+    Setting ``workers`` to 0 disables the process lane; all work then runs
+    in the fast lane regardless of size (useful on single-core serverless).
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        fast_lane_bytes: int = DEFAULT_FAST_LANE_BYTES,
+        fast_lane_workers: int = DEFAULT_FAST_LANE_WORKERS,
+        fast_lane_queue_size: int | None = None,
+        retry_after: int = DEFAULT_RETRY_AFTER_SECONDS,
+    ) -> None:
+        self.fast_lane_bytes = fast_lane_bytes
+        self.retry_after = retry_after
+
+        fast_workers = max(1, fast_lane_workers)
+        fast_queue = fast_workers * 4 if fast_lane_queue_size is None else fast_lane_queue_size
+        self._fast = _Lane(
+            "fast",
+            lambda: ThreadPoolExecutor(
+                max_workers=fast_workers, thread_name_prefix="analytics-fast"
+            ),
+            fast_workers,
+            fast_queue,
+        )
+        self._process: _Lane | None = None
+        self._manager: SyncManager | None = None
+        self._manager_lock = threading.Lock()
+        if workers > 0:
+            # spawn avoids forking a multi-threaded event loop process
+            self._process = _Lane(
+                "process",
+                lambda: ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=start_worker_sampler,
+                ),
+                workers,
+                queue_size,
+            )
+
+    @classmethod
+    def from_env(cls) -> "ComputePool":
+        """
+        Build a pool from environment configuration
+
+        - ANALYTICS_POOL_WORKERS: process workers (default: CPU count, 0 disables)
+        - ANALYTICS_POOL_QUEUE_SIZE: queued jobs beyond busy workers (default: 2x workers)
+        - ANALYTICS_FAST_LANE_BYTES: max payload size for the fast lane
+        - ANALYTICS_FAST_LANE_WORKERS: fast lane threads
+        - ANALYTICS_RETRY_AFTER_SECONDS: Retry-After hint when saturated
+        """
+        workers = _env_int("ANALYTICS_POOL_WORKERS", os.cpu_count() or 1)
+        return cls(
+            workers=workers,
+            queue_size=_env_int("ANALYTICS_POOL_QUEUE_SIZE", workers * 2),
+            fast_lane_bytes=_env_int("ANALYTICS_FAST_LANE_BYTES", DEFAULT_FAST_LANE_BYTES),
+            fast_lane_workers=_env_int("ANALYTICS_FAST_LANE_WORKERS", DEFAULT_FAST_LANE_WORKERS),
+            retry_after=_env_int("ANALYTICS_RETRY_AFTER_SECONDS", DEFAULT_RETRY_AFTER_SECONDS),
+        )
+
+    @property
+    def process_workers(self) -> int:
+        """Process lane workers (0 when the lane is disabled)"""
+        return 0 if self._process is None else self._process.workers
+
+    def _stream_channel(self) -> tuple["queue.Queue[Any]", threading.Event]:
+        """A fresh bounded queue and cancel flag shared with process workers"""
+        with self._manager_lock:
+            if self._manager is None:
+                manager = multiprocessing.get_context("spawn").Manager()
+                self._manager = manager
+        return self._manager.Queue(STREAM_QUEUE_SIZE), self._manager.Event()
+
+    def uses_process_lane(self, size: int) -> bool:
+        """Whether a payload of ``size`` bytes runs in a process worker"""
+        return self._select_lane(size) is self._process
+
+    def _select_lane(self, size: int) -> _Lane:
+        if self._process is None or size <= self.fast_lane_bytes:
+            return self._fast
+        return self._process
+
+    async def run(self, fn: Callable[..., T], *args: Any, size: int = 0) -> T:
+        """
+        Run ``fn(*args)`` in the lane matching the payload size
+
+        Functions routed to the process lane must be picklable (module-level).
+
+        Raises:
+            PoolSaturatedError: If the selected lane is at capacity
+        """
+        lane = self._select_lane(size)
+        if not lane.try_acquire():
+            raise PoolSaturatedError(lane.name, self.retry_after)
+        try:
+            loop = asyncio.get_running_loop()
+            if lane is self._fast:
+                # run_in_executor does not carry context over; keep the active span
+                context = contextvars.copy_context()
+                return await loop.run_in_executor(lane.executor(), partial(context.run, fn, *args))
+            result, error, samples, stacks, spans = await loop.run_in_executor(
+                lane.executor(), partial(_call_with_metrics, current_context(), fn, *args)
+            )
+        finally:
+            lane.release()
+        _merge_worker_metrics(samples, stacks, spans)
+        if error is not None:
+            raise error
+        return cast(T, result)
+
+    async def stream(
+        self, fn: Callable[..., Iterator[T]], *args: Any, size: int = 0
+    ) -> AsyncGenerator[T, None]:
+        """
+        Iterate ``fn(*args)`` (e.g. a generator function) in the lane
+        matching the payload size
+
+        In the fast lane each item is produced on a lane thread as it is
+        consumed. In the process lane the worker produces items into a
+        bounded queue, at most ``STREAM_QUEUE_SIZE`` ahead of the consumer.
+        Either way the lane stays occupied until the iteration ends or is
+        closed; closing a process-lane stream early stops its worker at the
+        next item. Admission is checked on the first item.
+
+        Raises:
+            PoolSaturatedError: If the selected lane is at capacity
+        """
+        lane = self._select_lane(size)
+        if not lane.try_acquire():
+            raise PoolSaturatedError(lane.name, self.retry_after)
+        if lane is not self._fast:
+            async for item in self._stream_from_worker(lane, fn, *args):
+                yield item
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            iterator = context.run(fn, *args)
+            done = object()
+            while True:
+                item = await loop.run_in_executor(
+                    lane.executor(), partial(context.run, next, iterator, done)
+                )
+                if item is done:
+                    return
+                yield cast(T, item)
+        finally:
+            lane.release()
+
+    async def _stream_from_worker(
+        self, lane: _Lane, fn: Callable[..., Iterator[T]], *args: Any
+    ) -> AsyncGenerator[T, None]:
+        """Process-lane half of ``stream``; ``lane`` is already acquired"""
+        try:
+            items, cancelled = await asyncio.to_thread(self._stream_channel)
+            worker = lane.executor().submit(
+                _stream_with_metrics, items, cancelled, current_context(), fn, *args
+            )
+        except BaseException:
+            lane.release()
+            raise
+        # The slot is held until the worker stops, even if the consumer leaves early
+        worker.add_done_callback(lambda _: lane.release())
+        finished = False
+        try:
+            while True:
+                item = await asyncio.to_thread(_next_streamed, items, worker)
+                if isinstance(item, _StreamEnd):
+                    break
+                yield cast(T, item)
+            finished = True
+        finally:
+            if not finished:
+                cancelled.set()
+        _, error, samples, stacks, spans = await asyncio.wrap_future(worker)
+        _merge_worker_metrics(samples, stacks, spans)
+        if error is not None:
+            raise error
+
+    def stats(self) -> dict[str, Any]:
+        """Current lane occupancy for health reporting"""
+        lanes = [self._fast] if self._process is None else [self._fast, self._process]
+        return {
+            lane.name: {
+                "workers": lane.workers,
+                "capacity": lane.capacity,
+                "inFlight": lane.in_flight,
+            }
+            for lane in lanes
+        }
+
+    def shutdown(self) -> None:
+        """Stop all executors (called on application shutdown)"""
+        self._fast.shutdown()
+        if self._process is not None:
+            self._process.shutdown()
+        with self._manager_lock:
+            manager, self._manager = self._manager, None
+        if manager is not None:
+            manager.shutdown()
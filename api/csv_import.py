@@ -0,0 +1,345 @@
+"""
+Streaming CSV Import
+Categorizes bank-export CSVs row by row in constant memory
+
+The Python counterpart of the Go import handler (``import.go``): rows are
+read one at a time with the ``csv`` module, mapped to Transaction-compatible
+records with the same field auto-detection, date formats, amount parsing and
+validation messages, and fed in chunks of ``chunk_rows`` into a
+MerchantAggregator. Nothing is kept per row, so a multi-year export costs
+the memory of one chunk plus the running per-category totals.
+
+Only the first MAX_INVALID_EXAMPLES invalid rows are returned verbatim; the
+rest are counted.
+"""
+
+import csv
+import io
+import json
+import math
+import time
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import IO, Any
+
+from api.analytics.categorization import MerchantAggregator
+from api.endpoint import RequestError
+from api.tracing import span
+
+DEFAULT_CHUNK_ROWS = 10_000
+MAX_INVALID_EXAMPLES = 20
+
+# Fields a mapping may name; "payee" is accepted as an alias of description
+FIELDS = ("date", "description", "amount", "category", "merchant", "notes")
+FIELD_ALIASES = {"payee": "description"}
+
+# Header names matched exactly (case-insensitive) before substring matching
+EXACT_HEADERS = {
+    "date": ("date", "transaction_date", "transaction date"),
+    "amount": ("amount", "value"),
+    "description": ("description", "memo", "payee"),
+    "category": ("category",),
+    "merchant": ("merchant", "vendor"),
+    "notes": ("notes", "note"),
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%Y/%m/%d",
+    "%d-%m-%Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%d %H:%M:%S",
+)
+
+# (row index, raw row, validation errors) of a row that was not imported
+InvalidRow = tuple[int, list[str], list[str]]
+
+
+def detect_field_mapping(headers: list[str]) -> dict[str, str]:
+    """
+    Map each field to a CSV header, as the Go importer's autoDetectFieldMapping
+
+    Exact header names win over substring matches; the first matching
+    header is used.
+    """
+    mapping: dict[str, str] = {}
+    for header in headers:
+        name = header.strip().lower()
+        for field, names in EXACT_HEADERS.items():
+            if name in names:
+                mapping.setdefault(field, header)
+
+    for header in headers:
+        name = header.strip().lower()
+        if "date" not in mapping and "date" in name and "update" not in name:
+            mapping["date"] = header
+        elif "amount" not in mapping and ("amount" in name or "price" in name):
+            mapping["amount"] = header
+        elif "description" not in mapping and ("description" in name or "payee" in name):
+            mapping["description"] = header
+        elif "merchant" not in mapping and ("merchant" in name or "vendor" in name):
+            mapping["merchant"] = header
+        elif (
+            "notes" not in mapping and "note" in name and not ("debit" in name or "credit" in name)
+        ):
+            mapping["notes"] = header
+    return mapping
+
+
+def parse_field_mapping(value: str | dict[str, Any] | None) -> dict[str, str]:
+    """
+    Validate a user field mapping (field -> CSV header), given as JSON or a dict
+
+    Raises:
+        RequestError: If the mapping is not a JSON object of known fields to strings
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError as e:
+            raise RequestError(f"Invalid field mapping: {e}") from None
+    if not isinstance(value, dict):
+        raise RequestError("fieldMapping must be a JSON object")
+
+    mapping: dict[str, str] = {}
+    for field, header in value.items():
+        field = FIELD_ALIASES.get(field, field)
+        if field not in FIELDS:
+            raise RequestError(f"Unknown fieldMapping field: {field}")
+        if not isinstance(header, str) or not header:
+            raise RequestError(f"fieldMapping.{field} must be a column name")
+        mapping[field] = header
+    return mapping
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text: str) -> date:
+    """
+    Parse a date in any of DATE_FORMATS
+
+    Cached, since a statement repeats the same few hundred dates.
+
+    Raises:
+        ValueError: If no format matches
+    """
+    text = text.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"unable to parse date: {text}")
+
+
+def parse_amount(text: str) -> float:
+    """
+    Parse an amount, ignoring currency symbols and thousands separators;
+    parentheses mean negative (accounting format)
+
+    Raises:
+        ValueError: If the rest is not a finite number
+    """
+    cleaned = text.strip()
+    for symbol in ("$", "€", "£", ","):
+        cleaned = cleaned.replace(symbol, "")
+    cleaned = cleaned.strip()
+    negative = cleaned.startswith("(") and cleaned.endswith(")")
+    if negative:
+        cleaned = cleaned.strip("()")
+    amount = float(cleaned)
+    # float() accepts "nan" and "inf", which no total could use
+    if not math.isfinite(amount):
+        raise ValueError(f"not a finite number: {text.strip()!r}")
+    return -amount if negative else amount
+
+
+class CSVImporter:
+    """
+    Turns CSV lines into Transaction-compatible records
+
+    Counts valid and invalid rows as they stream past and keeps the first
+    MAX_INVALID_EXAMPLES invalid rows.
+    """
+
+    def __init__(
+        self, field_mapping: dict[str, str] | None = None, expenses_positive: bool = False
+    ) -> None:
+        self.field_mapping = field_mapping or {}
+        self.expenses_positive = expenses_positive
+        self.mapping: dict[str, str] = {}
+        self.valid = 0
+        self.invalid = 0
+        self.invalid_rows: list[InvalidRow] = []
+        self._now = int(time.time() * 1000)
+        self._latest_date = date.today() + timedelta(days=1)
+
+    def transactions(self, lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+        """
+        Yield a record per valid row of ``lines`` (the header row first)
+
+        The mapping is the detected one updated with ``field_mapping``.
+
+        Raises:
+            RequestError: If the file is empty or has no date or amount column
+        """
+        reader = csv.reader(lines, skipinitialspace=True)
+        headers = next(reader, None)
+        if not headers:
+            raise RequestError("CSV file is empty")
+        self.mapping = {**detect_field_mapping(headers), **self.field_mapping}
+        for field in ("date", "amount"):
+            if self.mapping.get(field) not in headers:
+                raise RequestError(f"No {field} column found; pass it in fieldMapping")
+
+        positions = {
+            field: headers.index(header)
+            for field, header in self.mapping.items()
+            if header in headers
+        }
+        rows = (row for row in reader if row)
+        for index, row in enumerate(rows):
+            values = {
+                field: row[position] if position < len(row) else ""
+                for field, position in positions.items()
+            }
+            transaction, errors = self._normalize(values, index)
+            if transaction is None:
+                self.invalid += 1
+                if len(self.invalid_rows) < MAX_INVALID_EXAMPLES:
+                    self.invalid_rows.append((index, row, errors))
+            else:
+                self.valid += 1
+                yield transaction
+
+    def _normalize(
+        self, values: dict[str, str], index: int
+    ) -> tuple[dict[str, Any] | None, list[str]]:
+        """Validate one row, as the Go importer's normalizeTransaction"""
+        errors: list[str] = []
+        day: date | None = None
+        if not values["date"]:
+            errors.append("Date is required")
+        else:
+            try:
+                day = parse_date(values["date"])
+            except ValueError as e:
+                errors.append(f"Invalid date format: {e}")
+            else:
+                if day > self._latest_date:
+                    errors.append("Future dates are not allowed")
+
+        amount = 0.0
+        if not values["amount"]:
+            errors.append("Amount is required")
+        else:
+            try:
+                amount = parse_amount(values["amount"])
+            except ValueError as e:
+                errors.append(f"Invalid amount: {e}")
+
+        if errors or day is None:
+            return None, errors
+        if self.expenses_positive:
+            amount = -amount
+
+        transaction = {
+            "id": f"import_{self._now}_{index}",
+            "date": day.isoformat(),
+            "amount": amount,
+            "envelopeId": "unassigned",
+            "category": values.get("category") or "Imported",
+            "type": "income" if amount >= 0 else "expense",
+            "lastModified": self._now,
+            "createdAt": self._now,
+            "description": values.get("description") or "Imported Transaction",
+        }
+        for field in ("merchant", "notes"):
+            if values.get(field):
+                transaction[field] = values[field]
+        return transaction, errors
+
+    def summary(self) -> dict[str, Any]:
+        """Import counts and the first invalid rows, in the Go importer's shape"""
+        return {
+            "fieldMapping": self.mapping,
+            "valid": self.valid,
+            "invalid": self.invalid,
+            "invalidRows": [
+                {"index": index, "row": ",".join(row), "errors": errors}
+                for index, row, errors in self.invalid_rows
+            ],
+        }
+
+
+def chunks(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    """Consecutive lists of up to ``size`` items"""
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def categorize_csv(
+    lines: Iterable[str],
+    field_mapping: dict[str, str] | None = None,
+    months_of_data: int | None = None,
+    expenses_positive: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> dict[str, Any]:
+    """
+    Import a CSV and categorize its expenses in one pass
+
+    Args:
+        lines: CSV text lines, header first (e.g. a file opened with newline="")
+        field_mapping: Field -> CSV header, overriding the detected mapping
+        months_of_data: Months the export spans (default: inferred from its dates)
+        expenses_positive: Whether the export lists expenses as positive amounts
+        chunk_rows: Rows handed to the aggregator at a time
+
+    Returns:
+        A categorization response plus an ``import`` summary
+
+    Raises:
+        RequestError: If the CSV has no header, date or amount column
+    """
+    if months_of_data is not None and months_of_data <= 0:
+        raise RequestError("monthsOfData must be a positive integer")
+
+    importer = CSVImporter(field_mapping, expenses_positive)
+    aggregator = MerchantAggregator()
+    with span("csv_import.categorize", chunk_rows=chunk_rows) as import_span:
+        for chunk in chunks(importer.transactions(lines), chunk_rows):
+            # Imported rows are never assigned to an envelope yet
+            aggregator.add(
+                [t["description"] for t in chunk],
+                [t["amount"] for t in chunk],
+                [None] * len(chunk),
+                [t["date"] for t in chunk],
+            )
+        import_span.set_attribute("rows", importer.valid + importer.invalid)
+        import_span.set_attribute("invalid", importer.invalid)
+        response = aggregator.response(months_of_data)
+    return {**response, "import": importer.summary()}
+
+
+def categorize_csv_file(binary: IO[bytes], **options: Any) -> dict[str, Any]:
+    """categorize_csv over a binary file (UTF-8, with or without a BOM)"""
+    with io.TextIOWrapper(binary, encoding="utf-8-sig", newline="") as lines:
+        return categorize_csv(lines, **options)
+
+
+def categorize_csv_upload(upload: bytes | str, **options: Any) -> dict[str, Any]:
+    """
+    categorize_csv over an upload held in memory (bytes) or spooled to the
+    file at a path; both cross into worker processes cheaply
+    """
+    if isinstance(upload, str):
+        with open(upload, "rb") as binary:
+            return categorize_csv_file(binary, **options)
+    return categorize_csv_file(io.BytesIO(upload), **options)
@@ -0,0 +1,168 @@
+"""
+Shared JSON Endpoint Plumbing
+Transport-neutral request decoding and error handling for analytics endpoints
+
+Each endpoint module exposes ``handle_request(body: bytes) -> (status, payload)``.
+The FastAPI app (``api/main.py``) and the Vercel ``handler`` classes are both
+thin adapters over that function, so decoding, validation and error shapes
+are identical no matter which runtime serves the request.
+"""
+
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler
+from typing import Any
+
+from api.result_cache import cache_key, load_result, store_result
+from api.tracing import SPAN_KIND_SERVER, span
+
+logger = logging.getLogger(__name__)
+
+EndpointResult = tuple[int, dict[str, Any]]
+
+INTERNAL_ERROR_MESSAGE = "An internal error occurred. Please try again later."
+
+
+class RequestError(Exception):
+    """Client error with an HTTP status code and a user-facing message"""
+
+    def __init__(self, message: str, status_code: int = 400) -> None:
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def error_body(message: str) -> dict[str, Any]:
+    """Standard error response body (see ErrorResponse)"""
+    return {"success": False, "error": message}
+
+
+def decode_json_object(body: bytes) -> dict[str, Any]:
+    """
+    Decode a request body into a JSON object
+
+    Raises:
+        RequestError: If the body is empty, not valid JSON, or not an object
+    """
+    if not body:
+        raise RequestError("Request body is required")
+    try:
+        with span("request.decode", bytes=len(body)):
+            data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise RequestError(f"Invalid JSON format: {str(e)}") from e
+    if not isinstance(data, dict):
+        raise RequestError("Request body must be a JSON object")
+    return data
+
+
+def run_endpoint(call: Callable[[], dict[str, Any]], name: str) -> EndpointResult:
+    """
+    Run an endpoint body and map failures to error responses
+
+    - RequestError / ValueError -> 400 with the error message
+    - anything else -> 500 with a sanitized message (full error is logged)
+    """
+    try:
+        return 200, call()
+    except RequestError as e:
+        return e.status_code, error_body(e.message)
+    except ValueError as e:
+        return 400, error_body(str(e))
+    except Exception as e:
+        logger.error(f"Internal error in {name} API: {str(e)}", exc_info=True)
+        return 500, error_body(INTERNAL_ERROR_MESSAGE)
+
+
+def run_json_endpoint(
+    body: bytes, process: Callable[[dict[str, Any]], dict[str, Any]], name: str
+) -> EndpointResult:
+    """Decode ``body`` and run ``process`` on it (errors mapped by run_endpoint)"""
+    return run_endpoint(lambda: process(decode_json_object(body)), name)
+
+
+def run_cached_endpoint(
+    body: bytes, call: Callable[[], dict[str, Any]], name: str, *key_parts: str
+) -> EndpointResult:
+    """
+    run_endpoint with successful responses served from the result cache
+
+    Results are keyed by ``name``, the raw body and any ``key_parts`` (for
+    inputs outside the body, such as the current date); errors are never
+    cached.
+    """
+    key = cache_key(name, body, *key_parts)
+    cached = load_result(name, key)
+    if cached is not None:
+        return 200, json.loads(cached)
+    status_code, payload = run_endpoint(call, name)
+    if status_code == 200:
+        store_result(key, json.dumps(payload).encode())
+    return status_code, payload
+
+
+def run_cached_json_endpoint(
+    body: bytes,
+    process: Callable[[dict[str, Any]], dict[str, Any]],
+    name: str,
+    *key_parts: str,
+) -> EndpointResult:
+    """run_json_endpoint through the result cache (see run_cached_endpoint)"""
+    return run_cached_endpoint(body, lambda: process(decode_json_object(body)), name, *key_parts)
+
+
+class JSONEndpointHandler(BaseHTTPRequestHandler, ABC):
+    """
+    Base Vercel serverless handler for JSON endpoints
+
+    Subclasses set ``info`` (returned on GET) and ``process`` (the module's
+    ``handle_request``); everything else is shared.
+    """
+
+    info: dict[str, Any] = {}
+    options_status: int = 200
+
+    @staticmethod
+    @abstractmethod
+    def process(body: bytes) -> EndpointResult:
+        """Run the endpoint on a raw request body"""
+
+    def _get_allowed_origin(self) -> str:
+        """Get allowed origin from environment or use wildcard for development"""
+        return os.environ.get("ALLOWED_ORIGIN", "*")
+
+    def _set_headers(self, status_code: int = 200) -> None:
+        """Set response headers"""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Access-Control-Allow-Origin", self._get_allowed_origin())
+        self.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.end_headers()
+
+    def _send_json_response(self, data: dict[str, Any], status_code: int = 200) -> None:
+        """Send JSON response"""
+        self._set_headers(status_code)
+        self.wfile.write(json.dumps(data).encode())
+
+    def do_OPTIONS(self) -> None:
+        """Handle CORS preflight"""
+        self._set_headers(self.options_status)
+
+    def do_GET(self) -> None:
+        """Handle GET requests (service info / health check)"""
+        self._send_json_response(self.info)
+
+    def do_POST(self) -> None:
+        """Read the body and delegate to the endpoint's handle_request"""
+        content_length = int(self.headers.get("Content-Length", 0))
+        with span(
+            f"POST {self.path.split('?')[0]}", SPAN_KIND_SERVER, bytes=content_length
+        ) as request_span:
+            body = self.rfile.read(content_length) if content_length > 0 else b""
+            status_code, payload = type(self).process(body)
+            request_span.set_attribute("http.response.status_code", status_code)
+            self._send_json_response(payload, status_code)
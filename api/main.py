@@ -3,19 +3,161 @@ VioletVault Analytics API
 FastAPI application providing analytics endpoints for the frontend
 """
 
-from typing import Any
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import IO, Any, Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+
+from api.analytics import (
+    EnvelopeIntegrityAuditor,
+    categorization,
+    envelope_suggestions,
+    prediction,
+    recurring,
+)
+from api.analytics.audit import audit_timestamp
+from api.audit_pages import (
+    MAX_PAGE_SIZE,
+    AuditPageStore,
+    CursorExpiredError,
+    InvalidCursorError,
+    audit_id,
+    build_page,
+    decode_cursor,
+)
+from api.autofunding import index as autofunding
+from api.compute_pool import ComputePool, PoolSaturatedError
+from api.csv_import import categorize_csv_upload, parse_field_mapping
+from api.endpoint import (
+    EndpointResult,
+    RequestError,
+    decode_json_object,
+    error_body,
+    run_endpoint,
+)
+from api.metrics import REGISTRY, MetricsMiddleware, write_metrics_file
+from api.models import (
+    AuditSnapshot,
+    BudgetExport,
+    IntegrityAuditResult,
+    PagedAuditResult,
+    PayloadValidationError,
+    SnapshotUpload,
+    payload_validation_error,
+)
+from api.parallel_validation import should_validate_in_parallel, validate_in_parallel
+from api.pipeline import run_pipeline
+from api.profiling import (
+    PROFILE_HEADER,
+    PROFILE_ID_HEADER,
+    ProfileStore,
+    ProfilingForbiddenError,
+    is_profile_requested,
+    profile_call,
+)
+from api.result_cache import cached_result, shared_across_processes
+from api.sampling_profiler import SamplingProfiler, install_sampler
+from api.sharded_audit import audit_sharded, should_shard_audit
+from api.single_flight import SingleFlight, request_key
+from api.snapshots import (
+    SharedSnapshot,
+    SnapshotNotFoundError,
+    SnapshotStore,
+    SnapshotTooLargeError,
+    StoredSnapshot,
+    autofunding_request,
+    categorization_request,
+    envelope_suggestion_request,
+    prediction_request,
+    recurring_request,
+    resolve_snapshot,
+    snapshot_id,
+)
+from api.tracing import InMemorySpanExporter, TracingMiddleware, get_exporter, otlp_request, span
+
+# Shared compute pool for CPU-bound analytics (configured via ANALYTICS_* env vars)
+compute_pool = ComputePool.from_env()
+
+# Recent operator-requested request profiles
+profile_store = ProfileStore.from_env()
+
+# Always-on background stack sampler (ANALYTICS_SAMPLER_HZ=0 disables)
+sampler = SamplingProfiler.from_env()
+
+# Coalesces concurrent identical analytics requests
+single_flight = SingleFlight()
+
+# Cached audit results backing cursor pagination
+audit_pages = AuditPageStore.from_env()
+
+# Uploaded snapshots, parsed once and shared by every analytics endpoint
+snapshot_store = SnapshotStore.from_env()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Uploaded CSVs are buffered in memory up to this size, then on disk
+CSV_SPOOL_BYTES = 1024 * 1024
+
+# Largest accepted CSV upload (ANALYTICS_CSV_MAX_BYTES)
+CSV_MAX_BYTES = int(os.environ.get("ANALYTICS_CSV_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def _compute_pool_metrics() -> list[str]:
+    """Expose compute pool occupancy alongside the registry metrics"""
+    name = "analytics_compute_pool_in_flight"
+    lines = [f"# HELP {name} Jobs admitted to each compute pool lane", f"# TYPE {name} gauge"]
+    for lane, stats in compute_pool.stats().items():
+        lines.append(f'{name}{{lane="{lane}"}} {stats["inFlight"]}')
+    return lines
+
+
+REGISTRY.add_collector(_compute_pool_metrics)
+
+
+async def _write_metrics_periodically(path: str, interval: float) -> None:
+    """Dump the metrics exposition to a local file for textfile scraping"""
+    while True:
+        await asyncio.to_thread(write_metrics_file, path)
+        await asyncio.sleep(interval)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    """Start the sampler and optional metrics file writer; release workers on shutdown"""
+    install_sampler(sampler)
+    metrics_task: asyncio.Task[None] | None = None
+    metrics_file = os.environ.get("ANALYTICS_METRICS_FILE")
+    if metrics_file:
+        interval = float(os.environ.get("ANALYTICS_METRICS_INTERVAL_SECONDS", "15"))
+        metrics_task = asyncio.create_task(_write_metrics_periodically(metrics_file, interval))
+    yield
+    if metrics_task is not None:
+        metrics_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await metrics_task
+    sampler.stop()
+    compute_pool.shutdown()
 
-from api.analytics import EnvelopeIntegrityAuditor
-from api.models import AuditSnapshot, IntegrityAuditResult
 
 # Create FastAPI app
 app = FastAPI(
     title="VioletVault Analytics API",
     description="Heavy compute analytics endpoints for VioletVault budget data",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS for frontend access
@@ -29,16 +171,276 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+def parse_audit_snapshot(
+    payload: bytes, snapshot: StoredSnapshot | SharedSnapshot | None = None
+) -> AuditSnapshot:
+    """
+    Audit input from a raw payload, or from a stored snapshot when given
+
+    Raises:
+        PayloadValidationError: If the payload does not match AuditSnapshot
+        SnapshotNotFoundError: If a shared snapshot was dropped meanwhile
+    """
+    if snapshot is not None:
+        return resolve_snapshot(snapshot).to_audit_snapshot()
+    try:
+        with span("audit.validate", bytes=len(payload)) as validate_span:
+            audit_snapshot = AuditSnapshot.model_validate_json(payload)
+            validate_span.set_attribute("rows", len(audit_snapshot.transactions))
+            validate_span.set_attribute("envelopes", len(audit_snapshot.envelopes))
+    except ValidationError as e:
+        raise payload_validation_error(e) from None
+    return audit_snapshot
+
+
+def build_stored_snapshot(payload: bytes) -> StoredSnapshot:
+    """
+    Validate an uploaded snapshot and convert it to columnar form
+
+    Raises:
+        PayloadValidationError: If the payload does not match SnapshotUpload
+    """
+    try:
+        with span("snapshot.validate", bytes=len(payload)) as validate_span:
+            upload = SnapshotUpload.model_validate_json(payload)
+            validate_span.set_attribute("rows", len(upload.transactions))
+    except ValidationError as e:
+        raise payload_validation_error(e) from None
+    return StoredSnapshot(upload)
+
+
+def build_pipeline_input(payload: bytes) -> tuple[StoredSnapshot, dict[str, dict[str, Any]]]:
+    """
+    Validate a full budget export and convert it to columnar form
+
+    Returns:
+        Tuple of (parsed snapshot, per-stage options)
+
+    Raises:
+        PayloadValidationError: If the payload does not match BudgetExport
+    """
+    try:
+        with span("pipeline.validate", bytes=len(payload)) as validate_span:
+            export = BudgetExport.model_validate_json(payload)
+            validate_span.set_attribute("rows", len(export.transactions))
+    except ValidationError as e:
+        raise payload_validation_error(e) from None
+    return StoredSnapshot(export.to_snapshot()), export.options
+
+
+async def load_stored_snapshot(payload: bytes) -> StoredSnapshot:
+    """
+    build_stored_snapshot in the compute pool, splitting the transaction
+    validation across workers for very large uploads
+
+    Raises:
+        PayloadValidationError: If the payload does not match SnapshotUpload
+    """
+    if should_validate_in_parallel(compute_pool, payload):
+        result = await validate_in_parallel(compute_pool, payload, SnapshotUpload)
+        if result is not None:
+            upload, transactions, errors = result
+            if errors:
+                raise PayloadValidationError(errors)
+            return StoredSnapshot(upload, transactions)
+    return await compute_pool.run(build_stored_snapshot, payload, size=len(payload))
+
+
+async def load_pipeline_input(payload: bytes) -> tuple[StoredSnapshot, dict[str, dict[str, Any]]]:
+    """
+    build_pipeline_input in the compute pool, splitting the transaction
+    validation across workers for very large exports
+
+    Raises:
+        PayloadValidationError: If the payload does not match BudgetExport
+    """
+    if should_validate_in_parallel(compute_pool, payload):
+        result = await validate_in_parallel(compute_pool, payload, BudgetExport)
+        if result is not None:
+            export, transactions, errors = result
+            if errors:
+                raise PayloadValidationError(errors)
+            return StoredSnapshot(export.to_snapshot(), transactions), export.options
+    return await compute_pool.run(build_pipeline_input, payload, size=len(payload))
+
+
+# Stands in for the timestamp of cached audit results until each is served
+AUDIT_TIMESTAMP_PLACEHOLDER = "0000-00-00T00:00:00Z"
+_TIMESTAMP_FIELD = b'"timestamp":'
+_PLACEHOLDER_FIELD = _TIMESTAMP_FIELD + json.dumps(AUDIT_TIMESTAMP_PLACEHOLDER).encode()
+
+
+def stamp_audit(content: bytes) -> bytes:
+    """
+    Put the current time into a serialized audit result holding the placeholder
+
+    The field is spliced in as bytes, so a cached result is served without
+    being parsed or re-serialized. Only ``snapshotSize`` follows the
+    timestamp, so the last occurrence is the top-level field.
+    """
+    start = content.rindex(_PLACEHOLDER_FIELD)
+    stamp = _TIMESTAMP_FIELD + json.dumps(audit_timestamp()).encode()
+    return b"".join((content[:start], stamp, content[start + len(_PLACEHOLDER_FIELD) :]))
+
+
+def run_envelope_audit(
+    payload: bytes, snapshot: StoredSnapshot | SharedSnapshot | None = None
+) -> bytes:
+    """
+    Validate a raw snapshot payload (or use a stored snapshot) and audit it
+
+    Runs inside the compute pool, so it takes and returns bytes: parsing,
+    validation, auditing and serialization all happen off the event loop.
+    Results for raw payloads go through the shared result cache with a
+    placeholder timestamp: each response is stamped when it is served.
+
+    Raises:
+        PayloadValidationError: If the payload does not match AuditSnapshot
+    """
+
+    def audit() -> bytes:
+        audit_snapshot = parse_audit_snapshot(payload, snapshot)
+        result = EnvelopeIntegrityAuditor().audit(audit_snapshot)
+        result.timestamp = AUDIT_TIMESTAMP_PLACEHOLDER
+        return result.model_dump_json().encode()
+
+    if snapshot is not None:
+        return stamp_audit(audit())
+    # Key part marks entries stored with the placeholder timestamp
+    return stamp_audit(cached_result("audit", payload, audit, "timestamp-placeholder"))
+
+
+def run_paged_audit(
+    payload: bytes,
+    group_by: str | None = None,
+    snapshot: StoredSnapshot | SharedSnapshot | None = None,
+) -> dict[str, Any]:
+    """
+    Validate and audit a snapshot, optionally grouping violations
+
+    Returns a JSON-ready dict so the result can be cached and sliced into
+    pages without re-serializing models. The summary counts the violations
+    before grouping.
+
+    Raises:
+        PayloadValidationError: If the payload does not match AuditSnapshot
+    """
+    auditor = EnvelopeIntegrityAuditor()
+    result = auditor.audit(parse_audit_snapshot(payload, snapshot))
+    if group_by is not None:
+        result.violations = auditor.group_violations(result.violations, group_by)
+    return result.model_dump(mode="json")
+
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(_request: Request, exc: PoolSaturatedError) -> JSONResponse:
+    """Shed load when the compute pool is full"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Analytics service is busy, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(SnapshotNotFoundError)
+async def snapshot_not_found_handler(_request: Request, exc: SnapshotNotFoundError) -> JSONResponse:
+    """Unknown or evicted snapshot IDs; the client should upload again"""
+    return JSONResponse(status_code=404, content={"detail": str(exc)})
+
+
+@app.exception_handler(SnapshotTooLargeError)
+async def snapshot_too_large_handler(_request: Request, exc: SnapshotTooLargeError) -> JSONResponse:
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(ProfilingForbiddenError)
+async def profiling_forbidden_handler(
+    _request: Request, exc: ProfilingForbiddenError
+) -> JSONResponse:
+    """Reject profiling requests without a valid operator token"""
+    return JSONResponse(status_code=403, content={"detail": str(exc)})
+
+
+async def run_analytics(
+    request: Request, fn: Callable[[bytes], Any], payload: bytes, size: int | None = None
+) -> tuple[Any, dict[str, str]]:
+    """
+    Run an analytics task in the compute pool
+
+    Identical concurrent requests (same route and body) are coalesced into
+    one computation. When the caller sends a valid operator
+    ``X-Profile-Token`` the task instead runs on its own under cProfile; the
+    report is stored and its ID returned as a header.
+
+    ``size`` picks the pool lane and defaults to the payload length. Tasks
+    bound to a stored snapshot pass the snapshot's size (see
+    snapshot_task_input).
+
+    Returns:
+        Tuple of (task result, extra response headers)
+    """
+    lane_size = len(payload) if size is None else size
+    if not is_profile_requested(request.headers):
+        route = request.url.path
+        # Query parameters can change the computation (e.g. audit grouping)
+        variant = f"{route}?{request.url.query}" if request.url.query else route
+        result = await single_flight.do(
+            request_key(variant, payload),
+            route,
+            lambda: compute_pool.run(fn, payload, size=lane_size),
+        )
+        return result, {}
+
+    result, report, stats_data = await compute_pool.run(profile_call, fn, payload, size=lane_size)
+    profile_id = profile_store.add(report, stats_data, endpoint=request.url.path)
+    return result, {PROFILE_ID_HEADER: profile_id}
+
+
+async def snapshot_task_input(
+    snapshot: StoredSnapshot, pinned: bool = False
+) -> tuple[StoredSnapshot | SharedSnapshot, int]:
+    """
+    A stored snapshot as passed to a compute pool task, and the size that
+    picks the task's lane
+
+    Snapshots small enough for the fast lane, or ``pinned`` to it, are passed
+    as they are. Larger ones run in a process worker and are passed as a
+    reference to their shared-memory copy, made (off the event loop) on
+    first use.
+    """
+    if pinned:
+        return snapshot, 0
+    if not compute_pool.uses_process_lane(snapshot.nbytes):
+        return snapshot, snapshot.nbytes
+    return await asyncio.to_thread(snapshot.share), snapshot.nbytes
 
 
 @app.get("/")
-def get_root() -> dict[str, str]:
+async def get_root() -> dict[str, str]:
     """Health check endpoint"""
     return {"service": "VioletVault Analytics API", "version": "1.0.0", "status": "healthy"}
 
 
-@app.post("/audit/envelope-integrity", response_model=IntegrityAuditResult)
-def audit_envelope_integrity(snapshot: AuditSnapshot) -> IntegrityAuditResult:
+@app.post(
+    "/audit/envelope-integrity",
+    response_model=IntegrityAuditResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": AuditSnapshot.model_json_schema()}},
+        }
+    },
+)
+async def audit_envelope_integrity(
+    request: Request,
+    group_by: Literal["missingEnvelopeId"] | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    snapshotId: str | None = None,
+) -> Response:
     """
     Perform envelope integrity audit on budget data snapshot
 
@@ -49,8 +451,26 @@ def audit_envelope_integrity(snapshot: AuditSnapshot) -> IntegrityAuditResult:
     - **Negative Envelopes**: Envelopes with negative balances (unless allowed)
     - **Balance Leakage**: Sum of envelope balances + unassigned cash != actual balance
 
+    Validation and the audit itself run in the compute pool; small snapshots
+    take the fast lane. Returns 503 with Retry-After when the pool is saturated.
+
+    With ``Accept: application/x-ndjson`` the violations are streamed one per
+    line as the checks find them, followed by a final line holding the
+    summary, timestamp and snapshotSize.
+
+    ``group_by=missingEnvelopeId`` collapses all orphans of one missing
+    envelope into a single violation (count, totalAmount, sampleIds).
+    ``limit`` returns the first page plus a ``nextCursor``; later pages are
+    served from the cached result by ``GET /audit/envelope-integrity``.
+
+    ``snapshotId`` audits a snapshot uploaded via ``POST /snapshots``
+    instead of the request body.
+
     Args:
-        snapshot: Complete budget snapshot with envelopes, transactions, and metadata
+        request: Request whose body is an AuditSnapshot
+        group_by: Optional detail field to group violations by
+        limit: Optional page size
+        snapshotId: Optional stored snapshot to audit instead of the body
 
     Returns:
         IntegrityAuditResult with all violations found and summary statistics
@@ -58,16 +478,564 @@ def audit_envelope_integrity(snapshot: AuditSnapshot) -> IntegrityAuditResult:
     Raises:
         HTTPException: If snapshot data is invalid or processing fails
     """
+    payload = await request.body()
+    snapshot = snapshot_store.get(snapshotId) if snapshotId is not None else None
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return await stream_envelope_audit(payload, snapshot)
+    sharded = snapshot is not None and should_shard_audit(compute_pool, snapshot)
+    if group_by is not None or limit is not None:
+        if snapshot is not None and sharded:
+            compute = partial(sharded_audit_task, request, snapshot, group_by)
+        else:
+            compute = partial(
+                run_audit_task,
+                request,
+                partial(run_paged_audit, group_by=group_by),
+                payload,
+                snapshot,
+            )
+        cache_body = f"snapshot:{snapshotId}".encode() if snapshot is not None else payload
+        return await paged_envelope_audit(group_by, limit, cache_body, compute)
+    if snapshot is not None and sharded:
+        result, headers = await sharded_audit_task(request, snapshot)
+        return JSONResponse(result, headers=headers)
+    content, headers = await run_audit_task(request, run_envelope_audit, payload, snapshot)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+async def run_audit_task(
+    request: Request,
+    fn: Callable[..., Any],
+    payload: bytes,
+    snapshot: StoredSnapshot | None = None,
+) -> tuple[Any, dict[str, str]]:
+    """
+    Run an audit task via run_analytics, mapping failures to HTTP errors
+
+    Tasks over a stored snapshot pick their lane by the snapshot's size.
+    """
     try:
-        auditor = EnvelopeIntegrityAuditor()
-        result = auditor.audit(snapshot)
-        return result
+        if snapshot is None:
+            return await run_analytics(request, fn, payload)
+        task_snapshot, size = await snapshot_task_input(snapshot)
+        return await run_analytics(request, partial(fn, snapshot=task_snapshot), payload, size=size)
+    except PayloadValidationError as e:
+        raise RequestValidationError(e.errors) from None
+    except (PoolSaturatedError, ProfilingForbiddenError, SnapshotNotFoundError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Audit failed: {str(e)}") from e
 
 
+async def sharded_audit_task(
+    request: Request, snapshot: StoredSnapshot, group_by: str | None = None
+) -> tuple[dict[str, Any], dict[str, str]]:
+    """
+    Audit a large stored snapshot with its transactions sharded across the
+    process workers; identical concurrent requests share one audit
+
+    Every step, up to the JSON-ready result, runs in the process lane, so
+    neither the event loop nor the fast lane is held by the audit.
+
+    Returns:
+        Tuple of (JSON-ready IntegrityAuditResult, extra response headers)
+    """
+    route = request.url.path
+    key = request_key(f"{route}?{request.url.query}", b"")
+    audit = partial(audit_sharded, compute_pool, snapshot, group_by)
+    return await single_flight.do(key, route, audit), {}
+
+
+async def paged_envelope_audit(
+    group_by: str | None,
+    limit: int | None,
+    cache_body: bytes,
+    compute: Callable[[], Awaitable[tuple[dict[str, Any], dict[str, str]]]],
+) -> JSONResponse:
+    """First page of a grouped/paged audit, computed once and cached for later pages"""
+    audit = audit_id(cache_body, group_by)
+    result = audit_pages.get(audit)
+    headers: dict[str, str] = {}
+    if result is None:
+        result, headers = await compute()
+        audit_pages.put(audit, result)
+    return JSONResponse(build_page(audit, result, 0, limit), headers=headers)
+
+
+@app.get("/audit/envelope-integrity", response_model=PagedAuditResult)
+async def audit_envelope_integrity_page(cursor: str) -> JSONResponse:
+    """
+    Fetch a later page of a paged audit
+
+    Pages are sliced from the cached audit; nothing is recomputed. Returns
+    410 once the cached audit has expired.
+    """
+    try:
+        audit, offset, limit = decode_cursor(cursor)
+        page = audit_pages.page(audit, offset, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    except CursorExpiredError as e:
+        raise HTTPException(status_code=410, detail=str(e)) from None
+    return JSONResponse(page)
+
+
+def audit_ndjson(
+    payload: bytes, snapshot: StoredSnapshot | SharedSnapshot | None = None
+) -> Iterator[bytes]:
+    """Validate an audit input, then yield the audit as NDJSON chunks"""
+    yield from EnvelopeIntegrityAuditor().stream_ndjson(parse_audit_snapshot(payload, snapshot))
+
+
+async def stream_envelope_audit(
+    payload: bytes, snapshot: StoredSnapshot | None = None
+) -> StreamingResponse:
+    """
+    Stream audit violations as NDJSON
+
+    Validation and the audit both run in the compute pool lane matching the
+    payload size, under its admission limit. Either lane hands each chunk on
+    as soon as it is produced: the fast lane on a lane thread as the client
+    reads, the process lane through a bounded queue from the worker. The
+    first chunk is awaited before the response starts, so schema errors
+    still surface as 422 and a saturated pool as 503. Streamed audits are
+    neither coalesced nor profiled.
+    """
+    task_snapshot: StoredSnapshot | SharedSnapshot | None = None
+    size = len(payload)
+    if snapshot is not None:
+        task_snapshot, size = await snapshot_task_input(snapshot)
+    chunks = compute_pool.stream(audit_ndjson, payload, task_snapshot, size=size)
+    try:
+        first = await anext(chunks)
+    except PayloadValidationError as e:
+        raise RequestValidationError(e.errors) from None
+
+    async def body() -> AsyncIterator[bytes]:
+        # Closing the chunks as soon as the client goes away frees the lane
+        async with contextlib.aclosing(chunks):
+            yield first
+            async for chunk in chunks:
+                yield chunk
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def handle_snapshot_request(
+    build_request: Callable[[StoredSnapshot, dict[str, Any]], dict[str, Any]],
+    process: Callable[[dict[str, Any]], dict[str, Any]],
+    name: str,
+    snapshot: StoredSnapshot | SharedSnapshot,
+    body: bytes,
+) -> EndpointResult:
+    """
+    Counterpart of a module's ``handle_request`` for a stored snapshot
+
+    The optional body carries only the non-snapshot parameters (e.g.
+    monthsOfData); the data itself comes from ``snapshot``.
+
+    Raises:
+        SnapshotNotFoundError: If a shared snapshot was dropped meanwhile
+    """
+    data = resolve_snapshot(snapshot)
+    return run_endpoint(
+        lambda: process(build_request(data, decode_json_object(body) if body else {})), name
+    )
+
+
+def uses_process_state(payload: bytes, state_fields: tuple[bytes, ...]) -> bool:
+    """
+    Whether a request body may use per-user state that only this process sees
+
+    Under a result cache backend other processes do not share (``memory``,
+    or ``none``), per-user state kept in a pool worker would be invisible to
+    the requests the other lanes serve, so requests naming one of
+    ``state_fields`` (quoted JSON keys) all run in the fast lane. A body
+    that merely mentions one in a value only costs a run in that lane.
+    """
+    return not shared_across_processes() and any(field in payload for field in state_fields)
+
+
+async def dispatch_json_endpoint(
+    request: Request,
+    handle_request: Callable[[bytes], EndpointResult],
+    snapshot_request: Callable[[StoredSnapshot | SharedSnapshot, bytes], EndpointResult],
+    state_fields: tuple[bytes, ...] = (),
+    snapshot_state: bool = False,
+) -> JSONResponse:
+    """
+    Run a shared ``handle_request`` (same code as the Vercel handlers) in the pool
+
+    With a ``snapshotId`` query parameter ``snapshot_request`` runs instead,
+    over the stored snapshot in the lane matching its size. Requests using
+    per-user state (see uses_process_state) run in the fast lane; with
+    ``snapshot_state`` every snapshot request does.
+    """
+    payload = await request.body()
+    pinned = uses_process_state(payload, state_fields)
+    snapshot_key = request.query_params.get("snapshotId")
+    if snapshot_key is None:
+        (status_code, content), headers = await run_analytics(
+            request, handle_request, payload, size=0 if pinned else None
+        )
+    else:
+        pinned = pinned or (snapshot_state and not shared_across_processes())
+        task_snapshot, size = await snapshot_task_input(snapshot_store.get(snapshot_key), pinned)
+        fn = partial(snapshot_request, task_snapshot)
+        (status_code, content), headers = await run_analytics(request, fn, payload, size=size)
+    return JSONResponse(status_code=status_code, content=content, headers=headers)
+
+
+@app.post("/analytics/categorization")
+async def categorize_merchants(request: Request) -> JSONResponse:
+    """
+    Analyze merchant patterns and suggest envelope budgets
+
+    Same contract as the Vercel function at POST /api/analytics/categorization.
+    """
+    return await dispatch_json_endpoint(
+        request,
+        categorization.handle_request,
+        partial(
+            handle_snapshot_request,
+            categorization_request,
+            categorization.process_column_categorization,
+            "categorization",
+        ),
+        state_fields=(b'"incremental"', b'"patterns"', b'"patternVersion"'),
+    )
+
+
+@app.get("/analytics/categorization")
+async def categorization_info() -> dict[str, Any]:
+    """Categorization service info"""
+    return categorization.SERVICE_INFO
+
+
+def spool_csv(data: bytes) -> IO[bytes]:
+    """A temporary file starting with ``data``, kept until the caller deletes it"""
+    spool = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+    spool.write(data)
+    return spool
+
+
+@app.post(
+    "/analytics/categorization/csv",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"text/csv": {"schema": {"type": "string"}}},
+        }
+    },
+)
+async def categorize_csv_export(
+    request: Request,
+    monthsOfData: int | None = Query(None, ge=1),
+    fieldMapping: str | None = None,
+    expensesPositive: bool = False,
+) -> JSONResponse:
+    """
+    Import a bank-export CSV and analyze its merchant patterns
+
+    The body is the raw CSV. Columns are detected from the header row like
+    the Go import function does; ``fieldMapping`` (a JSON object such as
+    ``{"date": "Transaction Date", "payee": "Payee"}``) overrides them. Set
+    ``expensesPositive`` for exports that list expenses as positive amounts;
+    ``monthsOfData`` defaults to the months the export's dates span.
+    The upload is buffered in memory up to 1 MiB and spooled to a temporary
+    file beyond that (written off the event loop); uploads over
+    ``ANALYTICS_CSV_MAX_BYTES`` (default 256 MiB) are rejected with 413. It
+    is then categorized as a stream in the compute pool lane matching its
+    size, so the response carries the categorization plus an ``import``
+    summary without holding the rows in memory.
+    """
+    try:
+        mapping = parse_field_mapping(fieldMapping)
+    except RequestError as e:
+        return JSONResponse(status_code=e.status_code, content=error_body(e.message))
+
+    buffer = bytearray()
+    spool: IO[bytes] | None = None
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > CSV_MAX_BYTES:
+                message = f"CSV upload exceeds the {CSV_MAX_BYTES} byte limit"
+                return JSONResponse(status_code=413, content=error_body(message))
+            if spool is not None:
+                await run_in_threadpool(spool.write, chunk)
+                continue
+            buffer += chunk
+            if len(buffer) > CSV_SPOOL_BYTES:
+                spool = await run_in_threadpool(spool_csv, bytes(buffer))
+                buffer.clear()
+        if spool is not None:
+            await run_in_threadpool(spool.close)
+
+        upload = bytes(buffer) if spool is None else spool.name
+        status_code, content = await compute_pool.run(
+            run_endpoint,
+            partial(
+                categorize_csv_upload,
+                upload,
+                field_mapping=mapping,
+                months_of_data=monthsOfData,
+                expenses_positive=expensesPositive,
+            ),
+            "csv_import",
+            size=size,
+        )
+    finally:
+        if spool is not None:
+            spool.close()
+            await run_in_threadpool(os.unlink, spool.name)
+    return JSONResponse(status_code=status_code, content=content)
+
+
+@app.post("/analytics/envelope-suggestions")
+async def suggest_envelopes(request: Request) -> JSONResponse:
+    """
+    Suggest an existing envelope for each unassigned transaction
+
+    Same contract as the Vercel function at POST /api/analytics/envelope_suggestions.
+    """
+    return await dispatch_json_endpoint(
+        request,
+        envelope_suggestions.handle_request,
+        partial(
+            handle_snapshot_request,
+            envelope_suggestion_request,
+            envelope_suggestions.process_envelope_suggestions,
+            "envelope_suggestions",
+        ),
+        state_fields=(b'"userId"',),
+        snapshot_state=True,
+    )
+
+
+@app.get("/analytics/envelope-suggestions")
+async def envelope_suggestions_info() -> dict[str, Any]:
+    """Envelope suggestion service info"""
+    return envelope_suggestions.SERVICE_INFO
+
+
+@app.post("/analytics/prediction")
+async def predict_payday(request: Request) -> JSONResponse:
+    """
+    Predict next payday from paycheck history
+
+    Same contract as the Vercel function at POST /api/analytics/prediction.
+    """
+    return await dispatch_json_endpoint(
+        request,
+        prediction.handle_request,
+        partial(
+            handle_snapshot_request, prediction_request, prediction.process_prediction, "prediction"
+        ),
+    )
+
+
+@app.get("/analytics/prediction")
+async def prediction_info() -> dict[str, Any]:
+    """Prediction service info"""
+    return prediction.SERVICE_INFO
+
+
+@app.post("/analytics/recurring")
+async def detect_recurring(request: Request) -> JSONResponse:
+    """
+    Detect recurring charges and subscriptions per merchant
+
+    Same contract as the Vercel function at POST /api/analytics/recurring.
+    """
+    return await dispatch_json_endpoint(
+        request,
+        recurring.handle_request,
+        partial(
+            handle_snapshot_request,
+            recurring_request,
+            recurring.process_column_recurring,
+            "recurring",
+        ),
+    )
+
+
+@app.get("/analytics/recurring")
+async def recurring_info() -> dict[str, Any]:
+    """Recurring charge service info"""
+    return recurring.SERVICE_INFO
+
+
+@app.post("/autofunding")
+async def simulate_autofunding(request: Request) -> JSONResponse:
+    """
+    Simulate autofunding rule execution without making changes
+
+    Same contract as the Vercel function at POST /api/autofunding.
+    """
+    return await dispatch_json_endpoint(
+        request,
+        autofunding.handle_request,
+        partial(
+            handle_snapshot_request,
+            autofunding_request,
+            autofunding.process_autofunding,
+            "autofunding",
+        ),
+    )
+
+
+@app.get("/autofunding")
+async def autofunding_info() -> dict[str, Any]:
+    """AutoFunding service info"""
+    return autofunding.SERVICE_INFO
+
+
+@app.post("/analytics/pipeline")
+async def analytics_pipeline(request: Request) -> JSONResponse:
+    """
+    Run audit, categorization, prediction and autofunding in one request
+
+    The body is a full budget export (``budget``, ``envelopes``,
+    ``transactions``, ``autoFundingRules``) plus optional per-stage
+    ``options``, e.g. ``{"categorization": {"monthsOfData": 4}}``. It is
+    parsed once; the stages then run concurrently over the shared data and
+    each reports its own result or error and duration. The parsed export is
+    also kept in the snapshot store, so follow-up calls can use the returned
+    ``snapshotId``.
+    """
+    start = time.perf_counter()
+    payload = await request.body()
+    try:
+        snapshot, options = await load_pipeline_input(payload)
+    except PayloadValidationError as e:
+        raise RequestValidationError(e.errors) from None
+    parse_ms = (time.perf_counter() - start) * 1000
+
+    try:
+        stages = await run_pipeline(compute_pool, snapshot, options)
+    except RequestError as e:
+        return JSONResponse(status_code=e.status_code, content=error_body(e.message))
+    except BaseException:
+        snapshot.release()
+        raise
+
+    key = snapshot.content_id
+    try:
+        snapshot_store.put(key, snapshot)
+    except SnapshotTooLargeError:
+        # Not stored, so nothing else would free its shared-memory copy
+        snapshot.release()
+    return JSONResponse(
+        {
+            "success": all(stage["success"] for stage in stages.values()),
+            "snapshotId": key,
+            "parseMs": round(parse_ms, 3),
+            "totalMs": round((time.perf_counter() - start) * 1000, 3),
+            "stages": stages,
+        }
+    )
+
+
+@app.post("/snapshots", status_code=201)
+async def upload_snapshot(request: Request) -> dict[str, Any]:
+    """
+    Parse and validate a budget snapshot once for reuse by every endpoint
+
+    The body is an AuditSnapshot plus optional ``autoFundingRules``. Pass the
+    returned ``snapshotId`` as a query parameter to the audit, categorization,
+    prediction and autofunding endpoints instead of re-sending the data. IDs
+    hash the parsed data (the pipeline returns the same ID for the same
+    budget), and re-uploading unchanged bytes is free.
+    """
+    payload = await request.body()
+    upload_key = snapshot_id(payload)
+    key = snapshot_store.uploaded(upload_key)
+    if key is not None:
+        with contextlib.suppress(SnapshotNotFoundError):
+            return {"snapshotId": key, **snapshot_store.get(key).summary()}
+    try:
+        snapshot = await load_stored_snapshot(payload)
+    except PayloadValidationError as e:
+        raise RequestValidationError(e.errors) from None
+    snapshot_store.put(snapshot.content_id, snapshot, upload_key)
+    return {"snapshotId": snapshot.content_id, **snapshot.summary()}
+
+
+@app.delete("/snapshots/{snapshot_key}", status_code=204)
+async def delete_snapshot(snapshot_key: str) -> Response:
+    """Drop a stored snapshot"""
+    if not snapshot_store.delete(snapshot_key):
+        raise SnapshotNotFoundError(f"Snapshot not found: {snapshot_key}")
+    return Response(status_code=204)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus text exposition of request, function and cache metrics"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profiles")
+async def list_profiles(request: Request) -> dict[str, Any]:
+    """List stored request profiles (operator token required)"""
+    _require_profile_token(request)
+    return {"profiles": profile_store.list_ids()}
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request) -> dict[str, Any]:
+    """Fetch a stored request profile (operator token required)"""
+    _require_profile_token(request)
+    report = profile_store.get(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
+
+
+def _require_profile_token(request: Request) -> None:
+    if not is_profile_requested(request.headers):
+        raise ProfilingForbiddenError(f"{PROFILE_HEADER} header required")
+
+
+@app.get("/debug/single-flight")
+async def single_flight_stats(request: Request) -> dict[str, Any]:
+    """Request keys with the most coalesced duplicates (operator token required)"""
+    _require_profile_token(request)
+    return {"inFlight": single_flight.in_flight, "keys": single_flight.stats()}
+
+
+@app.get("/debug/flamegraph", response_class=PlainTextResponse)
+async def flamegraph(request: Request, minutes: int = 5) -> PlainTextResponse:
+    """
+    Collapsed-stack samples for the last N minutes (operator token required)
+
+    Feed the output to flamegraph.pl or speedscope to render a flamegraph.
+    """
+    _require_profile_token(request)
+    if minutes < 1:
+        raise HTTPException(status_code=400, detail="minutes must be a positive integer")
+    return PlainTextResponse(sampler.collapsed(minutes))
+
+
+@app.get("/debug/traces")
+async def traces(request: Request, trace_id: str | None = Query(None, alias="traceId")) -> Any:
+    """
+    Buffered spans as an OTLP/JSON export request (operator token required)
+
+    Only available with ANALYTICS_TRACE_EXPORTER=memory; pass traceId to
+    fetch a single trace.
+    """
+    _require_profile_token(request)
+    exporter = get_exporter()
+    if not isinstance(exporter, InMemorySpanExporter):
+        raise HTTPException(status_code=404, detail="In-memory tracing is not enabled")
+    return otlp_request(exporter.spans(trace_id))
+
+
 @app.get("/health")
-def health_check() -> dict[str, Any]:
+async def health_check() -> dict[str, Any]:
     """
     Detailed health check endpoint
     Returns service status and capabilities
@@ -76,11 +1044,26 @@ def health_check() -> dict[str, Any]:
         "status": "healthy",
         "service": "VioletVault Analytics API",
         "version": "1.0.0",
-        "endpoints": {"audit": "/audit/envelope-integrity"},
+        "endpoints": {
+            "audit": "/audit/envelope-integrity",
+            "categorization": "/analytics/categorization",
+            "csvCategorization": "/analytics/categorization/csv",
+            "envelopeSuggestions": "/analytics/envelope-suggestions",
+            "prediction": "/analytics/prediction",
+            "recurring": "/analytics/recurring",
+            "autofunding": "/autofunding",
+            "pipeline": "/analytics/pipeline",
+            "metrics": "/metrics",
+            "snapshots": "/snapshots",
+        },
+        "computePool": compute_pool.stats(),
+        "snapshotStore": snapshot_store.stats(),
     }
 
 
 if __name__ == "__main__":
     import uvicorn
 
+    # A single long-lived process keeps compiled patterns and caches warm and
+    # serves every endpoint over HTTP/1.1 keep-alive
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,432 @@
+"""
+Prometheus-Compatible Metrics
+Dependency-free counters, gauges and histograms rendered in the Prometheus
+text exposition format
+
+Exposed by the FastAPI app at ``GET /metrics`` and optionally written to a
+local file (``ANALYTICS_METRICS_FILE``) for node_exporter's textfile
+collector. Recording a sample is a ``perf_counter`` call plus a locked list
+increment, so instrumentation stays well under 1% of request cost.
+
+Worker processes in the compute pool record into their own registry; the
+pool drains those samples after each job and merges them into the parent.
+"""
+
+import functools
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, MutableMapping
+from typing import Any, TypeVar, cast
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LabelValues = tuple[str, ...]
+
+# Latency buckets in seconds
+DURATION_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+# Payload size buckets in bytes
+SIZE_BUCKETS: tuple[float, ...] = (
+    1024,
+    16 * 1024,
+    256 * 1024,
+    1024 * 1024,
+    16 * 1024 * 1024,
+    64 * 1024 * 1024,
+)
+
+# Coarse request size classes used as a label on the latency histogram
+_SIZE_CLASSES: tuple[tuple[int, str], ...] = (
+    (1024, "le_1KiB"),
+    (64 * 1024, "le_64KiB"),
+    (1024 * 1024, "le_1MiB"),
+    (16 * 1024 * 1024, "le_16MiB"),
+)
+
+
+def size_class(num_bytes: int) -> str:
+    """Map a payload size to a low-cardinality label value"""
+    for limit, label in _SIZE_CLASSES:
+        if num_bytes <= limit:
+            return label
+    return "gt_16MiB"
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    """Base class: name, help text, label names and a lock"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def render(self) -> list[str]:
+        """Exposition lines for the metric's samples (the header is separate)"""
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+    def drain(self) -> dict[LabelValues, float]:
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values: dict[LabelValues, float]) -> None:
+        for labels, amount in values.items():
+            self.inc(amount, labels)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (not merged across processes)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, labels: LabelValues = ()) -> None:
+        self.inc(-amount, labels)
+
+    def set(self, value: float, labels: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed bucket bounds"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[LabelValues, list[float]] = {}
+
+    def observe(self, value: float, labels: LabelValues = ()) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, labels: LabelValues = ()) -> int:
+        series = self._series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines: list[str] = []
+        for labels, series in items:
+            cumulative = 0.0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), series[:-1], strict=True):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} "
+                    f"{_format_value(cumulative)}"
+                )
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_str} {_format_value(cumulative)}")
+        return lines
+
+    def drain(self) -> dict[LabelValues, list[float]]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: dict[LabelValues, list[float]]) -> None:
+        with self._lock:
+            for labels, values in series.items():
+                current = self._series.get(labels)
+                if current is None:
+                    self._series[labels] = list(values)
+                else:
+                    for i, value in enumerate(values):
+                        current[i] += value
+
+
+class MetricsRegistry:
+    """Collection of metrics plus render-time collectors"""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], list[str]]) -> None:
+        """Register a callable producing extra exposition lines at render time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            samples = metric.render()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+    def drain(self) -> dict[str, Any]:
+        """Take (and reset) counter/histogram samples recorded in this process"""
+        snapshot: dict[str, Any] = {}
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Counter | Histogram):
+                values = metric.drain()
+                if values:
+                    snapshot[name] = values
+        return snapshot
+
+    def merge(self, snapshot: dict[str, Any]) -> None:
+        """Fold samples drained from another process into this registry"""
+        for name, values in snapshot.items():
+            metric = self._metrics.get(name)
+            if isinstance(metric, Counter | Histogram):
+                metric.merge(values)
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION: Histogram = REGISTRY.register(
+    Histogram(
+        "analytics_http_request_duration_seconds",
+        "HTTP request latency by route and request size class",
+        ("method", "route", "status", "size_class"),
+    )
+)
+HTTP_REQUEST_SIZE: Histogram = REGISTRY.register(
+    Histogram(
+        "analytics_http_request_size_bytes",
+        "HTTP request body size",
+        ("route",),
+        buckets=SIZE_BUCKETS,
+    )
+)
+HTTP_RESPONSE_SIZE: Histogram = REGISTRY.register(
+    Histogram(
+        "analytics_http_response_size_bytes",
+        "HTTP response body size",
+        ("route",),
+        buckets=SIZE_BUCKETS,
+    )
+)
+HTTP_IN_FLIGHT: Gauge = REGISTRY.register(
+    Gauge("analytics_http_requests_in_flight", "HTTP requests currently being served")
+)
+FUNCTION_DURATION: Histogram = REGISTRY.register(
+    Histogram(
+        "analytics_function_duration_seconds",
+        "Wall time spent inside instrumented analytics functions",
+        ("function",),
+    )
+)
+CACHE_REQUESTS: Counter = REGISTRY.register(
+    Counter(
+        "analytics_cache_requests_total",
+        "Cache lookups by cache name and result (hit/miss)",
+        ("cache", "result"),
+    )
+)
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1) -> None:
+    """Count ``count`` cache lookups; hit ratios are derived at render time"""
+    CACHE_REQUESTS.inc(float(count), (cache, "hit" if hit else "miss"))
+
+
+def _cache_hit_ratio_lines() -> list[str]:
+    totals: dict[str, list[float]] = {}
+    for (cache, result), value in list(CACHE_REQUESTS._values.items()):
+        entry = totals.setdefault(cache, [0.0, 0.0])
+        entry[0 if result == "hit" else 1] += value
+    if not totals:
+        return []
+    name = "analytics_cache_hit_ratio"
+    lines = [f"# HELP {name} Fraction of cache lookups served from cache", f"# TYPE {name} gauge"]
+    for cache, (hits, misses) in sorted(totals.items()):
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        lines.append(f'{name}{{cache="{_escape(cache)}"}} {_format_value(round(ratio, 6))}')
+    return lines
+
+
+REGISTRY.add_collector(_cache_hit_ratio_lines)
+
+
+def timed(function: str) -> Callable[[F], F]:
+    """Record the wall time of every call to the decorated function"""
+
+    def decorator(fn: F) -> F:
+        labels = (function,)
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                FUNCTION_DURATION.observe(time.perf_counter() - start, labels)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def write_metrics_file(path: str) -> None:
+    """Atomically write the current exposition to ``path`` (textfile collector format)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+ASGIApp = Callable[[Scope, Receive, Send], Awaitable[None]]
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, payload sizes and in-flight requests
+
+    Routes are labelled by their path template (e.g. ``/audit/envelope-integrity``)
+    so cardinality stays bounded; unmatched paths share the ``unmatched`` label.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        request_bytes = 0
+        response_bytes = 0
+        status = "500"
+
+        async def counting_receive() -> Message:
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal response_bytes, status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                (scope["method"], route_label, status, size_class(request_bytes)),
+            )
+            HTTP_REQUEST_SIZE.observe(request_bytes, (route_label,))
+            HTTP_RESPONSE_SIZE.observe(response_bytes, (route_label,))
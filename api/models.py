@@ -3,9 +3,25 @@ Data Models for VioletVault Analytics Service
 Mirrors the TypeScript/Zod schemas from the frontend
 """
 
-from typing import Literal
-
-from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+# Mirrors EnvelopeTypeSchema (liability subtypes such as "bill" included)
+EnvelopeType = Literal[
+    "standard",
+    "goal",
+    "liability",
+    "supplemental",
+    "personal",
+    "credit_card",
+    "mortgage",
+    "auto",
+    "student",
+    "business",
+    "other",
+    "bill",
+]
 
 
 class Envelope(BaseModel):
@@ -26,9 +42,7 @@ class Envelope(BaseModel):
     description: str | None = Field(None, max_length=500, description="Description")
 
     # Discriminated Union Type
-    type: Literal["standard", "goal", "liability", "supplemental"] = Field(
-        default="standard", description="Envelope type"
-    )
+    type: EnvelopeType = Field(default="standard", description="Envelope type")
 
     # Goal specific
     targetAmount: float | None = Field(None, ge=0)
@@ -112,6 +126,49 @@ class AuditSnapshot(BaseModel):
     metadata: BudgetMetadata = Field(..., description="Budget metadata")
 
 
+class SnapshotUpload(AuditSnapshot):
+    """
+    Budget snapshot uploaded once and reused by every analytics endpoint
+    Auto-funding rules are validated when a simulation uses them
+    """
+
+    autoFundingRules: list[dict[str, Any]] = Field(
+        default_factory=list, description="Auto-funding rules to simulate"
+    )
+
+
+class BudgetExport(BaseModel):
+    """
+    Full budget export, as written by generate_test_data.py
+    Only the parts the analytics pipeline uses are parsed; the rest is ignored
+    """
+
+    budget: BudgetMetadata = Field(..., description="Budget record (a one-element list in exports)")
+    envelopes: list[Envelope] = Field(..., description="All envelopes in the budget")
+    transactions: list[Transaction] = Field(..., description="All transactions")
+    autoFundingRules: list[dict[str, Any]] = Field(
+        default_factory=list, description="Auto-funding rules to simulate"
+    )
+    options: dict[str, dict[str, Any]] = Field(
+        default_factory=dict, description="Per-stage pipeline parameters keyed by stage name"
+    )
+
+    @field_validator("budget", mode="before")
+    @classmethod
+    def _unwrap_budget(cls, value: Any) -> Any:
+        if isinstance(value, list) and len(value) == 1:
+            return value[0]
+        return value
+
+    def to_snapshot(self) -> SnapshotUpload:
+        return SnapshotUpload.model_construct(
+            envelopes=self.envelopes,
+            transactions=self.transactions,
+            metadata=self.budget,
+            autoFundingRules=self.autoFundingRules,
+        )
+
+
 class IntegrityViolation(BaseModel):
     """
     Represents a single integrity violation found during audit
@@ -143,3 +200,34 @@ class IntegrityAuditResult(BaseModel):
     summary: dict = Field(..., description="Summary statistics (counts by severity and type)")
     timestamp: str = Field(..., description="When the audit was performed (ISO format)")
     snapshotSize: dict = Field(..., description="Size of the data snapshot analyzed")
+
+
+class PagedAuditResult(IntegrityAuditResult):
+    """
+    One page of a (possibly grouped) integrity audit
+    Summary counts cover the whole audit before grouping
+    """
+
+    totalViolations: int = Field(..., description="Violations across all pages")
+    nextCursor: str | None = Field(None, description="Cursor for the next page, if any")
+
+
+class PayloadValidationError(Exception):
+    """Picklable carrier for request validation errors raised inside pool workers"""
+
+    def __init__(self, errors: list[Any]) -> None:
+        super().__init__(errors)
+        self.errors = errors
+
+
+def payload_validation_error(e: ValidationError, *loc: str) -> PayloadValidationError:
+    """
+    Convert a body validation error into FastAPI's error shape
+
+    ``loc`` is the path of the validated value within the body, e.g.
+    ``("transactions",)`` for a transaction array validated on its own.
+    """
+    errors: list[dict[str, Any]] = [
+        {**dict(err), "loc": ("body", *loc, *err["loc"])} for err in e.errors(include_url=False)
+    ]
+    return PayloadValidationError(errors)
@@ -0,0 +1,559 @@
+"""
+Parallel Transaction Validation
+Validates very large transaction arrays in chunks across compute pool workers
+
+Pydantic validates ``list[Transaction]`` on a single core, which dominates
+upload latency beyond roughly 100k rows. Payloads larger than
+ANALYTICS_PARALLEL_VALIDATION_BYTES are therefore validated in three steps:
+
+1. The caller copies the raw body into a ``multiprocessing.shared_memory``
+   block once. One worker finds the top-level ``transactions`` array and
+   cuts the rest of the document into one segment per worker at likely
+   element starts, without decoding it.
+2. Each segment is walked concurrently, element by element, to check its
+   cut and find where the array ends.
+3. The array is cut into byte ranges at element starts recorded by the
+   walks, and each range is validated concurrently in its own worker,
+   straight from shared memory. The worker with the last range also
+   validates the rest of the document (the header).
+4. The caller joins the columns in order. Validation errors are reported
+   with their global row index, as a serial validation would report them.
+
+Only offsets, the header and the validated columns cross process
+boundaries; the columns are the bulk of that.
+
+The cut stays cheap by not tracking every token. A likely element start
+is an object with the same first key as the array's first element, right
+after a comma; counting quotes before it (less escaped ones) tells whether
+it lies inside a string. The walks track depth (skipping runs of flat
+objects in one regex match), so a cut inside a nested value is caught
+before any validation starts: walking from the element start before it
+overruns it. Everything after the array's first element is walked,
+because the array's end is only known once a walk reaches it; segments
+past the end are then ignored. Payloads that cannot be cut
+this way, or are malformed, are validated serially instead, so their
+errors match what a single pass reports.
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import re
+from collections.abc import Sequence
+from functools import cache
+from multiprocessing import shared_memory
+from typing import Any, cast
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from api.compute_pool import ComputePool
+from api.models import Transaction, payload_validation_error
+from api.snapshots import TransactionColumns
+from api.tracing import span
+
+DEFAULT_MIN_BYTES = 16 * 1024 * 1024
+DEFAULT_MIN_CHUNK_BYTES = 2 * 1024 * 1024
+
+# (byte offset, byte length) of a run of array elements, without brackets
+ChunkRange = tuple[int, int]
+
+# (offset of the comma before an array element, offset of the element)
+ElementStart = tuple[int, int]
+
+# (offsets of the array's opening bracket and its first element, the starts
+# of the walk segments after the first)
+SplitResult = tuple[int, int, list[ElementStart]]
+
+# (offset of the array's closing bracket, or None if the walk reached the end
+# of its segment; element starts recorded on the way)
+WalkOutcome = tuple[int | None, list[ElementStart]]
+
+# (ranges before the last run, offsets of the last run and the closing bracket)
+ChunkPlan = tuple[list[ChunkRange], int, int]
+
+# (columns, or None if a row is invalid; errors indexed within the run; rows in the run)
+ChunkOutcome = tuple[TransactionColumns | None, list[dict[str, Any]], int]
+
+_STRING_PATTERN = rb'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+_WHITESPACE = re.compile(rb"\s*+")
+_STRING = re.compile(_STRING_PATTERN, re.DOTALL)
+# A value holding no nested object or array (strings are consumed whole)
+_FLAT_VALUE = re.compile(
+    rb"(?:\{[^\"{}\[\]]*+(?:"
+    + _STRING_PATTERN
+    + rb"[^\"{}\[\]]*+)*+\}|\[[^\"{}\[\]]*+(?:"
+    + _STRING_PATTERN
+    + rb"[^\"{}\[\]]*+)*+\]|"
+    + _STRING_PATTERN
+    + rb'|[^"{}\[\],\s]++)',
+    re.DOTALL,
+)
+# Flat objects, each followed by a comma
+_ELEMENT_RUN = re.compile(
+    rb"(?:\{[^\"{}\[\]]*+(?:" + _STRING_PATTERN + rb"[^\"{}\[\]]*+)*+\}\s*+,\s*+)*+", re.DOTALL
+)
+# Text up to the next bracket outside strings
+_NON_STRUCTURAL = re.compile(
+    rb"[^\"{}\[\]]*+(?:" + _STRING_PATTERN + rb"[^\"{}\[\]]*+)*+", re.DOTALL
+)
+# Backslash runs ending in a quote (the quote is escaped when the run is odd)
+_BACKSLASHES_BEFORE_QUOTE = re.compile(rb'(\\++)"')
+
+
+class _UnsplittableError(Exception):
+    """The payload is not JSON this scanner can split; validate it serially"""
+
+
+@cache
+def _transaction_list() -> TypeAdapter[list[Transaction]]:
+    return TypeAdapter(list[Transaction])
+
+
+def should_validate_in_parallel(pool: ComputePool, payload: bytes) -> bool:
+    """
+    Whether ``payload`` is large enough to split across the pool's workers
+
+    ANALYTICS_PARALLEL_VALIDATION_BYTES sets the threshold (default 16 MiB,
+    0 disables). Needs at least two process workers.
+    """
+    min_bytes = int(os.environ.get("ANALYTICS_PARALLEL_VALIDATION_BYTES", DEFAULT_MIN_BYTES))
+    return (
+        min_bytes > 0
+        and pool.process_workers > 1
+        and len(payload) >= max(min_bytes, pool.fast_lane_bytes + 1)
+    )
+
+
+def _is_malformed(errors: list[dict[str, Any]]) -> bool:
+    return any(err["type"] == "json_invalid" for err in errors)
+
+
+def _skip_ws(data: bytes, pos: int) -> int:
+    return cast(re.Match[bytes], _WHITESPACE.match(data, pos)).end()
+
+
+def _skip_value(data: bytes, pos: int) -> int:
+    """
+    End of the JSON value starting at ``pos``
+
+    Flat values are matched in one regex call; nested containers are walked
+    bracket by bracket, skipping their flat members whole.
+
+    Raises:
+        _UnsplittableError: If no well-formed value starts at ``pos``
+    """
+    flat = _FLAT_VALUE.match(data, pos)
+    if flat is not None:
+        return flat.end()
+    depth = 0
+    while pos < len(data):
+        char = data[pos : pos + 1]
+        if char in (b"{", b"["):
+            flat = _FLAT_VALUE.match(data, pos)
+            if flat is not None:
+                pos = flat.end()
+            else:
+                depth += 1
+                pos += 1
+        elif char in (b"}", b"]") and depth > 0:
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+        else:
+            end = cast(re.Match[bytes], _NON_STRUCTURAL.match(data, pos)).end()
+            if end == pos:
+                # An unterminated string or a stray closing bracket
+                raise _UnsplittableError
+            pos = end
+    raise _UnsplittableError
+
+
+def _array_start(data: bytes, key: str) -> int:
+    """
+    Offset of the opening bracket of the top-level ``key`` array
+
+    Only the members before it are scanned.
+
+    Raises:
+        _UnsplittableError: If the document is not an object whose ``key``
+            member is an array
+    """
+    pos = _skip_ws(data, 0)
+    if data[pos : pos + 1] != b"{":
+        raise _UnsplittableError
+    pos = _skip_ws(data, pos + 1)
+    while True:
+        name = _STRING.match(data, pos)
+        if name is None:
+            raise _UnsplittableError
+        pos = _skip_ws(data, name.end())
+        if data[pos : pos + 1] != b":":
+            raise _UnsplittableError
+        pos = _skip_ws(data, pos + 1)
+        if json.loads(name.group()) == key:
+            if data[pos : pos + 1] != b"[":
+                raise _UnsplittableError
+            return pos
+        pos = _skip_ws(data, _skip_value(data, pos))
+        if data[pos : pos + 1] != b",":
+            raise _UnsplittableError
+        pos = _skip_ws(data, pos + 1)
+
+
+def walk_elements(data: bytes, pos: int, checkpoint_bytes: int) -> WalkOutcome:
+    """
+    Walk array elements from the element start at ``pos`` until the array's
+    closing bracket or the end of ``data``, whichever comes first
+
+    Runs of flat objects are skipped in one regex match per
+    ``checkpoint_bytes``; an element start is recorded after each such stretch.
+
+    Raises:
+        _UnsplittableError: If the elements are not well-formed, or the last
+            one before the end of ``data`` is not followed by a comma
+    """
+    if data[pos : pos + 1] == b"]":
+        return pos, []
+    elements: list[ElementStart] = []
+    mark = pos
+    while True:
+        run = cast(re.Match[bytes], _ELEMENT_RUN.match(data, pos, pos + checkpoint_bytes))
+        if run.end() > pos:
+            pos = _skip_ws(data, run.end())
+        else:
+            pos = _skip_ws(data, _skip_value(data, pos))
+            char = data[pos : pos + 1]
+            if char == b"]":
+                return pos, elements
+            if char != b",":
+                raise _UnsplittableError
+            pos = _skip_ws(data, pos + 1)
+        if pos == len(data):
+            return None, elements
+        if pos - mark >= checkpoint_bytes:
+            elements.append((data.rfind(b",", mark, pos), pos))
+            mark = pos
+
+
+def _quotes(data: bytes, start: int, stop: int) -> int:
+    """Quotes in data[start:stop] not escaped by a backslash"""
+    count = data.count(b'"', start, stop)
+    if data.find(b"\\", start, stop) >= 0:
+        count -= sum(
+            len(run.group(1)) % 2 for run in _BACKSLASHES_BEFORE_QUOTE.finditer(data, start, stop)
+        )
+    return count
+
+
+def split_document(data: bytes, max_chunks: int, min_chunk_bytes: int) -> SplitResult | None:
+    """
+    Locate the ``transactions`` array and cut the rest of the document into
+    segments for walk_segment
+
+    Segments start at the first likely element start after each of
+    ``max_chunks`` evenly spaced offsets and are at least ``min_chunk_bytes``
+    long. They span everything after the array's first element, since
+    where the array ends is not known yet.
+
+    Returns:
+        None if the payload has no transaction array to split (validate it
+        serially instead), otherwise the SplitResult
+    """
+    try:
+        open_at = _array_start(data, "transactions")
+        first = _skip_ws(data, open_at + 1)
+        first_key = re.match(rb"\{\s*+(" + _STRING_PATTERN + rb")\s*+:", data[first : first + 256])
+    except (_UnsplittableError, UnicodeDecodeError, json.JSONDecodeError):
+        return None
+    if first_key is None:
+        # Empty, or not an array of objects
+        return open_at, first, []
+
+    element_start = re.compile(
+        rb",\s*+(\{\s*+" + re.escape(first_key.group(1)) + rb"\s*+:)", re.DOTALL
+    )
+    chunks = max(1, min(max_chunks, (len(data) - first) // max(1, min_chunk_bytes)))
+    stride = (len(data) - first) // chunks
+    segments: list[ElementStart] = []
+    outside = first
+    for index in range(1, chunks):
+        target = max(first + stride * index, outside + 1)
+        while (candidate := element_start.search(data, target)) is not None:
+            if _quotes(data, outside, candidate.start()) % 2 == 0:
+                break
+            target = candidate.end()
+        if candidate is None:
+            break
+        segments.append((candidate.start(), candidate.start(1)))
+        outside = candidate.start(1)
+    return open_at, first, segments
+
+
+def split_payload(
+    block_name: str, size: int, max_chunks: int, min_chunk_bytes: int
+) -> SplitResult | None:
+    """
+    split_document over a payload staged in shared memory
+
+    Runs in a worker process; the caller owns the block.
+    """
+    with span("validate.split", bytes=size) as split_span:
+        result = split_document(_read(block_name, 0, size), max_chunks, min_chunk_bytes)
+        split_span.set_attribute("segments", 0 if result is None else len(result[2]) + 1)
+    return result
+
+
+def walk_segment(
+    block_name: str, start: int, stop: int, checkpoint_bytes: int
+) -> WalkOutcome | None:
+    """
+    walk_elements over data[start:stop] of a payload staged in shared memory
+
+    Runs in a worker process. Offsets in the outcome are within the payload.
+
+    Returns:
+        None if the segment's elements are malformed or do not end at ``stop``
+    """
+    with span("validate.walk", bytes=stop - start):
+        try:
+            close_at, elements = walk_elements(
+                _read(block_name, start, stop - start), 0, checkpoint_bytes
+            )
+        except _UnsplittableError:
+            return None
+    return (
+        None if close_at is None else start + close_at,
+        [(start + comma, start + element) for comma, element in elements],
+    )
+
+
+def plan_chunks(
+    split: SplitResult, walks: Sequence[WalkOutcome | None], max_chunks: int, min_chunk_bytes: int
+) -> ChunkPlan | None:
+    """
+    Cut the transaction array into runs from the walks of its segments
+
+    Walks start at the array's first element, and each walk that reaches
+    the next segment proves that segment starts at an element too. The
+    first walk to find a closing bracket therefore finds the array's, and
+    later segments lie past it. Runs start at the recorded element start at
+    or after each of ``max_chunks`` evenly spaced offsets within the array.
+
+    Returns:
+        None if a walk failed or none found the closing bracket
+    """
+    _, first, segments = split
+    elements: list[ElementStart] = []
+    for index, walk in enumerate(walks):
+        if walk is None:
+            return None
+        if index > 0:
+            elements.append(segments[index - 1])
+        close_at, passed = walk
+        elements.extend(passed)
+        if close_at is not None:
+            break
+    else:
+        return None
+
+    starts = [element for _, element in elements]
+    chunks = max(1, min(max_chunks, (close_at - first) // max(1, min_chunk_bytes)))
+    ranges: list[ChunkRange] = []
+    start = first
+    for index in range(1, chunks):
+        found = bisect.bisect_left(starts, first + (close_at - first) * index // chunks)
+        if found == len(starts):
+            break
+        comma, element = elements[found]
+        if element > start:
+            ranges.append((start, comma - start))
+            start = element
+    return ranges, start, close_at
+
+
+def _read(block_name: str, offset: int, length: int) -> bytes:
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        return bytes(cast(memoryview, block.buf)[offset : offset + length])
+    finally:
+        block.close()
+
+
+def _validate_rows(data: bytes) -> ChunkOutcome:
+    """
+    Validate a JSON array of transactions
+
+    Error locations use row indices within ``data``
+    (``("body", "transactions", <row>, ...)``); the caller shifts them.
+    """
+    with span("validate.chunk", bytes=len(data)) as chunk_span:
+        try:
+            transactions = _transaction_list().validate_json(data)
+        except ValidationError as e:
+            errors = payload_validation_error(e, "transactions").errors
+            chunk_span.set_attribute("errors", len(errors))
+            rows = 0 if _is_malformed(errors) else len(json.loads(data))
+            return None, errors, rows
+        chunk_span.set_attribute("rows", len(transactions))
+    return TransactionColumns(transactions), [], len(transactions)
+
+
+def validate_chunk(block_name: str, offset: int, length: int) -> ChunkOutcome:
+    """
+    Validate one run of transactions read from shared memory
+
+    Runs in a worker process.
+    """
+    return _validate_rows(b"[" + _read(block_name, offset, length) + b"]")
+
+
+def validate_last_chunk(
+    block_name: str, size: int, model: type[BaseModel], open_at: int, start: int, close_at: int
+) -> tuple[Any, list[dict[str, Any]], ChunkOutcome] | None:
+    """
+    Validate the last run of transactions and the document around the array
+
+    Runs in a worker process. The header is the document with an empty
+    transaction array.
+
+    Returns:
+        None if the header is malformed, otherwise a tuple of (header or
+        None, header errors, the run's ChunkOutcome)
+    """
+    data = _read(block_name, 0, size)
+    try:
+        header = model.model_validate_json(data[:open_at] + b"[]" + data[close_at + 1 :])
+        header_errors: list[dict[str, Any]] = []
+    except ValidationError as e:
+        header, header_errors = None, payload_validation_error(e).errors
+    # A repeated transactions key would make the header disagree with the rows
+    if _is_malformed(header_errors) or getattr(header, "transactions", None):
+        return None
+    return header, header_errors, _validate_rows(b"[" + data[start:close_at] + b"]")
+
+
+def _stage(payload: bytes) -> str:
+    """Copy ``payload`` into a new shared memory block and return its name"""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(payload)))
+    try:
+        cast(memoryview, block.buf)[: len(payload)] = payload
+    finally:
+        block.close()
+    return block.name
+
+
+def _release(block_name: str) -> None:
+    block = shared_memory.SharedMemory(name=block_name)
+    block.close()
+    block.unlink()
+
+
+def _ordered_errors(
+    model: type[BaseModel], header_errors: list[dict[str, Any]], row_errors: list[dict[str, Any]]
+) -> list[dict[str, Any]]:
+    """Interleave header and row errors in model field order, like one validation pass"""
+    fields = list(model.model_fields)
+    position = fields.index("transactions")
+
+    def field_index(err: dict[str, Any]) -> int:
+        loc = err["loc"]
+        return fields.index(loc[1]) if len(loc) > 1 and loc[1] in fields else len(fields)
+
+    before = [err for err in header_errors if field_index(err) < position]
+    after = [err for err in header_errors if field_index(err) >= position]
+    return before + row_errors + after
+
+
+async def validate_in_parallel(
+    pool: ComputePool, payload: bytes, model: type[BaseModel]
+) -> tuple[Any, TransactionColumns, list[dict[str, Any]]] | None:
+    """
+    Validate ``payload`` against ``model`` with its transactions split across workers
+
+    ANALYTICS_VALIDATION_MIN_CHUNK_BYTES sets the smallest run of
+    transactions handed to a worker (default 2 MiB).
+
+    Args:
+        pool: Compute pool whose process lane runs the chunks
+        payload: Raw JSON body
+        model: Model with a ``transactions: list[Transaction]`` field
+
+    Returns:
+        None if the payload cannot be split or is malformed (validate it
+        serially instead), otherwise a tuple of (validated model without
+        transactions, the transactions column-wise, validation errors in
+        FastAPI's shape). The model is None whenever there are errors.
+
+    Raises:
+        PoolSaturatedError: If the process lane cannot admit the work
+    """
+    min_chunk_bytes = int(
+        os.environ.get("ANALYTICS_VALIDATION_MIN_CHUNK_BYTES", DEFAULT_MIN_CHUNK_BYTES)
+    )
+    checkpoint_bytes = max(1, min_chunk_bytes // 8)
+    size = len(payload)
+    block_name = await pool.run(_stage, payload)
+    try:
+        split = await pool.run(
+            split_payload, block_name, size, pool.process_workers, min_chunk_bytes, size=size
+        )
+        if split is None:
+            return None
+        starts = [split[1], *(element for _, element in split[2])]
+        walks = await asyncio.gather(
+            *(
+                pool.run(walk_segment, block_name, start, stop, checkpoint_bytes, size=size)
+                for start, stop in zip(starts, [*starts[1:], size], strict=True)
+            ),
+            return_exceptions=True,
+        )
+        for walk in walks:
+            if isinstance(walk, BaseException):
+                raise walk
+        plan = plan_chunks(
+            split, cast(list[WalkOutcome | None], walks), pool.process_workers, min_chunk_bytes
+        )
+        if plan is None:
+            return None
+        ranges, last_start, close_at = plan
+        open_at = split[0]
+        last, *outcomes = await asyncio.gather(
+            pool.run(
+                validate_last_chunk,
+                block_name,
+                size,
+                model,
+                open_at,
+                last_start,
+                close_at,
+                size=size,
+            ),
+            *(pool.run(validate_chunk, block_name, *chunk, size=size) for chunk in ranges),
+            return_exceptions=True,
+        )
+    finally:
+        _release(block_name)
+    for outcome in (last, *outcomes):
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+    if last is None:
+        return None
+    header, header_errors, last_outcome = cast(tuple[Any, list[dict[str, Any]], ChunkOutcome], last)
+    columns = TransactionColumns()
+    row_errors: list[dict[str, Any]] = []
+    first_row = 0
+    for chunk_columns, chunk_errors, rows in [*cast(list[ChunkOutcome], outcomes), last_outcome]:
+        if _is_malformed(chunk_errors):
+            return None
+        row_errors.extend(
+            {**err, "loc": (*err["loc"][:2], first_row + int(err["loc"][2]), *err["loc"][3:])}
+            for err in chunk_errors
+        )
+        if chunk_columns is not None:
+            columns.extend(chunk_columns)
+        first_row += rows
+    errors = _ordered_errors(model, header_errors, row_errors)
+    return (None if errors else header), columns, errors
@@ -0,0 +1,149 @@
+"""
+Unified Analytics Pipeline
+Runs audit, categorization, prediction and autofunding over one parsed export
+
+The export is parsed and validated once into a StoredSnapshot; every stage
+then derives its input from that shared data and runs as its own compute
+pool task, so the stages execute concurrently (in separate processes once
+the export is too large for the thread lane, reading one shared-memory copy
+of the snapshot). Each stage reports its own timing and outcome: a failing
+stage does not block or fail the others.
+"""
+
+import asyncio
+import time
+from collections.abc import Callable
+from typing import Any
+
+from api.analytics import EnvelopeIntegrityAuditor, categorization, prediction
+from api.autofunding import index as autofunding
+from api.compute_pool import ComputePool, PoolSaturatedError
+from api.endpoint import RequestError, run_endpoint
+from api.snapshots import (
+    SharedSnapshot,
+    StoredSnapshot,
+    autofunding_request,
+    categorization_request,
+    prediction_request,
+    resolve_snapshot,
+)
+
+
+def audit_stage(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """Integrity audit; ``params`` may set group_by"""
+    auditor = EnvelopeIntegrityAuditor()
+    result = auditor.audit(snapshot.to_audit_snapshot())
+    group_by = params.get("group_by")
+    if group_by is not None:
+        result.violations = auditor.group_violations(result.violations, group_by)
+    return result.model_dump(mode="json")
+
+
+def categorization_stage(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    return categorization.process_column_categorization(categorization_request(snapshot, params))
+
+
+def prediction_stage(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    return prediction.process_prediction(prediction_request(snapshot, params))
+
+
+def autofunding_stage(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    return autofunding.process_autofunding(autofunding_request(snapshot, params))
+
+
+PIPELINE_STAGES: dict[str, Callable[[StoredSnapshot, dict[str, Any]], dict[str, Any]]] = {
+    "audit": audit_stage,
+    "categorization": categorization_stage,
+    "prediction": prediction_stage,
+    "autofunding": autofunding_stage,
+}
+
+
+def run_stage(
+    name: str,
+    stage: Callable[[StoredSnapshot, dict[str, Any]], dict[str, Any]],
+    snapshot: StoredSnapshot | SharedSnapshot,
+    params: dict[str, Any],
+) -> dict[str, Any]:
+    """
+    Run one stage, capturing its duration and any failure
+
+    Errors are mapped exactly like the standalone endpoints (client errors
+    keep their message, anything else is logged and sanitized). A snapshot
+    dropped from shared memory meanwhile fails the stage like any error.
+    """
+    start = time.perf_counter()
+    status_code, body = run_endpoint(lambda: stage(resolve_snapshot(snapshot), params), name)
+    outcome: dict[str, Any] = {
+        "success": status_code == 200,
+        "statusCode": status_code,
+        "durationMs": round((time.perf_counter() - start) * 1000, 3),
+    }
+    if status_code == 200:
+        outcome["result"] = body
+    else:
+        outcome["error"] = body["error"]
+    return outcome
+
+
+async def run_pipeline(
+    pool: ComputePool, snapshot: StoredSnapshot, options: dict[str, dict[str, Any]]
+) -> dict[str, Any]:
+    """
+    Run every stage concurrently over ``snapshot``
+
+    Stages pick their lane by the snapshot's estimated size: small exports
+    share the parsed data in the thread lane, while large ones run in
+    process workers so the stages are not serialized by the GIL. Those are
+    passed a reference to the snapshot's shared-memory copy (see
+    ``StoredSnapshot.share``), made once for all stages; the caller frees it
+    with ``release`` unless the snapshot store takes the snapshot over.
+
+    Args:
+        pool: Compute pool to run the stages in
+        snapshot: Parsed export shared by all stages
+        options: Per-stage parameters keyed by stage name
+
+    Returns:
+        Mapping of stage name to its outcome
+
+    Raises:
+        RequestError: If options name an unknown stage
+    """
+    unknown = sorted(set(options) - set(PIPELINE_STAGES))
+    if unknown:
+        raise RequestError(f"Unknown pipeline stages in options: {', '.join(unknown)}")
+
+    task_snapshot: StoredSnapshot | SharedSnapshot = snapshot
+    if pool.uses_process_lane(snapshot.nbytes):
+        task_snapshot = await asyncio.to_thread(snapshot.share)
+
+    names = list(PIPELINE_STAGES)
+    outcomes = await asyncio.gather(
+        *(
+            pool.run(
+                run_stage,
+                name,
+                PIPELINE_STAGES[name],
+                task_snapshot,
+                options.get(name, {}),
+                size=snapshot.nbytes,
+            )
+            for name in names
+        ),
+        return_exceptions=True,
+    )
+
+    stages: dict[str, Any] = {}
+    for name, outcome in zip(names, outcomes, strict=True):
+        if isinstance(outcome, PoolSaturatedError):
+            outcome = {
+                "success": False,
+                "statusCode": 503,
+                "durationMs": 0.0,
+                "error": str(outcome),
+            }
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        stages[name] = outcome
+    return stages
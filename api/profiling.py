@@ -0,0 +1,201 @@
+"""
+On-Demand Request Profiling
+Runs a single analytics request under cProfile when an operator asks for it
+
+Profiling is enabled only when ``ANALYTICS_PROFILE_TOKEN`` is set; a request
+opts in by sending the same value in the ``X-Profile-Token`` header. The
+profiler runs inside the compute pool next to the work itself, and the
+resulting report (broken down by audit / simulation / model layer) is kept
+in a bounded in-memory store and optionally written to
+``ANALYTICS_PROFILE_DIR`` as ``<id>.prof`` (pstats) and ``<id>.json``.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from typing import Any
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Source groups used to break the report down by layer (matched on path fragments)
+PROFILE_GROUPS: dict[str, tuple[str, ...]] = {
+    "audit": ("api/analytics/audit.py",),
+    "simulation": (
+        "api/autofunding/simulation.py",
+        "api/autofunding/rules.py",
+        "api/autofunding/conditions.py",
+        "api/autofunding/currency.py",
+    ),
+    "categorization": ("api/analytics/categorization.py",),
+    "prediction": ("api/analytics/prediction.py",),
+    "models": ("api/models.py", "api/autofunding/models.py", "/pydantic/", "/pydantic_core/"),
+}
+
+DEFAULT_FUNCTIONS_PER_GROUP = 15
+DEFAULT_MAX_STORED_PROFILES = 20
+
+# One cProfile session per process: on Python 3.12+ cProfile sits on
+# sys.monitoring, which refuses a second active profiler
+_profile_lock = threading.Lock()
+
+
+class ProfilingForbiddenError(Exception):
+    """Raised when a profile is requested without a valid operator token"""
+
+
+def profiling_token() -> str | None:
+    """Operator token from the environment (profiling is disabled when unset)"""
+    return os.environ.get("ANALYTICS_PROFILE_TOKEN") or None
+
+
+def is_profile_requested(headers: Mapping[str, str]) -> bool:
+    """
+    Check whether a request asks to be profiled
+
+    Raises:
+        ProfilingForbiddenError: If the header is present but the token does not match
+    """
+    supplied = headers.get(PROFILE_HEADER)
+    if supplied is None:
+        return False
+    expected = profiling_token()
+    if expected is None or not hmac.compare_digest(supplied.encode(), expected.encode()):
+        raise ProfilingForbiddenError("Invalid profiling token")
+    return True
+
+
+def _group_for(filename: str) -> str:
+    path = filename.replace(os.sep, "/")
+    for group, fragments in PROFILE_GROUPS.items():
+        if any(fragment in path for fragment in fragments):
+            return group
+    return "other"
+
+
+def _short_path(filename: str) -> str:
+    path = filename.replace(os.sep, "/")
+    marker = path.rfind("/api/")
+    if marker >= 0:
+        return path[marker + 1 :]
+    return path.rsplit("/site-packages/", 1)[-1]
+
+
+def build_report(
+    profiler: cProfile.Profile, elapsed: float, limit: int = DEFAULT_FUNCTIONS_PER_GROUP
+) -> dict[str, Any]:
+    """
+    Summarize profiler stats by source group
+
+    Each group lists its most expensive functions by cumulative time and the
+    group's total self time; a plain-text pstats listing is included as well.
+    """
+    stats = pstats.Stats(profiler)
+    raw: dict[tuple[str, int, str], tuple[int, int, float, float, Any]]
+    raw = stats.stats  # type: ignore[attr-defined]
+
+    groups: dict[str, dict[str, Any]] = {}
+    for (filename, line, name), (primitive, calls, self_time, cumulative, _) in raw.items():
+        group = groups.setdefault(_group_for(filename), {"selfSeconds": 0.0, "functions": []})
+        group["selfSeconds"] += self_time
+        group["functions"].append(
+            {
+                "function": f"{_short_path(filename)}:{line}({name})",
+                "calls": calls,
+                "primitiveCalls": primitive,
+                "selfSeconds": round(self_time, 6),
+                "cumulativeSeconds": round(cumulative, 6),
+            }
+        )
+
+    for group in groups.values():
+        group["selfSeconds"] = round(group["selfSeconds"], 6)
+        group["functions"].sort(key=lambda f: f["cumulativeSeconds"], reverse=True)
+        del group["functions"][limit:]
+
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit * 2)
+
+    return {
+        "elapsedSeconds": round(elapsed, 6),
+        "groups": groups,
+        "text": text.getvalue(),
+    }
+
+
+def profile_call(fn: Callable[..., Any], *args: Any) -> tuple[Any, dict[str, Any], bytes]:
+    """
+    Run ``fn(*args)`` under cProfile
+
+    Module-level so it can be shipped to compute pool worker processes.
+    Concurrent calls in one process (fast lane threads) run one at a time.
+
+    Returns:
+        Tuple of (fn result, report, marshalled pstats data)
+    """
+    profiler = cProfile.Profile()
+    with _profile_lock:
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            result = fn(*args)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+    report = build_report(profiler, elapsed)
+    report["function"] = getattr(fn, "__qualname__", repr(fn))
+    # Same format as pstats.Stats.dump_stats, loadable with pstats/snakeviz
+    stats_data = marshal.dumps(profiler.stats)
+    return result, report, stats_data
+
+
+class ProfileStore:
+    """Bounded store of recent profile reports, optionally mirrored to disk"""
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_STORED_PROFILES, directory: str | None = None
+    ) -> None:
+        self.max_entries = max_entries
+        self.directory = directory
+        self._reports: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ProfileStore":
+        return cls(directory=os.environ.get("ANALYTICS_PROFILE_DIR") or None)
+
+    def add(self, report: dict[str, Any], stats_data: bytes, endpoint: str) -> str:
+        """Store a report and return its ID"""
+        profile_id = uuid.uuid4().hex
+        report = {**report, "id": profile_id, "endpoint": endpoint, "createdAt": time.time()}
+        with self._lock:
+            self._reports[profile_id] = report
+            while len(self._reports) > self.max_entries:
+                self._reports.popitem(last=False)
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            base = os.path.join(self.directory, profile_id)
+            with open(f"{base}.prof", "wb") as f:
+                f.write(stats_data)
+            with open(f"{base}.json", "w") as f:
+                json.dump(report, f, indent=2)
+        return profile_id
+
+    def get(self, profile_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            return self._reports.get(profile_id)
+
+    def list_ids(self) -> list[str]:
+        with self._lock:
+            return list(reversed(self._reports))
@@ -0,0 +1,401 @@
+"""
+Analytics Result Cache
+Content-addressed cache for analytics results with pluggable backends
+
+Results are keyed by a SHA-256 of the endpoint name and the raw request
+body, so identical requests are answered without recomputing. Backends:
+
+- ``memory``: per-process LRU (lost on cold start, not shared by workers)
+- ``disk``: one file per entry under a directory such as ``/tmp``; writes
+  are atomic renames, so any number of processes can share it
+- ``sqlite``: a single SQLite database in WAL mode, shared across processes
+
+Every backend bounds its size in bytes (evicting least recently used
+entries) and expires entries after a TTL. Only stdlib modules are used so
+the serverless handlers keep their cold-start budget.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import cache
+from typing import Any
+
+from api.metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "memory"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), "violet-vault-cache")
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), "violet-vault-cache.sqlite3")
+
+# Bump when analytics output changes so stale persisted results are ignored
+CACHE_VERSION = "1"
+
+# Disk entries start with their expiry time (little-endian double)
+_EXPIRY = struct.Struct("<d")
+
+
+def cache_key(name: str, body: bytes, *parts: str) -> str:
+    """Content hash identifying one analytics result"""
+    digest = hashlib.sha256(f"{CACHE_VERSION}\0{name}\0".encode())
+    for part in parts:
+        digest.update(f"{part}\0".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """Byte-valued key/value store with TTL and size-bounded eviction"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None:
+        """Return the live value for ``key``, or None"""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        """Store ``value``, evicting older entries if over budget"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every entry"""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU; thread-safe but private to one process"""
+
+    def __init__(
+        self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ) -> None:
+        super().__init__(max_bytes, ttl_seconds)
+        self.total_bytes = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class DiskCacheBackend(CacheBackend):
+    """
+    One file per entry, shared by every process using the directory
+
+    Writes go to a temporary file that is renamed into place, so readers
+    never see partial entries. Reads bump the file's mtime, and every
+    ``sweep_interval`` writes a sweep drops expired files and then the least
+    recently used ones until the directory fits ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_DIRECTORY,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        sweep_interval: int = 32,
+    ) -> None:
+        super().__init__(max_bytes, ttl_seconds)
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) < _EXPIRY.size or _EXPIRY.unpack_from(data)[0] < time.time():
+            self._unlink(path)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data[_EXPIRY.size :]
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_EXPIRY.pack(time.time() + self.ttl_seconds))
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._unlink(tmp_path)
+            raise
+        self._writes += 1
+        if self._writes % self.sweep_interval == 0:
+            self.sweep()
+
+    def sweep(self) -> None:
+        """Drop expired entries, then least recently used ones beyond max_bytes"""
+        now = time.time()
+        live: list[tuple[float, int, str]] = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".bin"):
+                    continue
+                try:
+                    stat = entry.stat()
+                    with open(entry.path, "rb") as f:
+                        header = f.read(_EXPIRY.size)
+                except FileNotFoundError:
+                    continue
+                if len(header) < _EXPIRY.size or _EXPIRY.unpack(header)[0] < now:
+                    self._unlink(entry.path)
+                else:
+                    live.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in live)
+        for _, size, path in sorted(live):
+            if total <= self.max_bytes:
+                break
+            self._unlink(path)
+            total -= size
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self) -> None:
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith((".bin", ".tmp")):
+                    self._unlink(entry.path)
+
+
+class SqliteCacheBackend(CacheBackend):
+    """
+    SQLite-backed cache shared by every process opening the same file
+
+    WAL mode lets readers proceed during writes; writes use IMMEDIATE
+    transactions with a busy timeout so concurrent workers queue instead of
+    failing. Each thread gets its own connection. Reads never write: their
+    access times are buffered and flushed with the next ``set`` (before it
+    evicts) or once ``touch_batch`` reads are pending.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SQLITE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        touch_batch: int = 256,
+    ) -> None:
+        super().__init__(max_bytes, ttl_seconds)
+        self.path = path
+        self.touch_batch = touch_batch
+        self._local = threading.local()
+        self._touched: dict[str, float] = {}
+        self._touched_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def _connect(self) -> Any:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM results WHERE key = ? AND expires >= ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        with self._touched_lock:
+            self._touched[key] = now
+            flush = len(self._touched) >= self.touch_batch
+        if flush:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touched(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return bytes(row[0])
+
+    def _flush_touched(self, conn: Any) -> None:
+        """Write buffered access times (inside the caller's transaction)"""
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        conn.executemany(
+            "UPDATE results SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in touched.items()],
+        )
+
+    def set(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._flush_touched(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, expires, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + self.ttl_seconds, now),
+            )
+            conn.execute("DELETE FROM results WHERE expires < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute("SELECT key, size FROM results ORDER BY accessed").fetchall()
+                evict = []
+                for row_key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((row_key,))
+                    total -= size
+                conn.executemany("DELETE FROM results WHERE key = ?", evict)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        with self._touched_lock:
+            self._touched.clear()
+        self._connect().execute("DELETE FROM results")
+
+
+def backend_from_env() -> CacheBackend | None:
+    """
+    Build the configured backend (None when caching is disabled)
+
+    - ANALYTICS_CACHE_BACKEND: memory (default), disk, sqlite or none
+    - ANALYTICS_CACHE_DIR: directory for the disk backend
+    - ANALYTICS_CACHE_PATH: database file for the sqlite backend
+    - ANALYTICS_CACHE_MAX_BYTES: size bound (default 64 MiB)
+    - ANALYTICS_CACHE_TTL_SECONDS: entry lifetime (default 3600)
+    """
+    kind = os.environ.get("ANALYTICS_CACHE_BACKEND", DEFAULT_BACKEND).lower()
+    max_bytes = int(os.environ.get("ANALYTICS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    ttl = float(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    if kind == "none":
+        return None
+    if kind == "disk":
+        directory = os.environ.get("ANALYTICS_CACHE_DIR", DEFAULT_DIRECTORY)
+        return DiskCacheBackend(directory, max_bytes, ttl)
+    if kind == "sqlite":
+        return SqliteCacheBackend(
+            os.environ.get("ANALYTICS_CACHE_PATH", DEFAULT_SQLITE_PATH), max_bytes, ttl
+        )
+    if kind == "memory":
+        return MemoryCacheBackend(max_bytes, ttl)
+    raise ValueError(f"Unknown ANALYTICS_CACHE_BACKEND: {kind}")
+
+
+@cache
+def result_backend() -> CacheBackend | None:
+    """The process-wide backend, created on first use"""
+    return backend_from_env()
+
+
+def shared_across_processes() -> bool:
+    """Whether every process sees the same entries (disk or sqlite backend)"""
+    return isinstance(result_backend(), DiskCacheBackend | SqliteCacheBackend)
+
+
+def load_result(name: str, key: str) -> bytes | None:
+    """
+    Look up a result, counting the hit or miss under ``result:<name>``
+
+    Backend errors are logged and treated as misses so a broken cache never
+    fails a request.
+    """
+    backend = result_backend()
+    if backend is None:
+        return None
+    try:
+        value = backend.get(key)
+    except Exception:
+        logger.warning("Result cache read failed", exc_info=True)
+        value = None
+    record_cache_lookup(f"result:{name}", value is not None)
+    return value
+
+
+def store_result(key: str, value: bytes) -> None:
+    """Store a result (errors are logged and ignored)"""
+    backend = result_backend()
+    if backend is None:
+        return
+    try:
+        backend.set(key, value)
+    except Exception:
+        logger.warning("Result cache write failed", exc_info=True)
+
+
+def cached_result(name: str, body: bytes, compute: Callable[[], bytes], *key_parts: str) -> bytes:
+    """Return the cached result for (name, body), computing and storing it on a miss"""
+    key = cache_key(name, body, *key_parts)
+    value = load_result(name, key)
+    if value is None:
+        value = compute()
+        store_result(key, value)
+    return value
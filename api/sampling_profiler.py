@@ -0,0 +1,216 @@
+"""
+Always-On Sampling Profiler
+Background thread that samples every thread's Python stack at a fixed rate
+
+Stacks are aggregated in memory as collapsed-stack counts (the input format
+of flamegraph.pl / speedscope) in time buckets, so ``/debug/flamegraph`` can
+dump the last N minutes. Memory is bounded by the retention window and a cap
+on distinct stacks per bucket; overflow is counted under ``[other]``.
+
+Compute pool worker processes run their own sampler; the pool drains it
+after each job and merges the stacks into the parent's current bucket.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+from types import FrameType
+
+OVERFLOW_STACK = "[other]"
+
+# Leaf frames of threads that are parked waiting for work
+IDLE_LEAVES: frozenset[tuple[str, str]] = frozenset(
+    {
+        ("threading.py", "wait"),
+        ("selectors.py", "select"),
+        ("thread.py", "_worker"),
+        ("queue.py", "get"),
+        ("connection.py", "_recv"),
+        ("connection.py", "wait"),
+        ("process.py", "_process_worker"),
+        ("sampling_profiler.py", "_run"),
+    }
+)
+
+DEFAULT_HZ = 100
+DEFAULT_WINDOW_MINUTES = 15
+DEFAULT_MAX_STACKS = 10_000
+DEFAULT_BUCKET_SECONDS = 60
+MAX_DEPTH = 128
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def collapse_frame(frame: FrameType, max_depth: int = MAX_DEPTH) -> tuple[str, tuple[str, str]]:
+    """
+    Collapse a frame chain into ``root;...;leaf``
+
+    Returns:
+        Tuple of (collapsed stack, (leaf file basename, leaf function name))
+    """
+    labels: list[str] = []
+    leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+    current: FrameType | None = frame
+    while current is not None and len(labels) < max_depth:
+        labels.append(_frame_label(current))
+        current = current.f_back
+    labels.reverse()
+    return ";".join(labels), leaf
+
+
+class SamplingProfiler:
+    """Fixed-rate stack sampler with bounded, time-bucketed aggregation"""
+
+    def __init__(
+        self,
+        hz: int = DEFAULT_HZ,
+        window_minutes: int = DEFAULT_WINDOW_MINUTES,
+        max_stacks: int = DEFAULT_MAX_STACKS,
+        bucket_seconds: int = DEFAULT_BUCKET_SECONDS,
+        include_idle: bool = False,
+    ) -> None:
+        self.hz = hz
+        self.window_seconds = window_minutes * 60
+        self.max_stacks = max_stacks
+        self.bucket_seconds = bucket_seconds
+        self.include_idle = include_idle
+        self.samples_taken = 0
+        self._buckets: deque[tuple[int, dict[str, int]]] = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls) -> "SamplingProfiler":
+        """
+        Build a sampler from environment configuration
+
+        - ANALYTICS_SAMPLER_HZ: samples per second (default 100, 0 disables)
+        - ANALYTICS_SAMPLER_WINDOW_MINUTES: retention window (default 15)
+        - ANALYTICS_SAMPLER_MAX_STACKS: distinct stacks kept per bucket
+        """
+        return cls(
+            hz=int(os.environ.get("ANALYTICS_SAMPLER_HZ", DEFAULT_HZ)),
+            window_minutes=int(
+                os.environ.get("ANALYTICS_SAMPLER_WINDOW_MINUTES", DEFAULT_WINDOW_MINUTES)
+            ),
+            max_stacks=int(os.environ.get("ANALYTICS_SAMPLER_MAX_STACKS", DEFAULT_MAX_STACKS)),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the sampling thread (no-op when disabled or already running)"""
+        if self.hz <= 0 or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="analytics-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self) -> None:
+        interval = 1.0 / self.hz
+        while not self._stop.wait(interval):
+            self.sample_once()
+
+    def sample_once(self) -> None:
+        """Take one sample of every other thread's stack"""
+        own_id = threading.get_ident()
+        stacks: list[str] = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack, leaf = collapse_frame(frame)
+            if not self.include_idle and leaf in IDLE_LEAVES:
+                continue
+            stacks.append(stack)
+        self.samples_taken += 1
+        if stacks:
+            self._record(stacks)
+
+    def _current_bucket(self, now: float) -> dict[str, int]:
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append((start, {}))
+        horizon = now - self.window_seconds - self.bucket_seconds
+        while self._buckets and self._buckets[0][0] < horizon:
+            self._buckets.popleft()
+        return self._buckets[-1][1]
+
+    def _record(self, stacks: list[str], counts: list[int] | None = None) -> None:
+        with self._lock:
+            bucket = self._current_bucket(time.time())
+            for i, stack in enumerate(stacks):
+                count = 1 if counts is None else counts[i]
+                if stack not in bucket and len(bucket) >= self.max_stacks:
+                    stack = OVERFLOW_STACK
+                bucket[stack] = bucket.get(stack, 0) + count
+
+    def collapsed(self, minutes: int) -> str:
+        """Collapsed-stack dump (``stack count`` per line) for the last N minutes"""
+        since = time.time() - minutes * 60
+        totals: dict[str, int] = {}
+        with self._lock:
+            for start, bucket in self._buckets:
+                if start + self.bucket_seconds < since:
+                    continue
+                for stack, count in bucket.items():
+                    totals[stack] = totals.get(stack, 0) + count
+        lines = [f"{stack} {count}" for stack, count in sorted(totals.items())]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def drain(self) -> dict[str, int]:
+        """Take (and reset) all aggregated stacks, e.g. from a worker process"""
+        totals: dict[str, int] = {}
+        with self._lock:
+            for _, bucket in self._buckets:
+                for stack, count in bucket.items():
+                    totals[stack] = totals.get(stack, 0) + count
+            self._buckets.clear()
+        return totals
+
+    def merge(self, stacks: dict[str, int]) -> None:
+        """Fold stacks drained from another process into the current bucket"""
+        if stacks:
+            self._record(list(stacks), list(stacks.values()))
+
+
+# The sampler running in this process (parent app or pool worker), if any
+_active_sampler: SamplingProfiler | None = None
+
+
+def install_sampler(sampler: SamplingProfiler) -> None:
+    """Start ``sampler`` and make it the process-wide target for merged stacks"""
+    global _active_sampler
+    sampler.start()
+    _active_sampler = sampler
+
+
+def start_worker_sampler() -> None:
+    """Process pool initializer: start a sampler inside the worker"""
+    sampler = SamplingProfiler.from_env()
+    if sampler.hz > 0:
+        install_sampler(sampler)
+
+
+def drain_active_stacks() -> dict[str, int]:
+    """Stacks sampled in this process since the last drain (empty if no sampler)"""
+    return _active_sampler.drain() if _active_sampler is not None else {}
+
+
+def merge_into_active(stacks: dict[str, int]) -> None:
+    """Merge stacks from a worker process into this process's sampler"""
+    if _active_sampler is not None:
+        _active_sampler.merge(stacks)
@@ -0,0 +1,258 @@
+"""
+Sharded Envelope Audit
+Runs the per-transaction audit check of a stored snapshot across worker processes
+
+For tenants with millions of transactions the audit is dominated by the
+orphaned-transaction check, which visits every row. For stored snapshots
+with at least ANALYTICS_AUDIT_SHARD_ROWS transactions the check is split
+into one contiguous shard per process worker:
+
+- The envelope references (envelopeId, fromEnvelopeId, toEnvelopeId) are
+  dictionary-encoded once per snapshot into int32 columns.
+- Those columns and a one-byte validity flag per referenced ID are placed
+  in one ``multiprocessing.shared_memory`` block that every shard reads in
+  place.
+- Each worker returns only the (row, field) positions of orphaned
+  references in its shard.
+- The positions are merged in shard order and the violations built from
+  the snapshot's columns. The envelope-level checks then run on the whole
+  snapshot, so the result is the same as a serial audit.
+
+The encoding and the merge touch every row too, so they run as
+process-lane jobs as well, over the snapshot's shared-memory copy: neither
+the event loop nor the fast lane that serves small clients carries them.
+When every referenced ID exists, no shards are dispatched at all.
+"""
+
+import asyncio
+import os
+from multiprocessing import shared_memory
+from typing import Any, cast
+
+from api.analytics.audit import (
+    ORPHAN_REFERENCE_FIELDS,
+    EnvelopeIntegrityAuditor,
+    orphan_violation,
+    valid_envelope_ids,
+)
+from api.compute_pool import ComputePool
+from api.snapshots import SharedSnapshot, StoredSnapshot, resolve_snapshot
+from api.tracing import span
+
+DEFAULT_SHARD_ROWS = 250_000
+
+# Bytes per encoded reference (array("i"))
+_CODE_SIZE = 4
+
+# (global row index, index into the scanned fields) of one orphaned reference
+OrphanPosition = tuple[int, int]
+
+# (shared memory block name, scanned fields, validity table size)
+StagedReferences = tuple[str, list[str], int]
+
+
+def should_shard_audit(pool: ComputePool, snapshot: StoredSnapshot) -> bool:
+    """
+    Whether ``snapshot`` is large enough to audit in shards
+
+    ANALYTICS_AUDIT_SHARD_ROWS sets the threshold (default 250000, 0
+    disables). Needs at least two process workers.
+    """
+    min_rows = int(os.environ.get("ANALYTICS_AUDIT_SHARD_ROWS", DEFAULT_SHARD_ROWS))
+    return (
+        min_rows > 0
+        and pool.process_workers > 1
+        and snapshot.transaction_count >= min_rows
+        and snapshot.nbytes > pool.fast_lane_bytes
+    )
+
+
+def shard_bounds(rows: int, shards: int) -> list[tuple[int, int]]:
+    """Split ``rows`` into at most ``shards`` contiguous, near-equal [start, stop) ranges"""
+    shards = max(1, min(shards, rows))
+    size, extra = divmod(rows, shards)
+    bounds = []
+    start = 0
+    for shard in range(shards):
+        stop = start + size + (1 if shard < extra else 0)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def scan_shard(
+    block_name: str, rows: int, fields: int, table_size: int, start: int, stop: int
+) -> list[OrphanPosition]:
+    """
+    Find orphaned references in rows [start, stop) of the shared code columns
+
+    Runs in a worker process. The block holds ``fields`` int32 columns of
+    ``rows`` codes each, followed by ``table_size`` validity bytes.
+
+    Returns:
+        Orphan positions sorted by row, then field (the serial check order)
+    """
+    block = shared_memory.SharedMemory(name=block_name)
+    buffer = cast(memoryview, block.buf)
+    table_offset = fields * rows * _CODE_SIZE
+    orphans: list[OrphanPosition] = []
+    try:
+        with span("audit.shard", rows=stop - start, firstRow=start) as shard_span:
+            invalid = {
+                code
+                for code, valid in enumerate(buffer[table_offset : table_offset + table_size])
+                if not valid
+            }
+            for field in range(fields):
+                offset = field * rows * _CODE_SIZE
+                with (
+                    buffer[offset + start * _CODE_SIZE : offset + stop * _CODE_SIZE] as raw,
+                    raw.cast("i") as codes,
+                ):
+                    orphans.extend(
+                        (row, field)
+                        for row, code in enumerate(codes.tolist(), start)
+                        if code in invalid
+                    )
+            shard_span.set_attribute("violations", len(orphans))
+    finally:
+        del buffer
+        block.close()
+    orphans.sort()
+    return orphans
+
+
+def stage_references(shared: StoredSnapshot | SharedSnapshot) -> StagedReferences | None:
+    """
+    Dictionary-encode the snapshot's envelope references into a new shared
+    memory block for scan_shard
+
+    Runs in a worker process; the caller releases the block.
+
+    Returns:
+        None if every referenced envelope exists, otherwise the StagedReferences
+    """
+    snapshot = resolve_snapshot(shared)
+    rows = snapshot.transaction_count
+    table, codes = snapshot.envelope_references(ORPHAN_REFERENCE_FIELDS)
+    valid_ids = valid_envelope_ids(snapshot.envelopes)
+    validity = bytes(ref in valid_ids for ref in table)
+    if 0 not in validity:
+        return None
+
+    fields = list(codes)
+    table_offset = len(fields) * rows * _CODE_SIZE
+    block = shared_memory.SharedMemory(create=True, size=table_offset + len(validity))
+    try:
+        buffer = cast(memoryview, block.buf)
+        for index, name in enumerate(fields):
+            offset = index * rows * _CODE_SIZE
+            buffer[offset : offset + rows * _CODE_SIZE] = memoryview(codes[name]).cast("B")
+        buffer[table_offset : table_offset + len(validity)] = validity
+        del buffer
+    finally:
+        block.close()
+    return block.name, fields, len(validity)
+
+
+def _release(block_name: str) -> None:
+    block = shared_memory.SharedMemory(name=block_name)
+    block.close()
+    block.unlink()
+
+
+def merge_orphans(
+    shared: StoredSnapshot | SharedSnapshot,
+    fields: list[str],
+    positions: list[OrphanPosition],
+    group_by: str | None = None,
+) -> dict[str, Any]:
+    """
+    Build the JSON-ready audit result from the orphan positions found by the
+    shards
+
+    Runs in a worker process.
+    """
+    snapshot = resolve_snapshot(shared)
+    ids, amounts, dates = (snapshot.columns[name] for name in ("id", "amount", "date"))
+    descriptions = snapshot.columns.get("description")
+    orphans = [
+        orphan_violation(
+            fields[field],
+            ids[row],
+            snapshot.columns[fields[field]][row],
+            amounts[row],
+            dates[row],
+            descriptions[row] if descriptions is not None else None,
+        )
+        for row, field in positions
+    ]
+    auditor = EnvelopeIntegrityAuditor()
+    result = auditor.audit_with_orphans(
+        snapshot.envelopes, snapshot.metadata, orphans, snapshot.transaction_count
+    )
+    if group_by is not None:
+        result.violations = auditor.group_violations(result.violations, group_by)
+    return result.model_dump(mode="json")
+
+
+async def audit_sharded(
+    pool: ComputePool, snapshot: StoredSnapshot, group_by: str | None = None
+) -> dict[str, Any]:
+    """
+    Audit a stored snapshot with the per-transaction check sharded across workers
+
+    Every step is routed by the snapshot's size, so a snapshot large enough
+    to shard is encoded, scanned and merged in the process lane.
+
+    Args:
+        pool: Compute pool whose process lane runs the shards
+        snapshot: Stored snapshot to audit
+        group_by: Optional detail field to group violations by
+
+    Returns:
+        The IntegrityAuditResult EnvelopeIntegrityAuditor.audit() reports,
+        dumped to JSON-ready form
+
+    Raises:
+        PoolSaturatedError: If the pool cannot admit the jobs
+        SnapshotNotFoundError: If the snapshot's shared copy was freed meanwhile
+    """
+    rows = snapshot.transaction_count
+    fields: list[str] = []
+    positions: list[OrphanPosition] = []
+    task_snapshot: StoredSnapshot | SharedSnapshot = snapshot
+    if pool.uses_process_lane(snapshot.nbytes):
+        task_snapshot = await asyncio.to_thread(snapshot.share)
+    with span("audit.sharded", rows=rows) as audit_span:
+        staged = await pool.run(stage_references, task_snapshot, size=snapshot.nbytes)
+        if staged is not None:
+            block_name, fields, table_size = staged
+            bounds = shard_bounds(rows, pool.process_workers)
+            audit_span.set_attribute("shards", len(bounds))
+            try:
+                outcomes = await asyncio.gather(
+                    *(
+                        pool.run(
+                            scan_shard,
+                            block_name,
+                            rows,
+                            len(fields),
+                            table_size,
+                            start,
+                            stop,
+                            size=snapshot.nbytes,
+                        )
+                        for start, stop in bounds
+                    ),
+                    return_exceptions=True,
+                )
+            finally:
+                _release(block_name)
+            for outcome in outcomes:
+                if isinstance(outcome, BaseException):
+                    raise outcome
+                positions.extend(outcome)
+        return await pool.run(
+            merge_orphans, task_snapshot, fields, positions, group_by, size=snapshot.nbytes
+        )
@@ -0,0 +1,125 @@
+"""
+Request Coalescing (Single-Flight)
+Concurrent identical analytics requests share one computation
+
+Requests are keyed by route plus a hash of the raw body. The first request
+for a key (the leader) starts the computation as its own task; duplicates
+arriving while it runs await the same task instead of recomputing. Work
+saved is reported per route in Prometheus and per key in a bounded table.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+from api.metrics import REGISTRY, Counter
+
+T = TypeVar("T")
+
+DEFAULT_MAX_TRACKED_KEYS = 256
+
+SINGLE_FLIGHT_REQUESTS: Counter = REGISTRY.register(
+    Counter(
+        "analytics_single_flight_requests_total",
+        "Requests by route and role (leader computed, coalesced awaited a leader)",
+        ("route", "role"),
+    )
+)
+SINGLE_FLIGHT_SAVED_SECONDS: Counter = REGISTRY.register(
+    Counter(
+        "analytics_single_flight_saved_seconds_total",
+        "Compute time avoided by coalescing duplicate requests",
+        ("route",),
+    )
+)
+
+
+def request_key(route: str, body: bytes) -> str:
+    """Coalescing key for a request: route plus SHA-256 of the body"""
+    return f"{route}:{hashlib.sha256(body).hexdigest()}"
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key"""
+
+    def __init__(self, max_tracked_keys: int = DEFAULT_MAX_TRACKED_KEYS) -> None:
+        self.max_tracked_keys = max_tracked_keys
+        self._in_flight: dict[str, asyncio.Task[Any]] = {}
+        self._key_stats: OrderedDict[str, dict[str, Any]] = OrderedDict()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: str, route: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Return the result of ``fn()``, sharing it with concurrent callers of ``key``
+
+        The computation runs in its own task so a disconnecting caller cannot
+        cancel work other callers are waiting on.
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            SINGLE_FLIGHT_REQUESTS.inc(1.0, (route, "coalesced"))
+            self._track(key, route, coalesced=1)
+            return await asyncio.shield(task)
+
+        SINGLE_FLIGHT_REQUESTS.inc(1.0, (route, "leader"))
+        task = asyncio.ensure_future(self._lead(key, route, fn))
+        self._in_flight[key] = task
+        self._track(key, route, coalesced=0)
+        return await asyncio.shield(task)
+
+    async def _lead(self, key: str, route: str, fn: Callable[[], Awaitable[T]]) -> T:
+        start = time.perf_counter()
+        try:
+            return await fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            self._in_flight.pop(key, None)
+            stats = self._key_stats.get(key)
+            if stats is not None and stats["coalesced"]:
+                saved = elapsed * stats["pendingCoalesced"]
+                stats["savedSeconds"] += saved
+                stats["pendingCoalesced"] = 0
+                SINGLE_FLIGHT_SAVED_SECONDS.inc(saved, (route,))
+
+    def _track(self, key: str, route: str, coalesced: int) -> None:
+        stats = self._key_stats.get(key)
+        if stats is None:
+            stats = {
+                "route": route,
+                "leaders": 0,
+                "coalesced": 0,
+                "pendingCoalesced": 0,
+                "savedSeconds": 0.0,
+            }
+            self._key_stats[key] = stats
+            while len(self._key_stats) > self.max_tracked_keys:
+                self._key_stats.popitem(last=False)
+        else:
+            self._key_stats.move_to_end(key)
+        if coalesced:
+            stats["coalesced"] += coalesced
+            stats["pendingCoalesced"] += coalesced
+        else:
+            stats["leaders"] += 1
+
+    def stats(self, limit: int = 20) -> list[dict[str, Any]]:
+        """Keys with the most coalesced requests (most work saved first)"""
+        rows = [
+            {
+                "key": key,
+                "route": s["route"],
+                "leaders": s["leaders"],
+                "coalesced": s["coalesced"],
+                "savedSeconds": round(s["savedSeconds"], 6),
+            }
+            for key, s in self._key_stats.items()
+            if s["coalesced"]
+        ]
+        rows.sort(key=lambda row: (row["savedSeconds"], row["coalesced"]), reverse=True)
+        return rows[:limit]
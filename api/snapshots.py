@@ -0,0 +1,492 @@
+"""
+Server-Side Snapshot Store
+Parse and validate a budget snapshot once, then run analytics by snapshot ID
+
+Uploaded snapshots are kept in memory with transactions stored column-wise
+(one list per field, amounts in a float array), which is both smaller than a
+list of models and cheap to scan for the categorization and prediction
+inputs. The store is an LRU bounded by the estimated size of its snapshots.
+
+Snapshot IDs hash the parsed data, not the request body, so a budget gets
+the same ID whether it was uploaded on its own or as part of a pipeline
+export.
+
+Snapshots too large for the compute pool's thread lane are copied once into
+``multiprocessing.shared_memory``; tasks sent to process workers then carry
+only a SharedSnapshot reference, and each worker keeps its most recently
+loaded snapshots.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from multiprocessing import shared_memory
+from typing import Any, cast
+
+from api.metrics import record_cache_lookup
+from api.models import AuditSnapshot, Envelope, SnapshotUpload, Transaction
+from api.tracing import span
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Transaction columns handed to categorization
+CATEGORIZATION_FIELDS = ("id", "date", "amount", "envelopeId", "description")
+
+# Transaction fields handed to envelope suggestions
+SUGGESTION_FIELDS = ("id", "date", "envelopeId", "description", "merchant")
+
+# Transaction columns handed to recurring charge detection
+RECURRING_FIELDS = ("date", "amount", "description", "merchant")
+
+# Shared snapshots each process worker keeps loaded
+WORKER_SNAPSHOT_CACHE = 2
+
+
+class SnapshotNotFoundError(Exception):
+    """Raised when a snapshot ID is unknown or has been evicted"""
+
+
+class SnapshotTooLargeError(Exception):
+    """Raised when a single snapshot exceeds the store's byte budget"""
+
+
+def snapshot_id(body: bytes) -> str:
+    """Hash of an upload body, so re-uploading the same bytes is recognised"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _column_nbytes(values: Sequence[Any]) -> int:
+    if isinstance(values, array):
+        return sys.getsizeof(values)
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values if v is not None)
+
+
+class TransactionColumns:
+    """
+    Transactions held column-wise: one list per Transaction field (amounts in
+    a float array) plus each row's extra fields
+
+    Chunks validated separately are joined with ``extend``.
+    """
+
+    def __init__(self, transactions: Sequence[Transaction] = ()) -> None:
+        self.count = len(transactions)
+        self.columns: dict[str, Any] = {}
+        for name in Transaction.model_fields:
+            values = [getattr(txn, name) for txn in transactions]
+            self.columns[name] = array("d", values) if name == "amount" else values
+        self.extras: list[dict[str, Any] | None] = [txn.model_extra or None for txn in transactions]
+
+    def extend(self, other: "TransactionColumns") -> None:
+        for name, values in other.columns.items():
+            self.columns[name].extend(values)
+        self.extras.extend(other.extras)
+        self.count += other.count
+
+
+class StoredSnapshot:
+    """A validated snapshot with its transactions held column-wise"""
+
+    def __init__(
+        self, upload: SnapshotUpload, transactions: TransactionColumns | None = None
+    ) -> None:
+        """
+        Args:
+            upload: Validated snapshot
+            transactions: Columns validated separately (upload.transactions is
+                then ignored)
+        """
+        if transactions is None:
+            transactions = TransactionColumns(upload.transactions)
+        self.metadata = upload.metadata
+        self.envelopes: list[Envelope] = upload.envelopes
+        self.auto_funding_rules = upload.autoFundingRules
+        self.transaction_count = transactions.count
+
+        # Columns that are entirely None are left out and restored as defaults
+        self.columns: dict[str, Sequence[Any]] = {
+            name: values
+            for name, values in transactions.columns.items()
+            if name == "amount" or any(value is not None for value in values)
+        }
+        self.extras = transactions.extras
+        self.nbytes = self._estimate_nbytes()
+        self.content_id = self._content_id()
+        self._init_caches()
+
+    def _init_caches(self) -> None:
+        self._references: dict[tuple[str, ...], tuple[list[str], dict[str, array]]] = {}
+        # Shared-memory copy for process workers and its pickled length
+        self._shared: tuple[shared_memory.SharedMemory, int] | None = None
+        self._share_lock = threading.Lock()
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Pickle the data only; caches and the shared copy stay with this process"""
+        return {
+            name: value
+            for name, value in self.__dict__.items()
+            if name not in ("_references", "_shared", "_share_lock")
+        }
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init_caches()
+
+    def share(self) -> "SharedSnapshot":
+        """
+        Reference to a copy of this snapshot in shared memory
+
+        The copy is made on first use and kept until ``release``. Pickling
+        it is the only per-snapshot cost in this process; every later task
+        sends process workers just the block name.
+        """
+        with self._share_lock:
+            if self._shared is None:
+                with span("snapshot.share", bytes=self.nbytes, rows=self.transaction_count):
+                    data = pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+                    block = shared_memory.SharedMemory(create=True, size=len(data))
+                    cast(memoryview, block.buf)[: len(data)] = data
+                self._shared = (block, len(data))
+            block, size = self._shared
+        return SharedSnapshot(block.name, size, self.content_id)
+
+    def release(self) -> None:
+        """Free the shared-memory copy, if any (called when the store drops the snapshot)"""
+        with self._share_lock:
+            shared, self._shared = self._shared, None
+        if shared is not None:
+            shared[0].close()
+            shared[0].unlink()
+
+    def _estimate_nbytes(self) -> int:
+        total = sum(_column_nbytes(values) for values in self.columns.values())
+        total += sys.getsizeof(self.extras) + sum(
+            len(json.dumps(extra)) for extra in self.extras if extra
+        )
+        total += sum(len(env.model_dump_json()) for env in self.envelopes)
+        total += len(self.metadata.model_dump_json()) + len(json.dumps(self.auto_funding_rules))
+        return total
+
+    def _content_id(self) -> str:
+        """Snapshot ID hashed from the parsed data alone"""
+        digest = hashlib.sha256()
+        header = {
+            "metadata": self.metadata.model_dump(mode="json"),
+            "envelopes": [env.model_dump(mode="json") for env in self.envelopes],
+            "autoFundingRules": self.auto_funding_rules,
+            "extras": self.extras,
+        }
+        digest.update(json.dumps(header, sort_keys=True).encode())
+        for name in sorted(self.columns):
+            values = self.columns[name]
+            digest.update(f"\0{name}\0".encode())
+            if isinstance(values, array):
+                digest.update(values.tobytes())
+            else:
+                digest.update(json.dumps(values).encode())
+        return digest.hexdigest()[:32]
+
+    def rows(self, fields: Sequence[str]) -> list[dict[str, Any]]:
+        """Transactions as dicts holding only ``fields``"""
+        columns = [(name, self.columns[name]) for name in fields if name in self.columns]
+        return [
+            {name: values[i] for name, values in columns} for i in range(self.transaction_count)
+        ]
+
+    def envelope_references(self, fields: tuple[str, ...]) -> tuple[list[str], dict[str, array]]:
+        """
+        Envelope reference columns dictionary-encoded as int32 codes
+
+        Computed once per snapshot and field set. Missing or empty references
+        are coded -1; columns that are entirely None are left out.
+
+        Returns:
+            Tuple of (referenced IDs indexed by code, code column per field)
+        """
+        references = self._references.get(fields)
+        if references is None:
+            table: dict[str, int] = {}
+            codes = {
+                name: array(
+                    "i",
+                    [
+                        table.setdefault(ref, len(table)) if ref else -1
+                        for ref in self.columns[name]
+                    ],
+                )
+                for name in fields
+                if name in self.columns
+            }
+            references = self._references[fields] = (list(table), codes)
+        return references
+
+    def paychecks(self) -> list[dict[str, Any]]:
+        """Income transactions in the shape predict_next_payday expects"""
+        types, dates, amounts = self.columns["type"], self.columns["date"], self.columns["amount"]
+        paychecks = []
+        for i in range(self.transaction_count):
+            if types[i] != "income":
+                continue
+            paycheck = {"date": dates[i], "amount": amounts[i]}
+            extra = self.extras[i]
+            if extra and extra.get("processedAt"):
+                paycheck["processedAt"] = extra["processedAt"]
+            paychecks.append(paycheck)
+        return paychecks
+
+    def envelope_balances(self) -> list[dict[str, Any]]:
+        """Envelopes in the shape of the auto-funding context"""
+        balances = []
+        for env in self.envelopes:
+            extra = env.model_extra or {}
+            balances.append(
+                {
+                    "id": env.id,
+                    "name": env.name,
+                    "currentBalance": env.currentBalance,
+                    "monthlyAmount": extra.get("monthlyAmount", extra.get("monthlyBudget")),
+                }
+            )
+        return balances
+
+    def to_audit_snapshot(self) -> AuditSnapshot:
+        """Rebuild the audit input without re-running validation"""
+        names = list(self.columns)
+        transactions = [
+            Transaction.model_construct(
+                **{name: self.columns[name][i] for name in names}, **(self.extras[i] or {})
+            )
+            for i in range(self.transaction_count)
+        ]
+        return AuditSnapshot.model_construct(
+            envelopes=self.envelopes, transactions=transactions, metadata=self.metadata
+        )
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "envelopes": len(self.envelopes),
+            "transactions": self.transaction_count,
+            "autoFundingRules": len(self.auto_funding_rules),
+            "bytes": self.nbytes,
+        }
+
+
+# Shared snapshots loaded by this (worker) process, by block name
+_loaded_snapshots: OrderedDict[str, StoredSnapshot] = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+class SharedSnapshot:
+    """Picklable reference to a StoredSnapshot copied into shared memory"""
+
+    def __init__(self, name: str, size: int, content_id: str) -> None:
+        self.name = name
+        self.size = size
+        self.content_id = content_id
+
+    def load(self) -> StoredSnapshot:
+        """
+        The referenced snapshot, unpickled from shared memory on first use
+        in this process
+
+        Raises:
+            SnapshotNotFoundError: If the snapshot was dropped from the store
+                (and its block freed) before this worker loaded it
+        """
+        with _loaded_lock:
+            snapshot = _loaded_snapshots.get(self.name)
+            if snapshot is not None:
+                _loaded_snapshots.move_to_end(self.name)
+                return snapshot
+        try:
+            block = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            raise SnapshotNotFoundError(f"Snapshot not found: {self.content_id}") from None
+        try:
+            with (
+                span("snapshot.load", bytes=self.size),
+                cast(memoryview, block.buf)[: self.size] as data,
+            ):
+                snapshot = pickle.loads(data)
+        finally:
+            block.close()
+        with _loaded_lock:
+            _loaded_snapshots[self.name] = snapshot
+            while len(_loaded_snapshots) > WORKER_SNAPSHOT_CACHE:
+                _loaded_snapshots.popitem(last=False)
+        return cast(StoredSnapshot, snapshot)
+
+
+def resolve_snapshot(snapshot: StoredSnapshot | SharedSnapshot) -> StoredSnapshot:
+    """The snapshot itself, loading it first when given a shared reference"""
+    return snapshot.load() if isinstance(snapshot, SharedSnapshot) else snapshot
+
+
+def categorization_request(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Column-wise categorization request over a stored snapshot, for
+    process_column_categorization (``params`` may set monthsOfData, averaging,
+    patterns, ...)
+    """
+    return {
+        **params,
+        "columns": {name: snapshot.columns.get(name) for name in CATEGORIZATION_FIELDS},
+    }
+
+
+def envelope_suggestion_request(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Envelope suggestion request over a stored snapshot; the index is cached
+    under the budget ID unless ``params`` sets userId
+    """
+    return {
+        "userId": snapshot.metadata.id,
+        **params,
+        "transactions": snapshot.rows(SUGGESTION_FIELDS),
+    }
+
+
+def prediction_request(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """Prediction request over a stored snapshot's income transactions"""
+    return {**params, "paychecks": snapshot.paychecks()}
+
+
+def recurring_request(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Column-wise recurring charge request over a stored snapshot, for
+    process_column_recurring
+    """
+    return {
+        **params,
+        "columns": {name: snapshot.columns.get(name) for name in RECURRING_FIELDS},
+    }
+
+
+def autofunding_request(snapshot: StoredSnapshot, params: dict[str, Any]) -> dict[str, Any]:
+    """
+    Auto-funding request over a stored snapshot
+
+    Rules default to the snapshot's autoFundingRules and the context data to
+    its unassigned cash and envelope balances; ``params`` may override
+    ``rules`` and any part of ``context`` (trigger defaults to "manual").
+    """
+    context = params.get("context") or {}
+    data = {
+        "unassignedCash": snapshot.metadata.unassignedCash or 0,
+        "envelopes": snapshot.envelope_balances(),
+        **(context.get("data") or {}),
+    }
+    return {
+        "rules": params.get("rules", snapshot.auto_funding_rules),
+        "context": {"trigger": "manual", **context, "data": data},
+    }
+
+
+class SnapshotStore:
+    """
+    LRU of stored snapshots bounded by their total estimated size
+
+    Upload body hashes are remembered alongside, so an unchanged re-upload
+    finds its snapshot without being parsed again.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._snapshots: OrderedDict[str, StoredSnapshot] = OrderedDict()
+        # Upload body hash -> snapshot ID
+        self._uploads: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SnapshotStore":
+        """Build a store sized by ANALYTICS_SNAPSHOT_STORE_BYTES (default 256 MiB)"""
+        return cls(
+            max_bytes=int(os.environ.get("ANALYTICS_SNAPSHOT_STORE_BYTES", DEFAULT_MAX_BYTES))
+        )
+
+    def put(self, key: str, snapshot: StoredSnapshot, upload_key: str | None = None) -> None:
+        """
+        Store a snapshot, evicting least recently used ones to stay in budget
+
+        ``upload_key`` (the snapshot_id of the upload body) lets ``uploaded``
+        find the snapshot again.
+
+        Raises:
+            SnapshotTooLargeError: If the snapshot alone exceeds the budget
+        """
+        if snapshot.nbytes > self.max_bytes:
+            raise SnapshotTooLargeError(
+                f"Snapshot needs {snapshot.nbytes} bytes, store limit is {self.max_bytes}"
+            )
+        dropped: list[StoredSnapshot] = []
+        with self._lock:
+            previous = self._snapshots.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous.nbytes
+                if previous is not snapshot:
+                    dropped.append(previous)
+            self._snapshots[key] = snapshot
+            self.total_bytes += snapshot.nbytes
+            if upload_key is not None:
+                self._uploads[upload_key] = key
+            evicted_keys = set()
+            while self.total_bytes > self.max_bytes:
+                evicted_key, evicted = self._snapshots.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                evicted_keys.add(evicted_key)
+                dropped.append(evicted)
+            if evicted_keys:
+                self._forget_uploads(evicted_keys)
+        for old in dropped:
+            old.release()
+
+    def _forget_uploads(self, keys: set[str]) -> None:
+        self._uploads = {upload: key for upload, key in self._uploads.items() if key not in keys}
+
+    def uploaded(self, upload_key: str) -> str | None:
+        """ID of the stored snapshot parsed from an upload body, if still stored"""
+        with self._lock:
+            key = self._uploads.get(upload_key)
+            return key if key in self._snapshots else None
+
+    def get(self, key: str) -> StoredSnapshot:
+        """
+        Look up a snapshot and mark it recently used
+
+        Raises:
+            SnapshotNotFoundError: If the ID is unknown or was evicted
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(key)
+        record_cache_lookup("snapshots", snapshot is not None)
+        if snapshot is None:
+            raise SnapshotNotFoundError(f"Snapshot not found: {key}")
+        return snapshot
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            snapshot = self._snapshots.pop(key, None)
+            if snapshot is not None:
+                self.total_bytes -= snapshot.nbytes
+                self._forget_uploads({key})
+        if snapshot is None:
+            return False
+        snapshot.release()
+        return True
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "snapshots": len(self._snapshots),
+                "bytes": self.total_bytes,
+                "maxBytes": self.max_bytes,
+            }
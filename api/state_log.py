@@ -0,0 +1,272 @@
+"""
+Per-User State Logs
+Incremental per-user analytics state kept in the result cache backend
+
+Some analytics keep state per user between requests (category rollups,
+envelope suggestion indexes). Each process keeps its copy in a bounded LRU,
+and the copies are kept in step through the result cache backend, which
+disk and sqlite backends share between processes. Rewriting a user's whole
+state on every change would make each request cost as much as the user's
+history, so the backend holds a log instead:
+
+- a checkpoint: the whole state, written now and then
+- after it, one entry per change, holding only what that request changed
+- a head record naming the latest entry
+
+Every entry names its parent. A process whose copy is behind applies just
+the entries after its own revision; one without a copy (or on another
+branch) loads the latest checkpoint and the entries after it. A checkpoint
+replaces the chain once it has ``max_changes`` entries, once they touch as
+many items as the checkpoint holds, or once the checkpoint is half its TTL
+old, so writes stay proportional to what changed and loads stay bounded.
+An entry missing from the backend (evicted or expired) breaks the chain:
+the state then starts over empty and is reported as not cached.
+
+Processes that do not share the backend (the ``memory`` backend, or none)
+cannot see each other's state, so the API keeps requests that use it in
+one process (see ``shared_across_processes``).
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any, Generic, Protocol, TypeVar
+
+from api.endpoint import RequestError
+from api.metrics import record_cache_lookup
+from api.result_cache import (
+    cache_key,
+    load_result,
+    result_backend,
+    shared_across_processes,
+    store_result,
+)
+
+DEFAULT_MAX_CHANGES = 64
+
+# (revision, changes since the checkpoint, items they touched, items in the
+# checkpoint, checkpoint time) of a state's latest log entry
+LogPosition = tuple[str, int, int, int, float]
+
+
+class LoggedState(Protocol):
+    """A per-user state object a StateStore keeps in step with its log"""
+
+    # Held while the state is brought up to date or changed by a request
+    lock: threading.Lock
+    # Log entry the state was loaded from or saved as (None: not stored)
+    position: LogPosition | None
+
+    def apply(self, change: dict[str, Any]) -> None:
+        """Replay one change saved by ``StateStore.save``"""
+
+    def checkpoint(self) -> tuple[dict[str, Any], int]:
+        """The whole state as JSON-ready data, and the number of items it holds"""
+
+    def reset(self, checkpoint: dict[str, Any] | None) -> None:
+        """Replace the contents with a ``checkpoint()``'s, or with nothing"""
+
+
+S = TypeVar("S", bound=LoggedState)
+
+
+class StateLog:
+    """Checkpoints and change entries of one kind of state in the result cache"""
+
+    def __init__(self, name: str, max_changes: int = DEFAULT_MAX_CHANGES) -> None:
+        self.name = name
+        self.max_changes = max_changes
+
+    def _head_key(self, owner: str) -> str:
+        return cache_key(f"{self.name}_head", owner.encode())
+
+    def _entry_key(self, owner: str, revision: str) -> str:
+        return cache_key(self.name, revision.encode(), owner)
+
+    def head(self, owner: str) -> str | None:
+        """Revision of the owner's latest entry, None if nothing is stored"""
+        stored = load_result(f"{self.name}_head", self._head_key(owner))
+        return None if stored is None else stored.decode()
+
+    def read(
+        self, owner: str, head: str, since: str | None = None
+    ) -> tuple[dict[str, Any] | None, list[dict[str, Any]], LogPosition] | None:
+        """
+        The entries leading to ``head``, back to ``since`` or the latest checkpoint
+
+        Returns:
+            None if an entry is missing, otherwise a tuple of (checkpoint
+            state, or None when the walk reached ``since``; changes after it,
+            oldest first; position of ``head``)
+        """
+        changes: list[dict[str, Any]] = []
+        position: LogPosition | None = None
+        checkpoint: dict[str, Any] | None = None
+        revision: str | None = head
+        while revision is not None and revision != since:
+            data = load_result(self.name, self._entry_key(owner, revision))
+            if data is None:
+                return None
+            entry = json.loads(data)
+            if position is None:
+                position = (head, entry["depth"], entry["changed"], entry["items"], entry["at"])
+            if "state" in entry:
+                checkpoint = entry["state"]
+                break
+            changes.append(entry["change"])
+            revision = entry["parent"]
+        if position is None or (checkpoint is None and revision != since):
+            return None
+        changes.reverse()
+        return checkpoint, changes, position
+
+    def _checkpoint_due(self, position: LogPosition, changed: int) -> bool:
+        _, depth, total, items, at = position
+        backend = result_backend()
+        ttl = float("inf") if backend is None else backend.ttl_seconds
+        return (
+            depth >= self.max_changes
+            or total + changed >= max(items, 1)
+            or time.time() - at > ttl / 2
+        )
+
+    def write(
+        self,
+        owner: str,
+        position: LogPosition | None,
+        change: dict[str, Any],
+        changed: int,
+        checkpoint: Callable[[], tuple[dict[str, Any], int]],
+    ) -> LogPosition:
+        """
+        Append ``change`` (touching ``changed`` items) after ``position``, or
+        write ``checkpoint()`` instead when one is due or nothing is stored
+
+        Returns:
+            The position of the new entry, which is now the owner's head
+        """
+        if position is None or self._checkpoint_due(position, changed):
+            state, items = checkpoint()
+            entry: dict[str, Any] = {
+                "depth": 0,
+                "changed": 0,
+                "items": items,
+                "at": time.time(),
+                "state": state,
+            }
+        else:
+            parent, depth, total, items, at = position
+            entry = {
+                "parent": parent,
+                "depth": depth + 1,
+                "changed": total + changed,
+                "items": items,
+                "at": at,
+                "change": change,
+            }
+        data = json.dumps(entry, separators=(",", ":")).encode()
+        revision = hashlib.sha256(data).hexdigest()[:16]
+        store_result(self._entry_key(owner, revision), data)
+        store_result(self._head_key(owner), revision.encode())
+        return revision, entry["depth"], entry["changed"], entry["items"], entry["at"]
+
+
+class StateStore(Generic[S]):
+    """
+    Bounded LRU of per-owner states, each kept current with a StateLog
+
+    ``checkout`` hands out an owner's state brought up to date with the log
+    and holds its lock meanwhile, so a request's change and its log entry
+    stay in step with the other requests of this process.
+    """
+
+    def __init__(self, log: StateLog, max_owners: int) -> None:
+        self.log = log
+        self.max_owners = max_owners
+        self._states: OrderedDict[str, S] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    @contextmanager
+    def checkout(self, owner: str, create: Callable[[], S]) -> Iterator[tuple[S, bool]]:
+        """
+        The owner's latest state, with its lock held until the block ends
+
+        ``create()`` makes an empty state for an owner this process has not
+        kept.
+
+        Yields:
+            Tuple of (state, whether it was already cached here or in the backend)
+        """
+        with self._lock:
+            state = self._states.get(owner)
+            kept = state is not None
+            if state is None:
+                state = create()
+                if self.max_owners > 0:
+                    self._states[owner] = state
+            if kept:
+                self._states.move_to_end(owner)
+            while len(self._states) > self.max_owners:
+                self._states.popitem(last=False)
+        with state.lock:
+            hit = self._catch_up(owner, state, kept)
+            record_cache_lookup(self.log.name, hit)
+            yield state, hit
+
+    def _catch_up(self, owner: str, state: S, kept: bool) -> bool:
+        """Bring ``state`` (lock held) up to the owner's head; False if it starts out empty"""
+        head = self.log.head(owner)
+        position = state.position
+        if head is None:
+            # Nothing stored (never saved, or expired): only this copy is left,
+            # and the next save checkpoints it
+            state.position = None
+            return kept
+        if position is not None and position[0] == head:
+            return True
+        read = self.log.read(owner, head, None if position is None else position[0])
+        if read is None:
+            state.reset(None)
+            state.position = None
+            return False
+        checkpoint, changes, head_position = read
+        if checkpoint is not None:
+            state.reset(checkpoint)
+        for change in changes:
+            state.apply(change)
+        state.position = head_position
+        return True
+
+    def save(self, owner: str, state: S, change: dict[str, Any], changed: int) -> None:
+        """Log ``change``, touching ``changed`` items, just made to ``state`` within ``checkout``"""
+        state.position = self.log.write(owner, state.position, change, changed, state.checkpoint)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+def require_shared_state(kind: str) -> None:
+    """
+    Refuse to keep per-user state in a compute pool worker whose result
+    cache no other process sees
+
+    The API runs such requests in its own process in that case; this only
+    fires if one reached a worker anyway.
+
+    Raises:
+        RequestError: (500) If state kept here would be lost to other requests
+    """
+    import multiprocessing
+
+    if multiprocessing.parent_process() is not None and not shared_across_processes():
+        raise RequestError(
+            f"{kind} need a disk or sqlite ANALYTICS_CACHE_BACKEND in worker processes", 500
+        )
@@ -0,0 +1,73 @@
+from typing import Any
+
+import pytest
+
+from api.audit_pages import (
+    AuditPageStore,
+    CursorExpiredError,
+    InvalidCursorError,
+    audit_id,
+    build_page,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def _result(n: int) -> dict[str, Any]:
+    return {
+        "violations": [{"entityId": f"tx-{i}"} for i in range(n)],
+        "summary": {"total": n},
+        "timestamp": "2024-01-01T00:00:00Z",
+        "snapshotSize": {},
+    }
+
+
+def test_cursor_round_trip() -> None:
+    cursor = encode_cursor("abc", 50, 25)
+    assert decode_cursor(cursor) == ("abc", 50, 25)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor("abc", -1, 10), "e30"])
+def test_decode_cursor_rejects_malformed(cursor: str) -> None:
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_audit_id_depends_on_grouping() -> None:
+    assert audit_id(b"{}", None) == audit_id(b"{}", None)
+    assert audit_id(b"{}", None) != audit_id(b"{}", "missingEnvelopeId")
+
+
+def test_build_page_walks_all_violations() -> None:
+    result = _result(5)
+    page = build_page("a", result, 0, 2)
+    seen = [v["entityId"] for v in page["violations"]]
+    while page["nextCursor"]:
+        audit, offset, limit = decode_cursor(page["nextCursor"])
+        page = build_page(audit, result, offset, limit)
+        seen += [v["entityId"] for v in page["violations"]]
+    assert seen == [f"tx-{i}" for i in range(5)]
+    assert page["totalViolations"] == 5
+
+
+def test_build_page_without_limit_returns_everything() -> None:
+    page = build_page("a", _result(3), 0, None)
+    assert len(page["violations"]) == 3
+    assert page["nextCursor"] is None
+
+
+def test_store_evicts_least_recently_used() -> None:
+    store = AuditPageStore(max_entries=2)
+    store.put("a", _result(1))
+    store.put("b", _result(1))
+    store.get("a")
+    store.put("c", _result(1))
+    assert store.get("a") is not None
+    assert store.get("b") is None
+
+
+def test_store_expires_entries() -> None:
+    store = AuditPageStore(ttl_seconds=0)
+    store.put("a", _result(1))
+    with pytest.raises(CursorExpiredError):
+        store.page("a", 0, 1)
@@ -0,0 +1,58 @@
+"""
+Cold-start regression checks for the Vercel handler modules
+
+Each handler is imported in a fresh interpreter and compared with the budgets
+stored in ``cold_start_budget.json``: no forbidden package may be loaded, and
+the number of modules loaded stays under the recorded maximum. Both are
+deterministic, unlike wall-clock import times, which vary with machine load.
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+API_DIR = Path(__file__).parent
+REPO_ROOT = API_DIR.parent
+BUDGET: dict[str, Any] = json.loads((API_DIR / "cold_start_budget.json").read_text())
+
+
+def _cold_import(module: str) -> set[str]:
+    """Import ``module`` in a fresh interpreter and return the modules it loaded"""
+    preload = "; ".join(f"import {name}" for name in BUDGET["preloaded"])
+    code = (
+        f"{preload}; import sys; before = set(sys.modules); import {module}; "
+        "print(' '.join(sorted(set(sys.modules) - before)))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(proc.stdout.split())
+
+
+@pytest.mark.parametrize("module", sorted(BUDGET["modules"]))
+def test_handler_cold_import_stays_light(module: str) -> None:
+    """Cold import of each handler loads no forbidden package and few modules"""
+    spec = BUDGET["modules"][module]
+    loaded = _cold_import(module)
+
+    packages = {name.split(".")[0] for name in loaded}
+    forbidden = packages & set(spec["forbiddenModules"])
+    assert not forbidden, f"{module} imports {sorted(forbidden)} at import time"
+    assert (
+        len(loaded) <= spec["maxModules"]
+    ), f"{module} loads {len(loaded)} modules (budget {spec['maxModules']})"
+
+
+def test_handlers_do_not_mutate_sys_path() -> None:
+    """Handlers rely on package imports instead of sys.path manipulation"""
+    for module in BUDGET["modules"]:
+        source = (REPO_ROOT / (module.replace(".", "/") + ".py")).read_text()
+        assert "sys.path" not in source, module
@@ -0,0 +1,173 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections.abc import AsyncGenerator, Iterator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.compute_pool import ComputePool, PoolSaturatedError
+from api.main import app, audit_ndjson, run_envelope_audit
+from api.metrics import FUNCTION_DURATION
+
+client = TestClient(app)
+
+SNAPSHOT: dict[str, Any] = {
+    "envelopes": [],
+    "transactions": [],
+    "metadata": {"id": "budget-1", "lastModified": 1700000000000, "actualBalance": 0.0},
+}
+
+
+def test_fast_lane_rejects_when_saturated() -> None:
+    """A full lane raises PoolSaturatedError instead of queueing unboundedly"""
+    pool = ComputePool(workers=0, queue_size=0, fast_lane_workers=1, fast_lane_queue_size=0)
+    release = threading.Event()
+
+    async def scenario() -> None:
+        blocked = asyncio.create_task(pool.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturatedError) as exc_info:
+            await pool.run(sum, [1, 2])
+        assert exc_info.value.lane == "fast"
+        release.set()
+        assert await blocked is True
+        # Capacity is released once the blocking job finishes
+        assert await pool.run(sum, [1, 2]) == 3
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_lane_selection_by_size() -> None:
+    """Small payloads use the fast lane, large ones the process lane"""
+    pool = ComputePool(workers=2, queue_size=2, fast_lane_bytes=100)
+    assert pool._select_lane(50).name == "fast"
+    assert pool._select_lane(500).name == "process"
+    assert pool.stats()["process"]["capacity"] == 4
+
+    disabled = ComputePool(workers=0, queue_size=0, fast_lane_bytes=100)
+    assert disabled._select_lane(500).name == "fast"
+
+
+def test_process_lane_runs_audit() -> None:
+    """Audit payloads (and worker metrics) survive the round trip through a worker process"""
+    pool = ComputePool(workers=1, queue_size=0, fast_lane_bytes=0)
+    payload = json.dumps(SNAPSHOT).encode()
+    labels = ("EnvelopeIntegrityAuditor.audit",)
+    audits_before = FUNCTION_DURATION.count(labels)
+    try:
+        content = asyncio.run(pool.run(run_envelope_audit, payload, size=len(payload)))
+    finally:
+        pool.shutdown()
+    assert json.loads(content)["summary"]["total"] == 0
+    assert FUNCTION_DURATION.count(labels) == audits_before + 1
+
+
+def test_stream_holds_fast_lane_until_drained() -> None:
+    """A fast-lane stream occupies its worker slot until iteration ends"""
+    pool = ComputePool(workers=0, queue_size=0, fast_lane_workers=1, fast_lane_queue_size=0)
+
+    async def scenario() -> None:
+        chunks: AsyncGenerator[bytes, None] = pool.stream(iter, [b"a", b"b"])
+        assert await anext(chunks) == b"a"
+        with pytest.raises(PoolSaturatedError):
+            await pool.run(sum, [1, 2])
+        assert [chunk async for chunk in chunks] == [b"b"]
+        assert await pool.run(sum, [1, 2]) == 3
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_process_lane_streams_audit() -> None:
+    """Large NDJSON audits are produced in a worker process"""
+    pool = ComputePool(workers=1, queue_size=0, fast_lane_bytes=0)
+    payload = json.dumps(SNAPSHOT).encode()
+
+    async def drain() -> list[bytes]:
+        return [chunk async for chunk in pool.stream(audit_ndjson, payload, size=len(payload))]
+
+    try:
+        (trailer,) = asyncio.run(drain())
+    finally:
+        pool.shutdown()
+    assert json.loads(trailer)["summary"]["total"] == 0
+
+
+def _gated_chunks(gate: str) -> Iterator[bytes]:
+    """Yield one chunk, then wait (in the worker) until ``gate`` exists"""
+    yield b"first"
+    deadline = time.monotonic() + 30
+    while not Path(gate).exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield b"second"
+
+
+def _endless_chunks() -> Iterator[bytes]:
+    for i in itertools.count():
+        yield str(i).encode()
+
+
+def test_process_lane_streams_before_worker_finishes(tmp_path: Path) -> None:
+    """The first chunk arrives while the worker is still producing the rest"""
+    pool = ComputePool(workers=1, queue_size=0, fast_lane_bytes=0)
+    gate = tmp_path / "gate"
+
+    async def scenario() -> list[bytes]:
+        chunks = pool.stream(_gated_chunks, str(gate), size=1)
+        first = await asyncio.wait_for(anext(chunks), timeout=30)
+        # The worker cannot finish before the gate opens
+        assert not gate.exists()
+        gate.touch()
+        return [first] + [chunk async for chunk in chunks]
+
+    try:
+        assert asyncio.run(scenario()) == [b"first", b"second"]
+    finally:
+        pool.shutdown()
+
+
+def test_closing_process_stream_stops_worker() -> None:
+    """A consumer that leaves early cancels the worker and frees its slot"""
+    pool = ComputePool(workers=1, queue_size=0, fast_lane_bytes=0)
+
+    async def scenario() -> None:
+        chunks = pool.stream(_endless_chunks, size=1)
+        assert await anext(chunks) == b"0"
+        await chunks.aclose()
+        deadline = time.monotonic() + 10
+        while pool.stats()["process"]["inFlight"] and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert pool.stats()["process"]["inFlight"] == 0
+        assert await pool.run(sum, [1, 2], size=1) == 3
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+
+def test_audit_returns_503_when_saturated(monkeypatch: Any) -> None:
+    """Saturation surfaces as 503 with a Retry-After header"""
+
+    async def saturated(*args: Any, **kwargs: Any) -> Any:
+        raise PoolSaturatedError("process", 7)
+
+    monkeypatch.setattr("api.main.compute_pool.run", saturated)
+    response = client.post("/audit/envelope-integrity", json=SNAPSHOT)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_health_reports_pool_stats() -> None:
+    response = client.get("/health")
+    assert "fast" in response.json()["computePool"]
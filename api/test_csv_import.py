@@ -0,0 +1,131 @@
+import io
+import tracemalloc
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from api.csv_import import (
+    CSVImporter,
+    categorize_csv,
+    categorize_csv_file,
+    detect_field_mapping,
+    parse_amount,
+    parse_field_mapping,
+)
+from api.endpoint import RequestError
+from api.models import Transaction
+
+TEST_DATA = Path(__file__).parent / "test-data"
+
+
+def _lines(name: str) -> Iterator[str]:
+    with open(TEST_DATA / name, newline="", encoding="utf-8") as f:
+        yield from f
+
+
+def test_detects_bank_export_columns() -> None:
+    headers = ["Transaction Date", "Payee", "Amount", "Category"]
+    assert detect_field_mapping(headers) == {
+        "date": "Transaction Date",
+        "description": "Payee",
+        "amount": "Amount",
+        "category": "Category",
+    }
+    assert detect_field_mapping(["Posted Date", "Debit Amount", "Vendor Name"]) == {
+        "date": "Posted Date",
+        "amount": "Debit Amount",
+        "merchant": "Vendor Name",
+    }
+
+
+def test_parse_amount_formats() -> None:
+    assert parse_amount(" $1,234.50 ") == 1234.5
+    assert parse_amount("($85.50)") == -85.5
+    with pytest.raises(ValueError):
+        parse_amount("not a number")
+    for text in ("nan", "inf", "-Infinity", "($inf)"):
+        with pytest.raises(ValueError, match="not a finite number"):
+            parse_amount(text)
+
+
+def test_field_mapping_validation() -> None:
+    assert parse_field_mapping('{"payee": "Payee", "date": "When"}') == {
+        "description": "Payee",
+        "date": "When",
+    }
+    with pytest.raises(RequestError, match="Unknown"):
+        parse_field_mapping({"price": "Amount"})
+    with pytest.raises(RequestError, match="Invalid field mapping"):
+        parse_field_mapping("{")
+
+
+def test_rows_normalize_to_transactions() -> None:
+    importer = CSVImporter()
+    transactions = list(importer.transactions(_lines("sample-transactions.csv")))
+    assert importer.valid == 10 and importer.invalid == 0
+    for transaction in transactions:
+        Transaction.model_validate(transaction)
+    assert transactions[0]["merchant"] == "Starbucks"
+    assert transactions[4]["amount"] == -85.5 and transactions[4]["type"] == "expense"
+
+
+def test_invalid_rows_match_go_importer() -> None:
+    lines = list(_lines("invalid-rows.csv"))
+    # The fixture's "future" date has passed; keep one that stays in the future
+    lines[4] = "2999-12-31,Future Date,$100.00,Shopping\n"
+    importer = CSVImporter()
+    assert len(list(importer.transactions(lines))) == 2
+    summary = importer.summary()
+    assert [(row["index"], row["errors"]) for row in summary["invalidRows"]] == [
+        (1, ["Invalid date format: unable to parse date: 2024-13-45"]),
+        (2, ["Amount is required"]),
+        (3, ["Future dates are not allowed"]),
+        (4, ["Invalid amount: could not convert string to float: 'not a number'"]),
+    ]
+    assert summary["invalidRows"][1]["row"] == "2024-01-17,Missing Amount,,Transportation"
+
+
+def test_categorizes_bank_export() -> None:
+    lines = ["Transaction Date,Payee,Amount\n"] + [
+        f"01/{day:02d}/2024,Netflix.com,15.49\n" for day in range(1, 5)
+    ]
+    result = categorize_csv(lines, expenses_positive=True, chunk_rows=3)
+    assert [(s["category"], s["count"]) for s in result["suggestions"]] == [
+        ("Subscriptions", 4),
+        ("Streaming", 4),
+    ]
+    assert result["import"]["valid"] == 4
+
+    lines.append("01/05/2024,Netflix.com,nan\n")
+    result = categorize_csv(lines, expenses_positive=True)
+    assert result["import"]["valid"] == 4 and result["import"]["invalid"] == 1
+    assert result["import"]["invalidRows"][0]["errors"] == [
+        "Invalid amount: not a finite number: 'nan'"
+    ]
+
+    result = categorize_csv(_lines("bank-export.csv"), {"payee": "Payee"})
+    assert result["success"] and result["import"]["invalid"] == 0
+    with pytest.raises(RequestError, match="amount"):
+        categorize_csv(["Date,Payee\n", "2024-01-01,Shell\n"])
+
+
+def test_streams_in_constant_memory() -> None:
+    """Memory stays flat as the export grows (rows are never all held)"""
+
+    def export(rows: int) -> io.BytesIO:
+        body = "".join(
+            f"2023-{1 + i % 12:02d}-{1 + i % 28:02d},Local Shop {i % 50},-{i % 90 + 1}.25\n"
+            for i in range(rows)
+        )
+        return io.BytesIO(("\ufeffDate,Description,Amount\n" + body).encode())
+
+    peaks = []
+    for rows in (10_000, 40_000):
+        data = export(rows)
+        tracemalloc.start()
+        result = categorize_csv_file(data, chunk_rows=1_000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert result["import"]["valid"] == rows
+    assert peaks[1] < peaks[0] * 1.5
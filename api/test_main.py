@@ -1,8 +1,18 @@
+import asyncio
+import json
+import tempfile
+from pathlib import Path
 from typing import Any
 
+import pytest
 from fastapi.testclient import TestClient
 
+from api import main, result_cache
+from api.analytics import categorization
+from api.audit_pages import AuditPageStore
+from api.compute_pool import ComputePool
 from api.main import app
+from api.result_cache import MemoryCacheBackend
 
 client = TestClient(app)
 
@@ -92,3 +102,584 @@ def test_audit_envelope_integrity_internal_error(monkeypatch: Any) -> None:
     response = client.post("/audit/envelope-integrity", json=snapshot_data)
     assert response.status_code == 500
     assert "Audit failed: Simulated failure" in response.json()["detail"]
+
+
+def test_cached_audit_is_stamped_per_response(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The result cache never freezes the audit timestamp"""
+    backend = MemoryCacheBackend()
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    stamps = iter(["2024-01-01T00:00:00Z", "2024-01-02T00:00:00Z"])
+    monkeypatch.setattr("api.main.audit_timestamp", lambda: next(stamps))
+    parses = 0
+    parse_audit_snapshot = main.parse_audit_snapshot
+
+    def counting_parse(*args: Any) -> Any:
+        nonlocal parses
+        parses += 1
+        return parse_audit_snapshot(*args)
+
+    monkeypatch.setattr(main, "parse_audit_snapshot", counting_parse)
+
+    first = client.post("/audit/envelope-integrity", json=_orphan_snapshot())
+    second = client.post("/audit/envelope-integrity", json=_orphan_snapshot())
+    assert parses == 1
+    assert first.json()["timestamp"] == "2024-01-01T00:00:00Z"
+    assert second.json()["timestamp"] == "2024-01-02T00:00:00Z"
+    assert first.json()["violations"] == second.json()["violations"]
+
+
+def test_stamp_audit_splices_top_level_timestamp(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Only the result's own timestamp field is replaced, in place"""
+    monkeypatch.setattr("api.main.audit_timestamp", lambda: "2024-03-01T12:00:00Z")
+    placeholder = json.dumps(main.AUDIT_TIMESTAMP_PLACEHOLDER)
+    content = (
+        '{"violations":[{"message":"\\"timestamp\\":' + placeholder[1:-1] + '"}],'
+        f'"summary":{{}},"timestamp":{placeholder},"snapshotSize":{{"transactions":1}}}}'
+    ).encode()
+    stamped = json.loads(main.stamp_audit(content))
+    assert list(stamped) == ["violations", "summary", "timestamp", "snapshotSize"]
+    assert stamped["timestamp"] == "2024-03-01T12:00:00Z"
+    assert stamped["violations"] == json.loads(content)["violations"]
+
+
+def test_audit_envelope_integrity_ndjson_stream() -> None:
+    """NDJSON mode streams one violation per line, then the summary"""
+    snapshot_data: dict[str, Any] = {
+        "envelopes": [
+            {
+                "id": "env-1",
+                "name": "Groceries",
+                "category": "Food",
+                "lastModified": 1700000000000,
+                "currentBalance": -25.0,
+            }
+        ],
+        "transactions": [
+            {
+                "id": f"tx-{i}",
+                "date": "2024-01-01",
+                "amount": -10.0,
+                "envelopeId": "missing",
+                "category": "Food",
+                "lastModified": 1700000000000,
+            }
+            for i in range(3)
+        ],
+        "metadata": {"id": "budget-1", "lastModified": 1700000000000},
+    }
+    buffered = client.post("/audit/envelope-integrity", json=snapshot_data).json()
+
+    response = client.post(
+        "/audit/envelope-integrity",
+        json=snapshot_data,
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    *violations, trailer = lines
+    assert violations == buffered["violations"]
+    assert trailer["summary"] == buffered["summary"]
+    assert trailer["snapshotSize"] == buffered["snapshotSize"]
+    assert "violations" not in trailer
+
+
+def _orphan_snapshot() -> dict[str, Any]:
+    return {
+        "envelopes": [],
+        "transactions": [
+            {
+                "id": f"tx-{i}",
+                "date": "2024-01-01",
+                "amount": -10.0,
+                "envelopeId": f"deleted-{i % 2}",
+                "category": "Food",
+                "lastModified": 1700000000000,
+            }
+            for i in range(5)
+        ],
+        "metadata": {"id": "budget-1", "lastModified": 1700000000000, "actualBalance": 0.0},
+    }
+
+
+def test_audit_envelope_integrity_group_by_missing_envelope() -> None:
+    """Orphans of one missing envelope collapse into one violation"""
+    response = client.post(
+        "/audit/envelope-integrity?group_by=missingEnvelopeId", json=_orphan_snapshot()
+    )
+    assert response.status_code == 200
+    data = response.json()
+    groups = {v["entityId"]: v["details"] for v in data["violations"]}
+    assert groups["deleted-0"]["count"] == 3
+    assert groups["deleted-0"]["totalAmount"] == -30.0
+    assert groups["deleted-0"]["sampleIds"] == ["tx-0", "tx-2", "tx-4"]
+    assert groups["deleted-1"]["count"] == 2
+    messages = {v["entityId"]: v["message"] for v in data["violations"]}
+    assert messages["deleted-1"] == "2 transactions reference non-existent envelope: deleted-1"
+
+    single = _orphan_snapshot()
+    del single["transactions"][1:]
+    response = client.post("/audit/envelope-integrity?group_by=missingEnvelopeId", json=single)
+    (violation,) = response.json()["violations"]
+    assert violation["message"] == "1 transaction references non-existent envelope: deleted-0"
+    assert data["totalViolations"] == 2
+    assert data["nextCursor"] is None
+    # Summary still counts the underlying violations
+    assert data["summary"]["by_type"]["orphaned_transaction"] == 5
+
+
+def test_audit_envelope_integrity_cursor_pagination() -> None:
+    """Later pages are served from the cached audit"""
+    full = client.post("/audit/envelope-integrity", json=_orphan_snapshot()).json()
+
+    page = client.post("/audit/envelope-integrity?limit=2", json=_orphan_snapshot()).json()
+    violations = page["violations"]
+    assert page["totalViolations"] == 5
+    while page["nextCursor"]:
+        response = client.get("/audit/envelope-integrity", params={"cursor": page["nextCursor"]})
+        assert response.status_code == 200
+        page = response.json()
+        violations += page["violations"]
+    assert violations == full["violations"]
+
+
+def test_audit_envelope_integrity_bad_cursor() -> None:
+    response = client.get("/audit/envelope-integrity", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_audit_envelope_integrity_unknown_group_by() -> None:
+    response = client.post("/audit/envelope-integrity?group_by=amount", json=_orphan_snapshot())
+    assert response.status_code == 422
+
+
+def test_audit_envelope_integrity_ndjson_validation_error() -> None:
+    """Invalid snapshots are rejected before streaming starts"""
+    response = client.post(
+        "/audit/envelope-integrity",
+        json={"envelopes": [], "transactions": []},
+        headers={"Accept": "application/x-ndjson"},
+    )
+    assert response.status_code == 422
+
+
+def test_categorization_route() -> None:
+    """Categorization is served by the FastAPI app with the Vercel contract"""
+    transactions = [{"description": "Starbucks", "amount": -20.0} for _ in range(3)]
+    response = client.post(
+        "/analytics/categorization", json={"transactions": transactions, "monthsOfData": 1}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] is True
+    assert data["suggestions"][0]["category"] == "Coffee & Drinks"
+
+
+def test_categorization_route_errors() -> None:
+    """Shared decoding maps bad payloads to 400 error bodies"""
+    response = client.post("/analytics/categorization", content=b"{not json")
+    assert response.status_code == 400
+    assert "Invalid JSON" in response.json()["error"]
+
+    response = client.post(
+        "/analytics/categorization",
+        json={"transactions": [{"amount": -1}], "monthsOfData": 0},
+    )
+    assert response.status_code == 400
+    assert response.json() == {
+        "success": False,
+        "error": "monthsOfData must be a positive integer",
+    }
+
+
+def test_envelope_suggestions_route() -> None:
+    """Unassigned transactions get an envelope from the assigned ones"""
+    transactions = [
+        {"id": "t1", "date": "2024-01-02", "description": "Safeway #12", "envelopeId": "env-1"},
+        {"id": "t2", "date": "2024-01-09", "description": "Shell 0042", "envelopeId": "env-2"},
+        {"id": "t3", "date": "2024-01-10", "description": "SAFEWAY #99", "envelopeId": ""},
+    ]
+    response = client.post("/analytics/envelope-suggestions", json={"transactions": transactions})
+    assert response.status_code == 200
+    (suggestion,) = response.json()["suggestions"]
+    assert suggestion["index"] == 2
+    assert suggestion["transactionId"] == "t3"
+    assert suggestion["envelopeId"] == "env-1"
+
+    response = client.post("/analytics/envelope-suggestions", json={"transactions": []})
+    assert response.status_code == 400
+
+
+def test_prediction_route() -> None:
+    """Prediction is served by the FastAPI app"""
+    paychecks = [{"date": "2024-01-15"}, {"date": "2024-01-01"}]
+    response = client.post("/analytics/prediction", json={"paychecks": paychecks})
+    assert response.status_code == 200
+    assert response.json()["prediction"]["intervalDays"] == 14
+
+    response = client.post("/analytics/prediction", json={})
+    assert response.status_code == 400
+
+
+def test_recurring_route() -> None:
+    """Recurring charges are served by the FastAPI app"""
+    transactions = [
+        {"date": f"2024-{month:02d}-03", "amount": -15.99, "description": "NETFLIX.COM"}
+        for month in range(1, 5)
+    ]
+    response = client.post("/analytics/recurring", json={"transactions": transactions})
+    assert response.status_code == 200
+    (charge,) = response.json()["recurring"]
+    assert (charge["cadence"], charge["nextDate"]) == ("monthly", "2024-05-03")
+
+    response = client.post("/analytics/recurring", json={})
+    assert response.status_code == 400
+
+
+def test_autofunding_route() -> None:
+    """AutoFunding simulation is served by the FastAPI app"""
+    request_body: dict[str, Any] = {
+        "rules": [],
+        "context": {"data": {"unassignedCash": 100, "envelopes": []}, "trigger": "manual"},
+    }
+    response = client.post("/autofunding", json=request_body)
+    assert response.status_code == 200
+    assert response.json()["simulation"]["remainingCash"] == 100
+
+    response = client.get("/autofunding")
+    assert response.json()["name"] == "AutoFunding Simulation API"
+
+
+def test_snapshot_endpoints_match_body_requests() -> None:
+    """Analytics over an uploaded snapshot match the same data sent inline"""
+    snapshot_data = _orphan_snapshot()
+    snapshot_data["transactions"].append(
+        {
+            "id": "pay-1",
+            "date": "2024-01-15",
+            "amount": 2000.0,
+            "type": "income",
+            "envelopeId": "unassigned",
+            "category": "Income",
+            "lastModified": 1700000000000,
+        }
+    )
+    # The frontend marks expenses without an envelope as "unassigned"
+    snapshot_data["transactions"].extend(
+        {
+            "id": f"coffee-{i}",
+            "date": "2024-01-20",
+            "amount": -20.0,
+            "envelopeId": "unassigned",
+            "category": "Food",
+            "description": "Starbucks",
+            "lastModified": 1700000000000,
+        }
+        for i in range(3)
+    )
+    upload = client.post("/snapshots", json=snapshot_data)
+    assert upload.status_code == 201
+    key = upload.json()["snapshotId"]
+    assert upload.json()["transactions"] == 9
+    # Re-uploading identical data returns the same ID
+    assert client.post("/snapshots", json=snapshot_data).json()["snapshotId"] == key
+
+    inline = client.post("/audit/envelope-integrity", json=snapshot_data).json()
+    stored = client.post(f"/audit/envelope-integrity?snapshotId={key}").json()
+    assert stored["violations"] == inline["violations"]
+    assert stored["summary"] == inline["summary"]
+
+    grouped = client.post(
+        f"/audit/envelope-integrity?snapshotId={key}&group_by=missingEnvelopeId"
+    ).json()
+    assert grouped["totalViolations"] == 2
+
+    response = client.post(f"/analytics/prediction?snapshotId={key}")
+    assert response.status_code == 200
+    assert response.json()["prediction"]["message"] == "Need at least 2 paychecks to predict payday"
+
+    response = client.post(f"/analytics/categorization?snapshotId={key}", json={"monthsOfData": 2})
+    assert response.status_code == 200
+    (suggestion,) = response.json()["suggestions"]
+    assert (suggestion["amount"], suggestion["count"]) == (60.0, 3)
+    inline_categorization = client.post(
+        "/analytics/categorization",
+        json={"transactions": snapshot_data["transactions"], "monthsOfData": 2},
+    ).json()
+    assert response.json()["suggestions"] == inline_categorization["suggestions"]
+
+    response = client.post(f"/analytics/recurring?snapshotId={key}")
+    assert response.status_code == 200
+    assert response.json()["recurring"] == []
+
+    response = client.post(f"/analytics/envelope-suggestions?snapshotId={key}")
+    assert response.status_code == 200
+    assert response.json()["index"]["userId"] == snapshot_data["metadata"]["id"]
+
+    response = client.post(f"/autofunding?snapshotId={key}")
+    assert response.status_code == 200
+    assert response.json()["simulation"]["remainingCash"] == 0
+
+    assert client.delete(f"/snapshots/{key}").status_code == 204
+    assert client.post(f"/analytics/prediction?snapshotId={key}").status_code == 404
+
+
+def test_snapshot_upload_validation_error() -> None:
+    response = client.post("/snapshots", json={"envelopes": []})
+    assert response.status_code == 422
+
+
+def test_analytics_pipeline_route() -> None:
+    """One export in, every stage's result and timing out"""
+    export: dict[str, Any] = {
+        **_orphan_snapshot(),
+        "budget": [{"id": "budget-1", "lastModified": 1700000000000, "actualBalance": 0.0}],
+        "autoFundingRules": [],
+        "allTransactions": [],
+    }
+    del export["metadata"]
+    response = client.post("/analytics/pipeline", json=export)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["stages"]["audit"]["result"]["summary"]["total"] == 5
+    # No paychecks: prediction fails on its own without affecting the rest
+    assert data["stages"]["prediction"]["statusCode"] == 400
+    assert data["stages"]["autofunding"]["success"] is True
+    assert data["success"] is False
+    # The parsed export is reusable by ID
+    response = client.post(f"/autofunding?snapshotId={data['snapshotId']}")
+    assert response.status_code == 200
+
+    response = client.post("/analytics/pipeline", json={"envelopes": []})
+    assert response.status_code == 422
+
+
+def test_pipeline_and_upload_share_snapshot_ids() -> None:
+    """The same budget gets one ID whichever route parsed it"""
+    snapshot_data = _orphan_snapshot()
+    export = {**snapshot_data, "budget": [snapshot_data["metadata"]], "options": {}}
+    del export["metadata"]
+    pipeline_key = client.post("/analytics/pipeline", json=export).json()["snapshotId"]
+    upload_key = client.post("/snapshots", json=snapshot_data).json()["snapshotId"]
+    assert upload_key == pipeline_key
+    # Re-uploading the same bytes is recognised without parsing
+    assert client.post("/snapshots", json=snapshot_data).json()["snapshotId"] == upload_key
+
+
+def test_large_snapshot_requests_run_in_process_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Large stored snapshots reach process workers through shared memory"""
+    key = client.post("/snapshots", json=_orphan_snapshot()).json()["snapshotId"]
+    routes = [
+        f"/analytics/recurring?snapshotId={key}",
+        f"/analytics/categorization?snapshotId={key}",
+        f"/audit/envelope-integrity?snapshotId={key}&group_by=missingEnvelopeId",
+    ]
+
+    def results() -> list[dict[str, Any]]:
+        responses = [client.post(route).json() for route in routes]
+        for response in responses:
+            response.pop("timestamp", None)
+        return responses
+
+    in_process = results()
+    streamed_in_process = client.post(
+        f"/audit/envelope-integrity?snapshotId={key}", headers={"Accept": "application/x-ndjson"}
+    ).text.splitlines()
+
+    pool = ComputePool(workers=2, queue_size=2, fast_lane_bytes=0)
+    monkeypatch.setattr(main, "compute_pool", pool)
+    # Fresh paged-audit cache, so the grouped audit is recomputed in a worker
+    monkeypatch.setattr(main, "audit_pages", AuditPageStore())
+    try:
+        assert results() == in_process
+        streamed = client.post(
+            f"/audit/envelope-integrity?snapshotId={key}",
+            headers={"Accept": "application/x-ndjson"},
+        ).text.splitlines()
+        assert streamed[:-1] == streamed_in_process[:-1]
+        assert pool._process is not None and pool._process._executor is not None
+        assert main.snapshot_store.get(key)._shared is not None
+    finally:
+        pool.shutdown()
+    # Dropping the snapshot frees its shared-memory copy
+    assert client.delete(f"/snapshots/{key}").status_code == 204
+
+
+def test_categorization_csv_route() -> None:
+    """A raw CSV export is imported and categorized"""
+    body = "Transaction Date,Payee,Amount\n" + "".join(
+        f"01/{day:02d}/2024,Shell Oil {day},45.00\n" for day in range(1, 4)
+    )
+    response = client.post(
+        "/analytics/categorization/csv?expensesPositive=true&monthsOfData=1",
+        content=body,
+        headers={"Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["suggestions"][0]["category"] == "Gas Stations"
+    assert data["import"]["fieldMapping"]["description"] == "Payee"
+
+    response = client.post(
+        "/analytics/categorization/csv?fieldMapping=%7B%22price%22%3A%22Amount%22%7D",
+        content=body,
+    )
+    assert response.status_code == 400
+    response = client.post("/analytics/categorization/csv", content="")
+    assert response.json() == {"success": False, "error": "CSV file is empty"}
+
+
+def test_categorization_csv_route_spools_and_limits_uploads(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """Large uploads are spooled to a temporary file that is removed afterwards"""
+    body = "Date,Description,Amount\n" + "".join(
+        f"2024-01-{day:02d},Shell Oil,-45.00\n" for day in range(1, 29)
+    )
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr("api.main.CSV_SPOOL_BYTES", 64)
+    response = client.post("/analytics/categorization/csv", content=body)
+    assert response.status_code == 200
+    assert response.json()["import"]["valid"] == 28
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr("api.main.CSV_MAX_BYTES", 256)
+    response = client.post("/analytics/categorization/csv", content=body)
+    assert response.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_incremental_categorization_bypasses_result_cache() -> None:
+    """Each incremental request reaches the user's rollup"""
+    body = {
+        "userId": "route-rollup-user",
+        "incremental": True,
+        "transactions": [
+            {"id": "r1", "date": "2024-01-02", "description": "Netflix", "amount": -20.0}
+        ],
+    }
+    first = client.post("/analytics/categorization", json=body).json()
+    second = client.post("/analytics/categorization", json=body).json()
+    assert first["rollup"]["added"] == 1
+    assert second["rollup"] == {**first["rollup"], "cached": True, "added": 0}
+
+
+def test_incremental_rollups_stay_in_one_process(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Under the per-process memory backend, small and large requests share one rollup"""
+    history = [{"id": "l1", "date": "2024-01-02", "description": "Netflix", "amount": -20.0}]
+    later = history + [
+        {"id": f"l{i}", "date": f"2024-0{i}-02", "description": "Netflix", "amount": -20.0}
+        for i in range(2, 10)
+    ]
+
+    def body(transactions: list[dict[str, Any]]) -> bytes:
+        request = {"userId": "lane-rollup-user", "incremental": True}
+        return json.dumps({**request, "transactions": transactions}).encode()
+
+    assert len(body(history)) < 256 < len(body(later))
+    pool = ComputePool(workers=1, queue_size=1, fast_lane_bytes=256)
+    monkeypatch.setattr(main, "compute_pool", pool)
+    try:
+        first, second = (
+            client.post("/analytics/categorization", content=body(transactions)).json()
+            for transactions in (history, later)
+        )
+        # A request that reaches a worker anyway is refused rather than losing history
+        refused = asyncio.run(pool.run(categorization.handle_request, body(later), size=4096))
+    finally:
+        pool.shutdown()
+    assert first["rollup"]["added"] == 1
+    assert second["rollup"]["cached"] is True and second["rollup"]["added"] == 8
+    assert second["suggestions"][0]["count"] == 9
+    assert refused[0] == 500 and "worker processes" in refused[1]["error"]
+
+
+def test_suggestion_indexes_stay_in_one_process(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Under the per-process memory backend, every request using an index runs here"""
+    assigned = {"id": "s1", "date": "2024-01-02", "description": "Safeway #12", "envelopeId": "e1"}
+    pending = [
+        {"id": f"p{i}", "date": "2024-01-03", "description": "SAFEWAY #99", "envelopeId": ""}
+        for i in range(6)
+    ]
+
+    def body(transactions: list[dict[str, Any]]) -> bytes:
+        return json.dumps({"userId": "lane-index-user", "transactions": transactions}).encode()
+
+    assert len(body([assigned])) < 256 < len(body(pending))
+    key = client.post("/snapshots", json=_orphan_snapshot()).json()["snapshotId"]
+    pool = ComputePool(workers=1, queue_size=1, fast_lane_bytes=256)
+    monkeypatch.setattr(main, "compute_pool", pool)
+    try:
+        route = "/analytics/envelope-suggestions"
+        first, second = (
+            client.post(route, content=body(transactions)).json()
+            for transactions in ([assigned], pending)
+        )
+        # Snapshot requests index under the budget ID
+        snapshot = client.post(f"{route}?snapshotId={key}")
+    finally:
+        pool.shutdown()
+    assert first["index"]["added"] == 1
+    assert second["index"]["cached"] is True
+    assert [s["envelopeId"] for s in second["suggestions"]] == ["e1"] * 6
+    assert snapshot.status_code == 200 and snapshot.json()["index"]["userId"] == "budget-1"
+
+
+def test_pattern_sets_stay_in_one_process(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Under the per-process memory backend, a registered patternVersion resolves at any size"""
+    transactions = [
+        {"id": f"b{i}", "date": "2024-01-02", "description": "Rosas Bakery", "amount": -4.0}
+        for i in range(5)
+    ]
+
+    def body(count: int, **fields: Any) -> bytes:
+        request = {"userId": "lane-pattern-user", "transactions": transactions[:count]}
+        return json.dumps({**request, **fields}).encode()
+
+    registered_body = body(1, patterns={"Bakery": "bakery"})
+    assert len(registered_body) < 256
+    pool = ComputePool(workers=1, queue_size=1, fast_lane_bytes=256)
+    monkeypatch.setattr(main, "compute_pool", pool)
+    try:
+        registered = client.post("/analytics/categorization", content=registered_body).json()
+        version = registered["patternSet"]["patternVersion"]
+        assert len(body(5, patternVersion=version)) > 256
+        resolved = client.post("/analytics/categorization", content=body(5, patternVersion=version))
+    finally:
+        pool.shutdown()
+    assert resolved.status_code == 200
+    assert resolved.json()["patternSet"] == {**registered["patternSet"], "cached": True}
+
+
+def test_categorization_cache_branches_on_decoded_incremental_flag() -> None:
+    """An escaped incremental key still bypasses the cache; the word in a description does not"""
+    escaped = (
+        b'{"userId": "escaped-rollup-user", "\\u0069ncremental": true, "transactions": '
+        b'[{"id": "e1", "date": "2024-01-02", "description": "Hulu", "amount": -8.0}]}'
+    )
+    headers = {"Content-Type": "application/json"}
+    first = client.post("/analytics/categorization", content=escaped, headers=headers).json()
+    second = client.post("/analytics/categorization", content=escaped, headers=headers).json()
+    assert first["rollup"]["added"] == 1
+    assert second["rollup"] == {**first["rollup"], "cached": True, "added": 0}
+
+    body = {
+        "transactions": [
+            {"id": "w1", "date": "2024-01-02", "description": "incremental backup", "amount": -3.0}
+        ]
+    }
+    original = categorization.process_categorization
+    calls = []
+
+    def counting(request_data: dict[str, Any]) -> dict[str, Any]:
+        calls.append(request_data)
+        return original(request_data)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        backend = MemoryCacheBackend()
+        monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+        monkeypatch.setattr(categorization, "process_categorization", counting)
+        responses = [client.post("/analytics/categorization", json=body).json() for _ in range(2)]
+    assert responses[0] == responses[1]
+    assert len(calls) == 1
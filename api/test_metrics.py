@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app
+from api.metrics import (
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    _Metric,
+    record_cache_lookup,
+    size_class,
+    timed,
+    write_metrics_file,
+)
+
+client = TestClient(app)
+
+
+def test_histogram_render_is_cumulative() -> None:
+    """Buckets are cumulative and include +Inf, _sum and _count"""
+    histogram = Histogram("demo_seconds", "Demo", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, ("/a",))
+    histogram.observe(0.5, ("/a",))
+    histogram.observe(5.0, ("/a",))
+
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/a"} 3' in lines
+    assert 'demo_seconds_sum{route="/a"} 5.55' in lines
+
+
+def test_metric_types_must_render() -> None:
+    class Unrendered(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError, match="render"):
+        Unrendered("demo", "Demo")  # type: ignore[abstract]
+
+
+def test_registry_drain_and_merge() -> None:
+    """Samples drained from one registry fold into another"""
+    worker, parent = MetricsRegistry(), MetricsRegistry()
+    for registry in (worker, parent):
+        registry.register(Counter("jobs_total", "Jobs", ("kind",)))
+        registry.register(Histogram("job_seconds", "Job time", buckets=(1.0,)))
+
+    worker._metrics["jobs_total"].inc(2, ("audit",))  # type: ignore[attr-defined]
+    worker._metrics["job_seconds"].observe(0.5)  # type: ignore[attr-defined]
+    parent.merge(worker.drain())
+    parent.merge(worker.drain())  # second drain is empty
+
+    rendered = parent.render()
+    assert 'jobs_total{kind="audit"} 2' in rendered
+    assert "job_seconds_count 1" in rendered
+
+
+def test_timed_decorator_records_calls() -> None:
+    """Instrumented functions record one sample per call, even on error"""
+    histogram_name = "analytics_function_duration_seconds"
+
+    @timed("test_metrics.sample")
+    def sample(fail: bool) -> int:
+        if fail:
+            raise RuntimeError("boom")
+        return 1
+
+    sample(False)
+    try:
+        sample(True)
+    except RuntimeError:
+        pass
+
+    rendered = client.get("/metrics").text
+    assert f'{histogram_name}_count{{function="test_metrics.sample"}} 2' in rendered
+
+
+def test_size_class_labels() -> None:
+    assert size_class(10) == "le_1KiB"
+    assert size_class(100 * 1024) == "le_1MiB"
+    assert size_class(100 * 1024 * 1024) == "gt_16MiB"
+
+
+def test_metrics_endpoint_reports_routes_and_cache_ratio() -> None:
+    """Per-route latency, payload sizes and cache hit ratio appear in /metrics"""
+    client.get("/health")
+    record_cache_lookup("test-cache", hit=True)
+    record_cache_lookup("test-cache", hit=False)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'route="/health"' in body
+    assert "analytics_http_request_size_bytes_bucket" in body
+    assert "analytics_http_requests_in_flight" in body
+    assert 'analytics_cache_hit_ratio{cache="test-cache"} 0.5' in body
+    assert 'analytics_compute_pool_in_flight{lane="fast"}' in body
+
+
+def test_write_metrics_file(tmp_path: Path) -> None:
+    """Metrics can be scraped from a local file"""
+    target = tmp_path / "analytics.prom"
+    record_cache_lookup("file-cache", hit=True)
+    write_metrics_file(str(target))
+    assert 'analytics_cache_requests_total{cache="file-cache",result="hit"}' in target.read_text()
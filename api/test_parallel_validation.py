@@ -0,0 +1,256 @@
+import asyncio
+import json
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from pydantic import ValidationError
+
+from api.compute_pool import ComputePool
+from api.models import SnapshotUpload
+from api.parallel_validation import (
+    ChunkPlan,
+    _release,
+    _stage,
+    plan_chunks,
+    should_validate_in_parallel,
+    split_document,
+    split_payload,
+    validate_chunk,
+    validate_in_parallel,
+    validate_last_chunk,
+    walk_segment,
+)
+from api.snapshots import StoredSnapshot, TransactionColumns
+
+
+def _payload(
+    rows: int = 25, bad_rows: tuple[int, ...] = (), memo: Callable[[int], Any] = "row {}".format
+) -> bytes:
+    transactions: list[dict[str, Any]] = [
+        {
+            "id": f"tx-{i}",
+            "date": "2024-01-01",
+            "amount": -1.5 * i,
+            "envelopeId": "env-1",
+            "category": "Food",
+            "lastModified": 1700000000000,
+            "memo": memo(i),
+        }
+        for i in range(rows)
+    ]
+    for i in bad_rows:
+        transactions[i]["amount"] = "lots"
+    return json.dumps(
+        {
+            "envelopes": [],
+            "transactions": transactions,
+            "metadata": {"id": "budget-1", "lastModified": 1700000000000},
+        }
+    ).encode()
+
+
+def _serial_errors(payload: bytes) -> list[Any]:
+    with pytest.raises(ValidationError) as exc_info:
+        SnapshotUpload.model_validate_json(payload)
+    return [
+        {**err, "loc": ("body", *err["loc"])} for err in exc_info.value.errors(include_url=False)
+    ]
+
+
+def _plan(block_name: str, size: int, chunks: int) -> tuple[int, ChunkPlan] | None:
+    """The array's opening bracket and its ChunkPlan, computed in this process"""
+    split = split_payload(block_name, size, chunks, 1)
+    if split is None:
+        return None
+    starts = [split[1], *(element for _, element in split[2])]
+    walks = [
+        walk_segment(block_name, start, stop, 1)
+        for start, stop in zip(starts, [*starts[1:], size], strict=True)
+    ]
+    plan = plan_chunks(split, walks, chunks, 1)
+    return None if plan is None else (split[0], plan)
+
+
+def _run_in_process(payload: bytes, chunks: int) -> tuple[Any, list[Any], list[Any]] | None:
+    block_name = _stage(payload)
+    try:
+        planned = _plan(block_name, len(payload), chunks)
+        if planned is None:
+            return None
+        open_at, (ranges, last_start, close_at) = planned
+        outcomes = [validate_chunk(block_name, *chunk) for chunk in ranges]
+        last = validate_last_chunk(
+            block_name, len(payload), SnapshotUpload, open_at, last_start, close_at
+        )
+    finally:
+        _release(block_name)
+    if last is None:
+        return None
+    header, header_errors, last_outcome = last
+    outcomes.append(last_outcome)
+    # validate_in_parallel falls back to serial validation for malformed chunks
+    if any(err["type"] == "json_invalid" for _, errors, _ in outcomes for err in errors):
+        return None
+    return header, outcomes, header_errors
+
+
+def _joined(outcomes: list[Any]) -> TransactionColumns:
+    columns = TransactionColumns()
+    for chunk_columns, _, _ in outcomes:
+        columns.extend(chunk_columns)
+    return columns
+
+
+def test_chunks_match_serial_validation() -> None:
+    payload = _payload()
+    result = _run_in_process(payload, chunks=4)
+    assert result is not None
+    header, outcomes, errors = result
+    assert errors == [] and len(outcomes) == 4
+    assert all(rows >= 5 for _, _, rows in outcomes)
+
+    parallel = StoredSnapshot(header, _joined(outcomes))
+    serial = StoredSnapshot(SnapshotUpload.model_validate_json(payload))
+    assert parallel.transaction_count == serial.transaction_count == 25
+    assert parallel.columns == serial.columns
+    assert parallel.extras == serial.extras
+    assert parallel.metadata == serial.metadata
+
+
+def test_split_skips_boundaries_inside_strings() -> None:
+    """Memos that look like element starts or brackets do not cut a chunk"""
+    payload = _payload(memo=lambda i: f'],{{"id": "x{i}", \\"[{{' if i % 2 else f'tab\t "{i}"]')
+    result = _run_in_process(payload, chunks=5)
+    assert result is not None
+    header, outcomes, errors = result
+    assert errors == [] and len(outcomes) == 5
+    serial = StoredSnapshot(SnapshotUpload.model_validate_json(payload))
+    assert StoredSnapshot(header, _joined(outcomes)).columns == serial.columns
+
+
+def test_split_finds_array_between_other_members() -> None:
+    upload = json.loads(_payload(rows=6))
+    document = {
+        "metadata": {**upload["metadata"], "tags": ["a]", {"b": [1, 2]}]},
+        "envelopes": [
+            {
+                "id": "env-1",
+                "name": "Food [daily]",
+                "category": "Food",
+                "lastModified": 1700000000000,
+            }
+        ],
+        "transactions": upload["transactions"],
+        "autoFundingRules": [],
+    }
+    payload = json.dumps(document, indent=2).encode()
+    result = _run_in_process(payload, chunks=3)
+    assert result is not None
+    header, outcomes, errors = result
+    assert errors == [] and len(outcomes) == 3
+    serial = StoredSnapshot(SnapshotUpload.model_validate_json(payload))
+    parallel = StoredSnapshot(header, _joined(outcomes))
+    assert parallel.columns == serial.columns
+    assert parallel.envelopes == serial.envelopes
+    assert parallel.extras == serial.extras
+
+
+def test_split_finds_array_end_before_large_trailing_arrays() -> None:
+    """Many brackets after the transactions do not hide the array's end"""
+    upload = json.loads(_payload(rows=12))
+    upload["autoFundingRules"] = [
+        {"id": f"rule-{i}", "config": {"targets": [[i], []]}} for i in range(200)
+    ]
+    upload["envelopes"] = [
+        {"id": f"env-{i}", "name": f"Env [{i}]", "category": "Food", "lastModified": 1}
+        for i in range(50)
+    ]
+    document = {"transactions": upload.pop("transactions"), **upload}
+    payload = json.dumps(document).encode()
+    assert payload.count(b"]") > 500
+
+    block_name = _stage(payload)
+    try:
+        planned = _plan(block_name, len(payload), 3)
+    finally:
+        _release(block_name)
+    assert planned is not None
+    open_at, (_, _, close_at) = planned
+    assert json.loads(payload[open_at : close_at + 1]) == document["transactions"]
+
+    result = _run_in_process(payload, chunks=3)
+    assert result is not None
+    header, outcomes, errors = result
+    assert errors == [] and len(outcomes) == 3
+    serial = StoredSnapshot(SnapshotUpload.model_validate_json(payload))
+    parallel = StoredSnapshot(header, _joined(outcomes))
+    assert parallel.columns == serial.columns
+    assert parallel.auto_funding_rules == serial.auto_funding_rules
+    assert parallel.envelopes == serial.envelopes
+
+
+def test_chunk_errors_use_global_row_indices() -> None:
+    payload = _payload(bad_rows=(3, 21))
+    result = _run_in_process(payload, chunks=4)
+    assert result is not None
+    _, outcomes, _ = result
+    first_rows = [0]
+    for _, _, rows in outcomes:
+        first_rows.append(first_rows[-1] + rows)
+    errors = [
+        {**err, "loc": (*err["loc"][:2], first_row + err["loc"][2], *err["loc"][3:])}
+        for first_row, (_, chunk_errors, _) in zip(first_rows, outcomes, strict=False)
+        for err in chunk_errors
+    ]
+    assert errors == _serial_errors(payload)
+    assert [err["loc"][2] for err in errors] == [3, 21]
+
+
+def test_unsplittable_payload_falls_back() -> None:
+    assert split_document(b"not json", 2, 1) is None
+    assert split_document(b'{"transactions": {}}', 2, 1) is None
+    assert split_document(b'{"envelopes": [1, "], "], "transactions": 1}', 2, 1) is None
+    # Nested arrays of objects that share the rows' first key cut a row in half
+    nested = _payload(memo=lambda i: [{"id": i}, {"id": -i, "note": "x" * 40}])
+    assert _run_in_process(nested, chunks=4) is None
+    assert _run_in_process(b'{"transactions": [{"id": "a"}, {"id": "b"}', chunks=2) is None
+    assert _run_in_process(b'{"transactions": [{"id": "a"}], "x": [}', chunks=2) is None
+    # Cuts inside a row are caught by the walks, before any chunk is validated
+    block_name = _stage(nested)
+    try:
+        assert split_document(nested, 4, 1) is not None
+        assert _plan(block_name, len(nested), 4) is None
+    finally:
+        _release(block_name)
+
+
+def test_threshold_requires_process_workers(monkeypatch: Any) -> None:
+    monkeypatch.setenv("ANALYTICS_PARALLEL_VALIDATION_BYTES", "1")
+    payload = _payload()
+    assert not should_validate_in_parallel(ComputePool(workers=0, queue_size=0), payload)
+    pool = ComputePool(workers=2, queue_size=0, fast_lane_bytes=0)
+    assert should_validate_in_parallel(pool, payload)
+    monkeypatch.setenv("ANALYTICS_PARALLEL_VALIDATION_BYTES", "0")
+    assert not should_validate_in_parallel(pool, payload)
+
+
+def test_validate_in_parallel_across_workers(monkeypatch: Any) -> None:
+    """Rows and errors survive the round trip through worker processes"""
+    monkeypatch.setenv("ANALYTICS_VALIDATION_MIN_CHUNK_BYTES", "500")
+    pool = ComputePool(workers=2, queue_size=2, fast_lane_bytes=0)
+    valid, invalid = _payload(), _payload(bad_rows=(17,))
+    try:
+        result = asyncio.run(validate_in_parallel(pool, valid, SnapshotUpload))
+        invalid_result = asyncio.run(validate_in_parallel(pool, invalid, SnapshotUpload))
+    finally:
+        pool.shutdown()
+
+    assert result is not None and invalid_result is not None
+    upload, columns, errors = result
+    invalid_errors = invalid_result[2]
+
+    assert errors == []
+    serial = StoredSnapshot(SnapshotUpload.model_validate_json(valid))
+    assert StoredSnapshot(upload, columns).columns == serial.columns
+    assert invalid_errors == _serial_errors(invalid)
@@ -0,0 +1,83 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from api import pipeline
+from api.compute_pool import ComputePool
+from api.endpoint import RequestError
+from api.models import BudgetExport
+from api.snapshots import SharedSnapshot, StoredSnapshot
+
+EXPORT_FILE = (
+    Path(__file__).resolve().parents[1]
+    / "public/test-data/data/violet-vault-budget-autofunding.json"
+)
+
+
+def _snapshot() -> StoredSnapshot:
+    export = BudgetExport.model_validate_json(EXPORT_FILE.read_bytes())
+    return StoredSnapshot(export.to_snapshot())
+
+
+def _run(options: dict[str, dict[str, Any]], pool: ComputePool | None = None) -> dict[str, Any]:
+    pool = pool or ComputePool(workers=0, queue_size=0)
+    try:
+        return asyncio.run(pipeline.run_pipeline(pool, _snapshot(), options))
+    finally:
+        pool.shutdown()
+
+
+def test_pipeline_runs_every_stage_on_test_data_export() -> None:
+    stages = _run({"audit": {"group_by": "missingEnvelopeId"}})
+
+    assert set(stages) == {"audit", "categorization", "prediction", "autofunding"}
+    assert all(stage["success"] for stage in stages.values())
+    assert all(stage["durationMs"] >= 0 for stage in stages.values())
+    assert stages["prediction"]["result"]["prediction"]["pattern"] == "biweekly"
+    assert "violations" in stages["audit"]["result"]
+
+
+def test_large_exports_run_stages_in_worker_processes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Exports over the fast lane limit reach the process lane as one shared copy"""
+    pool = ComputePool(workers=2, queue_size=2, fast_lane_bytes=0)
+    run = pool.run
+    passed: list[Any] = []
+
+    async def record_snapshot(fn: Any, *args: Any, size: int = 0) -> Any:
+        passed.append(args[2])
+        return await run(fn, *args, size=size)
+
+    monkeypatch.setattr(pool, "run", record_snapshot)
+    snapshot = _snapshot()
+    try:
+        stages = asyncio.run(pipeline.run_pipeline(pool, snapshot, {}))
+    finally:
+        pool.shutdown()
+        snapshot.release()
+
+    assert all(stage["success"] for stage in stages.values())
+    assert stages["prediction"]["result"]["prediction"]["pattern"] == "biweekly"
+    assert len(passed) == 4 and all(isinstance(ref, SharedSnapshot) for ref in passed)
+    assert len({ref.name for ref in passed}) == 1
+
+
+def test_pipeline_isolates_stage_failures(monkeypatch: pytest.MonkeyPatch) -> None:
+    def broken(*_args: Any) -> dict[str, Any]:
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(pipeline.PIPELINE_STAGES, "audit", broken)
+    stages = _run({"categorization": {"monthsOfData": 0}})
+
+    assert stages["audit"]["success"] is False
+    assert stages["audit"]["statusCode"] == 500
+    assert "boom" not in stages["audit"]["error"]
+    assert stages["categorization"]["statusCode"] == 400
+    assert stages["prediction"]["success"] is True
+    assert stages["autofunding"]["success"] is True
+
+
+def test_pipeline_rejects_unknown_stage_options() -> None:
+    with pytest.raises(RequestError):
+        _run({"forecast": {}})
@@ -0,0 +1,124 @@
+import json
+import marshal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.main import app, run_envelope_audit
+from api.profiling import PROFILE_HEADER, PROFILE_ID_HEADER, ProfileStore, profile_call
+
+client = TestClient(app)
+
+TOKEN = "operator-secret"
+
+SNAPSHOT: dict[str, Any] = {
+    "envelopes": [
+        {"id": "env-1", "name": "Rent", "category": "Living", "lastModified": 1700000000000}
+    ],
+    "transactions": [
+        {
+            "id": "tx-1",
+            "date": "2024-01-01",
+            "amount": -5.0,
+            "envelopeId": "missing",
+            "category": "Living",
+            "lastModified": 1700000000000,
+        }
+    ],
+    "metadata": {"id": "budget-1", "lastModified": 1700000000000, "actualBalance": 0.0},
+}
+
+
+@pytest.fixture(autouse=True)
+def operator_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ANALYTICS_PROFILE_TOKEN", TOKEN)
+
+
+def test_profile_call_groups_by_layer() -> None:
+    """Reports break time down by audit and model layers"""
+    payload = json.dumps(SNAPSHOT).encode()
+    result, report, stats_data = profile_call(run_envelope_audit, payload)
+
+    assert json.loads(result)["summary"]["total"] == 1
+    assert report["function"] == "run_envelope_audit"
+    assert "audit" in report["groups"]
+    assert "models" in report["groups"]
+    audit_functions = [f["function"] for f in report["groups"]["audit"]["functions"]]
+    assert any("audit.py" in name for name in audit_functions)
+    assert isinstance(marshal.loads(stats_data), dict)
+
+
+def test_concurrent_profiles_run_one_at_a_time() -> None:
+    """Fast lane threads never enable two profilers at once"""
+    active: list[int] = []
+    overlaps: list[int] = []
+    lock = threading.Lock()
+
+    def work(index: int) -> int:
+        with lock:
+            active.append(index)
+            overlaps.append(len(active))
+        time.sleep(0.02)
+        with lock:
+            active.remove(index)
+        return index
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: profile_call(work, i), range(4)))
+
+    assert [result for result, _, _ in results] == [0, 1, 2, 3]
+    assert all(report["function"].endswith("work") for _, report, _ in results)
+    assert max(overlaps) == 1
+
+
+def test_profiled_audit_request_stores_report() -> None:
+    """A valid token profiles the request and exposes the report by ID"""
+    response = client.post(
+        "/audit/envelope-integrity", json=SNAPSHOT, headers={PROFILE_HEADER: TOKEN}
+    )
+    assert response.status_code == 200
+    assert response.json()["summary"]["total"] == 1
+    profile_id = response.headers[PROFILE_ID_HEADER]
+
+    report = client.get(f"/debug/profiles/{profile_id}", headers={PROFILE_HEADER: TOKEN})
+    assert report.status_code == 200
+    assert report.json()["endpoint"] == "/audit/envelope-integrity"
+    assert "audit" in report.json()["groups"]
+
+    listing = client.get("/debug/profiles", headers={PROFILE_HEADER: TOKEN})
+    assert profile_id in listing.json()["profiles"]
+
+
+def test_profiling_requires_valid_token() -> None:
+    """Wrong or missing tokens are rejected; unprofiled requests are unaffected"""
+    response = client.post(
+        "/audit/envelope-integrity", json=SNAPSHOT, headers={PROFILE_HEADER: "nope"}
+    )
+    assert response.status_code == 403
+
+    response = client.post("/audit/envelope-integrity", json=SNAPSHOT)
+    assert response.status_code == 200
+    assert PROFILE_ID_HEADER not in response.headers
+
+    assert client.get("/debug/profiles").status_code == 403
+
+
+def test_profiling_disabled_without_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("ANALYTICS_PROFILE_TOKEN")
+    response = client.post("/analytics/prediction", json={}, headers={PROFILE_HEADER: TOKEN})
+    assert response.status_code == 403
+
+
+def test_profile_store_is_bounded_and_mirrors_to_disk(tmp_path: Path) -> None:
+    store = ProfileStore(max_entries=2, directory=str(tmp_path))
+    ids = [store.add({"groups": {}}, marshal.dumps({}), endpoint="/x") for _ in range(3)]
+
+    assert store.get(ids[0]) is None
+    assert store.list_ids() == [ids[2], ids[1]]
+    assert (tmp_path / f"{ids[2]}.prof").exists()
+    assert (tmp_path / f"{ids[2]}.json").exists()
@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from api import result_cache
+from api.endpoint import run_cached_json_endpoint
+from api.result_cache import (
+    CacheBackend,
+    DiskCacheBackend,
+    MemoryCacheBackend,
+    SqliteCacheBackend,
+    cache_key,
+)
+
+BackendFactory = Callable[..., CacheBackend]
+
+
+@pytest.fixture(params=["memory", "disk", "sqlite"])
+def make_backend(request: pytest.FixtureRequest, tmp_path: Path) -> BackendFactory:
+    def factory(max_bytes: int = 1024, ttl_seconds: float = 60) -> CacheBackend:
+        if request.param == "disk":
+            return DiskCacheBackend(
+                str(tmp_path / "cache"), max_bytes, ttl_seconds, sweep_interval=1
+            )
+        if request.param == "sqlite":
+            return SqliteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes, ttl_seconds)
+        return MemoryCacheBackend(max_bytes, ttl_seconds)
+
+    return factory
+
+
+def test_cache_key_covers_name_body_and_parts() -> None:
+    assert cache_key("a", b"{}") == cache_key("a", b"{}")
+    assert cache_key("a", b"{}") != cache_key("b", b"{}")
+    assert cache_key("a", b"{}") != cache_key("a", b"[]")
+    assert cache_key("a", b"{}", "2024-01-01") != cache_key("a", b"{}", "2024-01-02")
+
+
+def test_backend_round_trip(make_backend: BackendFactory) -> None:
+    backend = make_backend()
+    assert backend.get("k") is None
+    backend.set("k", b"value")
+    assert backend.get("k") == b"value"
+    backend.clear()
+    assert backend.get("k") is None
+
+
+def test_backend_expires_entries(make_backend: BackendFactory) -> None:
+    backend = make_backend(ttl_seconds=-1)
+    backend.set("k", b"value")
+    assert backend.get("k") is None
+
+
+def test_backend_evicts_least_recently_used(make_backend: BackendFactory) -> None:
+    backend = make_backend(max_bytes=250)
+    backend.set("a", b"x" * 100)
+    backend.set("b", b"x" * 100)
+    assert backend.get("a") is not None
+    if isinstance(backend, DiskCacheBackend):
+        # mtime resolution can tie on fast filesystems; make recency explicit
+        os.utime(backend._path("b"), (0, 0))
+    backend.set("c", b"x" * 100)
+    assert backend.get("a") is not None
+    assert backend.get("b") is None
+    assert backend.get("c") is not None
+
+
+def _write_entry(kind: str, location: str) -> None:
+    backend: CacheBackend
+    if kind == "disk":
+        backend = DiskCacheBackend(location)
+    else:
+        backend = SqliteCacheBackend(location)
+    backend.set("shared", b"from another process")
+
+
+@pytest.mark.parametrize("kind", ["disk", "sqlite"])
+def test_persistent_backends_are_shared_across_processes(kind: str, tmp_path: Path) -> None:
+    location = str(tmp_path / ("cache" if kind == "disk" else "cache.sqlite3"))
+    process = multiprocessing.get_context("spawn").Process(
+        target=_write_entry, args=(kind, location)
+    )
+    process.start()
+    process.join(timeout=30)
+    assert process.exitcode == 0
+
+    backend = DiskCacheBackend(location) if kind == "disk" else SqliteCacheBackend(location)
+    assert backend.get("shared") == b"from another process"
+
+
+def test_cached_json_endpoint_skips_recompute(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = MemoryCacheBackend()
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    calls = 0
+
+    def process(data: dict[str, Any]) -> dict[str, Any]:
+        nonlocal calls
+        calls += 1
+        if data.get("fail"):
+            raise ValueError("bad input")
+        return {"success": True, "echo": data["value"]}
+
+    for _ in range(3):
+        assert run_cached_json_endpoint(b'{"value": 1}', process, "test") == (
+            200,
+            {"success": True, "echo": 1},
+        )
+    assert calls == 1
+
+    # Errors are not cached
+    for _ in range(2):
+        assert run_cached_json_endpoint(b'{"fail": true}', process, "test")[0] == 400
+    assert calls == 3
+
+
+def test_sqlite_reads_buffer_access_times(tmp_path: Path) -> None:
+    backend = SqliteCacheBackend(str(tmp_path / "cache.sqlite3"), touch_batch=2)
+    backend.set("a", b"value")
+    accessed = backend._connect().execute("SELECT accessed FROM results").fetchone()[0]
+
+    assert backend.get("a") == b"value"
+    assert backend._connect().execute("SELECT accessed FROM results").fetchone()[0] == accessed
+    # The next write flushes pending reads before it evicts
+    backend.set("b", b"value")
+    flushed = backend._connect().execute("SELECT accessed FROM results WHERE key = 'a'")
+    assert flushed.fetchone()[0] > accessed
+    # So does reaching touch_batch pending reads
+    assert backend.get("a") == backend.get("b") == b"value"
+    assert backend._touched == {}
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import main
+from api.main import app
+from api.profiling import PROFILE_HEADER
+from api.sampling_profiler import OVERFLOW_STACK, SamplingProfiler
+
+client = TestClient(app)
+
+
+def _busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample_once_captures_busy_thread() -> None:
+    """Busy threads show up as collapsed root;...;leaf stacks"""
+    sampler = SamplingProfiler(hz=0)
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,))
+    worker.start()
+    try:
+        for _ in range(20):
+            sampler.sample_once()
+            time.sleep(0.001)
+    finally:
+        stop.set()
+        worker.join()
+
+    dump = sampler.collapsed(minutes=1)
+    busy = [line for line in dump.splitlines() if "test_sampling_profiler.py:_busy_loop" in line]
+    assert busy
+    stack, count = busy[0].rsplit(" ", 1)
+    assert stack.startswith("threading.py:Thread._bootstrap")
+    assert int(count) >= 1
+    assert sampler.samples_taken == 20
+
+
+def test_background_thread_samples_at_rate() -> None:
+    sampler = SamplingProfiler(hz=200)
+    sampler.start()
+    try:
+        time.sleep(0.2)
+    finally:
+        sampler.stop()
+    assert not sampler.running
+    assert sampler.samples_taken > 5
+
+
+def test_distinct_stacks_are_bounded() -> None:
+    """Stacks beyond max_stacks are folded into the overflow bucket"""
+    sampler = SamplingProfiler(hz=0, max_stacks=2)
+    sampler.merge({"a;b": 3, "a;c": 1, "a;d": 2, "a;e": 4})
+
+    lines = dict(line.rsplit(" ", 1) for line in sampler.collapsed(1).splitlines())
+    assert len(lines) == 3
+    assert lines[OVERFLOW_STACK] == "6"
+
+
+def test_drain_resets_and_window_expires() -> None:
+    sampler = SamplingProfiler(hz=0, window_minutes=1, bucket_seconds=1)
+    sampler.merge({"main;work": 5})
+    assert sampler.drain() == {"main;work": 5}
+    assert sampler.collapsed(1) == ""
+
+    sampler._buckets.append((int(time.time()) - 600, {"old;stack": 1}))
+    sampler.merge({"new;stack": 1})
+    assert "old;stack" not in sampler.collapsed(1)
+
+
+def test_flamegraph_endpoint_requires_token(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ANALYTICS_PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(main, "sampler", SamplingProfiler(hz=0))
+    assert client.get("/debug/flamegraph").status_code == 403
+
+    main.sampler.merge({"app;audit": 7})
+    response = client.get("/debug/flamegraph?minutes=2", headers={PROFILE_HEADER: "secret"})
+    assert response.status_code == 200
+    assert response.text == "app;audit 7\n"
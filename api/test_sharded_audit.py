@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections.abc import Iterator
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import api.sharded_audit
+from api.analytics.audit import EnvelopeIntegrityAuditor
+from api.compute_pool import ComputePool
+from api.main import app
+from api.models import IntegrityAuditResult, SnapshotUpload
+from api.sharded_audit import audit_sharded, scan_shard, shard_bounds, should_shard_audit
+from api.snapshots import StoredSnapshot
+
+client = TestClient(app)
+
+
+def _transaction(i: int, **fields: Any) -> dict[str, Any]:
+    return {
+        "id": f"tx-{i}",
+        "date": "2024-01-01",
+        "amount": -1.0 - i,
+        "envelopeId": "env-1",
+        "category": "Food",
+        "lastModified": 1700000000000,
+        **fields,
+    }
+
+
+def _snapshot(orphans: bool = True) -> StoredSnapshot:
+    transactions = [_transaction(i, description=f"row {i}") for i in range(40)]
+    if orphans:
+        transactions[3]["envelopeId"] = "deleted-a"
+        transactions[17].update(fromEnvelopeId="deleted-b", toEnvelopeId="env-1")
+        transactions[29].update(envelopeId="deleted-a", toEnvelopeId="deleted-c")
+        transactions[39]["envelopeId"] = "unassigned"
+    envelopes = [
+        {"id": "env-1", "name": "Groceries", "category": "Food", "lastModified": 1},
+        {
+            "id": "env-2",
+            "name": "Rent",
+            "category": "Housing",
+            "lastModified": 1,
+            "currentBalance": -5.0,
+        },
+    ]
+    metadata = {"id": "budget-1", "lastModified": 1, "actualBalance": 0.0}
+    return StoredSnapshot(
+        SnapshotUpload.model_validate(
+            {"envelopes": envelopes, "transactions": transactions, "metadata": metadata}
+        )
+    )
+
+
+@pytest.fixture
+def pool() -> Iterator[ComputePool]:
+    pool = ComputePool(workers=2, queue_size=2, fast_lane_bytes=0)
+    try:
+        yield pool
+    finally:
+        pool.shutdown()
+
+
+def _without_timestamp(result: IntegrityAuditResult | dict[str, Any]) -> dict[str, Any]:
+    if isinstance(result, IntegrityAuditResult):
+        result = result.model_dump(mode="json")
+    return {key: value for key, value in result.items() if key != "timestamp"}
+
+
+def test_shard_bounds_cover_rows_in_order() -> None:
+    assert shard_bounds(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert shard_bounds(2, 8) == [(0, 1), (1, 2)]
+    assert shard_bounds(0, 4) == [(0, 0)]
+
+
+def test_shard_threshold(monkeypatch: Any, pool: ComputePool) -> None:
+    snapshot = _snapshot()
+    monkeypatch.setenv("ANALYTICS_AUDIT_SHARD_ROWS", "40")
+    assert should_shard_audit(pool, snapshot)
+    monkeypatch.setenv("ANALYTICS_AUDIT_SHARD_ROWS", "41")
+    assert not should_shard_audit(pool, snapshot)
+    monkeypatch.setenv("ANALYTICS_AUDIT_SHARD_ROWS", "1")
+    assert not should_shard_audit(ComputePool(workers=0, queue_size=0), snapshot)
+
+
+def test_sharded_audit_matches_serial(pool: ComputePool) -> None:
+    snapshot = _snapshot()
+    serial = EnvelopeIntegrityAuditor().audit(snapshot.to_audit_snapshot())
+    sharded = asyncio.run(audit_sharded(pool, snapshot))
+    assert _without_timestamp(sharded) == _without_timestamp(serial)
+    assert sharded["summary"]["total"] == 6
+
+
+def test_sharded_audit_without_orphans_skips_shards(monkeypatch: Any) -> None:
+    """No shard is dispatched when every referenced envelope exists"""
+    snapshot = _snapshot(orphans=False)
+    no_pool = ComputePool(workers=2, queue_size=0, fast_lane_bytes=0)
+    run = no_pool.run
+
+    async def no_shards(fn: Any, *args: Any, **kwargs: Any) -> Any:
+        assert fn is not scan_shard, "no shard should run"
+        return await run(fn, *args, **kwargs)
+
+    monkeypatch.setattr(no_pool, "run", no_shards)
+    try:
+        sharded = asyncio.run(audit_sharded(no_pool, snapshot))
+    finally:
+        no_pool.shutdown()
+    serial = EnvelopeIntegrityAuditor().audit(snapshot.to_audit_snapshot())
+    assert _without_timestamp(sharded) == _without_timestamp(serial)
+
+
+def test_audit_route_shards_large_snapshots(monkeypatch: Any, pool: ComputePool) -> None:
+    body = _snapshot().to_audit_snapshot().model_dump_json()
+    snapshot_key = client.post("/snapshots", content=body).json()["snapshotId"]
+    serial = client.post(f"/audit/envelope-integrity?snapshotId={snapshot_key}").json()
+
+    monkeypatch.setenv("ANALYTICS_AUDIT_SHARD_ROWS", "1")
+    monkeypatch.setattr("api.main.compute_pool", pool)
+    sharded = client.post(f"/audit/envelope-integrity?snapshotId={snapshot_key}").json()
+    page = client.post(
+        f"/audit/envelope-integrity?snapshotId={snapshot_key}&group_by=missingEnvelopeId&limit=2"
+    ).json()
+
+    serial.pop("timestamp")
+    sharded.pop("timestamp")
+    assert sharded == serial
+    assert page["totalViolations"] == 5
+    assert page["nextCursor"] is not None
+
+
+def _gated(gate_dir: str, step: str, *args: Any) -> Any:
+    """
+    Run ``api.sharded_audit.<step>`` once the test opens its gate
+
+    Runs in a worker process, which imports the unpatched module, so the
+    real step runs. Gates are files, since the test and the worker share
+    no memory.
+    """
+    gate = Path(gate_dir, step)
+    gate.with_suffix(".reached").touch()
+    deadline = time.monotonic() + 10
+    while not gate.with_suffix(".open").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return getattr(api.sharded_audit, step)(*args)
+
+
+def test_audit_steps_run_in_the_process_lane(monkeypatch: Any, pool: ComputePool) -> None:
+    """Encoding and merging are routed by the snapshot's size, like the shards"""
+    snapshot = _snapshot()
+    run = pool.run
+    sizes: dict[str, int] = {}
+
+    async def record_size(fn: Any, *args: Any, size: int = 0) -> Any:
+        sizes[fn.__name__] = size
+        return await run(fn, *args, size=size)
+
+    monkeypatch.setattr(pool, "run", record_size)
+    try:
+        asyncio.run(audit_sharded(pool, snapshot))
+    finally:
+        snapshot.release()
+    assert set(sizes) == {"stage_references", "scan_shard", "merge_orphans"}
+    assert all(pool.uses_process_lane(size) for size in sizes.values())
+
+
+def test_health_responds_during_sharded_audit(
+    monkeypatch: Any, pool: ComputePool, tmp_path: Path
+) -> None:
+    """Encoding and merging a sharded audit block neither the event loop nor the fast lane"""
+    body = _snapshot().to_audit_snapshot().model_dump_json()
+    snapshot_key = client.post("/snapshots", content=body).json()["snapshotId"]
+    monkeypatch.setenv("ANALYTICS_AUDIT_SHARD_ROWS", "1")
+    monkeypatch.setattr("api.main.compute_pool", pool)
+    steps = ("stage_references", "merge_orphans")
+    for step in steps:
+        monkeypatch.setattr(f"api.sharded_audit.{step}", partial(_gated, str(tmp_path), step))
+
+    async def wait_for(path: Path) -> bool:
+        deadline = time.monotonic() + 30
+        while not path.exists():
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def audit_with_health_checks() -> httpx.Response:
+        transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            audit = asyncio.create_task(
+                http.post(f"/audit/envelope-integrity?snapshotId={snapshot_key}")
+            )
+            for step in steps:
+                assert await wait_for(tmp_path / f"{step}.reached")
+                health = await asyncio.wait_for(http.get("/health"), 5)
+                assert health.status_code == 200
+                assert pool.stats()["fast"]["inFlight"] == 0
+                assert not audit.done()
+                (tmp_path / f"{step}.open").touch()
+            return await audit
+
+    response = asyncio.run(audit_with_health_checks())
+    assert response.status_code == 200
+    assert response.json()["summary"]["total"] == 6
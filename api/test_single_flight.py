@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from api.single_flight import SINGLE_FLIGHT_REQUESTS, SingleFlight, request_key
+
+
+def test_request_key_depends_on_route_and_body() -> None:
+    assert request_key("/a", b"{}") == request_key("/a", b"{}")
+    assert request_key("/a", b"{}") != request_key("/b", b"{}")
+    assert request_key("/a", b"{}") != request_key("/a", b"[]")
+
+
+def test_concurrent_duplicates_share_one_computation() -> None:
+    """Duplicates arriving during a computation await the leader's result"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def compute() -> dict[str, int]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"value": 42}
+
+    async def scenario() -> list[dict[str, int]]:
+        return await asyncio.gather(*(flight.do("k", "/route", compute) for _ in range(5)))
+
+    coalesced_before = SINGLE_FLIGHT_REQUESTS.value(("/route", "coalesced"))
+    results = asyncio.run(scenario())
+
+    assert calls == 1
+    assert results == [{"value": 42}] * 5
+    assert flight.in_flight == 0
+    assert SINGLE_FLIGHT_REQUESTS.value(("/route", "coalesced")) == coalesced_before + 4
+
+    stats = flight.stats()
+    assert stats[0]["key"] == "k"
+    assert stats[0]["coalesced"] == 4
+    assert stats[0]["savedSeconds"] > 0
+
+
+def test_sequential_calls_recompute() -> None:
+    """Coalescing only applies while a computation is in flight"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def compute() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def scenario() -> tuple[int, int]:
+        return await flight.do("k", "/r", compute), await flight.do("k", "/r", compute)
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_errors_propagate_to_all_waiters() -> None:
+    flight = SingleFlight()
+
+    async def fail() -> None:
+        await asyncio.sleep(0.01)
+        raise ValueError("bad payload")
+
+    async def scenario() -> list[BaseException | None]:
+        return await asyncio.gather(
+            *(flight.do("k", "/r", fail) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.in_flight == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_work() -> None:
+    flight = SingleFlight()
+
+    async def compute() -> str:
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario() -> str:
+        leader = asyncio.create_task(flight.do("k", "/r", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("k", "/r", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_tracked_keys_are_bounded() -> None:
+    flight = SingleFlight(max_tracked_keys=2)
+    for key in ("a", "b", "c"):
+        flight._track(key, "/r", coalesced=1)
+    assert {row["key"] for row in flight.stats()} == {"b", "c"}
@@ -0,0 +1,167 @@
+import pickle
+from typing import Any
+
+import pytest
+
+from api.analytics.categorization import process_categorization, process_column_categorization
+from api.models import SnapshotUpload
+from api.snapshots import (
+    SharedSnapshot,
+    SnapshotNotFoundError,
+    SnapshotStore,
+    SnapshotTooLargeError,
+    StoredSnapshot,
+    autofunding_request,
+    categorization_request,
+    snapshot_id,
+)
+
+
+def _upload(transaction_count: int = 3) -> SnapshotUpload:
+    data: dict[str, Any] = {
+        "envelopes": [
+            {
+                "id": "env-1",
+                "name": "Groceries",
+                "category": "Food",
+                "lastModified": 1700000000000,
+                "currentBalance": 50.0,
+                "monthlyBudget": 400,
+            }
+        ],
+        "transactions": [
+            {
+                "id": f"tx-{i}",
+                "date": f"2024-01-{i + 1:02d}",
+                "amount": -10.0 * (i + 1),
+                "envelopeId": "env-1",
+                "category": "Food",
+                "description": "Safeway",
+                "lastModified": 1700000000000,
+            }
+            for i in range(transaction_count)
+        ]
+        + [
+            {
+                "id": "pay-1",
+                "date": "2024-01-15",
+                "processedAt": "2024-01-15T09:00:00Z",
+                "amount": 2000.0,
+                "type": "income",
+                "envelopeId": "unassigned",
+                "category": "Income",
+                "lastModified": 1700000000000,
+            }
+        ],
+        "metadata": {"id": "budget-1", "lastModified": 1700000000000, "unassignedCash": 75.0},
+    }
+    return SnapshotUpload.model_validate(data)
+
+
+def test_columnar_snapshot_round_trips_audit_input() -> None:
+    upload = _upload()
+    rebuilt = StoredSnapshot(upload).to_audit_snapshot()
+    assert [t.model_dump() for t in rebuilt.transactions] == [
+        t.model_dump() for t in upload.transactions
+    ]
+    assert rebuilt.metadata == upload.metadata
+
+
+def test_snapshot_rows_and_paychecks() -> None:
+    snapshot = StoredSnapshot(_upload())
+    rows = snapshot.rows(("amount", "description"))
+    assert rows[0] == {"amount": -10.0, "description": "Safeway"}
+    assert snapshot.paychecks() == [
+        {"date": "2024-01-15", "amount": 2000.0, "processedAt": "2024-01-15T09:00:00Z"}
+    ]
+
+
+def test_column_categorization_matches_row_categorization() -> None:
+    upload = _upload()
+    for i, merchant in enumerate(["Starbucks #12", "Starbucks #40", "Dunkin", "Cafe Nero"]):
+        upload.transactions.append(
+            upload.transactions[0].model_copy(
+                update={
+                    "id": f"coffee-{i}",
+                    "amount": -20.0,
+                    "envelopeId": "",
+                    "description": merchant,
+                }
+            )
+        )
+    snapshot = StoredSnapshot(upload)
+    rows = snapshot.rows(("amount", "envelopeId", "description"))
+    columnar = process_column_categorization(categorization_request(snapshot, {}))
+    assert columnar == process_categorization({"transactions": rows})
+    assert columnar["suggestions"][0]["count"] == 4
+
+
+def test_autofunding_request_uses_snapshot_balances() -> None:
+    request = autofunding_request(StoredSnapshot(_upload()), {"context": {"trigger": "payday"}})
+    assert request["rules"] == []
+    assert request["context"]["trigger"] == "payday"
+    assert request["context"]["data"]["unassignedCash"] == 75.0
+    assert request["context"]["data"]["envelopes"][0]["monthlyAmount"] == 400
+
+
+def test_snapshot_id_is_content_hash() -> None:
+    assert snapshot_id(b"{}") == snapshot_id(b"{}")
+    assert snapshot_id(b"{}") != snapshot_id(b"[]")
+
+
+def test_content_id_hashes_parsed_data() -> None:
+    assert StoredSnapshot(_upload()).content_id == StoredSnapshot(_upload()).content_id
+    assert StoredSnapshot(_upload()).content_id != StoredSnapshot(_upload(2)).content_id
+
+
+def test_store_forgets_uploads_of_dropped_snapshots() -> None:
+    small = StoredSnapshot(_upload(1))
+    store = SnapshotStore(max_bytes=small.nbytes * 2)
+    store.put("a", small, upload_key="upload-a")
+    assert store.uploaded("upload-a") == "a"
+    store.put("b", StoredSnapshot(_upload(1)), upload_key="upload-b")
+    store.put("c", StoredSnapshot(_upload(1)))
+    assert store.uploaded("upload-a") is None
+    assert store.delete("b")
+    assert store.uploaded("upload-b") is None
+
+
+def test_shared_snapshot_round_trip() -> None:
+    snapshot = StoredSnapshot(_upload())
+    try:
+        shared = snapshot.share()
+        assert snapshot.share().name == shared.name
+        loaded = pickle.loads(pickle.dumps(shared)).load()
+        assert loaded.content_id == snapshot.content_id
+        assert loaded.rows(("amount",)) == snapshot.rows(("amount",))
+    finally:
+        snapshot.release()
+
+
+def test_released_snapshot_cannot_be_loaded() -> None:
+    snapshot = StoredSnapshot(_upload())
+    shared = snapshot.share()
+    store = SnapshotStore()
+    store.put("a", snapshot)
+    assert store.delete("a")
+    with pytest.raises(SnapshotNotFoundError):
+        SharedSnapshot(shared.name, shared.size, shared.content_id).load()
+
+
+def test_store_evicts_by_bytes() -> None:
+    small = StoredSnapshot(_upload(1))
+    store = SnapshotStore(max_bytes=small.nbytes * 2)
+    store.put("a", small)
+    store.put("b", StoredSnapshot(_upload(1)))
+    store.get("a")
+    store.put("c", StoredSnapshot(_upload(1)))
+    assert store.get("a") is small
+    with pytest.raises(SnapshotNotFoundError):
+        store.get("b")
+    assert store.stats()["bytes"] <= store.max_bytes
+
+
+def test_store_rejects_oversized_snapshot() -> None:
+    store = SnapshotStore(max_bytes=10)
+    with pytest.raises(SnapshotTooLargeError):
+        store.put("a", StoredSnapshot(_upload()))
@@ -0,0 +1,81 @@
+import threading
+from typing import Any
+
+import pytest
+
+from api import result_cache
+from api.result_cache import MemoryCacheBackend
+from api.state_log import LogPosition, StateLog, StateStore
+
+
+class Tally:
+    """Totals per name, changed by adding amounts"""
+
+    def __init__(self) -> None:
+        self.totals: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.position: LogPosition | None = None
+
+    def apply(self, change: dict[str, Any]) -> None:
+        for name, amount in change.items():
+            self.totals[name] = self.totals.get(name, 0) + amount
+
+    def checkpoint(self) -> tuple[dict[str, Any], int]:
+        return dict(self.totals), len(self.totals)
+
+    def reset(self, checkpoint: dict[str, Any] | None) -> None:
+        self.totals = dict(checkpoint or {})
+
+
+@pytest.fixture
+def backend(monkeypatch: Any) -> MemoryCacheBackend:
+    backend = MemoryCacheBackend(1024 * 1024, 60)
+    monkeypatch.setattr(result_cache, "result_backend", lambda: backend)
+    return backend
+
+
+def _add(store: StateStore[Tally], owner: str, change: dict[str, int]) -> tuple[Tally, bool]:
+    with store.checkout(owner, Tally) as (tally, hit):
+        tally.apply(change)
+        store.save(owner, tally, change, len(change))
+    return tally, hit
+
+
+def test_changes_are_logged_after_a_checkpoint(backend: MemoryCacheBackend) -> None:
+    log = StateLog("tally", max_changes=3)
+    writer = StateStore[Tally](log, max_owners=4)
+    _, hit = _add(writer, "user-1", {f"n{i}": 1 for i in range(10)})
+    assert hit is False
+    positions = []
+    for _ in range(4):
+        tally, _ = _add(writer, "user-1", {"n0": 1})
+        assert tally.position is not None
+        positions.append(tally.position[1])
+    # Three changes follow the checkpoint, then a new checkpoint replaces them
+    assert positions == [1, 2, 3, 0]
+    totals = dict(tally.totals)
+
+    # A process that has seen none of it loads the latest checkpoint
+    with StateStore[Tally](log, max_owners=4).checkout("user-1", Tally) as (reader, hit):
+        assert hit is True and reader.totals == totals
+
+    # One that is behind applies just the changes after its revision
+    behind = StateStore[Tally](log, max_owners=4)
+    _add(behind, "user-1", {"n1": 1})
+    _add(writer, "user-1", {"n2": 5})
+    with behind.checkout("user-1", Tally) as (caught_up, _):
+        assert caught_up.totals == {**totals, "n1": 2, "n2": 6}
+
+
+def test_a_broken_log_starts_over(backend: MemoryCacheBackend) -> None:
+    log = StateLog("tally")
+    _add(StateStore[Tally](log, max_owners=4), "user-1", {"a": 1, "b": 1, "c": 1})
+    tally, _ = _add(StateStore[Tally](log, max_owners=4), "user-1", {"b": 1})
+    assert tally.position is not None and tally.position[1] == 1
+
+    # The checkpoint the change follows is evicted
+    checkpoint = [key for key, (_, value) in backend._entries.items() if b'"state"' in value]
+    for key in checkpoint:
+        backend._remove(key)
+    with StateStore[Tally](log, max_owners=4).checkout("user-1", Tally) as (fresh, hit):
+        assert hit is False and fresh.totals == {}
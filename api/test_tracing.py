@@ -0,0 +1,208 @@
+import asyncio
+import json
+import uuid
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api.analytics.categorization import analyze_merchant_patterns
+from api.autofunding.index import process_autofunding
+from api.compute_pool import ComputePool
+from api.main import app, run_envelope_audit
+from api.profiling import PROFILE_HEADER
+from api.tracing import (
+    NOOP_SPAN,
+    FileSpanExporter,
+    InMemorySpanExporter,
+    set_exporter,
+    span,
+    start_span,
+)
+
+client = TestClient(app)
+
+TOKEN = "operator-secret"
+
+
+@pytest.fixture
+def exporter() -> Iterator[InMemorySpanExporter]:
+    memory = InMemorySpanExporter()
+    previous = set_exporter(memory)
+    try:
+        yield memory
+    finally:
+        set_exporter(previous)
+
+
+def _attributes(span_data: dict[str, Any]) -> dict[str, Any]:
+    return {attr["key"]: next(iter(attr["value"].values())) for attr in span_data["attributes"]}
+
+
+def _by_name(spans: list[dict[str, Any]], name: str) -> list[dict[str, Any]]:
+    return [s for s in spans if s["name"] == name]
+
+
+def _orphan_snapshot() -> dict[str, Any]:
+    """Unique per call so the result cache never answers it"""
+    transaction = {"date": "2024-01-01", "category": "Food", "lastModified": 1700000000000}
+    return {
+        "envelopes": [],
+        "transactions": [
+            {**transaction, "id": "t1", "amount": -5.0, "envelopeId": "deleted"},
+            {**transaction, "id": "t2", "amount": -7.0, "envelopeId": "unassigned"},
+        ],
+        "metadata": {
+            "id": f"budget-{uuid.uuid4()}",
+            "lastModified": 1700000000000,
+            "actualBalance": 0.0,
+        },
+    }
+
+
+def test_disabled_tracing_is_noop() -> None:
+    previous = set_exporter(None)
+    try:
+        assert span("anything", rows=1) is NOOP_SPAN
+    finally:
+        set_exporter(previous)
+
+
+def test_nested_spans_share_trace(exporter: InMemorySpanExporter) -> None:
+    with span("outer", rows=3) as outer:
+        with span("inner"):
+            pass
+        detached = start_span("detached")
+        detached.end()
+        detached.end()
+
+    inner, detached_data, outer_data = exporter.spans()
+    assert outer_data["name"] == "outer" and outer_data["parentSpanId"] == ""
+    assert inner["parentSpanId"] == outer.span_id
+    assert detached_data["parentSpanId"] == outer.span_id
+    assert {s["traceId"] for s in exporter.spans()} == {outer.trace_id}
+    assert len(outer.trace_id) == 32 and len(outer.span_id) == 16
+    assert outer_data["attributes"] == [{"key": "rows", "value": {"intValue": "3"}}]
+    assert int(outer_data["endTimeUnixNano"]) >= int(outer_data["startTimeUnixNano"])
+
+
+def test_span_records_errors(exporter: InMemorySpanExporter) -> None:
+    with pytest.raises(ValueError), span("failing"):
+        raise ValueError("boom")
+    (failed,) = exporter.spans()
+    assert failed["status"] == {"code": 2, "message": "boom"}
+    assert _attributes(failed)["exception.type"] == "ValueError"
+
+
+def test_file_exporter_writes_otlp_lines(tmp_path: Any) -> None:
+    path = tmp_path / "traces.jsonl"
+    previous = set_exporter(FileSpanExporter(str(path)))
+    try:
+        with span("first"):
+            pass
+        with span("second"):
+            pass
+    finally:
+        set_exporter(previous)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    names = [line["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] for line in lines]
+    assert names == ["first", "second"]
+
+
+def test_merchant_matching_span(exporter: InMemorySpanExporter) -> None:
+    transactions = [
+        {"amount": -20, "description": "Netflix"},
+        {"amount": -15, "description": "Starbucks"},
+        {"amount": 100, "description": "Paycheck"},
+    ]
+    analyze_merchant_patterns(transactions)
+    (match,) = _by_name(exporter.spans(), "categorization.match")
+    attributes = _attributes(match)
+    assert attributes["rows"] == "2"
+    assert attributes["transactions"] == "3"
+
+
+def test_autofunding_rule_spans(exporter: InMemorySpanExporter) -> None:
+    rule = {
+        "id": "rule-1",
+        "name": "Fixed",
+        "type": "fixed_amount",
+        "trigger": "manual",
+        "priority": 1,
+        "enabled": True,
+        "createdAt": "2024-01-01T00:00:00.000Z",
+        "config": {
+            "sourceType": "unassigned",
+            "targetType": "envelope",
+            "targetId": "env-1",
+            "amount": 50.0,
+        },
+    }
+    envelope = {"id": "env-1", "name": "Groceries", "currentBalance": 0.0}
+    process_autofunding(
+        {
+            "rules": [rule],
+            "context": {
+                "trigger": "manual",
+                "data": {"unassignedCash": 100.0, "envelopes": [envelope]},
+            },
+        }
+    )
+    spans = exporter.spans()
+    (validate,) = _by_name(spans, "autofunding.validate")
+    (rule_span,) = _by_name(spans, "autofunding.rule")
+    assert _attributes(validate)["rules"] == "1"
+    attributes = _attributes(rule_span)
+    assert attributes["rule.id"] == "rule-1"
+    assert attributes["rows"] == "1"
+    assert attributes["success"] is True
+
+
+def test_audit_request_trace(exporter: InMemorySpanExporter) -> None:
+    response = client.post("/audit/envelope-integrity", json=_orphan_snapshot())
+    assert response.status_code == 200
+
+    spans = exporter.spans()
+    (request_span,) = _by_name(spans, "POST /audit/envelope-integrity")
+    assert request_span["kind"] == 2
+    assert _attributes(request_span)["http.response.status_code"] == "200"
+
+    (validate,) = _by_name(spans, "audit.validate")
+    assert _attributes(validate)["rows"] == "2"
+    checks = {_attributes(s)["check"]: _attributes(s) for s in _by_name(spans, "audit.check")}
+    assert checks["orphaned_transactions"]["rows"] == "2"
+    assert checks["orphaned_transactions"]["violations"] == "1"
+    assert set(checks) == {"orphaned_transactions", "negative_envelopes", "balance_leakage"}
+    assert {s["traceId"] for s in spans} == {request_span["traceId"]}
+
+
+def test_process_lane_spans_join_parent_trace(
+    exporter: InMemorySpanExporter, monkeypatch: Any
+) -> None:
+    """Worker spans are drained back to the parent under the caller's span"""
+    monkeypatch.setenv("ANALYTICS_TRACE_EXPORTER", "memory")
+    monkeypatch.setenv("ANALYTICS_CACHE_BACKEND", "none")
+    pool = ComputePool(workers=1, queue_size=0, fast_lane_bytes=0)
+    payload = json.dumps(_orphan_snapshot()).encode()
+    try:
+        with span("parent") as parent:
+            asyncio.run(pool.run(run_envelope_audit, payload, size=len(payload)))
+    finally:
+        pool.shutdown()
+    checks = _by_name(exporter.spans(), "audit.check")
+    assert len(checks) == 3
+    assert {s["traceId"] for s in checks} == {parent.trace_id}
+
+
+def test_debug_traces_endpoint(exporter: InMemorySpanExporter, monkeypatch: Any) -> None:
+    monkeypatch.setenv("ANALYTICS_PROFILE_TOKEN", TOKEN)
+    with span("listed") as listed:
+        pass
+    assert client.get("/debug/traces").status_code == 403
+    response = client.get(
+        "/debug/traces", params={"traceId": listed.trace_id}, headers={PROFILE_HEADER: TOKEN}
+    )
+    assert response.status_code == 200
+    spans = response.json()["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["listed"]
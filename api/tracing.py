@@ -0,0 +1,371 @@
+"""
+Request Tracing
+Lightweight OpenTelemetry-compatible spans for the analytics hot paths
+
+Spans carry OTel-style trace and span IDs, unix-nanosecond timestamps,
+attributes (row counts and the like) and an error status. Finished spans
+are exported in the OTLP/JSON encoding, so they load into any OTLP-aware
+tool without running a collector:
+
+- ``memory``: a bounded in-process buffer, served at ``GET /debug/traces``
+- ``file``: one OTLP ``ExportTraceServiceRequest`` per line, appended to
+  ``ANALYTICS_TRACE_FILE`` (the collector's file exporter format)
+
+Tracing is off unless ANALYTICS_TRACE_EXPORTER is set. A disabled span is a
+shared no-op, so instrumented code costs one global lookup per span. Only
+stdlib modules are used so the serverless handlers keep their cold-start
+budget.
+
+Compute pool worker processes configure the same exporter. With ``file``
+they append to the shared file directly; with ``memory`` the pool drains
+their buffer after each job and re-exports it in the parent. The parent's
+active span context is handed to the worker so its spans join the trace.
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar
+from types import TracebackType
+from typing import Any
+
+DEFAULT_EXPORTER = "none"
+DEFAULT_BUFFER_SPANS = 10_000
+DEFAULT_TRACE_FILE = os.path.join(tempfile.gettempdir(), "violet-vault-traces.jsonl")
+
+SERVICE_NAME = "violet-vault-analytics"
+SCOPE_NAME = "api.tracing"
+
+# OTLP enum values
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+AttributeValue = str | bool | int | float
+
+# (trace ID, span ID) of the active span
+SpanContext = tuple[str, str]
+
+_current: ContextVar[SpanContext | None] = ContextVar("analytics_span", default=None)
+
+
+def _otlp_value(value: AttributeValue) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """
+    One timed operation
+
+    Used as a context manager it becomes the active span, so spans started
+    inside it are its children. ``start_span`` creates spans that are not
+    activated (for generators, whose bodies may resume in other contexts);
+    those are finished with ``end()``.
+    """
+
+    __slots__ = (
+        "name",
+        "kind",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "status_code",
+        "status_message",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        parent: SpanContext | None,
+        attributes: dict[str, AttributeValue],
+        kind: int = SPAN_KIND_INTERNAL,
+    ) -> None:
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent[0] if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent[1] if parent else ""
+        self.attributes = attributes
+        self.status_code = STATUS_UNSET
+        self.status_message = ""
+        self.end_ns: int | None = None
+        self._token: Any = None
+        self.start_ns = time.time_ns()
+
+    @property
+    def context(self) -> SpanContext:
+        return self.trace_id, self.span_id
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error)
+        self.attributes["exception.type"] = type(error).__name__
+
+    def end(self) -> None:
+        """Finish the span and hand it to the exporter (later calls are ignored)"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export([self.to_otlp()])
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self.context)
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        _current.reset(self._token)
+        if exc is not None:
+            self.record_error(exc)
+        self.end()
+
+    def to_otlp(self) -> dict[str, Any]:
+        """The span in OTLP/JSON form"""
+        span: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status_code},
+        }
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Stand-in returned while tracing is disabled"""
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def otlp_request(spans: list[dict[str, Any]]) -> dict[str, Any]:
+    """Wrap OTLP spans in an ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class SpanExporter(ABC):
+    """Destination for finished spans (already in OTLP/JSON form)"""
+
+    @abstractmethod
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        """Record finished spans"""
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps the most recent ``max_spans`` spans in memory"""
+
+    def __init__(self, max_spans: int = DEFAULT_BUFFER_SPANS) -> None:
+        self._spans: deque[dict[str, Any]] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self._spans.extend(spans)
+
+    def spans(self, trace_id: str | None = None) -> list[dict[str, Any]]:
+        """Buffered spans, oldest first, optionally limited to one trace"""
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id is not None:
+            spans = [span for span in spans if span["traceId"] == trace_id]
+        return spans
+
+    def drain(self) -> list[dict[str, Any]]:
+        """Remove and return every buffered span"""
+        with self._lock:
+            spans = list(self._spans)
+            self._spans.clear()
+        return spans
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends one OTLP JSON line per export to ``path``
+
+    Each line is written with a single append, so several processes can
+    share the file.
+    """
+
+    def __init__(self, path: str = DEFAULT_TRACE_FILE) -> None:
+        self.path = path
+
+    def export(self, spans: list[dict[str, Any]]) -> None:
+        line = json.dumps(otlp_request(spans), separators=(",", ":")) + "\n"
+        with open(self.path, "a") as f:
+            f.write(line)
+
+
+def exporter_from_env() -> SpanExporter | None:
+    """
+    Build the configured exporter (None when tracing is disabled)
+
+    - ANALYTICS_TRACE_EXPORTER: none (default), memory or file
+    - ANALYTICS_TRACE_FILE: output file for the file exporter
+    - ANALYTICS_TRACE_BUFFER_SPANS: spans kept by the memory exporter (default 10000)
+    """
+    kind = os.environ.get("ANALYTICS_TRACE_EXPORTER", DEFAULT_EXPORTER).lower()
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemorySpanExporter(
+            int(os.environ.get("ANALYTICS_TRACE_BUFFER_SPANS", DEFAULT_BUFFER_SPANS))
+        )
+    if kind == "file":
+        return FileSpanExporter(os.environ.get("ANALYTICS_TRACE_FILE", DEFAULT_TRACE_FILE))
+    raise ValueError(f"Unknown ANALYTICS_TRACE_EXPORTER: {kind}")
+
+
+_exporter: SpanExporter | None = exporter_from_env()
+
+
+def get_exporter() -> SpanExporter | None:
+    return _exporter
+
+
+def set_exporter(exporter: SpanExporter | None) -> SpanExporter | None:
+    """Replace the process-wide exporter (None disables tracing); returns the old one"""
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: AttributeValue) -> Any:
+    """
+    Context manager timing ``name`` as a child of the active span
+
+    Returns a no-op when tracing is disabled.
+    """
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, _current.get(), attributes, kind)
+
+
+def start_span(name: str, **attributes: AttributeValue) -> Any:
+    """Start a span under the active span without activating it; call ``end()``"""
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, _current.get(), attributes)
+
+
+def current_context() -> SpanContext | None:
+    """The active span's context, for propagation to worker processes"""
+    return _current.get()
+
+
+def run_in_context(parent: SpanContext | None, fn: Any, *args: Any) -> Any:
+    """Call ``fn(*args)`` with ``parent`` as the active span context"""
+    token = _current.set(parent)
+    try:
+        return fn(*args)
+    finally:
+        _current.reset(token)
+
+
+def drain_worker_spans() -> list[dict[str, Any]]:
+    """Spans buffered in this worker process since the last drain"""
+    exporter = _exporter
+    return exporter.drain() if isinstance(exporter, InMemorySpanExporter) else []
+
+
+def export_spans(spans: list[dict[str, Any]]) -> None:
+    """Re-export spans drained from a worker process"""
+    exporter = _exporter
+    if spans and exporter is not None:
+        exporter.export(spans)
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware opening a server span around every HTTP request
+
+    The span is named after the matched route template (``POST /snapshots``)
+    and is active while the endpoint runs, so analytics spans nest under it.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or _exporter is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def recording_send(message: Any) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with Span(scope["method"], _current.get(), {}, SPAN_KIND_SERVER) as request_span:
+            try:
+                await self.app(scope, receive, recording_send)
+            finally:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                request_span.name = f"{scope['method']} {route}"
+                request_span.set_attribute("http.request.method", scope["method"])
+                request_span.set_attribute("http.route", route)
+                request_span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    request_span.status_code = STATUS_ERROR